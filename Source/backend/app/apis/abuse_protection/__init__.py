@@ -1,9 +1,12 @@
-import re
 import time
 import databutton as db
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel, Field
 from typing import Dict, List, Optional, Any, Tuple
+from app.apis.keyword_index import register_keywords, scan_keywords, get_keyword_index
+from app.apis.message_prefilter import register_prefilter_namespaces, could_match
+from app.apis.rule_packs import register_rule_set
+from app.apis.rule_profiler import profiling_enabled, record_rule, record_hits, register_profiled_rules, DETECTOR_ABUSE
 
 '''
 1. API用途：惡意行為保護 API，用於檢測和處理用戶的惡意或攻擊性訊息
@@ -73,6 +76,70 @@ DEFAULT_ABUSE_CONFIG = {
     "block_durations": DEFAULT_BLOCK_DURATIONS
 }
 
+# 多關鍵詞組合 - 輕度負面詞
+MILD_NEGATIVE_WORDS = ["爛", "笨", "沒用", "垃圾", "智障", "廢物"]
+
+# 測試用攻擊詞
+ABUSE_TEST_WORDS = ["測試攻擊", "test attack"]
+
+# 共用關鍵詞索引的命名空間
+ABUSE_SENSITIVE_NAMESPACE = "abuse_sensitive_words"
+ABUSE_MILD_NAMESPACE = "abuse_mild_negative_words"
+ABUSE_TEST_NAMESPACE = "abuse_test_attack"
+
+register_keywords(ABUSE_SENSITIVE_NAMESPACE, DEFAULT_SENSITIVE_WORDS)
+register_keywords(ABUSE_MILD_NAMESPACE, MILD_NEGATIVE_WORDS)
+register_keywords(ABUSE_TEST_NAMESPACE, ABUSE_TEST_WORDS)
+
+# 訊息預篩：不含任何惡意行為詞的訊息不需掃描
+ABUSE_PREFILTER_GROUP = "abuse"
+register_prefilter_namespaces(ABUSE_PREFILTER_GROUP, [ABUSE_SENSITIVE_NAMESPACE, ABUSE_MILD_NAMESPACE, ABUSE_TEST_NAMESPACE])
+
+# 規則統計：每個詞是一條規則（規則ID為「命名空間:詞」），掃描成本記在 keyword_scan 上
+ABUSE_SCAN_RULE_ID = "keyword_scan"
+_PROFILED_INDEX_VERSION = None
+
+def record_abuse_profile(hits: Dict[str, Any], elapsed_ns: int) -> None:
+    """記錄一次惡意行為檢查的命中詞與掃描時間"""
+    global _PROFILED_INDEX_VERSION
+    index = get_keyword_index()
+    if _PROFILED_INDEX_VERSION != index.version:
+        _PROFILED_INDEX_VERSION = index.version
+        for namespace in (ABUSE_SENSITIVE_NAMESPACE, ABUSE_MILD_NAMESPACE, ABUSE_TEST_NAMESPACE):
+            register_profiled_rules(DETECTOR_ABUSE, namespace, {f"{namespace}:{term}": term for term in index.get_vocabulary(namespace)})
+    hit_ids = {
+        f"{namespace}:{term}"
+        for namespace in (ABUSE_SENSITIVE_NAMESPACE, ABUSE_MILD_NAMESPACE, ABUSE_TEST_NAMESPACE)
+        for term, _, _ in hits.get(namespace, ())
+    }
+    record_rule(DETECTOR_ABUSE, ABUSE_SCAN_RULE_ID, bool(hit_ids), elapsed_ns)
+    record_hits(DETECTOR_ABUSE, hit_ids)
+
+# 規則包：輕度負面詞與測試攻擊詞可由後台發布新版本即時替換（敏感詞仍由惡意行為設定管理）
+def export_abuse_rule_set() -> Dict[str, Any]:
+    """匯出惡意行為規則定義"""
+    return {"mild_negative_words": MILD_NEGATIVE_WORDS, "test_words": ABUSE_TEST_WORDS}
+
+def compile_abuse_rule_set(rule_set: Dict[str, Any]) -> Dict[str, List[str]]:
+    """驗證規則包中的惡意行為規則"""
+    compiled = {}
+    for key in ("mild_negative_words", "test_words"):
+        words = rule_set.get(key, [])
+        if not isinstance(words, list) or not all(isinstance(word, str) and word for word in words):
+            raise ValueError(f"{key} must be a list of non-empty strings")
+        compiled[key] = list(words)
+    return compiled
+
+def install_abuse_rule_set(compiled: Dict[str, List[str]]) -> None:
+    """套用新的惡意行為規則"""
+    global MILD_NEGATIVE_WORDS, ABUSE_TEST_WORDS
+    register_keywords(ABUSE_MILD_NAMESPACE, compiled["mild_negative_words"])
+    register_keywords(ABUSE_TEST_NAMESPACE, compiled["test_words"])
+    MILD_NEGATIVE_WORDS = compiled["mild_negative_words"]
+    ABUSE_TEST_WORDS = compiled["test_words"]
+
+register_rule_set("abuse", export_abuse_rule_set, compile_abuse_rule_set, install_abuse_rule_set)
+
 # 警告和禁用回應模板
 WARNING_MESSAGES = [
     "由於小安感受到被不當使用，為了保護自己希望能先適當劃清界線，請保有善意與禮貌進行交流。",
@@ -131,35 +198,33 @@ def check_message_for_abuse(message: str, config: AbuseConfig) -> bool:
     if not config.enabled:
         return False
     
-    # 將訊息轉為小寫以進行不區分大小寫的匹配
-    message_lower = message.lower()
+    # 敏感詞可由後台設定修改，詞表未變動時不會重建索引
+    register_keywords(ABUSE_SENSITIVE_NAMESPACE, config.sensitive_words)
+    
+    # 第一層預篩：沒有任何詞可能命中時直接略過
+    if not could_match(message, ABUSE_PREFILTER_GROUP):
+        return False
+    
+    # 共用關鍵詞索引一次掃描（不區分大小寫，中文詞不受 \b 限制）
+    profiling = profiling_enabled()
+    started = time.perf_counter_ns() if profiling else 0
+    hits = scan_keywords(message)
+    if profiling:
+        record_abuse_profile(hits, time.perf_counter_ns() - started)
     
     # 檢查惡意行為測試特殊字串
-    if "測試攻擊" in message_lower or "test attack" in message_lower:
+    if hits.get(ABUSE_TEST_NAMESPACE):
         print("檢測到測試攻擊字符串")
         return True
         
     # 檢查敏感詞
-    for word in config.sensitive_words:
-        word_lower = word.lower()
-        # 先檢查直接包含
-        if word_lower in message_lower:
-            print(f"檢測到敏感詞: {word_lower}")
-            return True
-        
-        # 再使用正則表達式檢查完整詞
-        try:
-            pattern = r'\b' + re.escape(word_lower) + r'\b'
-            if re.search(pattern, message_lower):
-                print(f"正則匹配到敏感詞: {word_lower}")
-                return True
-        except re.error:
-            # 如果正則表達式出錯，則繼續檢查下一個詞
-            pass
+    sensitive_hits = hits.get(ABUSE_SENSITIVE_NAMESPACE)
+    if sensitive_hits:
+        print(f"檢測到敏感詞: {sensitive_hits[0][0]}")
+        return True
     
     # 檢查多關鍵詞組合 - 至少兩個輕度負面詞同時出現更可能是攻擊
-    mild_negative_words = ["爛", "笨", "沒用", "垃圾", "智障", "廢物"]
-    count = sum(1 for word in mild_negative_words if word in message_lower)
+    count = len({term for term, _, _ in hits.get(ABUSE_MILD_NAMESPACE, ())})
     if count >= 2:
         print(f"檢測到多個輕度負面詞組合: {count}個")
         return True
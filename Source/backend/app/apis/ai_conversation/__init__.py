@@ -1,16 +1,18 @@
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, NamedTuple, Tuple, Union, AsyncIterator
+import asyncio
 import time
 import json
 import re
-import databutton as db
 from anthropic import Anthropic
 
 '''
 1. API用途：AI對話核心API，處理用戶訊息並生成智能回應，整合了詐騙檢測、情緒分析和其他各種模組
 2. 關聯頁面：前台主聚合頁「Chat」和後台的「中控台」頁面
-3. 目前狀態：啟用中（主要功能「ai_conversation_chat」結合多種模組執行，包含本地實現的內容安全檢查）
+3. 目前狀態：啟用中（主要功能「ai_conversation_chat」結合多種模組執行，包含本地實現的內容安全檢查；
+   「ai_conversation_chat_stream」以 SSE 逐句串流同樣的回應）
 '''
 
 # 導入AI人格設定
@@ -32,10 +34,18 @@ def check_content_safety(text):
     return {"is_safe": True, "flagged_categories": [], "alert_level": "none", "rejection_response": None, "processing_time": 0.0}
 
 from app.apis.special_response import detect_special_situation, generate_special_response
-from app.apis.values_filter import apply_values_filter
+from app.apis.values_filter import apply_values_filter, StreamingValuesFilter
 from app.apis.abuse_protection import check_abuse, AbuseCheckRequest
 from app.apis.usage_limits import check_usage_limits, UsageCheckRequest, update_user_usage, update_global_stats
 from app.apis.emotional_support import get_emotional_support_message, EmotionalSupportRequest
+from app.apis.keyword_index import register_keywords, has_keyword
+from app.apis.text_normalization import prepare_message
+from app.apis.llm_client import get_shared_anthropic_client, get_shared_async_anthropic_client, llm_call_slot, LLMOverloadedError
+
+# 人道關懷優先檢查 - 嚴重情緒困擾關鍵詞（註冊到共用關鍵詞索引）
+EMOTIONAL_DISTRESS_KEYWORDS = ["想死", "自殺", "輕生", "了結", "活不下去", "沒意思了"]
+EMOTIONAL_DISTRESS_NAMESPACE = "emotional_distress_keywords"
+register_keywords(EMOTIONAL_DISTRESS_NAMESPACE, EMOTIONAL_DISTRESS_KEYWORDS)
 
 # 導入情緒響應編排器
 try:
@@ -48,8 +58,8 @@ except ImportError as e:
 
 # 導入scam_detector模組，如果失敗則提供備用功能
 try:
-    from app.apis.scam_detector import detect_scam
-    print("Successfully imported scam_detector")
+    from app.apis.scam_utils import detect_scam
+    print("Successfully imported scam_utils")
 except ImportError as e:
     print(f"Error importing scam_detector: {e}")
     def detect_scam(message):
@@ -108,26 +118,23 @@ class ConversationResponse(BaseModel):
     emotion_analysis: Optional[Dict[str, Any]] = Field(None, description="Emotional analysis of the message")
 
 # Helper functions
-def get_anthropic_client():
+def get_anthropic_client() -> Anthropic:
     """
-    Create an Anthropic client with the API key from secrets
+    Return the worker's shared Anthropic client (kept alive across calls, see llm_client)
     """
     try:
-        api_key = db.secrets.get("ANTHROPIC_API_KEY")
-        if not api_key:
-            # For development, allow a fallback to an empty key which will trigger a proper error from Anthropic
-            print("WARNING: ANTHROPIC_API_KEY not found in secrets")
-            api_key = ""
-
-        client = Anthropic(api_key=api_key)
-        return client
+        return get_shared_anthropic_client()
     except Exception as e:
         print(f"Error creating Anthropic client: {str(e)}")
         raise e
 
-def get_system_prompt(is_scam: bool = False, scam_info: Optional[Dict[str, Any]] = None, matched_categories: Optional[List[str]] = None, emotion_data: Optional[Dict[str, Any]] = None, response_strategy: Optional[Dict[str, Any]] = None) -> str:
+def get_system_prompt_parts(is_scam: bool = False, scam_info: Optional[Dict[str, Any]] = None, matched_categories: Optional[List[str]] = None, emotion_data: Optional[Dict[str, Any]] = None, response_strategy: Optional[Dict[str, Any]] = None) -> Tuple[str, str]:
     """
-    Get the system prompt for Claude based on whether the message is a scam and any matching categories.
+    Get the system prompt for Claude, split into a stable prefix and a per-message suffix.
+
+    The prefix (persona, formatting rules, 防詐使命 and the scam or general-conversation guide) only
+    changes with the personality config, so it can be reused through prompt caching; the suffix holds
+    the detection result and emotion analysis of this message.
 
     Args:
         is_scam: Whether the message appears to be a scam
@@ -135,7 +142,7 @@ def get_system_prompt(is_scam: bool = False, scam_info: Optional[Dict[str, Any]]
         matched_categories: Categories of scam patterns matched
 
     Returns:
-        The system prompt for Claude
+        Tuple(穩定前綴, 動態後綴)
     """
     # 嘗試從設定中載入人格配置
     try:
@@ -296,50 +303,23 @@ def get_system_prompt(is_scam: bool = False, scam_info: Optional[Dict[str, Any]]
         5. 教育用戶辨識各種詐騙手法
         """
 
-    # 添加情緒回應策略（如果可用）
-    if emotion_data and response_strategy:
-        primary_emotion = emotion_data.get("primary_emotion", "")
-        emotion_intensity = emotion_data.get("emotion_intensity", 0.0)
-        secondary_emotions = emotion_data.get("secondary_emotions", [])
-        requires_support = emotion_data.get("requires_immediate_support", False)
-
-        response_tone = response_strategy.get("response_tone", "balanced")
-        focus_on_emotion = response_strategy.get("focus_on_emotion", False)
-        special_instructions = response_strategy.get("special_instructions", [])
-
-        emotion_prompt = f"""
-
-        【用戶情緒處理指南】
-        我已分析出用戶當前的情緒狀態：
-        - 主要情緒：{primary_emotion}（強度：{emotion_intensity:.1f}/1.0）
-        - 次要情緒：{', '.join(secondary_emotions) if secondary_emotions else '無明顯次要情緒'}
-        - 需要即時情緒支持：{'是' if requires_support else '否'}
-
-        回應策略：
-        - 回應語氣：{response_tone}
-        - {'優先處理情緒需求，然後再提供防詐資訊' if focus_on_emotion else '同時平衡情緒支持和防詐資訊'}
-        """
-
-        if special_instructions:
-            emotion_prompt += """
-
-        特別指示：
-        """
-            for i, instruction in enumerate(special_instructions, 1):
-                emotion_prompt += f"        {i}. {instruction}\n"
-
-        base_prompt += emotion_prompt
-
-    # 添加針對不同情境的指導
+    # 添加針對不同情境的指導（指南本身不隨訊息改變，屬於穩定前綴；偵測結果與情緒分析放在動態後綴）
+    dynamic_prompt = ""
     if is_scam:
         scam_type = scam_info.get("name", "可疑訊息") if scam_info else "可疑訊息"
         matched_cats = "、".join(matched_categories) if matched_categories else "一般可疑模式"
 
-        base_prompt += f"""
+        dynamic_prompt += f"""
 
-        【詐騙訊息回應指南】
-        這則訊息被偵測為可能的詐騙訊息，類型為「{scam_type}」。
+        【偵測結果】
+        類型：「{scam_type}」
         匹配的詐騙特徵類別：{matched_cats}
+        """
+
+        base_prompt += """
+
+        【詐騙訊息回應指南】
+        這則訊息被偵測為可能的詐騙訊息，類型與匹配的詐騙特徵類別列在最後的【偵測結果】。
 
         【核心精神】
         小安是親切的鄰家女孩，以自然且熟悉的方式進行對話並提供支持，而不是居高臨下的「拯救」也不是過度卑微的「求助」。永遠保持自信的態度，相信使用者有能力做出正確決定，你只是提供必要的資訊和建議。避免使用「抱歉」、「對不起」等卑微措辭。避免稱呼用戶為「朋友」，應該用更親近自然的語氣，像是與熟識的鄰居對話。
@@ -397,7 +377,74 @@ def get_system_prompt(is_scam: bool = False, scam_info: Optional[Dict[str, Any]]
         4. 讓用戶感到被尊重和被認可，而非被施捷或指導
         """
 
-    return base_prompt
+    # 添加情緒回應策略（如果可用）
+    if emotion_data and response_strategy:
+        primary_emotion = emotion_data.get("primary_emotion", "")
+        emotion_intensity = emotion_data.get("emotion_intensity", 0.0)
+        secondary_emotions = emotion_data.get("secondary_emotions", [])
+        requires_support = emotion_data.get("requires_immediate_support", False)
+
+        response_tone = response_strategy.get("response_tone", "balanced")
+        focus_on_emotion = response_strategy.get("focus_on_emotion", False)
+        special_instructions = response_strategy.get("special_instructions", [])
+
+        emotion_prompt = f"""
+
+        【用戶情緒處理指南】
+        我已分析出用戶當前的情緒狀態：
+        - 主要情緒：{primary_emotion}（強度：{emotion_intensity:.1f}/1.0）
+        - 次要情緒：{', '.join(secondary_emotions) if secondary_emotions else '無明顯次要情緒'}
+        - 需要即時情緒支持：{'是' if requires_support else '否'}
+
+        回應策略：
+        - 回應語氣：{response_tone}
+        - {'優先處理情緒需求，然後再提供防詐資訊' if focus_on_emotion else '同時平衡情緒支持和防詐資訊'}
+        """
+
+        if special_instructions:
+            emotion_prompt += """
+
+        特別指示：
+        """
+            for i, instruction in enumerate(special_instructions, 1):
+                emotion_prompt += f"        {i}. {instruction}\n"
+
+        dynamic_prompt += emotion_prompt
+
+    return base_prompt, dynamic_prompt
+
+def get_system_prompt(is_scam: bool = False, scam_info: Optional[Dict[str, Any]] = None, matched_categories: Optional[List[str]] = None, emotion_data: Optional[Dict[str, Any]] = None, response_strategy: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Get the system prompt for Claude based on whether the message is a scam and any matching categories.
+
+    Returns:
+        The system prompt for Claude
+    """
+    stable_prompt, dynamic_prompt = get_system_prompt_parts(is_scam, scam_info, matched_categories, emotion_data, response_strategy)
+    return stable_prompt + dynamic_prompt
+
+def build_cached_system(stable_prompt: str, dynamic_prompt: str = "") -> List[Dict[str, Any]]:
+    """系統提示的 content blocks：穩定前綴加上提示快取標記，動態後綴不快取"""
+    blocks = [{"type": "text", "text": stable_prompt, "cache_control": {"type": "ephemeral"}}]
+    if dynamic_prompt.strip():
+        blocks.append({"type": "text", "text": dynamic_prompt})
+    return blocks
+
+def get_cached_system_prompt(is_scam: bool = False, scam_info: Optional[Dict[str, Any]] = None, matched_categories: Optional[List[str]] = None, emotion_data: Optional[Dict[str, Any]] = None, response_strategy: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """與 get_system_prompt 相同的系統提示，以可快取的 content blocks 傳給 messages.create(system=...)"""
+    return build_cached_system(*get_system_prompt_parts(is_scam, scam_info, matched_categories, emotion_data, response_strategy))
+
+def count_usage_tokens(usage) -> Tuple[int, int, int]:
+    """
+    計算一次呼叫的 token 用量
+
+    Returns:
+        Tuple(總 token 數（含從快取讀取與寫入快取的輸入）, 從快取讀取的 token 數, 寫入快取的 token 數)
+    """
+    cache_read_tokens = getattr(usage, "cache_read_input_tokens", None) or 0
+    cache_write_tokens = getattr(usage, "cache_creation_input_tokens", None) or 0
+    total_tokens = usage.input_tokens + cache_read_tokens + cache_write_tokens + usage.output_tokens
+    return total_tokens, cache_read_tokens, cache_write_tokens
 
 def build_prompt(message: str, analysis_result: Dict[str, Any], is_scam: bool, chat_history: Optional[List[Dict[str, str]]] = None) -> List[Dict[str, str]]:
     """
@@ -432,517 +479,728 @@ def build_prompt(message: str, analysis_result: Dict[str, Any], is_scam: bool, c
 
     return messages
 
-@router.post("/chat", response_model=ConversationResponse, summary="AI Conversation Chat", description="Process a message with Claude and return an intelligent, empathetic response")
-def ai_conversation_chat(request: ConversationRequest):
+# 一般回應與情緒支持回應使用的模型
+CHAT_MODEL = "claude-3-haiku-20240307"
+# LLM 忙碌時建議用戶端重試的秒數
+LLM_OVERLOAD_RETRY_AFTER = 5
+
+class ReplyPlan(NamedTuple):
+    """A prepared LLM call and how to turn its text into the chat response"""
+    system: Union[str, List[Dict[str, Any]]]  # 一般回應使用可快取的 content blocks
+    messages: List[Dict[str, str]]
+    max_tokens: int
+    temperature: float
+    analysis: Dict[str, Any]
+    emotion_analysis: Optional[Dict[str, Any]] = None
+    is_scam: bool = False
+    scam_info: Optional[Dict[str, Any]] = None
+    record_usage: bool = True       # 更新用戶與全局的 token 使用統計
+    filter_values: bool = False     # 套用價值觀檢查（一般回應）
+    start_time: Optional[float] = None  # 有值時在 analysis 中回報 processing_time
+    fallback: Optional[Union[ConversationResponse, "ReplyPlan"]] = None  # LLM 呼叫失敗時改用
+
+def with_fallback(plan: Optional[ReplyPlan], fallback: Union[ConversationResponse, ReplyPlan]) -> Union[ConversationResponse, ReplyPlan]:
+    """情緒支持回應失敗時改用一般回應流程的結果"""
+    return plan._replace(fallback=fallback) if plan is not None else fallback
+
+def build_support_plan(message: str, support_prompt: str, max_tokens: int, analysis: Dict[str, Any],
+                       emotion_analysis: Optional[Dict[str, Any]], record_usage: bool,
+                       start_time: Optional[float] = None) -> ReplyPlan:
+    """情緒支持回應：只帶當前訊息與專門的系統提示"""
+    return ReplyPlan(
+        system=support_prompt,
+        messages=[{"role": "user", "content": message}],
+        max_tokens=max_tokens,
+        temperature=0.7,
+        analysis=analysis,
+        emotion_analysis=emotion_analysis,
+        record_usage=record_usage,
+        start_time=start_time
+    )
+
+def build_chat_plan(request: ConversationRequest, is_scam: bool, scam_info: Optional[Dict[str, Any]],
+                    matched_categories: List[str], emotion_analysis: Dict[str, Any],
+                    response_strategy: Dict[str, Any], system_additions: str = "") -> ReplyPlan:
+    """一般回應：對話歷史、含詐騙與情緒分析的系統提示，並依情緒調整 temperature"""
+    # 構建對話歷史
+    messages = build_prompt(
+        message=request.message,
+        analysis_result={"is_scam": is_scam, "scam_info": scam_info, "matched_categories": matched_categories},
+        is_scam=is_scam,
+        chat_history=request.chat_history
+    )
+
+    # 獲取系統提示（增加情緒分析信息）：穩定前綴使用提示快取，每則訊息不同的部分放在後綴
+    stable_prompt, dynamic_prompt = get_system_prompt_parts(
+        is_scam=is_scam,
+        scam_info=scam_info,
+        matched_categories=matched_categories,
+        emotion_data=emotion_analysis,
+        response_strategy=response_strategy
+    )
+
+    # 如果是编排器情况下的混合模式, 加入特殊指令
+    if system_additions:
+        dynamic_prompt += "\n\n" + system_additions
+
+    # 根據情緒分析調整溫度
+    temp_modifier = response_strategy.get("temperature_modifier", 0.0) if response_strategy else 0.0
+    # 調整基礎溫度：情緒強烈時降低randomness，確保更有針對性的回應
+    base_temp = 0.7
+    adjusted_temp = max(0.3, min(0.9, base_temp + temp_modifier))
+
+    return ReplyPlan(
+        system=build_cached_system(stable_prompt, dynamic_prompt),
+        messages=messages,
+        max_tokens=800,
+        temperature=adjusted_temp,
+        analysis={
+            "matched_categories": matched_categories,
+            "confidence": min(1.0, len(matched_categories) * 0.2) if matched_categories else 0.0
+        },
+        emotion_analysis=emotion_analysis,
+        is_scam=is_scam,
+        scam_info=scam_info,
+        filter_values=True
+    )
+
+def prepare_orchestrated_reply(request: ConversationRequest, user_id: str, start_time: float) -> Optional[Union[ConversationResponse, ReplyPlan]]:
     """
-    Process a user message with Anthropic's Claude and return an intelligent, contextual response with scam analysis
+    使用情緒回應編排器決定處理方式；編排器處理失敗時回傳 None，改用原始流程
     """
     try:
-        # 取得用戶ID（如果請求中沒有指定，使用一個代表網頁用戶的通用ID）
-        user_id = request.user_id or "web-user"
+        print("使用增強型情緒回應編排器...進行決策編排")
 
-        # 1. 基礎安全檢查 - HTML標籤檢測
-        if "<html>" in request.message or "</html>" in request.message or "<script>" in request.message or "<" in request.message and ">" in request.message:
-            print("檢測到HTML標籤，返回簡化提示")
+        # 使用編排器決定處理優先級
+        # 對話風險狀態只記在真正的 user_id 上；匿名請求（預設 "web-user"）共用同一個 ID，
+        # 若照樣累積會把所有匿名使用者混成一段對話，因此改用該請求自帶的 chat_history
+        decision_type, context = orchestrate_response(
+            message=request.message,
+            user_id=request.user_id or None,
+            chat_history=request.chat_history
+        )
+        print(f"編排器決策結果: {decision_type}")
+
+        # 處理直接回覆類型 - 無需後續LLM調用
+
+        # 1. 關鍵字匹配
+        if decision_type == "keyword_match":
+            print(f"關鍵詞匹配成功，返回預設回覆: {context['response'][:30]}...")
             return ConversationResponse(
-                response="偵測到程式碼，小安無法回覆!",
+                response=context["response"],
                 is_scam=False,
                 analysis={
-                    "matched_categories": ["html_tags"],
-                    "confidence": 1.0,
+                    "matched_categories": [],
+                    "confidence": 0.0,
+                    "response_type": "keyword_match"
                 },
                 scam_info=None
             )
 
-        # 1.1 基礎安全檢查 - 惡意行為檢查
-        abuse_check_result = check_abuse(AbuseCheckRequest(
-            message=request.message,
-            user_id=user_id,
-            channel="web"
-        ))
-
-        if abuse_check_result.is_abusive:
-            print(f"檢測到惡意行為！用戶: {user_id}, 行為: {abuse_check_result.action}, 違規次數: {abuse_check_result.violation_count}")
+        # 2. 安全違規
+        if decision_type == "safety_violation":
+            safety_result = context["safety_result"]
+            print(f"內容安全檢查失敗: {safety_result['flagged_categories']}")
             return ConversationResponse(
-                response=abuse_check_result.message or "抱歉，我無法回應這類型的訊息。請以尊重的方式溝通，謝謝。",
+                response=safety_result["rejection_response"],
                 is_scam=False,
                 analysis={
-                    "matched_categories": ["abusive_content"],
+                    "matched_categories": safety_result["flagged_categories"],
                     "confidence": 1.0,
-                    "alert_level": "high",
-                    "action": abuse_check_result.action,
-                    "block_duration": abuse_check_result.block_duration
+                    "alert_level": safety_result["alert_level"]
                 },
                 scam_info=None
             )
 
-        # 2. 系統資源管理 - 使用限制檢查
-        usage_result = check_usage_limits(UsageCheckRequest(
-            user_id=user_id,
-            channel="web",
-            token_count=0,  # 先設為0，後續會更新實際的token使用量
-            message=request.message  # 傳遞訊息內容以檢測緊急關鍵詞
-        ))
+        # 3. 危機情況或需要情緒支持（LLM 呼叫失敗時使用後續的一般回應流程）
+        support_plan = None
+        if decision_type == "crisis" or decision_type == "emotional_support":
+            print(f"檢測到{decision_type}情況，使用專門的情緒支持流程")
+
+            # 構建情緒支持的特定系統提示
+            emotion_analysis = context.get("emotion_analysis", {})
+            primary_emotion = emotion_analysis.get("primary_emotion", "強烈情緒")
+            crisis_type = context.get("crisis_result", {}).get("crisis_type", "emotional_distress")
+
+            crisis_prompt_additions = ""
+            if crisis_type == "suicide_risk":
+                crisis_prompt_additions = """
+                這是一個可能的自殺風險情況，你的回應至關重要：
+                1. 表達關心但不要顯得驚慌
+                2. 鼓勵用戶立即聯繫專業心理健康熱線 1925 或 1980
+                3. 提醒他們這些感受是暫時的，幫助是可得的
+                4. 避免長篇大論，提供簡潔、明確的支持
+                5. 保持尊重的態度，避免任何批判性言論
+                """
+            elif crisis_type == "immediate_danger":
+                crisis_prompt_additions = """
+                這是一個可能的人身安全威脅情況：
+                1. 鼓勵用戶立即報警 (110)
+                2. 引導他們尋找安全場所
+                3. 鼓勵與他人保持聯繫
+                4. 避免提供可能使情況惡化的建議
+                """
+            elif crisis_type == "severe_financial_distress":
+                crisis_prompt_additions = """
+                用戶可能經歷嚴重財務困境或詐騙損失：
+                1. 表達理解和支持，避免任何責備語氣
+                2. 提供實用的下一步建議（如報警、銀行止付）
+                3. 強調事情可以慢慢處理，鼓勵正視問題
+                4. 分享找專業金融或法律諮詢的資源
+                """
+
+            support_prompt = f"""
+            你是「防詐小安」，一位16歲的高中生，從小學時期就與用戶住在同一條巷子裡的鄰家女孩。
+
+            用戶正在經歷強烈的{primary_emotion}情緒。你的首要任務是提供情緒支持和理解。
+
+            {crisis_prompt_additions}
+
+            回應要點：
+            1. 用溫暖且理解的語氣，表達對用戶感受的理解和同理心
+            2. 強調用戶不是孤單的，你在這裡支持他/她
+            3. 提供1-2個簡單的、可以立即執行的建議
+            4. 避免過度樂觀或淡化用戶的情緒
+            5. 結尾表達持續支持的意願
+
+            使用全形標點符號，保持溫暖友善的語氣，像對待真正朋友一樣交流。
+            """
 
-        if not usage_result.allowed:
-            print(f"使用限制已達限！用戶: {user_id}, 冷卻時間: {usage_result.cooldown_remaining}秒")
-            return ConversationResponse(
-                response=usage_result.message or "靜置時間到了！你最近的訊息較多，小安需要休息一下。留一點時間給其他人使用吧！",
-                is_scam=False,
+            support_plan = build_support_plan(
+                request.message, support_prompt,
+                max_tokens=600,  # 略微增加以便提供更完整的支持
                 analysis={
-                    "matched_categories": ["usage_limit"],
-                    "confidence": 1.0,
-                    "alert_level": "medium",
-                    "cooldown_remaining": usage_result.cooldown_remaining,
-                    "usage_stats": usage_result.usage_stats
+                    "matched_categories": ["emotional_support", crisis_type],
+                    "confidence": 0.95,
+                    "emergency_level": "high"
                 },
-                scam_info=None
+                emotion_analysis=emotion_analysis,
+                record_usage=True,
+                start_time=start_time
             )
 
-        # 初始化變量 - 用於後續LLM生成
-        use_original_flow = True  # 默認值，如果編排器處理成功會設為False
-        system_additions = ""    # 默認空字符串，可能在混合模式下被更新
-        emotion_analysis = {}     # 情緒分析結果
-        response_strategy = {}    # 回應策略
-        is_scam = False           # 是否為詐騙訊息
-        scam_info = None          # 詐騙信息詳情
-        matched_categories = []   # 匹配的詐騙類別
-        start_time = time.time()  # 記錄處理開始時間
-
-        # 使用情緒回應編排器優化決策 (如果可用)
-        if HAS_ORCHESTRATOR:
-            try:
-                print("使用增強型情緒回應編排器...進行決策編排")
-
-                # 使用編排器決定處理優先級
-                decision_type, context = orchestrate_response(
-                    message=request.message,
-                    user_id=user_id,
-                    chat_history=request.chat_history
+        # 4. 特殊情境檢測
+        if decision_type == "special_situation":
+            special_situation = context.get("special_situation", {})
+            situation_rule = special_situation.get("rule")
+            if situation_rule:
+                print(f"檢測到特殊情境: {situation_rule.id}")
+                response_text = generate_special_response(situation_rule)
+                return ConversationResponse(
+                    response=response_text,
+                    is_scam=False,
+                    analysis={
+                        "matched_categories": [situation_rule.id],
+                        "confidence": 1.0,
+                        "emergency_level": situation_rule.emergency_level,
+                        "processing_time": time.time() - start_time
+                    },
+                    scam_info=None,
+                    emotion_analysis=context.get("emotion_analysis")
                 )
-                print(f"編排器決策結果: {decision_type}")
-
-                # 處理直接回覆類型 - 無需後續LLM調用
-
-                # 1. 關鍵字匹配
-                if decision_type == "keyword_match":
-                    print(f"關鍵詞匹配成功，返回預設回覆: {context['response'][:30]}...")
-                    return ConversationResponse(
-                        response=context["response"],
-                        is_scam=False,
-                        analysis={
-                            "matched_categories": [],
-                            "confidence": 0.0,
-                            "response_type": "keyword_match"
-                        },
-                        scam_info=None
-                    )
 
-                # 2. 安全違規
-                if decision_type == "safety_violation":
-                    safety_result = context["safety_result"]
-                    print(f"內容安全檢查失敗: {safety_result['flagged_categories']}")
-                    return ConversationResponse(
-                        response=safety_result["rejection_response"],
-                        is_scam=False,
-                        analysis={
-                            "matched_categories": safety_result["flagged_categories"],
-                            "confidence": 1.0,
-                            "alert_level": safety_result["alert_level"]
-                        },
-                        scam_info=None
-                    )
+        # 5. 準備AI對話的背景 - 使用編排器整合結果
+        system_additions = ""
+        try:
+            ai_context = integrate_with_ai_conversation(decision_type, context)
+            is_scam = ai_context.get("is_scam", False)
+            scam_info = ai_context.get("scam_info")
+            matched_categories = ai_context.get("matched_categories", [])
+            emotion_analysis = ai_context.get("emotion_analysis", {})
+            response_strategy = context.get("response_strategy", {})
+
+            # 混合模式 - 情緒與詐騙
+            if decision_type == "emotional_scam_hybrid":
+                print("使用情緒-詐騙混合模式生成回應")
+                emotion_first = ai_context.get("emotion_first", True)
+
+                if emotion_first:
+                    system_additions = """
+                    這是一個情緒-詐騙混合情況，需要優先處理用戶的情緒需求，同時提供詐騙警告：
+                    1. 先表達理解用戶的情緒，給予支持
+                    2. 溫和過渡到詐騙風險話題
+                    3. 清晰說明詐騙風險，但保持友善語氣
+                    4. 以支持性語句結尾
+                    """
+                else:
+                    system_additions = """
+                    這是一個情緒-詐騙混合情況，需要平衡警告和情緒支持：
+                    1. 簡短明確地提出詐騙風險
+                    2. 立即轉向情緒支持
+                    3. 提供具體建議時融入對情緒的理解
+                    4. 以溫暖鼓勵的語氣結尾
+                    """
 
-                # 3. 危機情況或需要情緒支持
-                if decision_type == "crisis" or decision_type == "emotional_support":
-                    print(f"檢測到{decision_type}情況，使用專門的情緒支持流程")
-                    try:
-                        # 獲取Anthropic客戶端
-                        client = get_anthropic_client()
-
-                        # 構建情緒支持的特定系統提示
-                        emotion_analysis = context.get("emotion_analysis", {})
-                        primary_emotion = emotion_analysis.get("primary_emotion", "強烈情緒")
-                        crisis_type = context.get("crisis_result", {}).get("crisis_type", "emotional_distress")
-
-                        crisis_prompt_additions = ""
-                        if crisis_type == "suicide_risk":
-                            crisis_prompt_additions = """
-                            這是一個可能的自殺風險情況，你的回應至關重要：
-                            1. 表達關心但不要顯得驚慌
-                            2. 鼓勵用戶立即聯繫專業心理健康熱線 1925 或 1980
-                            3. 提醒他們這些感受是暫時的，幫助是可得的
-                            4. 避免長篇大論，提供簡潔、明確的支持
-                            5. 保持尊重的態度，避免任何批判性言論
-                            """
-                        elif crisis_type == "immediate_danger":
-                            crisis_prompt_additions = """
-                            這是一個可能的人身安全威脅情況：
-                            1. 鼓勵用戶立即報警 (110)
-                            2. 引導他們尋找安全場所
-                            3. 鼓勵與他人保持聯繫
-                            4. 避免提供可能使情況惡化的建議
-                            """
-                        elif crisis_type == "severe_financial_distress":
-                            crisis_prompt_additions = """
-                            用戶可能經歷嚴重財務困境或詐騙損失：
-                            1. 表達理解和支持，避免任何責備語氣
-                            2. 提供實用的下一步建議（如報警、銀行止付）
-                            3. 強調事情可以慢慢處理，鼓勵正視問題
-                            4. 分享找專業金融或法律諮詢的資源
-                            """
-
-                        support_prompt = f"""
-                        你是「防詐小安」，一位16歲的高中生，從小學時期就與用戶住在同一條巷子裡的鄰家女孩。
-
-                        用戶正在經歷強烈的{primary_emotion}情緒。你的首要任務是提供情緒支持和理解。
-
-                        {crisis_prompt_additions}
-
-                        回應要點：
-                        1. 用溫暖且理解的語氣，表達對用戶感受的理解和同理心
-                        2. 強調用戶不是孤單的，你在這裡支持他/她
-                        3. 提供1-2個簡單的、可以立即執行的建議
-                        4. 避免過度樂觀或淡化用戶的情緒
-                        5. 結尾表達持續支持的意願
-
-                        使用全形標點符號，保持溫暖友善的語氣，像對待真正朋友一樣交流。
-                        """
-
-                        # 調用LLM生成情緒支持回應
-                        response = client.messages.create(
-                            model="claude-3-haiku-20240307",
-                            max_tokens=600,  # 略微增加以便提供更完整的支持
-                            temperature=0.7,
-                            system=support_prompt,
-                            messages=[{"role": "user", "content": request.message}]
-                        )
-
-                        support_message = response.content[0].text
-
-                        # 更新用戶和全局使用統計
-                        prompt_tokens = response.usage.input_tokens
-                        completion_tokens = response.usage.output_tokens
-                        total_tokens = prompt_tokens + completion_tokens
-                        update_user_usage(user_id, total_tokens)
-                        update_global_stats(total_tokens)
-
-                        # 返回情緒支持回應
-                        return ConversationResponse(
-                            response=support_message,
-                            is_scam=False,
-                            analysis={
-                                "matched_categories": ["emotional_support", crisis_type],
-                                "confidence": 0.95,
-                                "emergency_level": "high",
-                                "processing_time": time.time() - start_time
-                            },
-                            scam_info=None,
-                            emotion_analysis=emotion_analysis
-                        )
-                    except Exception as e:
-                        print(f"生成危機/情緒支持回應失敗: {e}，將使用一般回應流程")
-                        # 如果LLM生成失敗，繼續使用一般回應流程
-                        pass
-
-                # 4. 特殊情境檢測
-                if decision_type == "special_situation":
-                    special_situation = context.get("special_situation", {})
-                    situation_rule = special_situation.get("rule")
-                    if situation_rule:
-                        print(f"檢測到特殊情境: {situation_rule.id}")
-                        response_text = generate_special_response(situation_rule)
-                        return ConversationResponse(
-                            response=response_text,
-                            is_scam=False,
-                            analysis={
-                                "matched_categories": [situation_rule.id],
-                                "confidence": 1.0,
-                                "emergency_level": situation_rule.emergency_level,
-                                "processing_time": time.time() - start_time
-                            },
-                            scam_info=None,
-                            emotion_analysis=context.get("emotion_analysis")
-                        )
-
-                # 5. 準備AI對話的背景 - 使用編排器整合結果
-                try:
-                    ai_context = integrate_with_ai_conversation(decision_type, context)
-                    is_scam = ai_context.get("is_scam", False)
-                    scam_info = ai_context.get("scam_info")
-                    matched_categories = ai_context.get("matched_categories", [])
-                    emotion_analysis = ai_context.get("emotion_analysis", {})
-                    response_strategy = context.get("response_strategy", {})
-
-                    # 混合模式 - 情緒與詐騙
-                    if decision_type == "emotional_scam_hybrid":
-                        print("使用情緒-詐騙混合模式生成回應")
-                        emotion_first = ai_context.get("emotion_first", True)
-
-                        if emotion_first:
-                            system_additions = """
-                            這是一個情緒-詐騙混合情況，需要優先處理用戶的情緒需求，同時提供詐騙警告：
-                            1. 先表達理解用戶的情緒，給予支持
-                            2. 溫和過渡到詐騙風險話題
-                            3. 清晰說明詐騙風險，但保持友善語氣
-                            4. 以支持性語句結尾
-                            """
-                        else:
-                            system_additions = """
-                            這是一個情緒-詐騙混合情況，需要平衡警告和情緒支持：
-                            1. 簡短明確地提出詐騙風險
-                            2. 立即轉向情緒支持
-                            3. 提供具體建議時融入對情緒的理解
-                            4. 以溫暖鼓勵的語氣結尾
-                            """
-
-                    # 編排器處理成功，不使用原始流程
-                    use_original_flow = False
+        except Exception as e:
+            print(f"編排器集成錯誤: {e}，回退到基本分析")
+            import traceback
+            print(traceback.format_exc())
 
-                except Exception as e:
-                    print(f"編排器集成錯誤: {e}，回退到基本分析")
-                    import traceback
-                    print(traceback.format_exc())
-
-                    # 執行基本分析作為備選
-                    is_scam, scam_info, matched_categories = detect_scam(request.message)
-                    emotion_analysis = analyze_emotion(
-                        message=request.message,
-                        chat_history=request.chat_history
-                    )
-                    response_strategy = get_emotional_response_strategy(emotion_analysis)
-
-                    # 雖然集成出錯，但已有分析結果，所以不使用原始流程
-                    use_original_flow = False
-
-            except Exception as e:
-                print(f"編排器處理錯誤: {e}，回退到原始流程")
-                import traceback
-                print(traceback.format_exc())
-                # 完全回退到原始流程
-                use_original_flow = True
-
-        if use_original_flow:
-            # 原有的流程 - 不使用編排器
-            # 2. 情緒分析與危機監測
-            print("進行情緒分析...")
-            start_time = time.time()
+            # 執行基本分析作為備選（雖然集成出錯，但已有分析結果，所以不使用原始流程）
+            is_scam, scam_info, matched_categories = detect_scam(request.message)
             emotion_analysis = analyze_emotion(
                 message=request.message,
                 chat_history=request.chat_history
             )
-
-            # 根據情緒分析結果確定回應策略
             response_strategy = get_emotional_response_strategy(emotion_analysis)
-            print(f"情緒分析完成，耗時: {time.time() - start_time:.2f}秒，主要情緒: {emotion_analysis['primary_emotion']}, 強度: {emotion_analysis['emotion_intensity']:.2f}")
-
-            # 2.1 人道關懷優先檢查 - 嚴重情緒困擾
-            emotional_distress_keywords = ["想死", "自殺", "輕生", "了結", "活不下去", "沒意思了"]
-            has_distress_keywords = any(keyword in request.message for keyword in emotional_distress_keywords)
 
-            if (emotion_analysis.get("requires_immediate_support", False) and emotion_analysis.get("emotion_intensity", 0) > 0.7) or has_distress_keywords:
-                print("檢測到需要立即情緒支持，優先提供情緒回應...")
+    except Exception as e:
+        print(f"編排器處理錯誤: {e}，回退到原始流程")
+        import traceback
+        print(traceback.format_exc())
+        # 完全回退到原始流程
+        return None
 
-                try:
-                    # 獲取Anthropic客戶端
-                    client = get_anthropic_client()
+    return with_fallback(support_plan, build_chat_plan(
+        request, is_scam, scam_info, matched_categories, emotion_analysis, response_strategy, system_additions
+    ))
+
+def prepare_basic_reply(request: ConversationRequest) -> Union[ConversationResponse, ReplyPlan]:
+    """原有的流程 - 不使用編排器"""
+    # 2. 情緒分析與危機監測
+    print("進行情緒分析...")
+    start_time = time.time()
+    emotion_analysis = analyze_emotion(
+        message=request.message,
+        chat_history=request.chat_history
+    )
+
+    # 根據情緒分析結果確定回應策略
+    response_strategy = get_emotional_response_strategy(emotion_analysis)
+    print(f"情緒分析完成，耗時: {time.time() - start_time:.2f}秒，主要情緒: {emotion_analysis['primary_emotion']}, 強度: {emotion_analysis['emotion_intensity']:.2f}")
+
+    # 2.1 人道關懷優先檢查 - 嚴重情緒困擾（LLM 呼叫失敗時使用後續的一般回應流程）
+    has_distress_keywords = has_keyword(request.message, EMOTIONAL_DISTRESS_NAMESPACE)
+
+    support_plan = None
+    if (emotion_analysis.get("requires_immediate_support", False) and emotion_analysis.get("emotion_intensity", 0) > 0.7) or has_distress_keywords:
+        print("檢測到需要立即情緒支持，優先提供情緒回應...")
+
+        # 構建情緒支持的特定系統提示
+        support_prompt = f"""
+        你是「防詐小安」，一位16歲的高中生，從小學時期就與用戶住在同一條巷子裡的鄰家女孩。
+
+        用戶正在經歷強烈的情緒困擾，可能包含{emotion_analysis.get("primary_emotion")}。作為一個善解人意的朋友，你需要提供情緒支持。
+
+        回應要點：
+        1. 用溫暖且理解的語氣，表達對用戶感受的理解和同理心
+        2. 強調用戶不是孤單的，你在這裡支持他/她
+        3. 提供1-2個簡單的、可以立即執行的建議來緩解當前情緒
+        4. 如果涉及自殺或極度負面情緒，鼓勵用戶尋求專業幫助
+        5. 結尾表達持續支持的意願
+
+        使用全形標點符號，保持溫暖友善的語氣，像對待真正朋友一樣交流。
+        """
 
-                    # 構建情緒支持的特定系統提示
-                    support_prompt = f"""
-                    你是「防詐小安」，一位16歲的高中生，從小學時期就與用戶住在同一條巷子裡的鄰家女孩。
+        support_plan = build_support_plan(
+            request.message, support_prompt,
+            max_tokens=500,
+            analysis={
+                "matched_categories": ["emotional_support"],
+                "confidence": 0.95,
+            },
+            emotion_analysis=emotion_analysis,
+            record_usage=False
+        )
 
-                    用戶正在經歷強烈的情緒困擾，可能包含{emotion_analysis.get("primary_emotion")}。作為一個善解人意的朋友，你需要提供情緒支持。
+    # 2.2 人道關懷優先檢查 - 特殊情境檢查（被詐騙後等）
+    situation_detected, situation_rule = detect_special_situation(request.message)
+    if situation_detected and situation_rule:
+        print(f"檢測到特殊情境: {situation_rule.id}")
+        response_text = generate_special_response(situation_rule)
+        return with_fallback(support_plan, ConversationResponse(
+            response=response_text,
+            is_scam=False,
+            analysis={
+                "matched_categories": [situation_rule.id],
+                "confidence": 1.0,
+                "emergency_level": situation_rule.emergency_level
+            },
+            scam_info=None,
+            emotion_analysis=emotion_analysis
+        ))
 
-                    回應要點：
-                    1. 用溫暖且理解的語氣，表達對用戶感受的理解和同理心
-                    2. 強調用戶不是孤單的，你在這裡支持他/她
-                    3. 提供1-2個簡單的、可以立即執行的建議來緩解當前情緒
-                    4. 如果涉及自殺或極度負面情緒，鼓勵用戶尋求專業幫助
-                    5. 結尾表達持續支持的意願
+    # 4.1 內容分析 - 關鍵字完全匹配
+    keyword_response = get_response_for_keyword(request.message)
+    if keyword_response:
+        print(f"關鍵詞完全匹配成功，返回預設回覆: {keyword_response[:30]}...")
+        return with_fallback(support_plan, ConversationResponse(
+            response=keyword_response,
+            is_scam=False,
+            analysis={
+                "matched_categories": [],
+                "confidence": 0.0,
+                "response_type": "keyword_match"
+            },
+            scam_info=None,
+            emotion_analysis=emotion_analysis
+        ))
 
-                    使用全形標點符號，保持溫暖友善的語氣，像對待真正朋友一樣交流。
-                    """
+    # 4.2 內容分析 - 內容安全問題檢查
+    safety_result = check_content_safety(request.message)
+    if not safety_result["is_safe"] and safety_result["rejection_response"]:
+        print(f"內容安全檢查失敗: {safety_result['flagged_categories']}")
+        return with_fallback(support_plan, ConversationResponse(
+            response=safety_result["rejection_response"],
+            is_scam=False,
+            analysis={
+                "matched_categories": safety_result["flagged_categories"],
+                "confidence": 1.0,
+                "alert_level": safety_result["alert_level"]
+            },
+            scam_info=None,
+            emotion_analysis=emotion_analysis
+        ))
 
-                    # 調用LLM生成情緒支持回應
-                    response = client.messages.create(
-                        model="claude-3-haiku-20240307",
-                        max_tokens=500,
-                        temperature=0.7,
-                        system=support_prompt,
-                        messages=[{"role": "user", "content": request.message}]
-                    )
+    # 4.3 內容分析 - 詐騙偵測
+    is_scam, scam_info, matched_categories = detect_scam(request.message)
 
-                    support_message = response.content[0].text
-
-                    # 返回情緒支持回應
-                    return ConversationResponse(
-                        response=support_message,
-                        is_scam=False,
-                        analysis={
-                            "matched_categories": ["emotional_support"],
-                            "confidence": 0.95,
-                        },
-                        scam_info=None,
-                        emotion_analysis=emotion_analysis
-                    )
-                except Exception as e:
-                    print(f"生成情緒支持回應失敗: {e}，將使用一般回應流程")
-                    # 如果LLM生成失敗，繼續使用一般回應流程
-                    pass
+    return with_fallback(support_plan, build_chat_plan(
+        request, is_scam, scam_info, matched_categories, emotion_analysis, response_strategy
+    ))
 
-            # 2.2 人道關懷優先檢查 - 特殊情境檢查（被詐騙後等）
-            situation_detected, situation_rule = detect_special_situation(request.message)
-            if situation_detected and situation_rule:
-                print(f"檢測到特殊情境: {situation_rule.id}")
-                response_text = generate_special_response(situation_rule)
-                return ConversationResponse(
-                    response=response_text,
-                    is_scam=False,
-                    analysis={
-                        "matched_categories": [situation_rule.id],
-                        "confidence": 1.0,
-                        "emergency_level": situation_rule.emergency_level
-                    },
-                    scam_info=None,
-                    emotion_analysis=emotion_analysis
-                )
+def prepare_chat_reply(request: ConversationRequest, user_id: str) -> Union[ConversationResponse, ReplyPlan]:
+    """
+    LLM 呼叫之前的所有處理（安全檢查、使用限制、編排器或原始流程的分析）
 
-            # 4.1 內容分析 - 關鍵字完全匹配
-            keyword_response = get_response_for_keyword(request.message)
-            if keyword_response:
-                print(f"關鍵詞完全匹配成功，返回預設回覆: {keyword_response[:30]}...")
-                return ConversationResponse(
-                    response=keyword_response,
-                    is_scam=False,
-                    analysis={
-                        "matched_categories": [],
-                        "confidence": 0.0,
-                        "response_type": "keyword_match"
-                    },
-                    scam_info=None,
-                    emotion_analysis=emotion_analysis
-                )
+    包含同步的儲存空間讀寫與偵測，非同步端點以 asyncio.to_thread 執行，不佔住事件迴圈
 
-            # 4.2 內容分析 - 內容安全問題檢查
-            safety_result = check_content_safety(request.message)
-            if not safety_result["is_safe"] and safety_result["rejection_response"]:
-                print(f"內容安全檢查失敗: {safety_result['flagged_categories']}")
-                return ConversationResponse(
-                    response=safety_result["rejection_response"],
-                    is_scam=False,
-                    analysis={
-                        "matched_categories": safety_result["flagged_categories"],
-                        "confidence": 1.0,
-                        "alert_level": safety_result["alert_level"]
-                    },
-                    scam_info=None,
-                    emotion_analysis=emotion_analysis
-                )
-
-            # 4.3 內容分析 - 詐騙偵測
-            is_scam, scam_info, matched_categories = detect_scam(request.message)
+    Returns:
+        不需要 LLM 的直接回覆，或準備好的 LLM 呼叫
+    """
+    # 0. 訊息正規化（每則訊息只做一次，供後續各項偵測共用）
+    prepare_message(request.message)
 
-            analysis_result = {
-                "is_scam": is_scam,
-                "scam_info": scam_info,
-                "matched_categories": matched_categories
-            }
+    # 1. 基礎安全檢查 - HTML標籤檢測
+    if "<html>" in request.message or "</html>" in request.message or "<script>" in request.message or "<" in request.message and ">" in request.message:
+        print("檢測到HTML標籤，返回簡化提示")
+        return ConversationResponse(
+            response="偵測到程式碼，小安無法回覆!",
+            is_scam=False,
+            analysis={
+                "matched_categories": ["html_tags"],
+                "confidence": 1.0,
+            },
+            scam_info=None
+        )
 
-        # 獲取Anthropic客戶端
-        client = get_anthropic_client()
+    # 1.1 基礎安全檢查 - 惡意行為檢查
+    abuse_check_result = check_abuse(AbuseCheckRequest(
+        message=request.message,
+        user_id=user_id,
+        channel="web"
+    ))
 
-        # 構建對話歷史
-        messages = build_prompt(
-            message=request.message,
-            analysis_result={"is_scam": is_scam, "scam_info": scam_info, "matched_categories": matched_categories},
-            is_scam=is_scam,
-            chat_history=request.chat_history
+    if abuse_check_result.is_abusive:
+        print(f"檢測到惡意行為！用戶: {user_id}, 行為: {abuse_check_result.action}, 違規次數: {abuse_check_result.violation_count}")
+        return ConversationResponse(
+            response=abuse_check_result.message or "抱歉，我無法回應這類型的訊息。請以尊重的方式溝通，謝謝。",
+            is_scam=False,
+            analysis={
+                "matched_categories": ["abusive_content"],
+                "confidence": 1.0,
+                "alert_level": "high",
+                "action": abuse_check_result.action,
+                "block_duration": abuse_check_result.block_duration
+            },
+            scam_info=None
         )
 
-        # 獲取系統提示（增加情緒分析信息）
-        system_prompt = get_system_prompt(
-            is_scam=is_scam,
-            scam_info=scam_info,
-            matched_categories=matched_categories,
-            emotion_data=emotion_analysis,
-            response_strategy=response_strategy
+    # 2. 系統資源管理 - 使用限制檢查
+    usage_result = check_usage_limits(UsageCheckRequest(
+        user_id=user_id,
+        channel="web",
+        token_count=0,  # 先設為0，後續會更新實際的token使用量
+        message=request.message  # 傳遞訊息內容以檢測緊急關鍵詞
+    ))
+
+    if not usage_result.allowed:
+        print(f"使用限制已達限！用戶: {user_id}, 冷卻時間: {usage_result.cooldown_remaining}秒")
+        return ConversationResponse(
+            response=usage_result.message or "靜置時間到了！你最近的訊息較多，小安需要休息一下。留一點時間給其他人使用吧！",
+            is_scam=False,
+            analysis={
+                "matched_categories": ["usage_limit"],
+                "confidence": 1.0,
+                "alert_level": "medium",
+                "cooldown_remaining": usage_result.cooldown_remaining,
+                "usage_stats": usage_result.usage_stats
+            },
+            scam_info=None
         )
 
-        # 如果是编排器情况下的混合模式, 加入特殊指令
-        if HAS_ORCHESTRATOR and "system_additions" in locals() and system_additions:
-            system_prompt += "\n\n" + system_additions
+    # 使用情緒回應編排器優化決策 (如果可用)，失敗時使用原始流程
+    if HAS_ORCHESTRATOR:
+        prepared = prepare_orchestrated_reply(request, user_id, time.time())
+        if prepared is not None:
+            return prepared
+    return prepare_basic_reply(request)
+
+def record_token_usage(user_id: str, total_tokens: int, cache_read_tokens: int = 0, cache_write_tokens: int = 0) -> None:
+    """更新用戶和全局使用統計（含提示快取的命中與 token 數）"""
+    update_user_usage(user_id, total_tokens)
+    update_global_stats(total_tokens, cache_read_tokens, cache_write_tokens)
+
+def finalize_reply_text(plan: ReplyPlan, ai_response: str, user_message: str) -> Tuple[str, Optional[List[str]]]:
+    """一般回應套用價值觀檢查，並確保回應有實質內容"""
+    if not plan.filter_values:
+        return ai_response, None
+
+    # 應用價值觀檢查並調整回應
+    filtered_response, applied_principles = apply_values_filter(ai_response, user_message)
+    if applied_principles:
+        print(f"價值觀調整已應用: {', '.join(applied_principles)}")
+
+    # 最終確保回應有實質內容
+    if re.match(r'^[\s\.,，。、？！""…]{0,20}$', filtered_response):
+        print("警告：檢測到無實質內容的回應，使用默認回應")
+        filtered_response = "抱歉，我需要想一下這個問題。你能告訴我更多相關情況嗎？這樣我才能給你更好的建議。😊"
+        if applied_principles:
+            applied_principles.append("emergency_fallback")
+        else:
+            applied_principles = ["emergency_fallback"]
+    return filtered_response, applied_principles
+
+def build_reply_response(plan: ReplyPlan, text: str, applied_principles: Optional[List[str]]) -> ConversationResponse:
+    analysis = dict(plan.analysis)
+    if plan.start_time is not None:
+        analysis["processing_time"] = time.time() - plan.start_time
+    if plan.filter_values:
+        analysis["values_filtered"] = applied_principles if applied_principles else None
+    return ConversationResponse(
+        response=text,
+        is_scam=plan.is_scam,
+        analysis=analysis,
+        scam_info=plan.scam_info,
+        emotion_analysis=plan.emotion_analysis
+    )
+
+async def run_reply_plan(plan: ReplyPlan, user_id: str, user_message: str) -> ConversationResponse:
+    """
+    以 AsyncAnthropic 執行準備好的 LLM 呼叫（受 worker 的併發上限限制）
 
-        # 呼叫Claude API，根據情緒調整temperature
+    Raises:
+        LLMOverloadedError: 併發名額已滿且等待佇列已滿或逾時
+    """
+    try:
+        client = await get_shared_async_anthropic_client()
         start_time = time.time()
         print("調用Claude API生成回應...")
-        # 根據情緒分析調整溫度
-        temp_modifier = response_strategy.get("temperature_modifier", 0.0) if response_strategy else 0.0
-        # 調整基礎溫度：情緒強烈時降低randomness，確保更有針對性的回應
-        base_temp = 0.7
-        adjusted_temp = max(0.3, min(0.9, base_temp + temp_modifier))
-        print(f"使用溫度值: {adjusted_temp:.2f}")
-
-        # 打印系統提示的部分內容（僅用於調試）
-        print(f"系統提示預覽（前100個字符）: {system_prompt[:100]}...")
-        message = client.messages.create(
-            model="claude-3-haiku-20240307",
-            max_tokens=800,
-            temperature=adjusted_temp,
-            system=system_prompt,
-            messages=messages
+        if plan.filter_values:
+            print(f"使用溫度值: {plan.temperature:.2f}")
+            # 打印系統提示的部分內容（僅用於調試）
+            system_text = plan.system if isinstance(plan.system, str) else "".join(block["text"] for block in plan.system)
+            print(f"系統提示預覽（前100個字符）: {system_text[:100]}...")
+        async with llm_call_slot():
+            message = await client.messages.create(
+                model=CHAT_MODEL,
+                max_tokens=plan.max_tokens,
+                temperature=plan.temperature,
+                system=plan.system,
+                messages=plan.messages
+            )
+        print(f"Claude API response time: {time.time() - start_time:.2f} seconds")
+    except LLMOverloadedError:
+        raise
+    except Exception as e:
+        if plan.fallback is None:
+            raise
+        print(f"生成情緒支持回應失敗: {e}，將使用一般回應流程")
+        if isinstance(plan.fallback, ConversationResponse):
+            return plan.fallback
+        return await run_reply_plan(plan.fallback, user_id, user_message)
+
+    # 估算token使用量
+    total_tokens, cache_read_tokens, cache_write_tokens = count_usage_tokens(message.usage)
+    print(f"Token usage - prompt: {message.usage.input_tokens}, cache read: {cache_read_tokens}, cache write: {cache_write_tokens}, completion: {message.usage.output_tokens}, total: {total_tokens}")
+
+    # 更新用戶和全局使用統計（同步的儲存空間寫入，不佔住事件迴圈）
+    if plan.record_usage:
+        await asyncio.to_thread(record_token_usage, user_id, total_tokens, cache_read_tokens, cache_write_tokens)
+
+    # 提取回應
+    ai_response = message.content[0].text
+    text, applied_principles = finalize_reply_text(plan, ai_response, user_message)
+    return build_reply_response(plan, text, applied_principles)
+
+def overload_exception(error: LLMOverloadedError) -> HTTPException:
+    """LLM 併發名額與等待佇列已滿時回覆 503，並建議重試時間"""
+    print(f"LLM overloaded: {str(error)}")
+    return HTTPException(
+        status_code=503,
+        detail="小安現在有點忙，請稍等幾秒再傳一次訊息。",
+        headers={"Retry-After": str(LLM_OVERLOAD_RETRY_AFTER)}
+    )
+
+def conversation_error(error: Exception) -> HTTPException:
+    error_message = str(error)
+    print(f"Error in AI conversation: {error_message}")
+
+    if "api_key" in error_message.lower():
+        return HTTPException(
+            status_code=500,
+            detail="Anthropic API key configuration error. Please check your API key settings."
         )
-        response_time = time.time() - start_time
-        print(f"Claude API response time: {response_time:.2f} seconds")
-
-        # 估算token使用量
-        prompt_tokens = message.usage.input_tokens
-        completion_tokens = message.usage.output_tokens
-        total_tokens = prompt_tokens + completion_tokens
-        print(f"Token usage - prompt: {prompt_tokens}, completion: {completion_tokens}, total: {total_tokens}")
-
-        # 更新用戶和全局使用統計
-        update_user_usage(user_id, total_tokens)
-        update_global_stats(total_tokens)
+    return HTTPException(
+        status_code=500,
+        detail=f"Error processing conversation: {error_message}"
+    )
 
-        # 提取回應
-        ai_response = message.content[0].text
+@router.post("/chat", response_model=ConversationResponse, summary="AI Conversation Chat", description="Process a message with Claude and return an intelligent, empathetic response")
+async def ai_conversation_chat(request: ConversationRequest):
+    """
+    Process a user message with Anthropic's Claude and return an intelligent, contextual response with scam analysis
 
-        # 應用價值觀檢查並調整回應
-        filtered_response, applied_principles = apply_values_filter(ai_response, request.message)
-        if applied_principles:
-            print(f"價值觀調整已應用: {', '.join(applied_principles)}")
+    The pre-LLM checks run in a worker thread; the Claude call itself is awaited on the shared
+    AsyncAnthropic client, so a waiting conversation does not hold a threadpool thread.
+    Returns 503 with Retry-After when the worker's LLM call queue is full.
+    """
+    try:
+        # 取得用戶ID（如果請求中沒有指定，使用一個代表網頁用戶的通用ID）
+        user_id = request.user_id or "web-user"
 
-        # 最終確保回應有實質內容
-        if re.match(r'^[\s\.,，。、？！""…]{0,20}$', filtered_response):
-            print("警告：檢測到無實質內容的回應，使用默認回應")
-            filtered_response = "抱歉，我需要想一下這個問題。你能告訴我更多相關情況嗎？這樣我才能給你更好的建議。😊"
+        prepared = await asyncio.to_thread(prepare_chat_reply, request, user_id)
+        if isinstance(prepared, ConversationResponse):
+            return prepared
+        return await run_reply_plan(prepared, user_id, request.message)
+    except LLMOverloadedError as e:
+        raise overload_exception(e) from e
+    except Exception as e:
+        raise conversation_error(e) from e
+
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    """Server-Sent Events 格式的一個事件"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def reply_metadata(reply: Union[ConversationResponse, ReplyPlan]) -> Dict[str, Any]:
+    """在第一段文字之前送出的分析結果"""
+    return {
+        "is_scam": reply.is_scam,
+        "scam_info": reply.scam_info,
+        "emotion_analysis": reply.emotion_analysis,
+        "analysis": reply.analysis
+    }
+
+async def stream_reply_plan(plan: ReplyPlan, events, user_id: str, user_message: str) -> AsyncIterator[str]:
+    """
+    轉送 Claude 的串流回應：一般回應以完整句子為單位經過價值觀檢查後放行，
+    情緒支持回應直接轉送；回應完成時送出完整回應，讀完串流後以實際用量更新使用統計
+    """
+    values_filter = StreamingValuesFilter(user_message) if plan.filter_values else None
+    chunks = []
+    finished = False
+    prompt_tokens = cache_read_tokens = cache_write_tokens = completion_tokens = text_deltas = 0
+
+    def finish_response() -> List[str]:
+        """送出價值觀檢查保留的最後一段文字與 done 事件"""
+        finish_events = []
+        applied_principles = None
+        if values_filter:
+            text = values_filter.finish()
+            if text:
+                chunks.append(text)
+                finish_events.append(sse_event("delta", {"text": text}))
+            applied_principles = values_filter.applied_principles or None
             if applied_principles:
-                applied_principles.append("emergency_fallback")
-            else:
-                applied_principles = ["emergency_fallback"]
+                print(f"價值觀調整已應用: {', '.join(applied_principles)}")
+        response = build_reply_response(plan, "".join(chunks), applied_principles)
+        finish_events.append(sse_event("done", response.dict()))
+        return finish_events
+
+    async for event in events:
+        if event.type == "message_start":
+            start_usage = event.message.usage
+            _, cache_read_tokens, cache_write_tokens = count_usage_tokens(start_usage)
+            prompt_tokens = start_usage.input_tokens + cache_read_tokens + cache_write_tokens
+        elif event.type == "message_delta":
+            completion_tokens = event.usage.output_tokens
+        elif event.type == "content_block_delta" and event.delta.type == "text_delta":
+            text_deltas += 1
+            if finished:
+                continue
+            text = values_filter.feed(event.delta.text) if values_filter else event.delta.text
+            if text:
+                chunks.append(text)
+                yield sse_event("delta", {"text": text})
+            if values_filter and values_filter.truncated:
+                # 簡潔性原則已截斷回應：立即送出完整回應，之後的文字不再轉送，
+                # 但繼續讀完串流，以最後的 message_delta 取得實際的輸出用量
+                finished = True
+                for finish_event in finish_response():
+                    yield finish_event
+
+    if not finished:
+        for finish_event in finish_response():
+            yield finish_event
+
+    # 串流中斷而沒有最後的用量事件時，才以收到的文字片段數估算
+    completion_tokens = completion_tokens or text_deltas
+    total_tokens = prompt_tokens + completion_tokens
+    print(f"Token usage - prompt: {prompt_tokens}, cache read: {cache_read_tokens}, cache write: {cache_write_tokens}, completion: {completion_tokens}, total: {total_tokens}")
+    if plan.record_usage:
+        await asyncio.to_thread(record_token_usage, user_id, total_tokens, cache_read_tokens, cache_write_tokens)
+
+async def stream_chat_events(prepared: Union[ConversationResponse, ReplyPlan], user_id: str, user_message: str) -> AsyncIterator[str]:
+    """
+    SSE 事件：metadata（分析結果）→ delta（回應文字，可能多次）→ done（與 /chat 相同的完整回應）；
+    錯誤時送出 error。情緒支持回應開始前失敗時改用一般回應，並重新送出 metadata
+    """
+    try:
+        while isinstance(prepared, ReplyPlan):
+            plan = prepared
+            yield sse_event("metadata", reply_metadata(plan))
+            client = await get_shared_async_anthropic_client()
+            async with llm_call_slot():
+                try:
+                    start_time = time.time()
+                    events = await client.messages.create(
+                        model=CHAT_MODEL,
+                        max_tokens=plan.max_tokens,
+                        temperature=plan.temperature,
+                        system=plan.system,
+                        messages=plan.messages,
+                        stream=True
+                    )
+                    print(f"Claude API stream opened in {time.time() - start_time:.2f} seconds")
+                except Exception as e:
+                    if plan.fallback is None:
+                        raise
+                    print(f"生成情緒支持回應失敗: {e}，將使用一般回應流程")
+                    prepared = plan.fallback
+                    continue
+                try:
+                    async for event in stream_reply_plan(plan, events, user_id, user_message):
+                        yield event
+                finally:
+                    await events.close()
+            return
+
+        yield sse_event("metadata", reply_metadata(prepared))
+        yield sse_event("delta", {"text": prepared.response})
+        yield sse_event("done", prepared.dict())
+    except LLMOverloadedError as e:
+        error = overload_exception(e)
+        yield sse_event("error", {"status": error.status_code, "detail": error.detail, "retry_after": LLM_OVERLOAD_RETRY_AFTER})
+    except Exception as e:
+        error = conversation_error(e)
+        yield sse_event("error", {"status": error.status_code, "detail": error.detail})
 
-        return ConversationResponse(
-            response=filtered_response,
-            is_scam=is_scam,
-            analysis={
-                "matched_categories": matched_categories,
-                "confidence": min(1.0, len(matched_categories) * 0.2) if matched_categories else 0.0,
-                "values_filtered": applied_principles if applied_principles else None
-            },
-            scam_info=scam_info,
-            emotion_analysis=emotion_analysis
-        )
+@router.post("/chat-stream", summary="AI Conversation Chat Stream", description="Process a message with Claude and stream the response as Server-Sent Events")
+async def ai_conversation_chat_stream(request: ConversationRequest):
+    """
+    Same pipeline as /chat, streamed: a metadata event (is_scam, scam_info, emotion_analysis) is sent
+    before the first text, delta events carry the reply sentence by sentence after the values filter,
+    and a done event carries the complete ConversationResponse
+    """
+    try:
+        # 取得用戶ID（如果請求中沒有指定，使用一個代表網頁用戶的通用ID）
+        user_id = request.user_id or "web-user"
+        prepared = await asyncio.to_thread(prepare_chat_reply, request, user_id)
     except Exception as e:
-        error_message = str(e)
-        print(f"Error in AI conversation: {error_message}")
-
-        if "api_key" in error_message.lower():
-            raise HTTPException(
-                status_code=500,
-                detail="Anthropic API key configuration error. Please check your API key settings."
-            ) from e
-        else:
-            raise HTTPException(
-                status_code=500,
-                detail=f"Error processing conversation: {error_message}"
-            ) from e
+        raise conversation_error(e) from e
+
+    return StreamingResponse(
+        stream_chat_events(prepared, user_id, request.message),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -12,6 +12,7 @@ import traceback
 
 # 導入相關功能
 from app.apis.scam_utils import detect_scam, generate_response
+from app.apis.text_normalization import prepare_message
 from app.apis.line_bot import create_line_bot_api
 from linebot.models import TextSendMessage
 
@@ -109,6 +110,9 @@ async def alt_webhook2(request: Request):
                 if message_type == "text":
                     message_text = message.get("text", "")
                     
+                    # 訊息正規化（每則訊息只做一次，供後續各項偵測共用）
+                    prepare_message(message_text)
+                    
                     print(f"Processing message from {user_id}: {message_text[:50]}...")
                     
                     # 判斷是否為詐騙訊息
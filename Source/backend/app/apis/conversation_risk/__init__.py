@@ -0,0 +1,260 @@
+from typing import Dict, Any, Optional, Iterable, NamedTuple, Set, Tuple, Deque
+from collections import OrderedDict, deque
+import threading
+import time
+import numpy as np
+from fastapi import APIRouter, HTTPException
+from app.apis.detection_engine import (
+    ScamDetectionResult, get_scam_pattern_engine, get_scam_scoring_model, score_match_counts
+)
+
+'''
+1. API用途：對話層級的詐騙風險累積狀態，感情詐騙與投資詐騙常分散在多則訊息中，
+   每則訊息到達時只分析一次並累加到該用戶的狀態（隨時間衰減的類別計數 + 最近幾則訊息的特徵），
+   偵測器直接查詢狀態，不需重新掃描客戶端每次重送的 chat_history，對話再長每則訊息的成本也固定
+2. 關聯頁面：後台管理頁面（查看或重設單一用戶的對話風險狀態）
+3. 目前狀態：啟用中（狀態保存在各 worker 的記憶體中，以 LRU 限制數量，閒置過久自動捨棄）
+'''
+
+router = APIRouter(
+    prefix="/conversation-risk",
+    tags=["conversation-risk"],
+    responses={404: {"description": "Not found"}},
+)
+
+# 累積狀態設定
+CATEGORY_HALF_LIFE = 6 * 3600          # 類別計數半衰期（秒）
+MIN_DECAYED_COUNT = 0.05               # 衰減到此值以下的類別計數視為歸零
+RECENT_MESSAGES = 10                   # 保留最近幾則訊息的特徵
+MAX_CONVERSATIONS = 10000              # 每個 worker 最多保存的對話數
+CONVERSATION_TTL = 7 * 24 * 3600       # 閒置超過此時間的對話狀態捨棄（秒）
+
+# 對話層級判斷：至少兩則訊息帶有詐騙特徵，且累積後能判斷出具體的詐騙類型
+MIN_SCAM_MESSAGES = 2
+CONVERSATION_SCAM_THRESHOLD = 0.4
+CONVERSATION_SCORE_LENGTH = 100        # 累積計數以一般長度訊息的方式評分，不套用長短訊息折扣
+
+class MessageFeatures(NamedTuple):
+    """Features of a single message kept in the conversation state"""
+    timestamp: float
+    length: int
+    is_scam: bool
+    confidence: float
+    categories: Dict[str, Tuple[str, ...]]     # 詐騙規則類別 -> 命中內容
+    keyword_terms: Dict[str, Tuple[str, ...]]  # 關鍵詞命名空間 -> 命中詞
+
+class ConversationRiskState:
+    """
+    Decayed scam category counters and the last messages' features of one user
+
+    Concurrent requests of the same user update and read the state, so every method holds the state's lock.
+    """
+
+    def __init__(self, user_id: str):
+        self.user_id = user_id
+        self.category_counts: Dict[str, float] = {}
+        self.recent: Deque[MessageFeatures] = deque(maxlen=RECENT_MESSAGES)
+        self.message_count = 0
+        self.updated_at = 0.0
+        self._decayed_at = 0.0
+        self._lock = threading.RLock()
+
+    def decay(self, now: float) -> None:
+        """依經過時間衰減類別計數"""
+        with self._lock:
+            elapsed = now - self._decayed_at
+            if elapsed <= 0:
+                return
+            factor = 0.5 ** (elapsed / CATEGORY_HALF_LIFE)
+            self.category_counts = {
+                category_id: count * factor
+                for category_id, count in self.category_counts.items()
+                if count * factor >= MIN_DECAYED_COUNT
+            }
+            self._decayed_at = now
+
+    def observe(self, features: MessageFeatures) -> None:
+        """將一則訊息的特徵累加到狀態中"""
+        with self._lock:
+            self.decay(features.timestamp)
+            for category_id, matches in features.categories.items():
+                self.category_counts[category_id] = self.category_counts.get(category_id, 0.0) + len(matches)
+            self.recent.append(features)
+            self.message_count += 1
+            self.updated_at = features.timestamp
+
+    def recent_terms(self, namespace: str, last: int, max_age: Optional[float] = None) -> Set[str]:
+        """最近幾則訊息在某關鍵詞命名空間命中的詞（可限制訊息的最長經過時間）"""
+        now = time.time()
+        with self._lock:
+            recent = list(self.recent)[-last:]
+        terms: Set[str] = set()
+        for features in recent:
+            if max_age is not None and now - features.timestamp > max_age:
+                continue
+            terms.update(features.keyword_terms.get(namespace, ()))
+        return terms
+
+    def assess_scam(self, now: Optional[float] = None) -> Optional[ScamDetectionResult]:
+        """
+        以累積的類別計數評分整段對話；單則訊息不足以判斷（或只能判為一般可疑）、
+        但多則訊息合起來呈現同一類詐騙手法時回傳偵測結果，否則回傳 None
+        """
+        with self._lock:
+            return self._assess_scam_locked(now if now is not None else time.time())
+
+    def _assess_scam_locked(self, now: float) -> Optional[ScamDetectionResult]:
+        self.decay(now)
+        # 最新一則訊息本身沒有任何詐騙特徵時不以過去的訊息判斷
+        if not self.recent or not self.recent[-1].categories or not self.category_counts:
+            return None
+        scam_messages = [features for features in self.recent if features.categories]
+        if len(scam_messages) < MIN_SCAM_MESSAGES:
+            return None
+
+        model = get_scam_scoring_model()
+        match_counts = np.zeros(len(model["category_ids"]))
+        for category_id, count in self.category_counts.items():
+            index = model["category_index"].get(category_id)
+            if index is not None:
+                match_counts[index] = count
+        is_scam, scam_info, confidence = score_match_counts(match_counts, CONVERSATION_SCORE_LENGTH, model)
+        if not is_scam or not scam_info or scam_info["id"] == "general_suspicious" or confidence < CONVERSATION_SCAM_THRESHOLD:
+            return None
+
+        # 指標內容取自最近訊息的實際命中
+        patterns = get_scam_pattern_engine()["source"]
+        matched_indicators = [{
+            "category_id": "conversation_pattern",
+            "name": "對話累積風險",
+            "description": "多則訊息累積出現同一類詐騙手法的特徵，整段對話可能是逐步進行的詐騙",
+            "matches": [category_id for category_id in model["category_ids"] if category_id in self.category_counts]
+        }]
+        for category_id in model["category_ids"]:
+            if category_id not in self.category_counts or category_id not in patterns:
+                continue
+            matches = list(dict.fromkeys(
+                match for features in scam_messages for match in features.categories.get(category_id, ())
+            ))
+            matched_indicators.append({
+                "category_id": category_id,
+                "name": patterns[category_id]["name"],
+                "description": patterns[category_id]["description"],
+                "matches": matches
+            })
+
+        scam_info["conversation"] = {
+            "messages": len(self.recent),
+            "scam_messages": len(scam_messages),
+            "first_seen": scam_messages[0].timestamp
+        }
+        return ScamDetectionResult(True, scam_info, matched_indicators, confidence)
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            return self._summary_locked()
+
+    def _summary_locked(self) -> Dict[str, Any]:
+        return {
+            "user_id": self.user_id,
+            "message_count": self.message_count,
+            "updated_at": self.updated_at,
+            "category_counts": {category_id: round(count, 4) for category_id, count in self.category_counts.items()},
+            "recent": [
+                {
+                    "timestamp": features.timestamp,
+                    "length": features.length,
+                    "is_scam": features.is_scam,
+                    "confidence": round(features.confidence, 4),
+                    "categories": list(features.categories),
+                    "keyword_terms": {namespace: list(terms) for namespace, terms in features.keyword_terms.items()}
+                }
+                for features in self.recent
+            ]
+        }
+
+# 各用戶的對話狀態（LRU）
+_CONVERSATIONS: "OrderedDict[str, ConversationRiskState]" = OrderedDict()
+_CONVERSATIONS_LOCK = threading.Lock()
+
+def get_conversation_state(user_id: str) -> Optional[ConversationRiskState]:
+    """取得用戶的對話狀態；不存在或已閒置過久時回傳 None"""
+    with _CONVERSATIONS_LOCK:
+        state = _CONVERSATIONS.get(user_id)
+        if state is not None and time.time() - state.updated_at > CONVERSATION_TTL:
+            del _CONVERSATIONS[user_id]
+            state = None
+        return state
+
+def record_message(user_id: str, scam_result: ScamDetectionResult,
+                   keyword_terms: Optional[Dict[str, Iterable[str]]] = None,
+                   message_length: int = 0, timestamp: Optional[float] = None) -> ConversationRiskState:
+    """
+    將一則訊息的分析結果累加到用戶的對話狀態
+
+    Args:
+        user_id: 用戶ID
+        scam_result: 這則訊息的詐騙偵測結果
+        keyword_terms: 其他偵測器需要回顧的關鍵詞命中（命名空間 -> 詞）
+        message_length: 訊息長度
+        timestamp: 訊息時間，預設為現在
+
+    Returns:
+        更新後的對話狀態
+    """
+    now = timestamp if timestamp is not None else time.time()
+    features = MessageFeatures(
+        timestamp=now,
+        length=message_length,
+        is_scam=scam_result.is_scam,
+        confidence=scam_result.confidence,
+        categories={
+            indicator["category_id"]: tuple(indicator.get("matches", []))
+            for indicator in scam_result.matched_indicators
+        },
+        keyword_terms={namespace: tuple(terms) for namespace, terms in (keyword_terms or {}).items() if terms}
+    )
+    with _CONVERSATIONS_LOCK:
+        state = _CONVERSATIONS.get(user_id)
+        if state is None or now - state.updated_at > CONVERSATION_TTL:
+            state = ConversationRiskState(user_id)
+            _CONVERSATIONS[user_id] = state
+        _CONVERSATIONS.move_to_end(user_id)
+        while len(_CONVERSATIONS) > MAX_CONVERSATIONS:
+            _CONVERSATIONS.popitem(last=False)
+        state.observe(features)
+    return state
+
+def reset_conversation(user_id: str) -> bool:
+    """清除用戶的對話狀態"""
+    with _CONVERSATIONS_LOCK:
+        return _CONVERSATIONS.pop(user_id, None) is not None
+
+@router.get("/users/{user_id}", summary="取得對話風險狀態", description="取得單一用戶目前累積的詐騙類別計數、最近訊息特徵與對話層級判斷")
+def get_conversation_risk(user_id: str):
+    """取得用戶的對話風險狀態"""
+    try:
+        state = get_conversation_state(user_id)
+        if state is None:
+            raise HTTPException(status_code=404, detail="Conversation state not found")
+        result = state.assess_scam()
+        return {
+            **state.summary(),
+            "is_scam": result is not None,
+            "scam_info": result.scam_info if result else None,
+            "confidence": result.confidence if result else 0.0
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error getting conversation risk: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to get conversation risk: {str(e)}") from e
+
+@router.delete("/users/{user_id}", summary="重設對話風險狀態", description="清除單一用戶累積的對話風險狀態")
+def delete_conversation_risk(user_id: str):
+    """重設用戶的對話風險狀態"""
+    try:
+        return {"success": reset_conversation(user_id), "user_id": user_id}
+    except Exception as e:
+        print(f"Error resetting conversation risk: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to reset conversation risk: {str(e)}") from e
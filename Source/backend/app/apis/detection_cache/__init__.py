@@ -0,0 +1,150 @@
+from typing import Dict, Any, Optional, Callable, Tuple
+from collections import OrderedDict
+import copy
+import hashlib
+import json
+import threading
+import time
+from fastapi import APIRouter, HTTPException
+
+'''
+1. API用途：偵測結果快取（LRU + TTL），放在詐騙偵測引擎 detection_engine 的 detect_scam 前面，
+   同一則被大量轉傳的詐騙訊息只需計算一次；並提供命中率統計
+2. 關聯頁面：後台管理頁面（快取統計、清除快取）
+3. 目前狀態：啟用中（以正規化後訊息的雜湊值 + 規則版本作為鍵，規則變動時自動失效；
+   偵測也使用同一份正規化結果，確保鍵相同即結果相同）
+'''
+
+router = APIRouter(
+    prefix="/detection-cache",
+    tags=["detection-cache"],
+    responses={404: {"description": "Not found"}},
+)
+
+# 預設快取設定
+DEFAULT_CACHE_SIZE = 2048
+DEFAULT_CACHE_TTL = 3600  # 秒
+
+def fingerprint_rules(*rule_sets: Any) -> str:
+    """計算規則集的版本指紋（內容相同則指紋相同）"""
+    payload = json.dumps(rule_sets, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:12]
+
+def hash_text(text: str) -> bytes:
+    """訊息內容雜湊，避免以完整訊息當作快取鍵"""
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+class DetectionResultCache:
+    """Bounded LRU cache with TTL for detection results, keyed on (rules version, text hash)"""
+
+    def __init__(self, name: str, max_size: int = DEFAULT_CACHE_SIZE, ttl_seconds: int = DEFAULT_CACHE_TTL):
+        self.name = name
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Tuple[str, bytes], Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._rules_version: Optional[str] = None
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _check_version(self, rules_version: str) -> None:
+        # 規則版本變動時整個快取失效
+        if self._rules_version != rules_version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._rules_version = rules_version
+
+    def get(self, text: str, rules_version: str) -> Optional[Any]:
+        """取得快取結果（回傳複本），不存在或已過期時回傳 None"""
+        key = (rules_version, hash_text(text))
+        now = time.time()
+        with self._lock:
+            self._check_version(rules_version)
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            stored_at, value = entry
+            if now - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return copy.deepcopy(value)
+
+    def put(self, text: str, rules_version: str, value: Any) -> None:
+        """寫入快取（儲存複本，避免呼叫端修改結果影響快取）"""
+        key = (rules_version, hash_text(text))
+        stored = copy.deepcopy(value)
+        with self._lock:
+            self._check_version(rules_version)
+            self._entries[key] = (time.time(), stored)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_compute(self, text: str, rules_version: str, compute: Callable[[str], Any]) -> Any:
+        """有快取則直接回傳，否則計算後寫入快取"""
+        cached = self.get(text, rules_version)
+        if cached is not None:
+            return cached
+        value = compute(text)
+        self.put(text, rules_version, value)
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "name": self.name,
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl_seconds,
+            "rules_version": self._rules_version,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "expirations": self.expirations,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations
+        }
+
+# 各偵測器的快取實例
+_CACHES: Dict[str, DetectionResultCache] = {}
+
+def get_detection_cache(name: str, max_size: int = DEFAULT_CACHE_SIZE, ttl_seconds: int = DEFAULT_CACHE_TTL) -> DetectionResultCache:
+    """取得（或建立）指定名稱的偵測結果快取"""
+    cache = _CACHES.get(name)
+    if cache is None:
+        cache = _CACHES.setdefault(name, DetectionResultCache(name, max_size, ttl_seconds))
+    return cache
+
+@router.get("/stats", summary="取得偵測快取統計", description="取得各偵測器結果快取的命中率與容量統計")
+def get_cache_stats():
+    """取得所有偵測快取的統計資料"""
+    try:
+        return {"caches": [cache.stats() for cache in _CACHES.values()]}
+    except Exception as e:
+        print(f"Error getting cache stats: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to get cache stats: {str(e)}") from e
+
+@router.post("/clear", summary="清除偵測快取", description="清除所有偵測器的結果快取")
+def clear_caches():
+    """清除所有偵測快取"""
+    try:
+        for cache in _CACHES.values():
+            cache.clear()
+        return {"success": True, "cleared": list(_CACHES.keys())}
+    except Exception as e:
+        print(f"Error clearing caches: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to clear caches: {str(e)}") from e
@@ -0,0 +1,1272 @@
+from typing import Dict, Any, Tuple, List, Optional, NamedTuple, FrozenSet
+from itertools import combinations
+import re
+import threading
+import time
+import numpy as np
+from fastapi import APIRouter
+from app.apis.keyword_index import register_keywords, scan_keywords
+from app.apis.detection_cache import get_detection_cache, fingerprint_rules
+from app.apis.text_normalization import normalize_text, get_normalized_text
+from app.apis.scam_templates import find_scam_template, MIN_TEMPLATE_LENGTH
+from app.apis.scam_identifiers import find_reported_identifiers, IDENTIFIER_PATTERNS
+from app.apis.scam_images import find_scam_image
+from app.apis.rule_packs import register_rule_set, has_rule_set_override
+from app.apis.message_prefilter import register_prefilter_namespaces, register_prefilter_patterns, could_match
+from app.apis.script_detection import (
+    LANGUAGE_AUTO, LANGUAGE_ZH, ALL_LANGUAGES, detect_languages, resolve_languages, classify_rule_language
+)
+from app.apis.safe_regex import compile_rule, message_budget, budget_expired
+from app.apis.rule_profiler import profiling_enabled, record_rule, record_hits, register_profiled_rules, DETECTOR_SCAM
+from app.apis.domain_reputation import assess_links, extract_urls, check_domain, get_reputation_version, RISKY_VERDICTS, VERDICT_GOOD, LINK_PATTERNS
+
+'''
+1. API用途：統一的詐騙偵測引擎，集中管理詐騙規則（規則登錄後只編譯一次），並回傳共同的偵測結果型別；
+   scam_detector、scam_utils、local_scam_detector 的 detect_scam 皆由此引擎提供，各通道得到相同的判斷
+2. 關聯頁面：無直接關聯頁面，由文字分析、LINE 處理流程、AI 對話與情緒回應編排器經由上述模組使用
+3. 目前狀態：啟用中（scam_utils 與 local_scam_detector 保留舊的三元組回傳格式作為相容介面）
+'''
+
+# 創建一個空的router物件以符合Databutton框架要求
+router = APIRouter()
+
+class ScamDetectionResult(NamedTuple):
+    """
+    Common result of the detection engine
+
+    incomplete is set when the message's CPU budget ran out and some rules were skipped:
+    is_scam=False then only means nothing was found in the part that was scanned.
+    """
+    is_scam: bool
+    scam_info: Optional[Dict[str, Any]]
+    matched_indicators: List[Dict[str, Any]]
+    confidence: float
+    incomplete: bool = False
+
+    @property
+    def categories(self) -> List[str]:
+        """Matched indicator category ids, in match order"""
+        return [indicator["category_id"] for indicator in self.matched_indicators]
+
+    def as_category_tuple(self) -> Tuple[bool, Optional[Dict[str, Any]], List[str]]:
+        """Legacy (is_scam, scam_info, matched categories) tuple used by scam_utils-style callers"""
+        return self.is_scam, self.scam_info, self.categories
+
+# Enhanced: Define potential scam patterns with detailed information
+SCAM_PATTERNS = {
+    "urgent_action": {
+        "name": "緊急行動", 
+        "description": "訊息催促您立即行動，製造緊迫感以降低您的警覺性",
+        "patterns": [
+            r"\b緊急\b", r"\b立即\b", r"\b速度\b", r"\b盡快\b", r"\b馬上\b", r"\b現在就\b", r"\b不得延遲\b", r"\b刻不容緩\b",
+            r"\bimmediately\b", r"\burgent\b", r"\bASAP\b", r"\bquick\b", r"\bnow\b", r"\binstantly\b", r"\bno delay\b"
+        ]
+    },
+    "financial_incentives": {
+        "name": "金錢誘因", 
+        "description": "訊息提供非常誘人的金錢獎勵或利益，過於美好難以置信",
+        "patterns": [
+            r"\b贏取\b", r"\b中獎\b", r"\b獎金\b", r"\b報酬\b", r"\b紅利\b", r"\b利率\b", r"\b回報\b", r"\b免費\b", r"\b折扣\b", r"[0-9]{1,12},[0-9]+元", r"[0-9]{1,12}元獎金", r"[0-9]{1,12}0%", r"每月15-20%", r"輕鬆賺取", r"先支付", r"成功率", r"高報酬", r"手續費", r"立即領取",
+            r"\bwin\b", r"\baward\b", r"\bprize\b", r"\breward\b", r"\bbonus\b", r"\brate\b", r"\breturn\b", r"\bfree\b", r"\bdiscount\b", r"\bclaim\b", r"\bhighly\sprofitable\b"
+        ]
+    },
+    "personal_information": {
+        "name": "個人資訊請求", 
+        "description": "訊息要求您提供敏感的個人資訊，這些資料可能被用於身份盜用",
+        "patterns": [
+            r"\b密碼\b", r"\b驗證碼\b", r"\b帳號\b", r"\b身分證\b", r"\b信用卡\b", r"\b銀行卡\b", r"\b cvv\b", r"\b卡號\b",
+            r"\bpassword\b", r"\bverify\b", r"\baccount\b", r"\bID\b", r"\bcredit card\b", r"\bcode\b", r"\bpin\b", r"\bsecurity\b"
+        ]
+    },
+    "suspicious_links": {
+        "name": "可疑連結", 
+        "description": "訊息包含可疑連結，點擊可能導致釣魚網站或惡意軟體下載",
+        "patterns": [
+            r"http[s]?://[a-zA-Z0-9$-_@.&+!*\(\),%]+",
+            r"bit\.ly", r"goo\.gl", r"tinyurl", r"t\.co"
+        ]
+    },
+    "impersonation": {
+        "name": "身份冒充", 
+        "description": "訊息冒充官方機構或知名企業，試圖獲取您的信任",
+        "patterns": [
+            r"\b銀行\b", r"\b客服\b", r"\b政府\b", r"\b公司\b", r"\b警察\b", r"\b稅務\b", r"\b海關\b", r"\b電信\b", r"\b官方\b",
+            r"\bbank\b", r"\bcustomer service\b", r"\bgovernment\b", r"\bcompany\b", r"\bpolice\b", r"\btax\b", r"\bofficial\b"
+        ]
+    },
+    "investment_schemes": {
+        "name": "投資騙局", 
+        "description": "訊息提供不切實際的投資機會，承諾高回報和低風險",
+        "patterns": [
+            r"\b投資\b", r"\b股票\b", r"\b基金\b", r"\b加密貨幣\b", r"\b比特幣\b", r"\b以太幣\b", r"\b保證[^\s]{0,20}利\b", r"\b翻倍\b", r"秘密投資", r"[0-9]{1,12}%回報", r"限量名額", r"致富", r"專家團隊", r"絕佳標的", r"風險低", r"獲利", r"穩賺", r"無風險",
+            r"\binvestment\b", r"\bstock\b", r"\bfund\b", r"\bcrypto\b", r"\bbitcoin\b", r"\bethereum\b", r"\bguaranteed\b", r"\bdouble\b", r"\bhigh return\b", r"\blow risk\b", r"\bsecret\b"
+        ]
+    },
+    "romance_scam": {
+        "name": "感情詐騙", 
+        "description": "訊息利用感情操控，快速建立親密關係後要求金錢協助",
+        "patterns": [
+            r"\b交友\b", r"\b戀愛\b", r"\b愛情\b", r"\b約會\b", r"\b喜歡你\b", r"\b愛你\b", r"\b想你\b", r"\b想見你\b", r"親愛", r"借[0-9]+元", r"銀行卡", r"凍結", r"給我", r"會還你", r"一直在想你", r"見你",
+            r"\bdating\b", r"\bromance\b", r"\blove\b", r"\brelationship\b", r"\blike you\b", r"\blove you\b", r"\bmiss you\b", r"dear", r"darling", r"sweetheart"
+        ]
+    },
+    "threat_or_blackmail": {
+        "name": "威脅或勒索", 
+        "description": "訊息使用威脅或恐嚇手段，聲稱掌握您的隱私或會造成傷害",
+        "patterns": [
+            r"\b威脅\b", r"\b勒索\b", r"\b恐嚇\b", r"\b曝光\b", r"\b攻擊\b", r"\b後果\b", r"\b危險\b", r"\b黑客\b",
+            r"\bthreat\b", r"\bblackmail\b", r"\bexpose\b", r"\bhack\b", r"\bdanger\b", r"\bconsequence\b", r"\bpunish\b"
+        ]
+    },
+    "fake_job_offers": {
+        "name": "虛假工作機會", 
+        "description": "訊息提供不切實際的工作機會，通常要求先付費或要求個人資訊",
+        "patterns": [
+            r"\b工作機會\b", r"\b賺錢\b", r"\b在家工作\b", r"\b兼職\b", r"\b高薪\b", r"\b招聘\b", r"\b錄取\b", r"\b面試\b",
+            r"\bjob opportunity\b", r"\bmake money\b", r"\bwork from home\b", r"\bpart-time\b", r"\bhigh salary\b", r"\bhiring\b"
+        ]
+    },
+    "lottery_or_inheritance": {
+        "name": "彩票或遺產詐騙", 
+        "description": "訊息聲稱您中了彩票或有遺產繼承，但要求先付費才能領取",
+        "patterns": [
+            r"\b彩票\b", r"\b樂透\b", r"\b中獎\b", r"\b遺產\b", r"\b繼承\b", r"\b領取\b", r"\b抽獎\b", r"\b幸運號碼\b",
+            r"\blottery\b", r"\bjackpot\b", r"\bprize\b", r"\binheritance\b", r"\bclaim\b", r"\blucky number\b", r"\bwinner\b"
+        ]
+    },
+    "money_requests": {
+        "name": "借錢或轉帳要求",
+        "description": "訊息要求您借錢、轉帳或協助處理資金問題，常見於冒充親友的詐騙",
+        "patterns": [
+            # \b 在中文字之間不會成立，金額與單位之間不加；範圍收窄以通過 safe_regex 的回溯上限
+            r"(?:借[给給]?我|能借|可以借|借錢|[轉匯][给給]我).{0,10}?[0-9零一二三四五六七八九十百千萬億兩幾些]{1,6}\s?(?:[元塊圓幣]|美[金元]|台幣|日元|歐元|澳幣|rmb|usd|twd|jpy|eur|aud)",
+            r"(?:幫|協助|資助|支援)我.{0,10}?(?:解決|處理|應急|急需|緊急).{0,10}?(?:錢|資金|費用|財務)",
+            r"(?:銀行|[帳賬]戶|卡).{0,10}?(?:凍結|被凍|鎖住|鎖定|被盜|有問題)"
+        ]
+    }
+}
+
+# Literal rules are served by the shared keyword index instead of the regex engine
+SCAM_KEYWORD_NAMESPACE = "scam_patterns"
+
+# Category whose matches are re-checked against the local domain reputation index
+LINK_CATEGORY = "suspicious_links"
+
+# Prefilter group covering every rule tier of detect_scam except the template lookup
+SCAM_PREFILTER_GROUP = "scam"
+register_prefilter_namespaces(SCAM_PREFILTER_GROUP, [SCAM_KEYWORD_NAMESPACE])
+register_prefilter_patterns(SCAM_PREFILTER_GROUP, "reported_identifiers", IDENTIFIER_PATTERNS)
+register_prefilter_patterns(SCAM_PREFILTER_GROUP, "links", LINK_PATTERNS)
+_REGEX_METACHARACTERS = set(".^$*+?{}[]|()\\")
+
+def extract_literal_pattern(pattern: str) -> Optional[Tuple[str, bool]]:
+    r"""
+    Return (literal, whole_word) for a CJK keyword rule such as r"\b中獎\b", or None for real regex rules
+
+    \b never fires between two CJK characters, so these rules are matched as
+    plain literals through the keyword index. A rule written with \b is
+    treated as a whole word: its hit is dropped when it lies inside a longer
+    registered term (e.g. 銀行 inside 銀行卡). ASCII rules keep their regex
+    and word boundaries.
+    """
+    literal = pattern
+    whole_word = False
+    if literal.startswith(r"\b"):
+        literal = literal[2:]
+        whole_word = True
+    if literal.endswith(r"\b"):
+        literal = literal[:-2]
+        whole_word = True
+    if not literal or any(ch in _REGEX_METACHARACTERS for ch in literal):
+        return None
+    if not any(ord(ch) > 0x2E80 for ch in literal):
+        return None
+    return literal, whole_word
+
+def make_rule_id(category_id: str, rule_index: int) -> str:
+    """Stable id of a rule: its category and position in the category's pattern list (e.g. romance_scam.3)"""
+    return f"{category_id}.{rule_index}"
+
+def get_rule_language(category_id: str, pattern: str) -> Optional[str]:
+    """Language pack of a regex rule; link rules run for every language since URLs are written the same way"""
+    if category_id == LINK_CATEGORY:
+        return None
+    return classify_rule_language(pattern)
+
+def build_rule_packs(categories: List[Tuple[str, str, str, List[Tuple[str, Any, Optional[str], str]]]]) -> Dict[FrozenSet[str], Dict[str, Any]]:
+    """
+    Build one compiled rule pack per combination of languages
+
+    Each pack holds the language-neutral rules plus the rules of its languages,
+    with its own combined matcher, so a message only runs the rules its scripts can match.
+
+    Args:
+        categories: (category id, name, description, [(rule id, compiled rule, language or None, pattern)]) tuples
+
+    Returns:
+        Mapping of language set to {"categories": [...], "combined": matcher or None, "rule_count": int}
+    """
+    packs = {}
+    for size in range(len(ALL_LANGUAGES) + 1):
+        for languages in combinations(sorted(ALL_LANGUAGES), size):
+            languages = frozenset(languages)
+            pack_categories = []
+            pack_patterns = []
+            for category_id, category_name, category_description, rules in categories:
+                pack_rules = [rule for rule in rules if rule[2] is None or rule[2] in languages]
+                pack_categories.append((category_id, category_name, category_description, [(rule_id, rule) for rule_id, rule, _, _ in pack_rules]))
+                pack_patterns.extend(pattern for _, _, _, pattern in pack_rules if pattern not in pack_patterns)
+            # 非擷取群組的合併式：Python re 中帶擷取群組的大型交替式明顯較慢，這裡只用來定位第一個命中位置
+            combined = re.compile("|".join(f"(?:{pattern})" for pattern in pack_patterns), re.IGNORECASE) if pack_patterns else None
+            packs[languages] = {
+                "categories": pack_categories,
+                "combined": combined,
+                "rule_count": sum(len(rules) for _, _, _, rules in pack_categories)
+            }
+    return packs
+
+def compile_scam_patterns(patterns: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Compile scam pattern definitions into a reusable multi-pattern matcher
+
+    CJK literal rules are matched through the shared Aho-Corasick keyword index
+    (registered there when the rule set is installed, see install_scam_rule_set).
+    The remaining regex rules are split into per-language packs (see build_rule_packs);
+    each pack joins its rules into one combined expression that is scanned once per
+    message to find the first position where any of them can match; only then are
+    the per-rule compiled patterns run from that offset to tag the hits by category.
+
+    Args:
+        patterns: Pattern definitions in the same shape as SCAM_PATTERNS
+
+    Returns:
+        Dictionary with the source definitions, the per-language rule packs and the literal rules
+
+    Raises:
+        UnsafePatternError: A regex rule is invalid or can backtrack catastrophically (see safe_regex)
+    """
+    categories = []
+    unique_patterns = []
+    literal_categories: Dict[str, List[Tuple[str, bool, str]]] = {}
+    rule_languages: Dict[str, int] = {}
+    for category_id, category_info in patterns.items():
+        compiled_rules = []
+        for rule_index, pattern in enumerate(category_info["patterns"]):
+            rule_id = make_rule_id(category_id, rule_index)
+            literal_rule = extract_literal_pattern(pattern)
+            if literal_rule is not None:
+                # Literal rules are CJK only, i.e. always part of the zh pack
+                literal, whole_word = literal_rule
+                entries = literal_categories.setdefault(normalize_text(literal), [])
+                if not any(entry[:2] == (category_id, whole_word) for entry in entries):
+                    entries.append((category_id, whole_word, rule_id))
+                    rule_languages[LANGUAGE_ZH] = rule_languages.get(LANGUAGE_ZH, 0) + 1
+                continue
+            language = get_rule_language(category_id, pattern)
+            compiled_rules.append((rule_id, compile_rule(pattern), language, pattern))
+            rule_languages[language or "neutral"] = rule_languages.get(language or "neutral", 0) + 1
+            if pattern not in unique_patterns:
+                unique_patterns.append(pattern)
+        categories.append((category_id, category_info["name"], category_info["description"], compiled_rules))
+
+    return {
+        "source": patterns,
+        "version": fingerprint_rules(patterns),
+        "packs": build_rule_packs(categories),
+        "literal_categories": literal_categories,
+        "regex_patterns": unique_patterns,
+        "rule_languages": rule_languages,
+        "rule_count": sum(len(rules) for _, _, _, rules in categories) + sum(len(cats) for cats in literal_categories.values())
+    }
+
+def refresh_scam_pattern_engine(patterns: Optional[Dict[str, Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """
+    Rebuild the compiled matcher after the scam pattern definitions have changed
+
+    Args:
+        patterns: New pattern definitions; defaults to the active ones
+
+    Returns:
+        The newly compiled matcher
+    """
+    return update_scam_rules(patterns=patterns if patterns is not None else get_scam_patterns()).pattern_engine
+
+def get_scam_pattern_engine() -> Dict[str, Any]:
+    """Return the compiled matcher of the active rule set"""
+    return get_active_scam_rules().pattern_engine
+
+# High-risk phrases: a single hit is enough to classify the message (scam type id -> patterns)
+HIGH_RISK_CATEGORY = "high_risk_phrase"
+HIGH_RISK_PHRASES = {
+    "investment_scam": [
+        r"下載\s*(?:投資|理財|交易|賺錢)\s*(?:app|軟體|程式|平台)",
+        r"(?:投資|理財|交易)\s*(?:app|軟體|程式|平台)\s*下載",
+        r"教\s*(?:你|我)\s*(?:投資|理財|賺錢|賺大錢)",
+        r"(?:穩賺|穩贏|保證獲利|保證賺錢|高報酬|高回報)"
+    ]
+}
+
+# 命中高風險語句時取代該詐騙類型的一般說明與建議（scam type id -> description / advice）
+HIGH_RISK_RESULTS = {
+    "investment_scam": {
+        "description": "這看起來是典型的投資詐騙。詐騙者通常會誘導您下載未經授權的投資應用程式，並以高回報率為誘餌。",
+        "advice": [
+            "不要下載來路不明的投資APP或金融工具",
+            "正規投資平台會有完整的監管資訊和公司資料",
+            "謹記：高報酬通常伴隨高風險，沒有穩賺不賠的投資"
+        ]
+    }
+}
+
+def compile_high_risk_phrases(phrases: Dict[str, List[str]]) -> Dict[str, Any]:
+    """
+    Compile the high-risk phrase rules
+
+    Args:
+        phrases: Mapping of scam type id to phrase patterns
+
+    Returns:
+        Dictionary with the source mapping, its version and the compiled (scam type id, regex) rules
+    """
+    return {
+        "source": phrases,
+        "version": fingerprint_rules(phrases, HIGH_RISK_RESULTS),
+        "rules": [
+            (scam_type_id, make_rule_id(f"{HIGH_RISK_CATEGORY}.{scam_type_id}", rule_index),
+             compile_rule(pattern), classify_rule_language(pattern))
+            for scam_type_id, pattern_list in phrases.items()
+            for rule_index, pattern in enumerate(pattern_list)
+        ]
+    }
+
+def get_high_risk_phrase_engine() -> Dict[str, Any]:
+    """Return the compiled high-risk phrases of the active rule set"""
+    return get_active_scam_rules().high_risk_engine
+
+def match_high_risk_phrase(message: str, languages: Optional[FrozenSet[str]] = None) -> Optional[Tuple[str, str, Dict[str, Any]]]:
+    """Return (scam type id, matched text, match span) for the first high-risk phrase in the message, if any"""
+    if languages is None:
+        languages = detect_languages(message)
+    profiling = profiling_enabled()
+    for scam_type_id, rule_id, compiled_rule, language in get_high_risk_phrase_engine()["rules"]:
+        if language is not None and language not in languages:
+            continue
+        # 高風險語句不受偵測預算限制（規則少且都通過線性時間檢查），預算只截斷詐騙類別的規則
+        started = time.perf_counter_ns() if profiling else 0
+        found = compiled_rule.search(message, 0, MAX_SCAN_CHARS)
+        if profiling:
+            record_rule(DETECTOR_SCAM, rule_id, found is not None, time.perf_counter_ns() - started)
+        if found:
+            return scam_type_id, found.group(0), make_span(rule_id, found.start(), found.end(), found.group(0))
+    return None
+
+# Enhanced: Define scam types with more detailed classifications and advice
+SCAM_TYPES = {
+    "fake_customer_service": {
+        "name": "假冒客服詐騙",
+        "description": "詐騙者冒充銀行、電商平台或公用事業等客服人員，聲稱您的賬戶有疑似不對勢交易或問題需要針對。",
+        "advice": [
+            "永遠不要提供您的賬號、密碼、OTP等資料，合法客服總和不會記齊要求這些資料",
+            "不要急於點擊訊息連結，請直接聯絡官方客服管道確認",
+            "無論對方如何急迫，總應多花3分鐘思考認真輕重"
+        ],
+        "indicators": ["personal_information", "urgent_action", "impersonation", "suspicious_links"]
+    },
+    "investment_scam": {
+        "name": "投資詐騙",
+        "description": "詐騙者以高報酬率或誘餌引誘受害者進行投資，包含加密貨幣及股息、股票、投款計劃等方式。",
+        "advice": [
+            "沒有穩賺的投資，請細心謹慎對待投資高收益率的產品",
+            "只向合法監管機構的投資平台投資",
+            "投資前仔細查核公司背景及合約細則"
+        ],
+        "indicators": ["financial_incentives", "investment_schemes", "urgent_action"]
+    },
+    "romance_scam": {
+        "name": "交友詐騙",
+        "description": "詐騙者在交友軟件或社交平台上創建虛假個人資料，並織造浪漫的戀愛情節。在建立信任關係後，開始要求金錢援助。",
+        "advice": [
+            "謹慎交友，尤其是顯示經濟富裕的陌生人",
+            "盡量使用視訊或實際見面驗證對方身份",
+            "不要輕易轉帳或提供個人財物資料"
+        ],
+        "indicators": ["romance_scam", "financial_incentives", "urgent_action"]
+    },
+    "prize_or_lottery_scam": {
+        "name": "中獎詐騙",
+        "description": "詐騙者通知您在未參加的抽獎活動中獲獎，但提取獎金前，您需要先支付手續費或稅金等費用。",
+        "advice": [
+            "未參加的抽獎活動不可能中獎",
+            "真正的獎項不會要求您預先支付任何費用",
+            "對任何要求轉帳的抽獎通知保持警惕"
+        ],
+        "indicators": ["financial_incentives", "suspicious_links", "urgent_action"]
+    },
+    "money_request_scam": {
+        "name": "借錢詐騙",
+        "description": "詐騙者假裝是您認識的人，或利用緊急情況，要求您轉賬或借錢解決「緊急問題」。",
+        "advice": [
+            "收到借錢要求時，務必透過其他管道直接與對方確認",
+            "緊急求助且要求金錢幾乎都是詐騙，請保持冷靜",
+            "不要立即轉賬或借錢，先打電話跟對方確認身份"
+        ],
+        "indicators": ["urgent_action", "money_requests"]
+    },
+    "general_suspicious": {
+        "name": "可疑訊息",
+        "description": "這則訊息包含一些可疑元素，建議您提高警覺。",
+        "advice": [
+            "對要求個人資料或金錢的訊息保持警惕",
+            "不要點擊不明來源的連結",
+            "如有疑問，請透過官方管道確認"
+        ],
+        "indicators": []
+    }
+}
+
+# Category risk weights used by the confidence score
+HIGH_RISK_CATEGORIES = ["personal_information", "suspicious_links", "threat_or_blackmail"]
+MEDIUM_RISK_CATEGORIES = ["urgent_action", "financial_incentives", "impersonation"]
+
+def build_scam_scoring_model(patterns: Dict[str, Dict[str, Any]], scam_types: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Precompute the category x scam-type weight matrix used for scoring
+
+    Args:
+        patterns: Pattern definitions in the same shape as SCAM_PATTERNS
+        scam_types: Scam type definitions in the same shape as SCAM_TYPES
+
+    Returns:
+        Dictionary with category/type orderings, the weight matrix and risk weights
+    """
+    category_ids = list(patterns.keys())
+    category_index = {category_id: i for i, category_id in enumerate(category_ids)}
+
+    # General suspicious is only a fallback and never competes in the matching
+    type_ids = [scam_id for scam_id in scam_types if scam_id != "general_suspicious"]
+    type_weights = np.zeros((len(type_ids), len(category_ids)))
+    type_indicator_counts = np.zeros(len(type_ids))
+    for row, scam_id in enumerate(type_ids):
+        indicators = scam_types[scam_id].get("indicators", [])
+        type_indicator_counts[row] = len(indicators)
+        for indicator in indicators:
+            if indicator in category_index:
+                type_weights[row, category_index[indicator]] += 1
+
+    risk_weights = np.zeros(len(category_ids))
+    for category_id in HIGH_RISK_CATEGORIES:
+        if category_id in category_index:
+            risk_weights[category_index[category_id]] = 0.12
+    for category_id in MEDIUM_RISK_CATEGORIES:
+        if category_id in category_index:
+            risk_weights[category_index[category_id]] = 0.07
+
+    return {
+        "source": (patterns, scam_types),
+        "version": fingerprint_rules(scam_types),
+        "category_ids": category_ids,
+        "category_index": category_index,
+        "type_ids": type_ids,
+        "type_weights": type_weights,
+        "type_indicator_counts": type_indicator_counts,
+        "risk_weights": risk_weights
+    }
+
+def get_scam_scoring_model() -> Dict[str, Any]:
+    """Return the scoring model of the active rule set"""
+    return get_active_scam_rules().scoring_model
+
+def build_match_count_vector(matched_indicators: List[Dict[str, Any]], model: Dict[str, Any]) -> np.ndarray:
+    """Turn matched indicators into a per-category vector of distinct match counts"""
+    match_counts = np.zeros(len(model["category_ids"]))
+    for ind in matched_indicators:
+        index = model["category_index"].get(ind["category_id"])
+        if index is not None:
+            match_counts[index] = len(ind.get("matches", []))
+    return match_counts
+
+def score_confidence_vector(match_counts: np.ndarray, message_length: int, model: Dict[str, Any]) -> float:
+    """
+    Vectorized confidence score from a per-category match count vector
+
+    Args:
+        match_counts: Number of distinct matches per category (0 = not matched)
+        message_length: Length of the message in characters
+        model: Scoring model from build_scam_scoring_model
+
+    Returns:
+        Confidence score between 0 and 1
+    """
+    matched = match_counts > 0
+    category_count = int(matched.sum())  # Number of different categories matched
+    total_categories = len(model["category_ids"])
+
+    # No matches means no confidence
+    if category_count == 0:
+        return 0.0
+
+    # Base score from category matches (0.1 to 0.7)
+    base_score = min(0.7, (category_count / total_categories) * 0.7 + 0.15)
+
+    # High-risk / medium-risk category bonus, capped at 0.25
+    risk_score = min(0.25, float(model["risk_weights"] @ matched))
+
+    # Density of hits per category, with diminishing returns
+    match_density = float(np.minimum(0.05, match_counts * 0.01).sum())
+
+    # Adjust for message length (very short or very long messages are less likely to be scams)
+    length_factor = 1.0
+    if message_length < 20:  # Very short messages
+        length_factor = 0.5
+    elif message_length > 500:  # Very long messages
+        length_factor = 0.8
+
+    # Combine factors
+    confidence = (base_score + risk_score + match_density) * length_factor
+
+    # Ensure score is between 0 and 1
+    return min(1.0, max(0.0, confidence))
+
+def calculate_confidence_score(matched_categories: List[str], matched_indicators: List[Dict[str, Any]], message_length: int) -> float:
+    """
+    Calculate a confidence score based on the number and types of matched categories,
+    the specific matches found, and the message length
+    
+    Args:
+        matched_categories: List of matched category IDs
+        matched_indicators: Detailed information about matches
+        message_length: Length of the message in characters
+        
+    Returns:
+        Confidence score between 0 and 1
+    """
+    if not matched_categories:
+        return 0.0
+    model = get_scam_scoring_model()
+    return score_confidence_vector(build_match_count_vector(matched_indicators, model), message_length, model)
+
+# Rule registry: rules are added here and compiled once, instead of being rebuilt per call
+def register_scam_rules(category_id: str, patterns: List[str], name: Optional[str] = None,
+                        description: Optional[str] = None, replace: bool = False) -> Dict[str, Any]:
+    """
+    Register pattern rules for an indicator category and recompile the engine
+
+    Args:
+        category_id: Indicator category; created if it does not exist yet
+        patterns: Regex or literal patterns to add
+        name: Display name for a new category
+        description: Description for a new category
+        replace: Replace the category's existing patterns instead of extending them
+
+    Returns:
+        The recompiled pattern engine
+    """
+    updated = {cid: {**category, "patterns": list(category["patterns"])} for cid, category in get_scam_patterns().items()}
+    category = updated.setdefault(category_id, {"name": name or category_id, "description": description or "", "patterns": []})
+    if replace:
+        category["patterns"] = []
+    category["patterns"].extend(pattern for pattern in patterns if pattern not in category["patterns"])
+    return refresh_scam_pattern_engine(updated)
+
+def register_high_risk_phrases(scam_type_id: str, phrases: List[str], replace: bool = False) -> Dict[str, Any]:
+    """
+    Register high-risk phrases that directly classify a message as the given scam type
+
+    Args:
+        scam_type_id: Scam type assigned when one of the phrases matches
+        phrases: Regex patterns to add
+        replace: Replace the type's existing phrases instead of extending them
+
+    Returns:
+        The recompiled high-risk phrase rules
+    """
+    rules = get_active_scam_rules()
+    if scam_type_id not in rules.scam_types:
+        raise ValueError(f"Unknown scam type: {scam_type_id}")
+    updated = {type_id: list(pattern_list) for type_id, pattern_list in rules.high_risk_phrases.items()}
+    current = [] if replace else updated.get(scam_type_id, [])
+    updated[scam_type_id] = current + [phrase for phrase in phrases if phrase not in current]
+    return update_scam_rules(high_risk_phrases=updated).high_risk_engine
+
+def get_rule_registry() -> Dict[str, Any]:
+    """Summary of the registered rules and the active rules version"""
+    rules = get_active_scam_rules()
+    return {
+        "version": get_scam_rules_version(),
+        "categories": {category_id: len(category["patterns"]) for category_id, category in rules.patterns.items()},
+        "languages": rules.pattern_engine["rule_languages"],
+        "high_risk_phrases": {type_id: len(pattern_list) for type_id, pattern_list in rules.high_risk_phrases.items()},
+        "scam_types": list(rules.scam_types.keys())
+    }
+
+# Rule pack integration: the scam rule set is compiled off the request path and swapped in by reference
+class ScamRuleSet(NamedTuple):
+    """Definitions and compiled form of the scam rules, installed as one object so readers never mix two rule packs"""
+    patterns: Dict[str, Dict[str, Any]]
+    high_risk_phrases: Dict[str, List[str]]
+    scam_types: Dict[str, Dict[str, Any]]
+    pattern_engine: Dict[str, Any]
+    high_risk_engine: Dict[str, Any]
+    scoring_model: Dict[str, Any]
+
+# SCAM_PATTERNS, HIGH_RISK_PHRASES and SCAM_TYPES above are the built-in rules; the active
+# rules (possibly from a rule pack) are read through get_active_scam_rules and its getters
+_ACTIVE_SCAM_RULES: Optional[ScamRuleSet] = None
+_SCAM_RULES_LOCK = threading.RLock()  # only serializes rule updates, never taken by readers of an installed set
+
+def get_active_scam_rules() -> ScamRuleSet:
+    """Return the installed rule set, compiling the built-in rules on first use"""
+    rules = _ACTIVE_SCAM_RULES
+    if rules is None:
+        with _SCAM_RULES_LOCK:
+            if _ACTIVE_SCAM_RULES is None:
+                install_scam_rule_set(compile_scam_rule_set(
+                    {"patterns": SCAM_PATTERNS, "high_risk_phrases": HIGH_RISK_PHRASES, "scam_types": SCAM_TYPES}
+                ))
+            rules = _ACTIVE_SCAM_RULES
+    return rules
+
+def get_scam_patterns() -> Dict[str, Dict[str, Any]]:
+    """Active indicator categories and their patterns"""
+    return get_active_scam_rules().patterns
+
+def get_high_risk_phrases() -> Dict[str, List[str]]:
+    """Active high-risk phrases (scam type id -> patterns)"""
+    return get_active_scam_rules().high_risk_phrases
+
+def get_scam_types() -> Dict[str, Dict[str, Any]]:
+    """Active scam type definitions"""
+    return get_active_scam_rules().scam_types
+
+def update_scam_rules(patterns: Optional[Dict[str, Dict[str, Any]]] = None,
+                      high_risk_phrases: Optional[Dict[str, List[str]]] = None) -> ScamRuleSet:
+    """Compile changed definitions together with the unchanged ones and install the result as a new rule set"""
+    with _SCAM_RULES_LOCK:
+        rules = get_active_scam_rules()
+        compiled = compile_scam_rule_set({
+            "patterns": patterns if patterns is not None else rules.patterns,
+            "high_risk_phrases": high_risk_phrases if high_risk_phrases is not None else rules.high_risk_phrases,
+            "scam_types": rules.scam_types
+        })
+        install_scam_rule_set(compiled)
+    return compiled
+
+def export_scam_rule_set() -> Dict[str, Any]:
+    """Serializable definitions of the active scam rules"""
+    rules = get_active_scam_rules()
+    return {"patterns": rules.patterns, "high_risk_phrases": rules.high_risk_phrases, "scam_types": rules.scam_types}
+
+def compile_scam_rule_set(rule_set: Dict[str, Any]) -> ScamRuleSet:
+    """
+    Validate and compile a scam rule set from a rule pack
+
+    Args:
+        rule_set: Definitions in the shape returned by export_scam_rule_set
+
+    Returns:
+        ScamRuleSet with the definitions, pattern engine, high-risk phrases and scoring model
+    """
+    patterns = rule_set["patterns"]
+    high_risk_phrases = rule_set.get("high_risk_phrases", {})
+    scam_types = rule_set["scam_types"]
+    if "general_suspicious" not in scam_types:
+        raise ValueError("scam_types must define general_suspicious")
+    unknown_types = set(high_risk_phrases) - set(scam_types)
+    if unknown_types:
+        raise ValueError(f"High-risk phrases refer to unknown scam types: {', '.join(sorted(unknown_types))}")
+    return ScamRuleSet(
+        patterns=patterns,
+        high_risk_phrases=high_risk_phrases,
+        scam_types=scam_types,
+        pattern_engine=compile_scam_patterns(patterns),
+        high_risk_engine=compile_high_risk_phrases(high_risk_phrases),
+        scoring_model=build_scam_scoring_model(patterns, scam_types)
+    )
+
+def install_scam_rule_set(compiled: ScamRuleSet) -> None:
+    """
+    Swap in a compiled scam rule set with a single reference assignment; readers never take a lock
+
+    The shared keyword index, the message prefilter and the rule profiler are pointed at the
+    installed rules here rather than at compile time, so compiling a candidate set (e.g. while
+    validating a rule pack) never changes what the active rules match.
+    """
+    global _ACTIVE_SCAM_RULES
+    register_keywords(SCAM_KEYWORD_NAMESPACE, compiled.pattern_engine["literal_categories"].keys())
+    register_prefilter_patterns(SCAM_PREFILTER_GROUP, "scam_patterns", compiled.pattern_engine["regex_patterns"])
+    register_prefilter_patterns(SCAM_PREFILTER_GROUP, "high_risk_phrases", [
+        pattern for pattern_list in compiled.high_risk_phrases.values() for pattern in pattern_list
+    ])
+    register_profiled_rules(DETECTOR_SCAM, "scam_patterns", {
+        make_rule_id(category_id, rule_index): pattern
+        for category_id, category_info in compiled.patterns.items()
+        for rule_index, pattern in enumerate(category_info["patterns"])
+    })
+    register_profiled_rules(DETECTOR_SCAM, "high_risk_phrases", {
+        make_rule_id(f"{HIGH_RISK_CATEGORY}.{scam_type_id}", rule_index): pattern
+        for scam_type_id, pattern_list in compiled.high_risk_phrases.items()
+        for rule_index, pattern in enumerate(pattern_list)
+    })
+    _ACTIVE_SCAM_RULES = compiled
+
+# Built-in rules are compiled at import time, unless the local rule pack overrides them:
+# register_rule_set then compiles and installs the pack (the built-ins compile lazily if that fails)
+if not has_rule_set_override("scam"):
+    install_scam_rule_set(compile_scam_rule_set(
+        {"patterns": SCAM_PATTERNS, "high_risk_phrases": HIGH_RISK_PHRASES, "scam_types": SCAM_TYPES}
+    ))
+
+register_rule_set("scam", export_scam_rule_set, compile_scam_rule_set, install_scam_rule_set)
+
+# Result cache in front of detect_scam: the same forwarded scam text arrives many times
+_SCAM_RESULT_CACHE = get_detection_cache("detection_engine")
+
+def get_scam_rules_version() -> str:
+    """Version of the active rule pack (patterns, high-risk phrases, scam types, domain list), used to key cached results"""
+    rules = get_active_scam_rules()
+    return ":".join([
+        rules.pattern_engine["version"],
+        rules.high_risk_engine["version"],
+        rules.scoring_model["version"],
+        get_reputation_version()
+    ])
+
+def detect_scam(message: str, language: Optional[str] = LANGUAGE_AUTO) -> ScamDetectionResult:
+    """
+    Analyze a message for potential scam indicators, served from the result cache when possible
+
+    Args:
+        message: The message text to analyze
+        language: "auto" runs the rule packs of the scripts found in the message;
+            "zh" or "en" restricts the rules to that language (plus language-neutral rules)
+
+    Returns:
+        Same as detect_scam_uncached
+    """
+    normalized = get_normalized_text(message)
+    if len(normalized) < 5:
+        return detect_scam_uncached(normalized)
+
+    # Cheap first tier: no trigger of any rule in the message, so only a template can still match
+    if not could_match(normalized, SCAM_PREFILTER_GROUP):
+        if len(normalized) >= MIN_TEMPLATE_LENGTH:
+            template_result = detect_scam_template(normalized)
+            if template_result is not None:
+                return template_result
+        return ScamDetectionResult(False, None, [], 0.0)
+
+    # Reported phone numbers, bank accounts and LINE IDs are the strongest signal; no rules needed
+    identifier_result = detect_reported_identifier(normalized)
+    if identifier_result is not None:
+        return identifier_result
+
+    # Variants of a confirmed scam template are classified without running the rules
+    template_result = detect_scam_template(normalized)
+    if template_result is not None:
+        return template_result
+
+    languages = resolve_languages(normalized, language)
+    if languages == detect_languages(normalized):
+        return detect_scam_cached(normalized, detect_scam_uncached)
+    # An explicit language that leaves out part of the message's scripts gives a different result; cached separately
+    return detect_scam_cached(
+        f"{','.join(sorted(languages))}:{normalized}",
+        lambda _: detect_scam_uncached(normalized, languages)
+    )
+
+def detect_scam_cached(key: str, compute) -> ScamDetectionResult:
+    """
+    Serve a detection from the result cache, running the rules within the message's CPU budget otherwise
+
+    A result cut short by the budget is marked incomplete and not cached, so the next copy of the message is scanned again.
+    """
+    rules_version = get_scam_rules_version()
+    cached = _SCAM_RESULT_CACHE.get(key, rules_version)
+    if cached is not None:
+        return cached
+    with message_budget("scam") as budget:
+        result = compute(key)
+    if budget.exhausted:
+        return result._replace(incomplete=True)
+    _SCAM_RESULT_CACHE.put(key, rules_version, result)
+    return result
+
+# Confidence of a message carrying a reported scam identifier
+REPORTED_IDENTIFIER_CONFIDENCE = 0.95
+
+def detect_reported_identifier(message: str) -> Optional[ScamDetectionResult]:
+    """
+    Classify a message carrying a phone number, bank account or LINE ID reported as a scam
+
+    The result is marked with severity 1.0 so that the response orchestrator answers with
+    the scam alert template instead of generating a reply with the LLM.
+
+    Args:
+        message: The (normalized) message text
+
+    Returns:
+        Same as detect_scam_uncached, or None when no reported identifier is found
+    """
+    reported = find_reported_identifiers(message)
+    if not reported:
+        return None
+    scam_types = get_scam_types()
+    scam_type_id = next((identifier["scam_type"] for identifier in reported if identifier["scam_type"] in scam_types), None)
+    if scam_type_id is None:
+        scam_type_id = "general_suspicious"
+
+    scam_info = scam_types[scam_type_id].copy()
+    scam_info["id"] = scam_type_id
+    scam_info["confidence_score"] = REPORTED_IDENTIFIER_CONFIDENCE
+    scam_info["severity"] = 1.0
+    scam_info["reported_identifiers"] = [
+        {"type": identifier["type"], "value": identifier["value"]} for identifier in reported
+    ]
+    spans = []
+    for identifier in reported:
+        position = message.find(identifier["raw"])
+        if position >= 0:
+            spans.append(make_span(f"reported_identifier.{identifier['type']}", position, position + len(identifier["raw"]), identifier["raw"]))
+    matched_indicators = [{
+        "category_id": "reported_identifier",
+        "name": "已通報的詐騙聯絡方式",
+        "description": "訊息中的電話號碼、銀行帳號或 LINE ID 已被通報為詐騙使用",
+        "matches": [identifier["raw"] for identifier in reported],
+        "spans": spans
+    }]
+    return ScamDetectionResult(True, scam_info, matched_indicators, REPORTED_IDENTIFIER_CONFIDENCE)
+
+def detect_scam_template(message: str) -> Optional[ScamDetectionResult]:
+    """
+    Classify a message as a near-duplicate of a known scam template
+
+    Args:
+        message: The (normalized) message text
+
+    Returns:
+        Same as detect_scam_uncached, or None when no template is close enough
+    """
+    match = find_scam_template(message)
+    if match is None:
+        return None
+    template = match["template"]
+    scam_type_id = template.get("scam_type")
+    scam_types = get_scam_types()
+    if scam_type_id not in scam_types:
+        scam_type_id = "general_suspicious"
+
+    confidence = round(match["similarity"], 4)
+    scam_info = scam_types[scam_type_id].copy()
+    scam_info["id"] = scam_type_id
+    scam_info["confidence_score"] = confidence
+    scam_info["matched_template"] = {
+        "id": template["id"],
+        "similarity": confidence
+    }
+    matched_indicators = [{
+        "category_id": "known_scam_template",
+        "name": "已知詐騙範本",
+        "description": "訊息與已確認的詐騙訊息範本高度相似，可能是同一詐騙集團大量發送的變體",
+        "matches": [template["id"]]
+    }]
+    return ScamDetectionResult(True, scam_info, matched_indicators, confidence)
+
+def detect_scam_image(image_bytes: bytes) -> ScamDetectionResult:
+    """
+    Classify an image as a known scam screenshot by its perceptual hash
+
+    Args:
+        image_bytes: Raw image content (PNG, JPEG, ...)
+
+    Returns:
+        Same as detect_scam_uncached; not a scam when no known screenshot is close enough
+
+    Raises:
+        ValueError: If the image cannot be decoded
+    """
+    match = find_scam_image(image_bytes)
+    if match is None:
+        return ScamDetectionResult(False, None, [], 0.0)
+    image = match["image"]
+    scam_type_id = image.get("scam_type")
+    scam_types = get_scam_types()
+    if scam_type_id not in scam_types:
+        scam_type_id = "general_suspicious"
+
+    confidence = match["similarity"]
+    scam_info = scam_types[scam_type_id].copy()
+    scam_info["id"] = scam_type_id
+    scam_info["confidence_score"] = confidence
+    scam_info["matched_image"] = {
+        "id": image["id"],
+        "distance": match["distance"],
+        "similarity": confidence
+    }
+    matched_indicators = [{
+        "category_id": "known_scam_image",
+        "name": "已知詐騙截圖",
+        "description": "圖片與已確認的詐騙截圖幾乎相同，可能是同一則詐騙廣告或對話被大量轉傳",
+        "matches": [image["id"]]
+    }]
+    return ScamDetectionResult(True, scam_info, matched_indicators, confidence)
+
+# Long pasted texts (e.g. whole chat exports) are scanned window by window
+LONG_MESSAGE_THRESHOLD = 3000   # 超過此長度改用分段偵測
+DETECTION_WINDOW_SIZE = 1000    # 每段視窗字數
+DETECTION_WINDOW_OVERLAP = 80   # 視窗重疊字數，避免關鍵詞被切斷
+EARLY_EXIT_CONFIDENCE = 0.6     # 信心分數達到此上限即停止掃描
+MAX_SCAN_CHARS = 50000          # 單則訊息最多掃描字數，限制最壞情況的CPU用量
+HIGH_RISK_PHRASE_CONFIDENCE = 0.8  # 命中高風險語句時的最低信心分數
+MAX_SPANS_PER_CATEGORY = 50     # 每個類別最多回傳的命中位置數（命中內容仍全部計分）
+
+# Rule id of link hits added from the domain reputation index rather than a pattern
+LINK_REPUTATION_RULE_ID = f"{LINK_CATEGORY}.domain_reputation"
+# Profiling id of the combined matcher that locates the first possible regex hit
+COMBINED_RULE_ID = "combined"
+
+def make_span(rule_id: str, start: int, end: int, text: str) -> Dict[str, Any]:
+    """One rule hit: offsets are [start, end) in the normalized message"""
+    return {"rule_id": rule_id, "start": start, "end": end, "text": text}
+
+def apply_link_reputation(matches: List[str], links: List[Dict[str, Any]]) -> List[str]:
+    """
+    Adjust suspicious link matches using the domain reputation of the links in the message
+
+    Args:
+        matches: Raw matches of the suspicious_links rules
+        links: Links found in the message, as returned by assess_links
+
+    Returns:
+        Matches without links to known official domains, plus the domains of links that are
+        known bad, shorteners or lookalikes of official domains
+    """
+    adjusted = []
+    for match in matches:
+        hosts = [link["domain"] for link in extract_urls(match)]
+        # Links pointing only at known official domains are not suspicious by themselves
+        if hosts and all(check_domain(host)["verdict"] == VERDICT_GOOD for host in hosts):
+            continue
+        adjusted.append(match)
+    for link in links:
+        if link["verdict"] in RISKY_VERDICTS and not any(link["domain"] in match for match in adjusted):
+            adjusted.append(link["domain"])
+    return adjusted
+
+def find_nested_hits(literal_hits) -> List[bool]:
+    """
+    Flag the keyword hits that lie inside a longer hit, in one sweep over the hits sorted by start
+
+    Args:
+        literal_hits: (term, start, end) hits from the keyword index
+
+    Returns:
+        One flag per hit, in the order of literal_hits
+    """
+    nested = [False] * len(literal_hits)
+    # Longest hit first among hits with the same start; max_start is the earliest start reaching max_end
+    max_end, max_start = -1, -1
+    for index in sorted(range(len(literal_hits)), key=lambda i: (literal_hits[i][1], -literal_hits[i][2])):
+        _, start, end = literal_hits[index]
+        if max_end > end or (max_end == end and max_start < start):
+            nested[index] = True
+        elif end > max_end:
+            max_end, max_start = end, start
+    return nested
+
+def match_scam_indicators(message: str, languages: Optional[FrozenSet[str]] = None) -> List[Dict[str, Any]]:
+    """
+    Run the compiled scam patterns over a text and collect matched indicators
+
+    Args:
+        message: The (normalized) text to scan
+        languages: Rule packs to run; defaults to the scripts found in the text
+
+    Returns:
+        List of matched indicator dictionaries in SCAM_PATTERNS category order
+    """
+    engine = get_scam_pattern_engine()
+    if languages is None:
+        languages = detect_languages(message)
+    pack = engine["packs"][languages & ALL_LANGUAGES]
+    profiling = profiling_enabled()
+
+    # Literal keyword hits from the shared index (one pass over the message); literal rules are all Chinese
+    literal_hits = scan_keywords(message).get(SCAM_KEYWORD_NAMESPACE, ()) if LANGUAGE_ZH in languages else ()
+    # Every hit as (start, end, text, rule id), per category
+    hits: Dict[str, List[Tuple[int, int, str, str]]] = {}
+    nested = find_nested_hits(literal_hits)
+    for (term, start, end), inside_longer in zip(literal_hits, nested):
+        # Whole-word rules: skip hits that are part of a longer registered term
+        for category_id, whole_word, rule_id in engine["literal_categories"].get(term, []):
+            if whole_word and inside_longer:
+                continue
+            hits.setdefault(category_id, []).append((start, end, term, rule_id))
+    if profiling and hits:
+        record_hits(DETECTOR_SCAM, {hit[3] for category_hits in hits.values() for hit in category_hits})
+
+    # Single pass with the combined matcher; no regex rule can match before this offset
+    started = time.perf_counter_ns() if profiling else 0
+    first_hit = pack["combined"].search(message) if pack["combined"] else None
+    if profiling and pack["combined"]:
+        record_rule(DETECTOR_SCAM, COMBINED_RULE_ID, first_hit is not None, time.perf_counter_ns() - started)
+    links = assess_links(message)
+    if not first_hit and not hits and not links:
+        return []
+
+    # Check for patterns and collect detailed information
+    matched_indicators = []
+    for category_id, category_name, category_description, compiled_rules in pack["categories"]:
+        category_hits = hits.get(category_id, [])
+        # Out of time for this message: the remaining categories keep only their literal hits
+        if first_hit and not budget_expired():
+            offset = first_hit.start()
+            for rule_id, compiled_rule in compiled_rules:
+                started = time.perf_counter_ns() if profiling else 0
+                hit_count = len(category_hits)
+                # Find all matches in the message, with their offsets
+                for found in compiled_rule.finditer(message, offset):
+                    category_hits.append((found.start(), found.end(), found.group(0), rule_id))
+                if profiling:
+                    record_rule(DETECTOR_SCAM, rule_id, len(category_hits) > hit_count, time.perf_counter_ns() - started)
+        if not category_hits and not (category_id == LINK_CATEGORY and links):
+            continue
+        category_hits.sort()
+        # Distinct matched texts in order of first occurrence
+        matches = list(dict.fromkeys(text for _, _, text, _ in category_hits))
+        if category_id == LINK_CATEGORY and links:
+            matches = apply_link_reputation(matches, links)
+            kept = set(matches)
+            category_hits = [hit for hit in category_hits if hit[2] in kept]
+            hit_texts = {hit[2] for hit in category_hits}
+            for domain in matches:
+                position = message.find(domain) if domain not in hit_texts else -1
+                if position >= 0:
+                    category_hits.append((position, position + len(domain), domain, LINK_REPUTATION_RULE_ID))
+            category_hits.sort()
+
+        # If we found matches for this category, add it to our results
+        if matches:
+            matched_indicators.append({
+                "category_id": category_id,
+                "name": category_name,
+                "description": category_description,
+                "matches": matches,
+                "spans": [make_span(rule_id, start, end, text) for start, end, text, rule_id in category_hits[:MAX_SPANS_PER_CATEGORY]]
+            })
+    
+    return matched_indicators
+
+def score_scam_indicators(matched_indicators: List[Dict[str, Any]], message_length: int) -> Tuple[bool, Optional[Dict[str, Any]], float]:
+    """
+    Score matched indicators and pick the most likely scam type
+
+    Args:
+        matched_indicators: Indicators returned by match_scam_indicators
+        message_length: Length of the whole message in characters
+
+    Returns:
+        Tuple of (is_scam, scam type information or None, overall confidence)
+    """
+    # Matched categories as a vector over the category x type weight matrix
+    model = get_scam_scoring_model()
+    return score_match_counts(build_match_count_vector(matched_indicators, model), message_length, model)
+
+def score_match_counts(match_counts: np.ndarray, message_length: int,
+                       model: Optional[Dict[str, Any]] = None) -> Tuple[bool, Optional[Dict[str, Any]], float]:
+    """
+    Score a per-category match count vector and pick the most likely scam type
+
+    Args:
+        match_counts: Number of distinct matches per category, in scoring model order (may be fractional)
+        message_length: Length of the scored text in characters
+        model: Scoring model; defaults to the active one
+
+    Returns:
+        Same as score_scam_indicators
+    """
+    if model is None:
+        model = get_scam_scoring_model()
+    scam_types = model["source"][1]
+    matched = (match_counts > 0).astype(float)
+
+    # Calculate overall confidence score
+    confidence_score = score_confidence_vector(match_counts, message_length, model)
+
+    # Type score: base 1 per matched indicator category + bonus for multiple matches in it
+    category_scores = matched * (1 + np.minimum(0.5, match_counts * 0.1))
+    # Rounded so that mathematically equal scores tie and the first type in scam type order wins
+    type_scores = np.round(model["type_weights"] @ category_scores, 9)
+
+    # Determine most likely scam type (first type with the highest positive score)
+    most_likely_scam = None
+    max_score = 0
+    if len(type_scores):
+        best = int(np.argmax(type_scores))
+        if type_scores[best] > 0:
+            max_score = float(type_scores[best])
+            scam_id = model["type_ids"][best]
+
+            # Create a copy of the scam info with the ID and a confidence score
+            most_likely_scam = scam_types[scam_id].copy()
+            most_likely_scam["id"] = scam_id
+
+            # Calculate specific confidence for this scam type
+            indicator_count = model["type_indicator_counts"][best]
+            matched_indicator_ratio = float(model["type_weights"][best] @ matched) / indicator_count if indicator_count else 0
+            type_confidence = matched_indicator_ratio * 0.7 + confidence_score * 0.3
+            most_likely_scam["confidence_score"] = min(1.0, type_confidence)
+    
+    # If no specific scam type matched well but we have suspicious elements, use generic
+    is_scam = confidence_score > 0.2  # Lower threshold to catch more potential scams
+    
+    if is_scam and (max_score < 1.5 or not most_likely_scam):
+        most_likely_scam = scam_types["general_suspicious"].copy()
+        most_likely_scam["id"] = "general_suspicious"
+        most_likely_scam["confidence_score"] = confidence_score
+    
+    return is_scam, most_likely_scam, confidence_score
+
+# Enhanced detection function with rich analysis and confidence scoring
+def detect_scam_uncached(message: str, languages: Optional[FrozenSet[str]] = None) -> ScamDetectionResult:
+    """
+    Analyze a message for potential scam indicators
+    
+    Args:
+        message: The message text to analyze
+        languages: Rule packs to run; defaults to the scripts found in the message
+        
+    Returns:
+        ScamDetectionResult with:
+        - Boolean indicating if the message appears to be a scam
+        - Dictionary with scam type information if detected, or None
+        - List of matched indicators
+        - Overall confidence score
+    """
+    # Skip short messages or empty ones
+    if not message or len(message) < 5:
+        return ScamDetectionResult(False, None, [], 0.0)
+
+    # Very long pastes are scanned incrementally with early exit
+    if len(message) > LONG_MESSAGE_THRESHOLD:
+        is_scam, most_likely_scam, matched_indicators, confidence_score, _ = detect_scam_windowed(message, languages=languages)
+    else:
+        matched_indicators = match_scam_indicators(message, languages)
+        is_scam, most_likely_scam, confidence_score = False, None, 0.0
+        if matched_indicators:
+            is_scam, most_likely_scam, confidence_score = score_scam_indicators(matched_indicators, len(message))
+
+    # A high-risk phrase decides the scam type on its own
+    high_risk = match_high_risk_phrase(message, languages)
+    if high_risk:
+        scam_type_id, phrase, span = high_risk
+        confidence_score = max(confidence_score, HIGH_RISK_PHRASE_CONFIDENCE)
+        most_likely_scam = {**get_scam_types()[scam_type_id], **HIGH_RISK_RESULTS.get(scam_type_id, {}),
+                            "id": scam_type_id, "confidence_score": confidence_score}
+        matched_indicators = [{
+            "category_id": HIGH_RISK_CATEGORY,
+            "name": "高風險語句",
+            "description": "訊息包含詐騙常見的高風險語句",
+            "matches": [phrase],
+            "spans": [span]
+        }] + matched_indicators
+        return ScamDetectionResult(True, most_likely_scam, matched_indicators, confidence_score)
+
+    return ScamDetectionResult(is_scam, most_likely_scam, matched_indicators, confidence_score)
+
+def detect_scam_windowed(message: str, window_size: int = DETECTION_WINDOW_SIZE,
+                         overlap: int = DETECTION_WINDOW_OVERLAP,
+                         confidence_ceiling: float = EARLY_EXIT_CONFIDENCE,
+                         languages: Optional[FrozenSet[str]] = None
+                         ) -> Tuple[bool, Dict[str, Any], List[Dict[str, Any]], float, Dict[str, Any]]:
+    """
+    Analyze a long message window by window, stopping once confidence crosses the ceiling
+
+    Category hits are accumulated across windows and the score is updated
+    only when a window adds new matches. Scanning stops early when the
+    confidence reaches confidence_ceiling, and never goes past MAX_SCAN_CHARS.
+
+    Args:
+        message: The message text to analyze
+        window_size: Characters per window
+        overlap: Characters shared by consecutive windows so keywords on a boundary are not cut
+        confidence_ceiling: Confidence at which scanning stops
+        languages: Rule packs to run; by default each window runs the packs of its own scripts
+
+    Returns:
+        Same as detect_scam_uncached plus a dictionary describing the scan
+        (windows scanned, early exit, and the window that triggered the decision)
+    """
+    step = max(1, window_size - overlap)
+    scan_length = min(len(message), MAX_SCAN_CHARS)
+    window_starts = list(range(0, max(scan_length - overlap, 1), step))
+
+    decision = {
+        "mode": "windowed",
+        "window_size": window_size,
+        "total_windows": len(window_starts),
+        "windows_scanned": 0,
+        "early_exit": False,
+        "truncated": len(message) > MAX_SCAN_CHARS,
+        "trigger_window": None,
+        "budget_exhausted": False
+    }
+
+    accumulated: Dict[str, Dict[str, Any]] = {}
+    category_order = list(get_scam_pattern_engine()["source"].keys())
+    is_scam, most_likely_scam, confidence_score = False, None, 0.0
+    matched_indicators: List[Dict[str, Any]] = []
+
+    for window_index, window_start in enumerate(window_starts):
+        if budget_expired():
+            decision["budget_exhausted"] = True
+            break
+        window_end = min(window_start + window_size, scan_length)
+        decision["windows_scanned"] = window_index + 1
+
+        # Merge this window's hits into the running indicators
+        new_matches = False
+        for indicator in match_scam_indicators(message[window_start:window_end], languages):
+            current = accumulated.setdefault(indicator["category_id"], {**indicator, "matches": [], "spans": []})
+            for match in indicator["matches"]:
+                if match not in current["matches"]:
+                    current["matches"].append(match)
+                    new_matches = True
+            # Window offsets shifted to the whole message; hits in the overlap are seen twice
+            for span in indicator["spans"]:
+                shifted = {**span, "start": span["start"] + window_start, "end": span["end"] + window_start}
+                if len(current["spans"]) < MAX_SPANS_PER_CATEGORY and shifted not in current["spans"]:
+                    current["spans"].append(shifted)
+        if not new_matches:
+            continue
+
+        matched_indicators = [accumulated[category_id] for category_id in category_order if category_id in accumulated]
+        was_scam = is_scam
+        is_scam, most_likely_scam, confidence_score = score_scam_indicators(matched_indicators, len(message))
+
+        # Remember the window in which the message was first judged a scam
+        if is_scam and not was_scam:
+            decision["trigger_window"] = {"index": window_index, "start": window_start, "end": window_end}
+
+        if confidence_score >= confidence_ceiling:
+            decision["early_exit"] = window_index + 1 < len(window_starts)
+            decision["trigger_window"] = {"index": window_index, "start": window_start, "end": window_end}
+            break
+
+    if not is_scam:
+        decision["trigger_window"] = None
+    if most_likely_scam:
+        most_likely_scam["detection_window"] = decision
+
+    return is_scam, most_likely_scam, matched_indicators, confidence_score, decision
+
+def detect_scam_categories(message: str) -> Tuple[bool, Optional[Dict[str, Any]], List[str]]:
+    """
+    Compatibility shim for callers expecting (is_scam, scam_info, matched categories)
+
+    Args:
+        message: The message text to analyze
+
+    Returns:
+        Tuple of the scam flag, scam type information (or None) and matched category ids
+    """
+    return detect_scam(message).as_category_tuple()
@@ -0,0 +1,324 @@
+from typing import Dict, Any, List, Optional, Tuple
+from functools import lru_cache
+import hashlib
+import mmap
+import os
+import re
+import threading
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel, Field
+from app.apis.text_normalization import get_normalized_text
+from app.apis.rule_packs import get_private_data_dir, is_trusted_path
+
+'''
+1. API用途：網址擷取與本地網域信譽索引，判斷訊息中的連結屬於已知詐騙網域、官方網域、短網址或未知網域，
+   供 scam_detector 的「可疑連結」分類使用（例如區分 bank-secure.example.com 與真正的銀行網域）
+2. 關聯頁面：後台管理頁面（查詢網域信譽、重新載入清單）
+3. 目前狀態：啟用中（清單檔於啟動時編譯為排序後的索引檔並以 mmap 載入，多個 worker 共用同一份分頁；
+   查詢為二分搜尋，並以 LRU 快取常見網域；索引檔放在只有本程序使用者可存取的資料目錄）
+'''
+
+router = APIRouter(
+    prefix="/domain-reputation",
+    tags=["domain-reputation"],
+    responses={404: {"description": "Not found"}},
+)
+
+# 清單來源檔（可用環境變數指定其他路徑）
+DEFAULT_REPUTATION_SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "domain_reputation.txt")
+REPUTATION_SOURCE = os.environ.get("DOMAIN_REPUTATION_FILE", DEFAULT_REPUTATION_SOURCE)
+
+# 信譽分類
+VERDICT_BAD = "bad"
+VERDICT_GOOD = "good"
+VERDICT_SHORTENER = "shortener"
+VERDICT_LOOKALIKE = "lookalike"
+VERDICT_UNKNOWN = "unknown"
+RISKY_VERDICTS = (VERDICT_BAD, VERDICT_SHORTENER, VERDICT_LOOKALIKE)
+
+_SECTION_LABELS = {
+    VERDICT_BAD: b"b",
+    VERDICT_GOOD: b"g",
+    VERDICT_SHORTENER: b"s",
+}
+_LABEL_VERDICTS = {label: verdict for verdict, label in _SECTION_LABELS.items()}
+
+# 仿冒網域常模仿的品牌（官方網域的主要名稱）；未列入清單的網域以完整標籤比對，不做子字串比對
+LOOKALIKE_BRANDS = (
+    "line", "google", "apple", "youtube", "facebook", "landbank", "firstbank", "megabank",
+    "cathaybk", "ctbcbank", "esunbank", "taishinbank", "fubon"
+)
+LOOKALIKE_EXACT_MIN_LENGTH = 5      # 品牌名稱本身出現在非官方網域（例如 esunbank-verify.com）
+LOOKALIKE_HOMOGLYPH_MIN_LENGTH = 4  # 以形近字元替換的品牌（例如 1ine、g00gle）
+LOOKALIKE_EDIT_MIN_LENGTH = 6       # 與品牌相差一個字元（例如 gooogle、fac3book）
+
+# 形近字元（先替換多字元組合）
+_HOMOGLYPHS = (("rn", "m"), ("vv", "w"), ("0", "o"), ("1", "l"), ("i", "l"), ("3", "e"), ("5", "s"), ("7", "t"), ("4", "a"))
+
+# 無協定前綴的網域只接受常見頂級網域，避免把 "file.txt" 之類的字串當成網址
+COMMON_TLDS = frozenset([
+    "com", "net", "org", "tw", "cc", "me", "io", "co", "info", "biz", "xyz", "top", "vip", "club",
+    "shop", "site", "online", "app", "ly", "gl", "gd", "at", "id", "hk", "cn", "jp", "us", "uk",
+    "asia", "link", "live", "pro", "work", "fun", "icu", "cyou", "buzz", "win", "bet"
+])
+
+# 網址擷取（訊息已正規化：全形句點已轉為半形、英文字母已轉為小寫）
+_URL_RE = re.compile(
+    r"(?<![a-z0-9.@-])"
+    r"(?P<scheme>(?:https?|hxxps?)://)?"
+    r"(?:[^\s/@]+@)?"
+    r"(?P<host>(?:[a-z0-9](?:[a-z0-9-]{0,61}[a-z0-9])?\.)+[a-z]{2,24})"
+    r"(?::\d{1,5})?"
+    r"(?P<path>/[^\s\u3000-\u303f\u3400-\u9fff]*)?",  # 路徑到空白、中文字或中文標點為止（中文訊息的網址後常直接接文字）
+    re.IGNORECASE
+)
+# 擷取網址使用的規則（供訊息預篩推導觸發詞）
+LINK_PATTERNS = (_URL_RE,)
+_URL_TRAILING_PUNCTUATION = ".,;:!?)]}'\"，。；：！？）」』"
+
+class DomainReputationIndex:
+    """
+    Sorted, memory-mapped domain -> verdict index
+
+    The source list is compiled once into a sorted "domain\\tlabel\\n" file named after the
+    content hash of the source, so every worker maps the same file and shares its pages.
+    """
+
+    def __init__(self, source_path: str):
+        self.source_path = source_path
+        self.version = ""
+        self.entry_count = 0
+        self.index_path: Optional[str] = None
+        self._file = None
+        self._mm = None  # mmap，或目錄無法使用時的 bytes
+        self._load()
+
+    @staticmethod
+    def parse_source(content: str) -> Dict[str, str]:
+        """解析清單來源檔，回傳 {網域: 分類}；同一網域重複出現時以後者為準"""
+        entries: Dict[str, str] = {}
+        section = None
+        for raw_line in content.splitlines():
+            line = raw_line.split("#", 1)[0].strip().lower()
+            if not line:
+                continue
+            if line.startswith("[") and line.endswith("]"):
+                section = line[1:-1].strip()
+                if section not in _SECTION_LABELS:
+                    raise ValueError(f"Unknown section in domain reputation list: {section}")
+                continue
+            if section is None:
+                raise ValueError(f"Domain outside of a section: {line}")
+            domain = line.strip(".")
+            if domain:
+                entries[domain] = section
+        return entries
+
+    def _load(self) -> None:
+        with open(self.source_path, "rb") as source_file:
+            raw = source_file.read()
+        self.version = hashlib.sha1(raw).hexdigest()[:12]
+        entries = self.parse_source(raw.decode("utf-8"))
+        self.entry_count = len(entries)
+        if not entries:
+            return
+
+        lines = None
+        # 索引檔放在私有資料目錄，既有檔案需屬於本程序的使用者才使用；目錄無法使用時索引只放在記憶體
+        try:
+            self.index_path = os.path.join(get_private_data_dir("domain_reputation"), f"domain_reputation-{self.version}.idx")
+        except OSError as e:
+            print(f"Domain reputation index directory unavailable, keeping the index in memory: {str(e)}")
+            self.index_path = None
+        if self.index_path is None or not is_trusted_path(self.index_path):
+            lines = sorted(
+                domain.encode("utf-8") + b"\t" + _SECTION_LABELS[verdict] + b"\n"
+                for domain, verdict in entries.items()
+            )
+        if self.index_path is None:
+            self._mm = b"".join(lines)
+            return
+        if lines is not None:
+            # 寫入暫存檔後再原子性更名，同時啟動的 worker 不會讀到寫到一半的索引
+            tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as index_file:
+                index_file.write(b"".join(lines))
+            os.replace(tmp_path, self.index_path)
+
+        self._file = open(self.index_path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def close(self) -> None:
+        if isinstance(self._mm, mmap.mmap):
+            self._mm.close()
+            self._mm = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _search(self, key: bytes) -> Optional[bytes]:
+        """在排序後的索引檔中二分搜尋完整網域"""
+        mm = self._mm
+        if mm is None:
+            return None
+        lo, hi = 0, len(mm)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            line_start = mm.rfind(b"\n", 0, mid) + 1
+            line_end = mm.find(b"\n", line_start)
+            domain, _, label = mm[line_start:line_end].partition(b"\t")
+            if domain == key:
+                return label
+            if domain < key:
+                lo = line_end + 1
+            else:
+                hi = line_start
+        return None
+
+    def lookup(self, host: str) -> Tuple[str, Optional[str]]:
+        """
+        查詢網域信譽（子網域套用最接近的上層網域分類）
+        回傳 (分類, 命中的清單網域)
+        """
+        labels = host.lower().strip(".").split(".")
+        for i in range(len(labels) - 1):
+            candidate = ".".join(labels[i:])
+            label = self._search(candidate.encode("utf-8"))
+            if label is not None:
+                return _LABEL_VERDICTS[label], candidate
+        return VERDICT_UNKNOWN, None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "source_path": self.source_path,
+            "index_path": self.index_path,
+            "version": self.version,
+            "entries": self.entry_count,
+            "index_bytes": len(self._mm) if self._mm is not None else 0
+        }
+
+_INDEX_LOCK = threading.Lock()
+_REPUTATION_INDEX = DomainReputationIndex(REPUTATION_SOURCE)
+
+def get_reputation_index() -> DomainReputationIndex:
+    return _REPUTATION_INDEX
+
+def get_reputation_version() -> str:
+    return _REPUTATION_INDEX.version
+
+def reload_reputation_index(source_path: Optional[str] = None) -> DomainReputationIndex:
+    """重新載入清單；新索引建立完成後才替換，查詢不需加鎖"""
+    global _REPUTATION_INDEX
+    with _INDEX_LOCK:
+        new_index = DomainReputationIndex(source_path or _REPUTATION_INDEX.source_path)
+        _REPUTATION_INDEX = new_index
+        check_domain.cache_clear()
+    return new_index
+
+def normalize_homoglyphs(label: str) -> str:
+    for source, target in _HOMOGLYPHS:
+        label = label.replace(source, target)
+    return label
+
+def within_one_edit(a: str, b: str) -> bool:
+    """兩個字串是否只差一個字元（替換、插入或刪除）"""
+    if abs(len(a) - len(b)) > 1 or a == b:
+        return a == b
+    if len(a) > len(b):
+        a, b = b, a
+    i = 0
+    while i < len(a) and a[i] == b[i]:
+        i += 1
+    return a[i + (len(a) == len(b)):] == b[i + 1:]
+
+_BRAND_HOMOGLYPHS = {normalize_homoglyphs(brand): brand for brand in LOOKALIKE_BRANDS}
+
+def find_lookalike_brand(host: str) -> Optional[str]:
+    """
+    未列入清單的網域所模仿的品牌：網域標籤（以 . 與 - 分開，不含頂級網域）等於品牌名稱、
+    以形近字元替換後等於品牌名稱，或與品牌名稱只差一個字元；沒有時回傳 None
+    """
+    labels = host.split(".")[:-1]
+    for part in (part for label in labels for part in label.split("-") if part):
+        for brand in LOOKALIKE_BRANDS:
+            if part == brand:
+                if len(brand) >= LOOKALIKE_EXACT_MIN_LENGTH:
+                    return brand
+            elif len(brand) >= LOOKALIKE_EDIT_MIN_LENGTH and within_one_edit(part, brand):
+                return brand
+        if len(part) >= LOOKALIKE_HOMOGLYPH_MIN_LENGTH:
+            brand = _BRAND_HOMOGLYPHS.get(normalize_homoglyphs(part))
+            if brand is not None and part != brand:
+                return brand
+    return None
+
+def is_lookalike_domain(host: str) -> bool:
+    """未列入清單、但模仿官方品牌名稱的網域"""
+    return find_lookalike_brand(host) is not None
+
+@lru_cache(maxsize=4096)
+def check_domain(host: str) -> Dict[str, Any]:
+    """查詢單一網域的信譽，回傳共用快取結果，請勿修改"""
+    verdict, listed_domain = _REPUTATION_INDEX.lookup(host)
+    if verdict == VERDICT_UNKNOWN and is_lookalike_domain(host):
+        verdict = VERDICT_LOOKALIKE
+    return {"domain": host, "verdict": verdict, "listed_domain": listed_domain}
+
+def extract_urls(text: str) -> List[Dict[str, str]]:
+    """
+    從訊息中擷取網址與網域（依出現順序，不重複）
+    無協定前綴的網域需以 www. 開頭、帶有路徑或使用常見頂級網域
+    """
+    text = get_normalized_text(text)
+    if "." not in text:
+        return []
+
+    urls: Dict[str, Dict[str, str]] = {}
+    for match in _URL_RE.finditer(text):
+        host = match.group("host").lower()
+        if not (match.group("scheme") or match.group("path") or host.startswith("www.")):
+            if host.rsplit(".", 1)[-1] not in COMMON_TLDS:
+                continue
+        url = match.group(0).rstrip(_URL_TRAILING_PUNCTUATION)
+        if url not in urls:
+            urls[url] = {"url": url, "domain": host}
+    return list(urls.values())
+
+def assess_links(text: str) -> List[Dict[str, Any]]:
+    """擷取訊息中的連結並查詢各自的網域信譽"""
+    return [{"url": link["url"], **check_domain(link["domain"])} for link in extract_urls(text)]
+
+class DomainCheckRequest(BaseModel):
+    text: str = Field(..., description="要檢查的網址、網域或包含連結的訊息")
+
+@router.post("/check", summary="查詢網域信譽", description="擷取文字中的連結，回傳各網域屬於詐騙、官方、短網址、仿冒或未知")
+def check_domain_reputation(request: DomainCheckRequest):
+    """查詢文字中各連結的網域信譽"""
+    try:
+        return {"links": assess_links(request.text), "version": get_reputation_version()}
+    except Exception as e:
+        print(f"Error checking domain reputation: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to check domain reputation: {str(e)}") from e
+
+@router.get("/stats", summary="取得網域信譽索引資訊", description="取得目前載入的網域清單版本、筆數與查詢快取統計")
+def get_reputation_stats():
+    """取得網域信譽索引統計"""
+    try:
+        cache_info = check_domain.cache_info()
+        return {
+            **_REPUTATION_INDEX.stats(),
+            "lookup_cache": {"hits": cache_info.hits, "misses": cache_info.misses, "size": cache_info.currsize}
+        }
+    except Exception as e:
+        print(f"Error getting domain reputation stats: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to get domain reputation stats: {str(e)}") from e
+
+@router.post("/reload", summary="重新載入網域清單", description="重新讀取網域信譽清單檔並重建索引")
+def reload_domain_reputation():
+    """重新載入網域信譽清單"""
+    try:
+        index = reload_reputation_index()
+        return {"success": True, **index.stats()}
+    except Exception as e:
+        print(f"Error reloading domain reputation list: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to reload domain reputation list: {str(e)}") from e
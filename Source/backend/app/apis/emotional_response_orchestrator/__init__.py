@@ -22,9 +22,13 @@ def check_content_safety(text):
     """備用內容安全檢查函數"""
     return {"is_safe": True, "flagged_categories": [], "alert_level": "none", "rejection_response": None, "processing_time": 0.0}
 
-from app.apis.scam_detector import detect_scam
+from app.apis.detection_engine import detect_scam
+from app.apis.conversation_risk import record_message, ConversationRiskState
 from app.apis.special_response import detect_special_situation, generate_special_response
 from app.apis.keyword_responses import get_response_for_keyword
+from app.apis.keyword_index import register_keywords, scan_keywords, find_keywords
+from app.apis.message_prefilter import register_prefilter_namespaces, could_match
+from app.apis.rule_packs import register_rule_set
 
 # Define priority levels for different types of responses
 class ResponsePriority:
@@ -68,7 +72,8 @@ def orchestrate_response(
     
     Args:
         message: The user's message
-        user_id: Optional user ID for tracking
+        user_id: Optional user ID for tracking; conversation risk state is only kept when set,
+            otherwise the analysis falls back to chat_history alone
         chat_history: Optional chat history for context
         
     Returns:
@@ -114,8 +119,16 @@ def orchestrate_response(
             }
         context["safety_result"] = safety_result
         
+        # 2.5 Analyze the message once and fold it into the user's conversation risk state
+        scam_result = detect_scam(message)
+        conversation = None
+        if user_id:
+            conversation = record_message(
+                user_id, scam_result, {CRISIS_DISTRESS_NAMESPACE: find_distress_terms(message)}, len(message)
+            )
+        
         # 3. Crisis detection - highest priority
-        crisis_result = detect_crisis_situation(message, chat_history)
+        crisis_result = detect_crisis_situation(message, chat_history, conversation)
         context["crisis_result"] = crisis_result
         
         if crisis_result.is_crisis:
@@ -177,7 +190,13 @@ def orchestrate_response(
             ))
         
         # 6. Scam detection
-        is_scam, scam_info, matched_categories = detect_scam(message)
+        is_scam, scam_info, matched_categories = scam_result.as_category_tuple()
+        
+        # Scams spread over several messages: the conversation as a whole may show a specific scam type
+        if conversation is not None and (not is_scam or (scam_info and scam_info.get("id") == "general_suspicious")):
+            conversation_result = conversation.assess_scam()
+            if conversation_result is not None:
+                is_scam, scam_info, matched_categories = conversation_result.as_category_tuple()
         context["scam_analysis"] = {
             "is_scam": is_scam,
             "scam_info": scam_info,
@@ -242,82 +261,159 @@ def orchestrate_response(
             "processing_time": time.time() - processing_start if 'processing_start' in locals() else 0
         }
 
-def detect_crisis_situation(message: str, chat_history: Optional[List[Dict[str, str]]] = None) -> CrisisIndicator:
+# Self-harm and suicidal ideation patterns
+SUICIDE_PATTERNS = [
+    "想死", "自殺", "輕生", "了結", "活不下去", "沒意思了", "不想活", "結束生命",
+    "沒有活下去的意義", "沒理由再活著", "想一死百了", "不如死了算了", "活著沒意思"
+]
+
+# Immediate danger patterns
+DANGER_PATTERNS = [
+    "有人威脅我", "被追殺", "被跟蹤", "被人找上門", "被恐嚇", "被綁架", "被監禁",
+    "他們逼我交錢", "他們說要傷害我", "恐怕他們要來找我"
+]
+
+# Severe financial loss patterns
+SEVERE_LOSS_PATTERNS = [
+    "我已經被騙了", "我失去了所有積蓄", "我借了很多錢", "把退休金都給了",
+    "跳樓", "負債累累", "無力償還", "透支了全部信用卡", "被騙了很大一筆錢"
+]
+
+# Distress keywords used for escalation detection over recent history
+DISTRESS_KEYWORDS = ["害怕", "擔心", "焦慮", "絕望", "痛苦", "無助", "受不了", "無力"]
+
+# Vocabularies registered into the shared keyword index
+CRISIS_SUICIDE_NAMESPACE = "crisis_suicide"
+CRISIS_DANGER_NAMESPACE = "crisis_danger"
+CRISIS_SEVERE_LOSS_NAMESPACE = "crisis_severe_loss"
+CRISIS_DISTRESS_NAMESPACE = "crisis_distress"
+
+register_keywords(CRISIS_SUICIDE_NAMESPACE, SUICIDE_PATTERNS)
+register_keywords(CRISIS_DANGER_NAMESPACE, DANGER_PATTERNS)
+register_keywords(CRISIS_SEVERE_LOSS_NAMESPACE, SEVERE_LOSS_PATTERNS)
+register_keywords(CRISIS_DISTRESS_NAMESPACE, DISTRESS_KEYWORDS)
+
+# Prefilter group for the vocabularies checked against the current message (distress is only used on history)
+CRISIS_PREFILTER_GROUP = "crisis"
+register_prefilter_namespaces(CRISIS_PREFILTER_GROUP, [CRISIS_SUICIDE_NAMESPACE, CRISIS_DANGER_NAMESPACE, CRISIS_SEVERE_LOSS_NAMESPACE])
+CRISIS_DISTRESS_PREFILTER_GROUP = "crisis_distress"
+register_prefilter_namespaces(CRISIS_DISTRESS_PREFILTER_GROUP, [CRISIS_DISTRESS_NAMESPACE])
+
+# Escalation detection: distinct distress terms over the last messages of the conversation
+ESCALATION_MESSAGES = 2
+ESCALATION_MIN_TERMS = 3
+ESCALATION_MAX_AGE = 3600  # seconds; older messages in the conversation state are not considered
+
+def find_distress_terms(message: str) -> List[str]:
+    """Distress keywords in a message, recorded into the conversation state for escalation detection"""
+    if not could_match(message, CRISIS_DISTRESS_PREFILTER_GROUP):
+        return []
+    return find_keywords(message, CRISIS_DISTRESS_NAMESPACE)
+
+# Rule pack integration: crisis vocabularies can be republished without a restart
+CRISIS_RULE_KEYS = ("suicide", "danger", "severe_loss", "distress")
+
+def export_crisis_rule_set() -> Dict[str, List[str]]:
+    """Serializable definitions of the crisis vocabularies"""
+    return {
+        "suicide": SUICIDE_PATTERNS,
+        "danger": DANGER_PATTERNS,
+        "severe_loss": SEVERE_LOSS_PATTERNS,
+        "distress": DISTRESS_KEYWORDS
+    }
+
+def compile_crisis_rule_set(rule_set: Dict[str, Any]) -> Dict[str, List[str]]:
+    """Validate crisis vocabularies from a rule pack"""
+    compiled = {}
+    for key in CRISIS_RULE_KEYS:
+        terms = rule_set.get(key)
+        if not isinstance(terms, list) or not all(isinstance(term, str) and term for term in terms):
+            raise ValueError(f"{key} must be a list of non-empty strings")
+        compiled[key] = list(terms)
+    return compiled
+
+def install_crisis_rule_set(compiled: Dict[str, List[str]]) -> None:
+    """Swap in new crisis vocabularies"""
+    global SUICIDE_PATTERNS, DANGER_PATTERNS, SEVERE_LOSS_PATTERNS, DISTRESS_KEYWORDS
+    register_keywords(CRISIS_SUICIDE_NAMESPACE, compiled["suicide"])
+    register_keywords(CRISIS_DANGER_NAMESPACE, compiled["danger"])
+    register_keywords(CRISIS_SEVERE_LOSS_NAMESPACE, compiled["severe_loss"])
+    register_keywords(CRISIS_DISTRESS_NAMESPACE, compiled["distress"])
+    SUICIDE_PATTERNS = compiled["suicide"]
+    DANGER_PATTERNS = compiled["danger"]
+    SEVERE_LOSS_PATTERNS = compiled["severe_loss"]
+    DISTRESS_KEYWORDS = compiled["distress"]
+
+register_rule_set("crisis", export_crisis_rule_set, compile_crisis_rule_set, install_crisis_rule_set)
+
+def detect_crisis_situation(message: str, chat_history: Optional[List[Dict[str, str]]] = None,
+                            conversation: Optional[ConversationRiskState] = None) -> CrisisIndicator:
     """
     Detect potential crisis situations that require immediate attention.
     
     Args:
         message: The user's message
         chat_history: Optional chat history for context
+        conversation: Optional conversation risk state of the user, already updated with this message;
+            used instead of re-scanning chat_history for escalating distress once it holds
+            ESCALATION_MESSAGES messages
         
     Returns:
         CrisisIndicator with detection results
     """
-    # Self-harm and suicidal ideation patterns
-    suicide_patterns = [
-        "想死", "自殺", "輕生", "了結", "活不下去", "沒意思了", "不想活", "結束生命",
-        "沒有活下去的意義", "沒理由再活著", "想一死百了", "不如死了算了", "活著沒意思"
-    ]
-    
-    # Immediate danger patterns
-    danger_patterns = [
-        "有人威脅我", "被追殺", "被跟蹤", "被人找上門", "被恐嚇", "被綁架", "被監禁",
-        "他們逼我交錢", "他們說要傷害我", "恐怕他們要來找我"
-    ]
-    
-    # Severe financial loss patterns
-    severe_loss_patterns = [
-        "我已經被騙了", "我失去了所有積蓄", "我借了很多錢", "把退休金都給了",
-        "跳樓", "負債累累", "無力償還", "透支了全部信用卡", "被騙了很大一筆錢"
-    ]
+    # One pass over the message through the shared keyword index, skipped when no crisis term can match
+    hits = scan_keywords(message) if could_match(message, CRISIS_PREFILTER_GROUP) else {}
     
     # Check for crisis indicators
-    for pattern in suicide_patterns:
-        if pattern in message:
-            return CrisisIndicator(
-                is_crisis=True,
-                crisis_type="suicide_risk",
-                confidence=0.9,
-                priority=ResponsePriority.CRISIS,
-                recommended_action="immediate_emotional_support_with_resources"
-            )
+    if hits.get(CRISIS_SUICIDE_NAMESPACE):
+        return CrisisIndicator(
+            is_crisis=True,
+            crisis_type="suicide_risk",
+            confidence=0.9,
+            priority=ResponsePriority.CRISIS,
+            recommended_action="immediate_emotional_support_with_resources"
+        )
     
-    for pattern in danger_patterns:
-        if pattern in message:
-            return CrisisIndicator(
-                is_crisis=True,
-                crisis_type="immediate_danger",
-                confidence=0.85,
-                priority=ResponsePriority.CRISIS,
-                recommended_action="safety_first_with_emergency_contact_info"
-            )
+    if hits.get(CRISIS_DANGER_NAMESPACE):
+        return CrisisIndicator(
+            is_crisis=True,
+            crisis_type="immediate_danger",
+            confidence=0.85,
+            priority=ResponsePriority.CRISIS,
+            recommended_action="safety_first_with_emergency_contact_info"
+        )
     
-    for pattern in severe_loss_patterns:
-        if pattern in message:
-            return CrisisIndicator(
-                is_crisis=True,
-                crisis_type="severe_financial_distress",
-                confidence=0.8,
-                priority=ResponsePriority.URGENT,
-                recommended_action="supportive_guidance_with_resources"
-            )
+    if hits.get(CRISIS_SEVERE_LOSS_NAMESPACE):
+        return CrisisIndicator(
+            is_crisis=True,
+            crisis_type="severe_financial_distress",
+            confidence=0.8,
+            priority=ResponsePriority.URGENT,
+            recommended_action="supportive_guidance_with_resources"
+        )
     
-    # Check chat history for escalating distress if available
-    if chat_history and len(chat_history) > 1:
+    # Check recent messages for escalating distress: from the conversation state when it already holds
+    # enough messages (e.g. not right after a restart or in another worker), otherwise by scanning
+    # the chat history sent with the request
+    recent_distress = None
+    if conversation is not None and len(conversation.recent) >= ESCALATION_MESSAGES:
+        recent_distress = conversation.recent_terms(CRISIS_DISTRESS_NAMESPACE, ESCALATION_MESSAGES, ESCALATION_MAX_AGE)
+    elif chat_history and len(chat_history) > 1:
         user_messages = [msg["content"] for msg in chat_history if msg.get("role") == "user"]
-        if len(user_messages) >= 2:
+        if len(user_messages) >= ESCALATION_MESSAGES:
             # Simple escalation detection - check if recent messages contain more distress indicators
-            distress_keywords = ["害怕", "擔心", "焦慮", "絕望", "痛苦", "無助", "受不了", "無力"]
-            recent_distress_count = sum(1 for kw in distress_keywords if any(kw in msg for msg in user_messages[-2:]))
-            
-            if recent_distress_count >= 3:
-                return CrisisIndicator(
-                    is_crisis=True,
-                    crisis_type="escalating_distress",
-                    confidence=0.7,
-                    priority=ResponsePriority.URGENT,
-                    recommended_action="validation_and_grounding_support"
-                )
+            recent_distress = set()
+            for msg in user_messages[-ESCALATION_MESSAGES:]:
+                recent_distress.update(term for term, _, _ in scan_keywords(msg).get(CRISIS_DISTRESS_NAMESPACE, ()))
+    
+    if recent_distress is not None and len(recent_distress) >= ESCALATION_MIN_TERMS:
+        return CrisisIndicator(
+            is_crisis=True,
+            crisis_type="escalating_distress",
+            confidence=0.7,
+            priority=ResponsePriority.URGENT,
+            recommended_action="validation_and_grounding_support"
+        )
     
     # No crisis detected
     return CrisisIndicator(
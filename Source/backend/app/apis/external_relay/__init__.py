@@ -13,6 +13,7 @@ import databutton as db
 # 引入LINE機器人的核心功能
 from app.apis.line_bot import create_line_bot_api
 from app.apis.emotional_response_orchestrator import orchestrate_response, generate_emotional_support_response
+from app.apis.text_normalization import prepare_message
 from linebot.models import TextSendMessage
 
 router = APIRouter(
@@ -113,6 +114,9 @@ async def external_line_webhook(request: Request):
                     
                     print(f"處理來自 {user_id} 的訊息：{message_text[:50]}...")
                     
+                    # 訊息正規化（每則訊息只做一次，供後續各項偵測共用）
+                    prepare_message(message_text)
+                    
                     # 使用統一的編排器來決定回應策略和生成回應
                     print(f"使用編排器處理來自用戶 {user_id} 的訊息")
                     # 獲取聊天歷史（如果有）
@@ -150,7 +154,7 @@ async def external_line_webhook(request: Request):
                         print(f"處理{response_type}情況，使用LLM生成支持性回應")
                         try:
                             # 獲取Anthropic客戶端
-                            from app.apis.ai_conversation import get_anthropic_client, get_system_prompt
+                            from app.apis.ai_conversation import get_anthropic_client
                             client = get_anthropic_client()
                             
                             # 構建特殊系統提示
@@ -241,11 +245,11 @@ async def external_line_webhook(request: Request):
                         print("使用LLM生成一般對話回應")
                         try:
                             # 獲取Anthropic客戶端
-                            from app.apis.ai_conversation import get_anthropic_client, get_system_prompt
+                            from app.apis.ai_conversation import get_anthropic_client, get_cached_system_prompt
                             client = get_anthropic_client()
                             
-                            # 構建系統提示和對話歷史
-                            system_prompt = get_system_prompt(
+                            # 構建系統提示（穩定前綴使用提示快取）和對話歷史
+                            system_prompt = get_cached_system_prompt(
                                 is_scam=False,
                                 scam_info=None,
                                 matched_categories=None,
@@ -0,0 +1,179 @@
+from typing import Dict, Any, List, Tuple, Optional, Iterable
+from collections import OrderedDict, deque
+import threading
+from fastapi import APIRouter
+from app.apis.text_normalization import normalize_text, get_normalized_text
+
+'''
+1. API用途：共用關鍵詞索引（Aho-Corasick 自動機），讓各個關鍵詞式偵測器註冊自己的詞表，
+   每則訊息只需線性掃描一次，即可得知各子系統有哪些詞出現
+2. 關聯頁面：無直接關聯頁面，由 scam_detector、abuse_protection、emotional_response_orchestrator、
+   usage_limits、ai_conversation 等模組內部使用
+3. 目前狀態：啟用中（純字面詞比對，不受 \\b 在中文字之間不成立的問題影響）
+'''
+
+# 創建一個空的router物件以符合Databutton框架要求
+router = APIRouter()
+
+# 掃描結果快取大小（同一則訊息會被多個子系統查詢）
+SCAN_CACHE_SIZE = 256
+
+class KeywordIndex:
+    """Aho-Corasick automaton over the literal vocabularies of several namespaces"""
+
+    def __init__(self):
+        self._vocabularies: Dict[str, Tuple[str, ...]] = {}
+        self._lock = threading.Lock()
+        self._automaton = None
+        self._version = 0
+        self._scan_cache: "OrderedDict[str, Dict[str, Tuple[Tuple[str, int, int], ...]]]" = OrderedDict()
+        self._cache_version = 0
+        self._preloaded: Optional[Dict[str, Any]] = None
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def register(self, namespace: str, terms: Iterable[str]) -> None:
+        """註冊（或替換）某個命名空間的詞表；詞表未變動時不會重建自動機"""
+        normalized_terms = (normalize_text(term) for term in terms if term)
+        vocabulary = tuple(dict.fromkeys(term for term in normalized_terms if term))
+        with self._lock:
+            if self._vocabularies.get(namespace) == vocabulary:
+                return
+            self._vocabularies[namespace] = vocabulary
+            self._automaton = None
+            self._version += 1
+
+    def get_vocabulary(self, namespace: str) -> Tuple[str, ...]:
+        return self._vocabularies.get(namespace, ())
+
+    def _build(self):
+        """建立 goto / fail / output 表"""
+        goto: List[Dict[str, int]] = [{}]
+        outputs: List[List[Tuple[str, str]]] = [[]]
+        for namespace, vocabulary in self._vocabularies.items():
+            for term in vocabulary:
+                state = 0
+                for ch in term:
+                    next_state = goto[state].get(ch)
+                    if next_state is None:
+                        goto.append({})
+                        outputs.append([])
+                        next_state = len(goto) - 1
+                        goto[state][ch] = next_state
+                    state = next_state
+                outputs[state].append((namespace, term))
+
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, next_state in goto[state].items():
+                queue.append(next_state)
+                fallback = fail[state]
+                while fallback and ch not in goto[fallback]:
+                    fallback = fail[fallback]
+                target = goto[fallback].get(ch, 0)
+                fail[next_state] = target if target != next_state else 0
+                outputs[next_state] = outputs[next_state] + outputs[fail[next_state]]
+
+        return goto, fail, [tuple(out) for out in outputs]
+
+    def _get_automaton(self):
+        automaton = self._automaton
+        if automaton is None:
+            with self._lock:
+                if self._automaton is None:
+                    # 規則包內預先建好的自動機，詞表完全相同時直接使用，省去重建
+                    preloaded = self._preloaded
+                    if preloaded is not None and preloaded["vocabularies"] == self._vocabularies:
+                        tables = preloaded["tables"]
+                    else:
+                        tables = self._build()
+                    self._automaton = (self._version, tables)
+                automaton = self._automaton
+        return automaton
+
+    def export_automaton(self) -> Dict[str, Any]:
+        """匯出目前的詞表與自動機，供規則包序列化"""
+        _, tables = self._get_automaton()
+        return {"vocabularies": dict(self._vocabularies), "tables": tables}
+
+    def preload_automaton(self, snapshot: Dict[str, Any]) -> None:
+        """載入規則包中的自動機（由 JSON 還原 tuple）；實際使用時才比對詞表是否一致"""
+        goto, fail, outputs = snapshot["tables"]
+        self._preloaded = {
+            "vocabularies": {namespace: tuple(vocabulary) for namespace, vocabulary in snapshot["vocabularies"].items()},
+            "tables": (goto, fail, [tuple(tuple(output) for output in state_outputs) for state_outputs in outputs])
+        }
+
+    def scan(self, text: str) -> Dict[str, Tuple[Tuple[str, int, int], ...]]:
+        """
+        對訊息的正規化結果做一次線性掃描，回傳每個命名空間命中的 (詞, 起點, 終點)
+        詞表與訊息皆經過相同的正規化，位置以正規化後的訊息為準；回傳值為共用快取，請勿修改
+        """
+        text = get_normalized_text(text)
+        if not text:
+            return {}
+
+        version, (goto, fail, outputs) = self._get_automaton()
+        with self._lock:
+            # 詞表更新後舊的掃描結果作廢；命中時移到最後，讓快取依最近使用淘汰（LRU）
+            if self._cache_version != version:
+                self._scan_cache = OrderedDict()
+                self._cache_version = version
+            cached = self._scan_cache.get(text)
+            if cached is not None:
+                self._scan_cache.move_to_end(text)
+                return cached
+
+        hits: Dict[str, List[Tuple[str, int, int]]] = {}
+        state = 0
+        for position, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for namespace, term in outputs[state]:
+                hits.setdefault(namespace, []).append((term, position - len(term) + 1, position + 1))
+
+        result = {namespace: tuple(found) for namespace, found in hits.items()}
+        with self._lock:
+            # 掃描期間詞表已更新時不寫入，避免舊版本的結果混入新快取
+            if self._cache_version == version:
+                self._scan_cache[text] = result
+                if len(self._scan_cache) > SCAN_CACHE_SIZE:
+                    self._scan_cache.popitem(last=False)
+        return result
+
+    def clear_cache(self) -> None:
+        """清除掃描結果快取"""
+        with self._lock:
+            self._scan_cache = OrderedDict()
+
+# 全系統共用的索引實例
+_SHARED_INDEX = KeywordIndex()
+
+def get_keyword_index() -> KeywordIndex:
+    return _SHARED_INDEX
+
+def register_keywords(namespace: str, terms: Iterable[str]) -> None:
+    """將子系統的詞表註冊到共用索引"""
+    _SHARED_INDEX.register(namespace, terms)
+
+def scan_keywords(text: str) -> Dict[str, Tuple[Tuple[str, int, int], ...]]:
+    """一次掃描訊息，回傳所有命名空間的命中結果"""
+    return _SHARED_INDEX.scan(text)
+
+def find_keywords(text: str, namespace: str) -> List[str]:
+    """回傳某命名空間在訊息中出現的詞（依首次出現順序，不重複）"""
+    hits = _SHARED_INDEX.scan(text).get(namespace, ())
+    return list(dict.fromkeys(term for term, _, _ in hits))
+
+def has_keyword(text: str, namespace: str, terms: Optional[Iterable[str]] = None) -> bool:
+    """檢查訊息是否包含某命名空間的任一詞；可用 terms 限定只看部分詞"""
+    hits = _SHARED_INDEX.scan(text).get(namespace, ())
+    if terms is None:
+        return bool(hits)
+    wanted = {normalize_text(term) for term in terms}
+    return any(term in wanted for term, _, _ in hits)
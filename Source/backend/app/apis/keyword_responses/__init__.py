@@ -3,6 +3,7 @@ import databutton as db
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel, Field
 from typing import Dict, List, Optional, Tuple
+from app.apis.text_normalization import get_normalized_text
 
 '''
 1. API用途：關鍵詞回應 API，處理簡單的關鍵詞模式匹配和回應，如打招呼、告別、感謝等簡單交流
@@ -316,9 +317,8 @@ def get_response_for_keyword(message: str) -> Optional[str]:
     if not config.enabled:
         return None
     
-    # 將訊息轉為小寫以進行不區分大小寫的匹配
-    message_lower = message.lower()
-    message_clean = message_lower.strip()
+    # 使用共用的正規化結果（全形半形、零寬字元、空白、大小寫皆已統一）
+    message_clean = get_normalized_text(message)
     
     # 計算兩個字符串的相似度 (0.0 到 1.0)
     def similarity(s1: str, s2: str) -> float:
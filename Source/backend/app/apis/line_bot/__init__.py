@@ -29,6 +29,8 @@ import re
 from app.apis.emotional_response_orchestrator import orchestrate_response, generate_emotional_support_response
 from app.apis.abuse_protection import check_abuse, AbuseCheckRequest
 from app.apis.usage_limits import check_usage_limits, UsageCheckRequest, update_user_usage, update_global_stats
+from app.apis.text_normalization import prepare_message
+from app.apis.detection_engine import detect_scam_image
 
 router = APIRouter(
     prefix="/line-bot",
@@ -278,6 +280,9 @@ async def webhook(request: Request, x_line_signature: Optional[str] = Header(Non
             message_text = event.message.text
             user_id = event.source.user_id
             
+            # 訊息正規化（每則訊息只做一次，供後續各項偵測共用）
+            prepare_message(message_text)
+            
             # -1. 檢查使用限制
             usage_result = check_usage_limits(UsageCheckRequest(
                 user_id=user_id,
@@ -345,7 +350,7 @@ async def webhook(request: Request, x_line_signature: Optional[str] = Header(Non
                 print(f"處理{response_type}情況，使用LLM生成支持性回應")
                 try:
                     # 獲取Anthropic客戶端
-                    from app.apis.ai_conversation import get_anthropic_client, get_system_prompt
+                    from app.apis.ai_conversation import get_anthropic_client
                     client = get_anthropic_client()
                     
                     # 構建特殊系統提示
@@ -445,11 +450,11 @@ async def webhook(request: Request, x_line_signature: Optional[str] = Header(Non
                 print("使用LLM生成一般對話回應")
                 try:
                     # 獲取Anthropic客戶端
-                    from app.apis.ai_conversation import get_anthropic_client, get_system_prompt, build_prompt
+                    from app.apis.ai_conversation import get_anthropic_client, get_cached_system_prompt, count_usage_tokens
                     client = get_anthropic_client()
                     
-                    # 構建系統提示和對話歷史
-                    system_prompt = get_system_prompt(
+                    # 構建系統提示（穩定前綴使用提示快取）和對話歷史
+                    system_prompt = get_cached_system_prompt(
                         is_scam=False,
                         scam_info=None,
                         matched_categories=None,
@@ -475,9 +480,7 @@ async def webhook(request: Request, x_line_signature: Optional[str] = Header(Non
                         print(f"LLM生成回應成功：{response_message[:50]}...")
                         
                         # 估算token用量
-                        prompt_tokens = response.usage.input_tokens
-                        completion_tokens = response.usage.output_tokens
-                        token_estimate = prompt_tokens + completion_tokens
+                        token_estimate, _, _ = count_usage_tokens(response.usage)
                     else:
                         print("LLM返回空回應，使用預設回應")
                         response_message = "您好！我是防詐小安。有什麼需要我協助的嗎？如果您收到可疑訊息，可以轉發給我來分析。"
@@ -525,12 +528,18 @@ async def webhook(request: Request, x_line_signature: Optional[str] = Header(Non
             message_id = event.message.id
             print(f"Received image with ID: {message_id}")
             
-            # Note: We're not currently downloading or analyzing the image content, but in the future
-            # we could process it with: content = line_bot_api.get_message_content(message_id)
-            
-            # For now, we respond with a generic message for images
-            # In the future, we could implement image analysis
+            # 下載圖片並以感知雜湊比對已知詐騙截圖（同一張詐騙廣告常被大量轉傳）
             response_message = "謝謝您傳送圖片。我正在學習如何分析圖片中的詐騙風險。若您擔心這張圖片可能有風險，請先不要點擊其中任何連結，並謹慎對待其中的資訊。"
+            try:
+                image_bytes = line_bot_api.get_message_content(message_id).content
+                result = detect_scam_image(image_bytes)
+                if result.is_scam:
+                    from app.apis.scam_detector import generate_response
+                    response_message = generate_response(result.scam_info, "image")
+                    print(f"圖片符合已知詐騙截圖: {result.matched_indicators[0]['matches']}, 類型: {result.scam_info['id']}")
+            except Exception as analysis_err:
+                # 無法下載或解碼時仍回覆一般提醒
+                print(f"Image analysis failed: {str(analysis_err)}")
             
             # Send response back to the user
             line_bot_api.reply_message(
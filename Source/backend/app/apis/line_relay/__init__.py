@@ -13,6 +13,7 @@ import re
 
 # 引入必要模塊
 from app.apis.scam_utils import detect_scam, generate_response
+from app.apis.text_normalization import prepare_message
 from app.apis.line_bot import create_line_bot_api
 from app.apis.usage_limits import check_usage_limits, UsageCheckRequest, update_user_usage, update_global_stats
 from linebot.models import TextSendMessage
@@ -105,6 +106,9 @@ async def process_relay_events(relay_request: LineRelayRequest):
                     # 處理文本消息
                     message_text = event.message.get("text", "")
                     
+                    # 訊息正規化（每則訊息只做一次，供後續各項偵測共用）
+                    prepare_message(message_text)
+                    
                     # 檢查使用限制
                     user_id = event.user_id
                     usage_result = check_usage_limits(UsageCheckRequest(
@@ -0,0 +1,354 @@
+from typing import Dict, Any, Optional, List, Tuple, AsyncIterator
+from contextlib import asynccontextmanager
+import asyncio
+import os
+import threading
+import time
+import httpx
+import databutton as db
+from anthropic import Anthropic, AsyncAnthropic, DefaultHttpxClient, DefaultAsyncHttpxClient, Timeout
+from fastapi import APIRouter, HTTPException
+
+'''
+1. API用途：Anthropic 客戶端管理，每個 worker 只建立一個長期使用的客戶端（HTTP keep-alive 連線池），
+   各對話與 LINE 處理流程共用，不必每則訊息重新讀取金鑰、重新建立連線與 TLS 握手；
+   連線池大小與逾時可由環境變數設定，金鑰更換後不需重新啟動，並統計連線重用率與握手時間；
+   非同步對話使用同一把金鑰的 AsyncAnthropic 客戶端，並以併發上限與等待佇列限制同時進行的 LLM 呼叫
+2. 關聯頁面：後台管理頁面（連線統計、更換金鑰後立即套用）
+3. 目前狀態：啟用中（ai_conversation.get_anthropic_client 由此提供；金鑰每隔 API_KEY_CHECK_INTERVAL 秒重新讀取，
+   變更時建立新客戶端，舊客戶端在 RETIRED_CLIENT_GRACE 秒後關閉，讓進行中的請求完成）
+'''
+
+router = APIRouter(
+    prefix="/llm-client",
+    tags=["llm-client"],
+    responses={404: {"description": "Not found"}},
+)
+
+API_KEY_SECRET = "ANTHROPIC_API_KEY"
+
+# 連線池與逾時設定
+LLM_MAX_CONNECTIONS = int(os.environ.get("ANTHROPIC_MAX_CONNECTIONS", "100"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get("ANTHROPIC_MAX_KEEPALIVE_CONNECTIONS", "20"))
+LLM_KEEPALIVE_EXPIRY = float(os.environ.get("ANTHROPIC_KEEPALIVE_EXPIRY", "120"))   # 秒，閒置連線保留時間
+LLM_CONNECT_TIMEOUT = float(os.environ.get("ANTHROPIC_CONNECT_TIMEOUT", "5"))      # 秒
+LLM_REQUEST_TIMEOUT = float(os.environ.get("ANTHROPIC_REQUEST_TIMEOUT", "60"))     # 秒，讀取回應的逾時
+LLM_MAX_RETRIES = int(os.environ.get("ANTHROPIC_MAX_RETRIES", "2"))
+
+# 非同步 LLM 呼叫的併發限制（每個 worker）
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", "64"))       # 同時進行的 LLM 呼叫數
+LLM_MAX_QUEUED = int(os.environ.get("LLM_MAX_QUEUED", "256"))                # 等待中的呼叫數上限，超過時立即回覆忙碌
+LLM_QUEUE_TIMEOUT = float(os.environ.get("LLM_QUEUE_TIMEOUT", "10"))         # 秒，排隊超過此時間回覆忙碌
+
+API_KEY_CHECK_INTERVAL = 300   # 秒，重新讀取金鑰的間隔
+RETIRED_CLIENT_GRACE = 120     # 秒，金鑰更換後舊客戶端保留的時間
+
+def get_connection_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=LLM_MAX_CONNECTIONS,
+        max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=LLM_KEEPALIVE_EXPIRY
+    )
+
+def get_client_settings() -> Dict[str, Any]:
+    return {
+        "max_connections": LLM_MAX_CONNECTIONS,
+        "max_keepalive_connections": LLM_MAX_KEEPALIVE_CONNECTIONS,
+        "keepalive_expiry": LLM_KEEPALIVE_EXPIRY,
+        "connect_timeout": LLM_CONNECT_TIMEOUT,
+        "request_timeout": LLM_REQUEST_TIMEOUT,
+        "max_retries": LLM_MAX_RETRIES,
+        "max_concurrency": LLM_MAX_CONCURRENCY,
+        "max_queued": LLM_MAX_QUEUED,
+        "queue_timeout": LLM_QUEUE_TIMEOUT
+    }
+
+def read_api_key() -> str:
+    """從 secrets 讀取金鑰；找不到時回傳空字串（呼叫 API 時由 Anthropic 回傳明確的錯誤）"""
+    api_key = db.secrets.get(API_KEY_SECRET)
+    if not api_key:
+        print(f"WARNING: {API_KEY_SECRET} not found in secrets")
+        return ""
+    return api_key
+
+class ConnectionStats:
+    """Request and connection counters fed by httpx event hooks and connection tracing"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.requests = 0
+            self.new_connections = 0
+            self.tls_handshakes = 0
+            self.handshake_seconds = 0.0
+            self.errors = 0
+
+    def _on_trace(self, event_name: str, connect_started: List[float]) -> None:
+        if event_name == "connection.connect_tcp.started":
+            connect_started[0] = time.perf_counter()
+            with self._lock:
+                self.new_connections += 1
+        elif event_name == "connection.start_tls.complete":
+            with self._lock:
+                self.tls_handshakes += 1
+                self.handshake_seconds += time.perf_counter() - connect_started[0]
+
+    def on_request(self, request: httpx.Request) -> None:
+        """每個送出的請求（含重試）：掛上連線追蹤，只有新建立的連線會觸發 connect 事件"""
+        with self._lock:
+            self.requests += 1
+        connect_started = [0.0]
+
+        def trace(event_name: str, info: Dict[str, Any]) -> None:
+            self._on_trace(event_name, connect_started)
+
+        request.extensions["trace"] = trace
+
+    async def on_request_async(self, request: httpx.Request) -> None:
+        """非同步客戶端的 on_request（事件掛鉤與連線追蹤都必須是 coroutine）"""
+        with self._lock:
+            self.requests += 1
+        connect_started = [0.0]
+
+        async def trace(event_name: str, info: Dict[str, Any]) -> None:
+            self._on_trace(event_name, connect_started)
+
+        request.extensions["trace"] = trace
+
+    def on_response(self, response: httpx.Response) -> None:
+        if response.status_code >= 500 or response.status_code == 429:
+            with self._lock:
+                self.errors += 1
+
+    async def on_response_async(self, response: httpx.Response) -> None:
+        self.on_response(response)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            reused = max(0, self.requests - self.new_connections)
+            return {
+                "requests": self.requests,
+                "new_connections": self.new_connections,
+                "reused_connections": reused,
+                "reuse_rate": round(reused / self.requests, 4) if self.requests else 0.0,
+                "tls_handshakes": self.tls_handshakes,
+                "avg_handshake_ms": round(self.handshake_seconds * 1000 / self.tls_handshakes, 2) if self.tls_handshakes else 0.0,
+                "error_responses": self.errors
+            }
+
+class AnthropicClientRegistry:
+    """One long-lived Anthropic client (and its async twin) per worker, rebuilt only when the API key changes"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._client: Optional[Anthropic] = None
+        self._async_client: Optional[AsyncAnthropic] = None
+        self._retired_async: List[Tuple[float, AsyncAnthropic]] = []
+        self._api_key: Optional[str] = None
+        self._checked_at = 0.0
+        self.stats = ConnectionStats()
+        self.clients_created = 0
+        self.key_rotations = 0
+        self.created_at: Optional[float] = None
+
+    def _build(self, api_key: str) -> Anthropic:
+        http_client = DefaultHttpxClient(
+            limits=get_connection_limits(),
+            event_hooks={"request": [self.stats.on_request], "response": [self.stats.on_response]}
+        )
+        return Anthropic(
+            api_key=api_key,
+            http_client=http_client,
+            timeout=Timeout(LLM_REQUEST_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+            max_retries=LLM_MAX_RETRIES
+        )
+
+    def _build_async(self, api_key: str) -> AsyncAnthropic:
+        http_client = DefaultAsyncHttpxClient(
+            limits=get_connection_limits(),
+            event_hooks={"request": [self.stats.on_request_async], "response": [self.stats.on_response_async]}
+        )
+        return AsyncAnthropic(
+            api_key=api_key,
+            http_client=http_client,
+            timeout=Timeout(LLM_REQUEST_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+            max_retries=LLM_MAX_RETRIES
+        )
+
+    def _retire(self, client: Any) -> None:
+        """舊客戶端延後關閉，進行中的請求仍可完成"""
+        timer = threading.Timer(RETIRED_CLIENT_GRACE, client.close)
+        timer.daemon = True
+        timer.start()
+
+    def _install(self, api_key: str) -> Anthropic:
+        old_client = self._client
+        self._client = self._build(api_key)
+        self._api_key = api_key
+        self.clients_created += 1
+        self.created_at = time.time()
+        if old_client is not None:
+            self.key_rotations += 1
+            self._retire(old_client)
+        # 非同步客戶端在下次使用時以新金鑰建立；舊的由事件迴圈在寬限期後關閉
+        if self._async_client is not None:
+            self._retired_async.append((time.monotonic(), self._async_client))
+            self._async_client = None
+        return self._client
+
+    def get_client(self) -> Anthropic:
+        """取得共用客戶端；每隔 API_KEY_CHECK_INTERVAL 秒確認金鑰是否變更"""
+        client = self._client
+        now = time.monotonic()
+        if client is not None and now - self._checked_at < API_KEY_CHECK_INTERVAL:
+            return client
+        with self._lock:
+            if self._client is not None and now - self._checked_at < API_KEY_CHECK_INTERVAL:
+                return self._client
+            api_key = read_api_key()
+            self._checked_at = now
+            if self._client is None or api_key != self._api_key:
+                return self._install(api_key)
+            return self._client
+
+    async def get_async_client(self) -> AsyncAnthropic:
+        """取得共用的非同步客戶端（與同步客戶端使用同一把金鑰，一併輪替）"""
+        self.get_client()
+        if self._retired_async:
+            await self._close_retired_async()
+        client = self._async_client
+        if client is None:
+            with self._lock:
+                if self._async_client is None:
+                    self._async_client = self._build_async(self._api_key or "")
+                client = self._async_client
+        return client
+
+    async def _close_retired_async(self) -> None:
+        now = time.monotonic()
+        expired = [client for retired_at, client in self._retired_async if now - retired_at >= RETIRED_CLIENT_GRACE]
+        if not expired:
+            return
+        self._retired_async = [(retired_at, client) for retired_at, client in self._retired_async if client not in expired]
+        for client in expired:
+            try:
+                await client.close()
+            except Exception as e:
+                print(f"Error closing retired Anthropic client: {str(e)}")
+
+    def rotate(self) -> Dict[str, Any]:
+        """立即重新讀取金鑰；金鑰變更時換用新客戶端"""
+        with self._lock:
+            api_key = read_api_key()
+            self._checked_at = time.monotonic()
+            changed = self._client is None or api_key != self._api_key
+            if changed:
+                self._install(api_key)
+        return {"rotated": changed, **self.summary()}
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "clients_created": self.clients_created,
+            "key_rotations": self.key_rotations,
+            "client_created_at": self.created_at,
+            "settings": get_client_settings(),
+            "connections": self.stats.snapshot(),
+            "concurrency": _LIMITER.snapshot()
+        }
+
+class LLMOverloadedError(Exception):
+    """Raised when no LLM call slot frees up in time or too many calls are already waiting"""
+
+class LLMConcurrencyLimiter:
+    """Caps concurrent async LLM calls per worker, with a bounded wait queue"""
+
+    def __init__(self, max_concurrency: int, max_queued: int, queue_timeout: float):
+        self.max_concurrency = max_concurrency
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.active = 0
+        self.waiting = 0
+        self.rejected = 0
+        self.completed = 0
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """
+        取得一個 LLM 呼叫名額，用完自動釋放
+
+        Raises:
+            LLMOverloadedError: 等待佇列已滿，或排隊超過 queue_timeout 秒
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        if self._semaphore.locked() and self.waiting >= self.max_queued:
+            self.rejected += 1
+            raise LLMOverloadedError(f"{self.waiting} LLM calls already waiting")
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError as e:
+            self.rejected += 1
+            raise LLMOverloadedError(f"No LLM call slot within {self.queue_timeout} seconds") from e
+        finally:
+            self.waiting -= 1
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self.completed += 1
+            self._semaphore.release()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "active": self.active,
+            "waiting": self.waiting,
+            "completed": self.completed,
+            "rejected": self.rejected
+        }
+
+_LIMITER = LLMConcurrencyLimiter(LLM_MAX_CONCURRENCY, LLM_MAX_QUEUED, LLM_QUEUE_TIMEOUT)
+
+# 每個 worker 共用的客戶端
+_REGISTRY = AnthropicClientRegistry()
+
+def get_shared_anthropic_client() -> Anthropic:
+    """取得此 worker 共用的 Anthropic 客戶端"""
+    return _REGISTRY.get_client()
+
+async def get_shared_async_anthropic_client() -> AsyncAnthropic:
+    """取得此 worker 共用的 AsyncAnthropic 客戶端"""
+    return await _REGISTRY.get_async_client()
+
+def llm_call_slot():
+    """非同步 LLM 呼叫的併發名額：async with llm_call_slot(): ...，忙碌時拋出 LLMOverloadedError"""
+    return _LIMITER.slot()
+
+def rotate_anthropic_client() -> Dict[str, Any]:
+    return _REGISTRY.rotate()
+
+def get_llm_client_stats() -> Dict[str, Any]:
+    return _REGISTRY.summary()
+
+@router.get("/stats", summary="取得 Anthropic 連線統計", description="取得此 worker 的請求數、新建連線數、連線重用率與平均握手時間")
+def get_llm_client_stats_endpoint():
+    """取得 Anthropic 連線統計"""
+    try:
+        return get_llm_client_stats()
+    except Exception as e:
+        print(f"Error getting LLM client stats: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to get LLM client stats: {str(e)}") from e
+
+@router.post("/rotate", summary="重新載入 Anthropic 金鑰", description="重新讀取 ANTHROPIC_API_KEY，金鑰變更時立即換用新客戶端，不需重新啟動")
+def rotate_llm_client_endpoint():
+    """重新載入 Anthropic 金鑰"""
+    try:
+        return rotate_anthropic_client()
+    except Exception as e:
+        print(f"Error rotating LLM client: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to rotate LLM client: {str(e)}") from e
@@ -1,10 +1,14 @@
 from typing import Dict, Any, Tuple, List
 from fastapi import APIRouter
+from app.apis.detection_engine import detect_scam_categories, detect_scam_image
+from app.apis.scam_images import load_image_bytes
 
 '''
 1. API用途：本地詐騙偵測功能，提供基礎的訊息詐騙偵測和回應生成
 2. 關聯頁面：主要作為LINE機器人和聊天功能的支援模組，無直接關聯頁面
-3. 目前狀態：以被更高級的scam_detector大部分取代，僅用於基礎功能和備用
+3. 目前狀態：以被更高級的scam_detector大部分取代，僅用於基礎功能和備用；偵測改由 detection_engine 提供
+   行為變更：不再因訊息含有「詐騙」、「騙」或 "scam" 字樣就判定為可疑（例如用戶詢問「這是詐騙嗎」），
+   判斷與其他通道相同
 '''
 
 # Create an empty router to satisfy the FastAPI API importing mechanism
@@ -19,25 +23,13 @@ def detect_scam(message: str) -> Tuple[bool, Dict[str, Any], List[str]]:
         
     Returns:
         Tuple containing:
-        - Boolean indicating if the message appears to be a scam
+        - Boolean indicating if the message appears to be a scam (the engine's verdict; the word
+          "詐騙"/"scam" in the message no longer flags it by itself)
         - Dictionary with scam type information if detected, or None
         - List of matched pattern categories
     """
-    # Simplified implementation for now
-    if 'scam' in message.lower() or '詐騙' in message or '騙' in message:
-        scam_info = {
-            "id": "general_suspicious",
-            "name": "可疑訊息", 
-            "description": "這則訊息包含可疑的關鍵詞，建議您提高警覺。",
-            "advice": [
-                "對要求個人資料或金錢的訊息保持警惕",
-                "不要點擊不明來源的連結",
-                "如有疑問，請透過官方管道確認"
-            ]
-        }
-        return True, scam_info, ["suspicious_content"]
-    else:
-        return False, None, []
+    # 與 scam_utils 使用同一個偵測引擎，各通道得到相同的判斷
+    return detect_scam_categories(message)
 
 def generate_response(scam_info: Dict[str, Any], message_type: str = "text") -> str:
     """
@@ -88,6 +80,5 @@ def analyze_image(image_url: str) -> Tuple[bool, Dict[str, Any], List[str]]:
         - Dictionary with scam type information if detected, or None
         - List of matched pattern categories
     """
-    # For now, we'll return a generic response for images
-    # In the future, we could implement image analysis with OCR and computer vision
-    return False, None, []
\ No newline at end of file
+    # 以感知雜湊比對已知詐騙截圖（尚未做 OCR）
+    return detect_scam_image(load_image_bytes(image_url)).as_category_tuple()
\ No newline at end of file
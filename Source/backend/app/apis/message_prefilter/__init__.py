@@ -0,0 +1,272 @@
+from typing import Dict, Any, List, Tuple, Optional, Iterable, FrozenSet, Union, Pattern
+from functools import lru_cache
+import re
+import sys
+import threading
+from re import _parser as sre_parse, _constants as sre_constants
+from fastapi import APIRouter, HTTPException
+from app.apis.keyword_index import get_keyword_index
+from app.apis.text_normalization import get_normalized_text
+
+'''
+1. API用途：訊息預篩（第一層極低成本檢查），大多數訊息是問候、貼圖文字或「謝謝」，
+   先以觸發字元表與小型字面詞集合判斷是否有任何規則可能命中，只有可能命中時才執行
+   詐騙偵測、危機偵測與惡意行為檢查等較昂貴的偵測；並統計各偵測器被略過的比例
+2. 關聯頁面：後台管理頁面（預篩略過率統計）
+3. 目前狀態：啟用中（觸發詞由各偵測器登錄的關鍵詞命名空間與正規表示式規則自動推導，
+   只略過不可能命中的訊息，不影響偵測結果；無法推導觸發詞的規則會讓該偵測器永遠執行）
+'''
+
+router = APIRouter(
+    prefix="/message-prefilter",
+    tags=["message-prefilter"],
+    responses={404: {"description": "Not found"}},
+)
+
+# 字元類別最多展開的字元數（超過則不作為觸發詞）
+MAX_CLASS_CHARS = 64
+
+_LITERAL = sre_constants.LITERAL
+_IN = sre_constants.IN
+_RANGE = sre_constants.RANGE
+_CATEGORY = sre_constants.CATEGORY
+_BRANCH = sre_constants.BRANCH
+_SUBPATTERN = sre_constants.SUBPATTERN
+_ATOMIC_GROUP = sre_constants.ATOMIC_GROUP
+_REPEATS = (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT, sre_constants.POSSESSIVE_REPEAT)
+# 不消耗字元的項目，不會打斷連續的字面字元
+_ZERO_WIDTH = (sre_constants.AT, sre_constants.ASSERT, sre_constants.ASSERT_NOT)
+
+@lru_cache(maxsize=1)
+def unicode_digits() -> FrozenSet[str]:
+    """\\d 在 str 規則中可命中的所有數字字元（Unicode Nd 類別）"""
+    return frozenset(ch for ch in map(chr, range(sys.maxunicode + 1)) if ch.isdecimal())
+
+def _class_triggers(items) -> Optional[FrozenSet[str]]:
+    """字元類別 [...] 可命中的字元；反向類別或範圍過大時回傳 None"""
+    chars = set()
+    for op, av in items:
+        if op is _LITERAL:
+            chars.add(chr(av))
+        elif op is _RANGE and av[1] - av[0] < MAX_CLASS_CHARS:
+            chars.update(map(chr, range(av[0], av[1] + 1)))
+        elif op is _CATEGORY and av is sre_constants.CATEGORY_DIGIT:
+            chars.update(unicode_digits())
+        else:
+            return None
+    return frozenset(ch.lower() for ch in chars) or None
+
+def _candidate_score(candidate: FrozenSet[str]) -> Tuple[int, bool, int]:
+    # 越長、越罕見（中日韓文字）、選項越少的觸發詞越能有效略過訊息
+    return (
+        min(len(literal) for literal in candidate),
+        all(ord(ch) > 0x2E80 for literal in candidate for ch in literal),
+        -len(candidate)
+    )
+
+def _required_literals(items) -> Optional[FrozenSet[str]]:
+    """
+    任何命中都必定包含其中至少一個字串的觸發詞集合（已轉小寫）；無法推導時回傳 None
+    """
+    candidates: List[FrozenSet[str]] = []
+    run: List[str] = []
+
+    def close_run() -> None:
+        if run:
+            candidates.append(frozenset(["".join(run).lower()]))
+            run.clear()
+
+    for op, av in items:
+        if op is _LITERAL:
+            run.append(chr(av))
+            continue
+        if op in _ZERO_WIDTH:
+            continue
+        close_run()
+        candidate = None
+        if op is _IN:
+            candidate = _class_triggers(av)
+        elif op is _CATEGORY and av is sre_constants.CATEGORY_DIGIT:
+            candidate = unicode_digits()
+        elif op is _SUBPATTERN:
+            candidate = _required_literals(av[3])
+        elif op is _ATOMIC_GROUP:
+            candidate = _required_literals(av)
+        elif op in _REPEATS and av[0] >= 1:
+            candidate = _required_literals(av[2])
+        elif op is _BRANCH:
+            branches = [_required_literals(branch) for branch in av[1]]
+            if all(branch is not None for branch in branches):
+                candidate = frozenset().union(*branches)
+        if candidate:
+            candidates.append(candidate)
+    close_run()
+
+    if not candidates:
+        return None
+    return max(candidates, key=_candidate_score)
+
+def extract_required_literals(pattern: Union[str, Pattern]) -> Optional[FrozenSet[str]]:
+    """
+    推導正規表示式規則的觸發詞：訊息中沒有任何一個觸發詞時，此規則必定不會命中
+
+    Args:
+        pattern: 規則字串或已編譯的規則
+
+    Returns:
+        觸發詞集合（小寫，供比對已正規化的訊息）；規則可能在沒有固定字元的情況下命中時回傳 None
+    """
+    if isinstance(pattern, str):
+        source, flags = pattern, 0
+    else:
+        source, flags = pattern.pattern, pattern.flags
+    try:
+        return _required_literals(sre_parse.parse(source, flags))
+    except (re.error, TypeError, ValueError, RecursionError):
+        return None
+
+def drop_redundant_literals(literals: Iterable[str]) -> List[str]:
+    """包含其他較短觸發詞的字串是多餘的（較短的詞出現時才可能出現它）"""
+    kept: List[str] = []
+    for literal in sorted(set(literals), key=lambda item: (len(item), item)):
+        if not any(shorter in literal for shorter in kept):
+            kept.append(literal)
+    return kept
+
+def group_by_first_char(literals: List[str]) -> Dict[str, Tuple[str, ...]]:
+    """觸發詞依首字元分組；訊息中出現的首字元才需要檢查對應的詞"""
+    groups: Dict[str, List[str]] = {}
+    for literal in literals:
+        groups.setdefault(literal[0], []).append(literal)
+    return {ch: tuple(group) for ch, group in groups.items()}
+
+class MessagePrefilter:
+    """Per-detector trigger characters and literals, derived from the registered keyword vocabularies and regex rules"""
+
+    def __init__(self):
+        self._namespaces: Dict[str, Tuple[str, ...]] = {}
+        self._patterns: Dict[str, Dict[str, Tuple[Any, ...]]] = {}
+        self._version = 0
+        self._compiled: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._checked: Dict[str, int] = {}
+        self._skipped: Dict[str, int] = {}
+
+    def register_namespaces(self, group: str, namespaces: Iterable[str]) -> None:
+        """偵測器使用的共用關鍵詞索引命名空間（詞表內容變動時自動重建）"""
+        with self._lock:
+            self._namespaces[group] = tuple(namespaces)
+            self._version += 1
+
+    def register_patterns(self, group: str, name: str, patterns: Iterable[Union[str, Pattern]]) -> None:
+        """登錄（或替換）偵測器執行的一組正規表示式規則"""
+        patterns = tuple(patterns)
+        with self._lock:
+            group_patterns = self._patterns.setdefault(group, {})
+            if group_patterns.get(name) == patterns:
+                return
+            group_patterns[name] = patterns
+            self._version += 1
+
+    def _build(self, group: str) -> Dict[str, Any]:
+        index = get_keyword_index()
+        literals = set()
+        for namespace in self._namespaces.get(group, ()):
+            literals.update(index.get_vocabulary(namespace))
+
+        unbounded_rules = []
+        for name, patterns in self._patterns.get(group, {}).items():
+            for pattern in patterns:
+                required = extract_required_literals(pattern)
+                if required is None:
+                    unbounded_rules.append(f"{name}: {getattr(pattern, 'pattern', pattern)}")
+                else:
+                    literals.update(required)
+
+        literals = drop_redundant_literals(literal for literal in literals if literal)
+        literals_by_char = group_by_first_char(literals)
+        return {
+            "trigger_chars": frozenset(literals_by_char),
+            "literals_by_char": literals_by_char,
+            "trigger_count": len(literals),
+            "unbounded_rules": unbounded_rules
+        }
+
+    def _get_compiled(self, group: str) -> Dict[str, Any]:
+        version = (self._version, get_keyword_index().version)
+        compiled = self._compiled.get(group)
+        if compiled is None or compiled["version"] != version:
+            with self._lock:
+                compiled = {**self._build(group), "version": version}
+                self._compiled[group] = compiled
+        return compiled
+
+    def could_match(self, text: str, group: str) -> bool:
+        """
+        第一層檢查：訊息是否可能命中該偵測器的任何規則
+
+        先以觸發字元表排除（絕大多數問候訊息在此結束），再只對訊息中出現的首字元
+        檢查其觸發詞是否出現；回傳 False 時可安全略過該偵測器
+        """
+        compiled = self._get_compiled(group)
+        self._checked[group] = self._checked.get(group, 0) + 1
+        if compiled["unbounded_rules"]:
+            return True
+        text = get_normalized_text(text)
+        literals_by_char = compiled["literals_by_char"]
+        for ch in compiled["trigger_chars"].intersection(text):
+            for literal in literals_by_char[ch]:
+                if literal in text:
+                    return True
+        self._skipped[group] = self._skipped.get(group, 0) + 1
+        return False
+
+    def stats(self) -> Dict[str, Any]:
+        groups = {}
+        for group in sorted(set(self._namespaces) | set(self._patterns)):
+            compiled = self._get_compiled(group)
+            checked = self._checked.get(group, 0)
+            skipped = self._skipped.get(group, 0)
+            groups[group] = {
+                "checked": checked,
+                "skipped": skipped,
+                "skip_rate": round(skipped / checked, 4) if checked else 0.0,
+                "trigger_chars": len(compiled["trigger_chars"]),
+                "trigger_literals": compiled["trigger_count"],
+                "unbounded_rules": compiled["unbounded_rules"]
+            }
+        return {"groups": groups}
+
+    def reset_stats(self) -> None:
+        self._checked = {}
+        self._skipped = {}
+
+# 全系統共用的預篩實例
+_SHARED_PREFILTER = MessagePrefilter()
+
+def register_prefilter_namespaces(group: str, namespaces: Iterable[str]) -> None:
+    """登錄偵測器使用的關鍵詞命名空間"""
+    _SHARED_PREFILTER.register_namespaces(group, namespaces)
+
+def register_prefilter_patterns(group: str, name: str, patterns: Iterable[Union[str, Pattern]]) -> None:
+    """登錄偵測器執行的正規表示式規則"""
+    _SHARED_PREFILTER.register_patterns(group, name, patterns)
+
+def could_match(text: str, group: str) -> bool:
+    """訊息是否可能命中該偵測器的規則；False 表示可直接略過"""
+    return _SHARED_PREFILTER.could_match(text, group)
+
+def get_prefilter_stats() -> Dict[str, Any]:
+    return _SHARED_PREFILTER.stats()
+
+def reset_prefilter_stats() -> None:
+    _SHARED_PREFILTER.reset_stats()
+
+@router.get("/stats", summary="取得訊息預篩統計", description="取得各偵測器的預篩檢查次數、略過率與觸發詞數量")
+def get_message_prefilter_stats():
+    """取得訊息預篩統計"""
+    try:
+        return get_prefilter_stats()
+    except Exception as e:
+        print(f"Error getting prefilter stats: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to get prefilter stats: {str(e)}") from e
@@ -0,0 +1,330 @@
+from typing import Dict, Any, Callable, List, Optional, Tuple
+import json
+import os
+import stat
+import threading
+import time
+import databutton as db
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel, Field
+from app.apis.keyword_index import get_keyword_index
+from app.apis.detection_cache import fingerprint_rules
+
+'''
+1. API用途：規則包管理，將詐騙、惡意行為、危機與特殊回應等規則集打包成有版本的 JSON 檔案
+   （規則定義與規則字串 + 預先建好的關鍵詞自動機），並可由後台發布新規則包即時熱切換；
+   冷啟動時省下的是關鍵詞自動機的建立，正規表示式載入時仍會重新編譯（有發布版本的規則集不會再先編譯內建規則）。
+   規則包目錄只允許本程序的使用者存取（0700），載入前檢查擁有者與權限
+2. 關聯頁面：後台管理頁面（匯出、發布、重新載入規則包）
+3. 目前狀態：啟用中（規則在發布時先編譯完成，再以參照替換的方式切換，請求處理路徑不需加鎖也不做檢查；
+   其他 worker 由啟動時開始的背景執行緒檢查共用的指標檔，在檢查間隔內自動切換到新版本）
+'''
+
+router = APIRouter(
+    prefix="/rule-packs",
+    tags=["rule-packs"],
+    responses={404: {"description": "Not found"}},
+)
+
+RULE_PACK_FORMAT = 2
+RULE_PACK_STORAGE_KEY = "rule_pack"
+# 應用程式專用的資料目錄（規則包與各偵測索引都放在這裡，不放在共用的暫存目錄，其他使用者無法寫入）
+DATA_DIR = os.environ.get("ANTI_SCAM_DATA_DIR", os.path.join(os.path.expanduser("~"), ".cache", "anti_scam"))
+RULE_PACK_DIR = os.environ.get("RULE_PACK_DIR", os.path.join(DATA_DIR, "rule_packs"))
+RULE_PACK_CHECK_INTERVAL = 30  # 秒，各 worker 檢查是否有新規則包的間隔
+
+_POINTER_PATH = os.path.join(RULE_PACK_DIR, "current")
+
+# 規則集提供者：名稱 -> (匯出定義, 編譯定義, 安裝編譯結果)
+_PROVIDERS: Dict[str, Tuple[Callable[[], Any], Callable[[Any], Any], Callable[[Any], None]]] = {}
+
+# 目前生效的規則包資訊（整個 dict 一次替換）
+_ACTIVE_PACK: Dict[str, Any] = {"version": "builtin", "source": "builtin", "created_at": None, "overrides": []}
+
+# 背景執行緒每次檢查時一併呼叫的函式（詐騙範本、截圖與識別碼清單等資料的版本檢查）
+_RELOAD_CHECKS: List[Callable[[], None]] = []
+
+# 只用來讓後台發布與背景重新載入依序進行，請求處理路徑不會取用
+_SWAP_LOCK = threading.Lock()
+
+_STARTUP_PACK: Optional[Dict[str, Any]] = None
+_STARTUP_PACK_LOADED = False
+_WATCHER_STARTED = False
+
+def get_artifact_path(version: str) -> str:
+    return os.path.join(RULE_PACK_DIR, f"rule_pack-{os.path.basename(version)}.json")
+
+def is_trusted_path(path: str) -> bool:
+    """檔案（或目錄）屬於本程序的使用者，且其他使用者不可寫入"""
+    try:
+        info = os.stat(path)
+    except OSError:
+        return False
+    return info.st_uid == os.getuid() and not info.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+
+def ensure_private_dir(path: str) -> str:
+    """建立私有目錄（0700）並回傳路徑；目錄不屬於本程序的使用者或其他人可寫入時拋出 PermissionError"""
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    if not is_trusted_path(path):
+        raise PermissionError(f"Directory {path} is not private to this user")
+    return path
+
+def get_private_data_dir(name: str) -> str:
+    """資料目錄下的私有子目錄（例如 scam_identifiers），不存在時建立"""
+    ensure_private_dir(DATA_DIR)
+    return ensure_private_dir(os.path.join(DATA_DIR, name))
+
+def ensure_rule_pack_dir() -> None:
+    """建立規則包目錄（0700）；目錄不屬於本程序的使用者時拒絕使用"""
+    ensure_private_dir(RULE_PACK_DIR)
+
+def read_current_version() -> Optional[str]:
+    """讀取本機目前的規則包版本（指標檔）"""
+    if not is_trusted_path(RULE_PACK_DIR) or not is_trusted_path(_POINTER_PATH):
+        return None
+    try:
+        with open(_POINTER_PATH, "r", encoding="utf-8") as pointer_file:
+            return pointer_file.read().strip() or None
+    except OSError:
+        return None
+
+def load_artifact(version: str) -> Optional[Dict[str, Any]]:
+    """讀取規則包檔案；檔案不屬於本程序的使用者或格式不符時回傳 None"""
+    path = get_artifact_path(version)
+    if not is_trusted_path(RULE_PACK_DIR) or not is_trusted_path(path):
+        print(f"Ignoring rule pack {version}: missing or not owned by this user")
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as artifact_file:
+            pack = json.load(artifact_file)
+    except (OSError, ValueError) as e:
+        print(f"Error loading rule pack {version}: {str(e)}")
+        return None
+    if not isinstance(pack, dict) or pack.get("format") != RULE_PACK_FORMAT:
+        return None
+    return pack
+
+def write_artifact(pack: Dict[str, Any]) -> str:
+    """寫入規則包檔案並更新指標檔（皆以暫存檔原子性更名）"""
+    ensure_rule_pack_dir()
+    path = get_artifact_path(pack["version"])
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as artifact_file:
+        json.dump(pack, artifact_file, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+    tmp_pointer = f"{_POINTER_PATH}.{os.getpid()}.tmp"
+    with open(tmp_pointer, "w", encoding="utf-8") as pointer_file:
+        pointer_file.write(pack["version"])
+    os.replace(tmp_pointer, _POINTER_PATH)
+    return path
+
+def _get_startup_pack() -> Optional[Dict[str, Any]]:
+    """冷啟動時讀取本機最新的規則包（每個程序只讀一次），並預先載入關鍵詞自動機"""
+    global _STARTUP_PACK, _STARTUP_PACK_LOADED
+    if not _STARTUP_PACK_LOADED:
+        _STARTUP_PACK_LOADED = True
+        version = read_current_version()
+        _STARTUP_PACK = load_artifact(version) if version else None
+        if _STARTUP_PACK is not None:
+            get_keyword_index().preload_automaton(_STARTUP_PACK["keyword_automaton"])
+            _set_active_pack(_STARTUP_PACK, "artifact")
+    return _STARTUP_PACK
+
+def has_rule_set_override(name: str) -> bool:
+    """本機規則包中是否有此規則集的發布版本（有時模組不必先編譯內建規則）"""
+    pack = _get_startup_pack()
+    return pack is not None and name in pack["overrides"]
+
+def _set_active_pack(pack: Dict[str, Any], source: str) -> None:
+    global _ACTIVE_PACK
+    _ACTIVE_PACK = {
+        "version": pack["version"],
+        "source": source,
+        "created_at": pack["created_at"],
+        "overrides": sorted(pack["overrides"])
+    }
+
+def register_rule_set(name: str, export: Callable[[], Any], compile_rules: Callable[[Any], Any],
+                      install: Callable[[Any], None]) -> None:
+    """
+    註冊規則集提供者
+    export 回傳可序列化的規則定義；compile_rules 驗證並編譯定義（失敗時拋出例外）；
+    install 以替換參照的方式套用編譯結果。若本機規則包中有此規則集的發布版本，立即套用
+    """
+    _PROVIDERS[name] = (export, compile_rules, install)
+    pack = _get_startup_pack()
+    if pack is not None and name in pack["overrides"]:
+        try:
+            install(compile_rules(pack["rule_sets"][name]))
+        except Exception as e:
+            print(f"Error installing rule set {name} from rule pack {pack['version']}: {str(e)}")
+
+def export_rule_sets() -> Dict[str, Any]:
+    """匯出目前生效的所有規則定義"""
+    return {name: export() for name, (export, _, _) in _PROVIDERS.items()}
+
+def build_rule_pack(overrides: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    以目前規則加上覆寫的規則集建立規則包，並編譯覆寫的規則集
+    回傳 (規則包, {規則集名稱: 編譯結果})；規則不合法時拋出 ValueError
+    """
+    unknown = set(overrides) - set(_PROVIDERS)
+    if unknown:
+        raise ValueError(f"Unknown rule sets: {', '.join(sorted(unknown))}")
+
+    compiled = {}
+    for name, definitions in overrides.items():
+        try:
+            compiled[name] = _PROVIDERS[name][1](definitions)
+        except Exception as e:
+            raise ValueError(f"Invalid rule set {name}: {str(e)}") from e
+
+    rule_sets = export_rule_sets()
+    rule_sets.update(overrides)
+    pack = {
+        "format": RULE_PACK_FORMAT,
+        "version": fingerprint_rules(rule_sets),
+        "created_at": time.time(),
+        "rule_sets": rule_sets,
+        "overrides": list(overrides.keys())
+    }
+    return pack, compiled
+
+def activate_rule_pack(pack: Dict[str, Any], compiled: Dict[str, Any], source: str) -> Dict[str, Any]:
+    """套用已編譯的規則集並寫入規則包檔案，其他 worker 會依指標檔跟進"""
+    with _SWAP_LOCK:
+        for name, value in compiled.items():
+            _PROVIDERS[name][2](value)
+        # 套用後的詞表與自動機一併存入規則包，下次冷啟動不必重建
+        pack["keyword_automaton"] = get_keyword_index().export_automaton()
+        write_artifact(pack)
+        _set_active_pack(pack, source)
+    return _ACTIVE_PACK
+
+def publish_rule_pack(overrides: Dict[str, Any]) -> Dict[str, Any]:
+    """發布新規則包：編譯驗證、儲存發布內容（重新部署後仍有效）並立即切換"""
+    stored = get_published_overrides()
+    stored.update(overrides)
+    pack, compiled = build_rule_pack(stored)
+    db.storage.json.put(RULE_PACK_STORAGE_KEY, {"version": pack["version"], "created_at": pack["created_at"], "overrides": stored})
+    return activate_rule_pack(pack, compiled, "published")
+
+def get_published_overrides() -> Dict[str, Any]:
+    """獲取已發布（覆寫內建規則）的規則集"""
+    try:
+        published = db.storage.json.get(RULE_PACK_STORAGE_KEY, default=None)
+        return dict(published.get("overrides", {})) if published else {}
+    except Exception as e:
+        print(f"Error loading published rule pack: {str(e)}")
+        return {}
+
+def sync_from_storage() -> None:
+    """從儲存空間還原已發布的規則包（容器縮減到零後本機檔案會消失）"""
+    try:
+        overrides = get_published_overrides()
+        if not overrides:
+            return
+        pack, compiled = build_rule_pack(overrides)
+        if pack["version"] != _ACTIVE_PACK["version"]:
+            activate_rule_pack(pack, compiled, "published")
+    except Exception as e:
+        print(f"Error syncing rule pack from storage: {str(e)}")
+
+def refresh_rule_pack() -> None:
+    """檢查指標檔，有其他 worker 發布的新版本時改用新規則包"""
+    version = read_current_version()
+    if version and version != _ACTIVE_PACK["version"]:
+        try:
+            reload_rule_pack(version)
+        except Exception as e:
+            print(f"Error reloading rule pack {version}: {str(e)}")
+
+def register_reload_check(check: Callable[[], None]) -> None:
+    """註冊由背景執行緒每隔 RULE_PACK_CHECK_INTERVAL 秒呼叫的檢查，讓其他 worker 的資料變更在檢查間隔內生效"""
+    _RELOAD_CHECKS.append(check)
+
+def _watch_rule_packs() -> None:
+    """背景執行緒：沒有本機規則包時先從儲存空間還原，之後每隔 RULE_PACK_CHECK_INTERVAL 秒檢查一次"""
+    if _get_startup_pack() is None:
+        sync_from_storage()
+    while True:
+        time.sleep(RULE_PACK_CHECK_INTERVAL)
+        refresh_rule_pack()
+        for check in list(_RELOAD_CHECKS):
+            try:
+                check()
+            except Exception as e:
+                print(f"Error in reload check {getattr(check, '__name__', check)}: {str(e)}")
+
+def start_rule_pack_watcher() -> None:
+    """應用程式啟動時開始檢查規則包（此時所有規則集都已註冊），每個程序只啟動一次"""
+    global _WATCHER_STARTED
+    if _WATCHER_STARTED:
+        return
+    _WATCHER_STARTED = True
+    threading.Thread(target=_watch_rule_packs, name="rule-pack-watcher", daemon=True).start()
+
+# 所有 API 模組都匯入後才執行，從儲存空間還原時才會包含每個規則集
+router.on_startup.append(start_rule_pack_watcher)
+
+def reload_rule_pack(version: Optional[str] = None) -> Dict[str, Any]:
+    """重新載入本機規則包檔案並切換"""
+    version = version or read_current_version()
+    pack = load_artifact(version) if version else None
+    if pack is None:
+        raise ValueError("No rule pack artifact available")
+    with _SWAP_LOCK:
+        if _ACTIVE_PACK["version"] == pack["version"]:
+            return _ACTIVE_PACK
+        for name in pack["overrides"]:
+            if name in _PROVIDERS:
+                _, compile_rules, install = _PROVIDERS[name]
+                install(compile_rules(pack["rule_sets"][name]))
+        _set_active_pack(pack, "artifact")
+    return _ACTIVE_PACK
+
+def get_active_rule_pack() -> Dict[str, Any]:
+    return {**_ACTIVE_PACK, "rule_sets": sorted(_PROVIDERS.keys())}
+
+class RulePackPublishRequest(BaseModel):
+    rule_sets: Dict[str, Any] = Field(..., description="要覆寫的規則集（名稱 -> 規則定義，格式同 /export）")
+
+@router.get("/current", summary="取得目前規則包", description="取得目前生效的規則包版本與來源")
+def get_current_rule_pack():
+    """取得目前規則包資訊"""
+    try:
+        return get_active_rule_pack()
+    except Exception as e:
+        print(f"Error getting rule pack info: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to get rule pack info: {str(e)}") from e
+
+@router.get("/export", summary="匯出規則定義", description="匯出目前生效的所有規則集定義，可修改後再發布")
+def export_rule_pack():
+    """匯出規則定義"""
+    try:
+        return {"version": _ACTIVE_PACK["version"], "rule_sets": export_rule_sets()}
+    except Exception as e:
+        print(f"Error exporting rule pack: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to export rule pack: {str(e)}") from e
+
+@router.post("/publish", summary="發布規則包", description="編譯並發布新的規則集，驗證通過後立即切換，不需重新啟動")
+def publish_rule_pack_endpoint(request: RulePackPublishRequest):
+    """發布規則包"""
+    try:
+        return {"success": True, **publish_rule_pack(request.rule_sets)}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    except Exception as e:
+        print(f"Error publishing rule pack: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to publish rule pack: {str(e)}") from e
+
+@router.post("/reload", summary="重新載入規則包", description="從儲存空間重新載入已發布的規則包")
+def reload_rule_pack_endpoint():
+    """重新載入規則包"""
+    try:
+        sync_from_storage()
+        return {"success": True, **get_active_rule_pack()}
+    except Exception as e:
+        print(f"Error reloading rule pack: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to reload rule pack: {str(e)}") from e
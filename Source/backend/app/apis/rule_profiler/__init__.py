@@ -0,0 +1,272 @@
+from typing import Dict, Any, List, Optional
+import glob
+import json
+import os
+import threading
+import time
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel, Field
+from app.apis.rule_packs import DATA_DIR, ensure_private_dir, is_trusted_path
+
+'''
+1. API用途：規則命中與執行成本統計（可選的量測），記錄詐騙偵測（scam_detector、scam_utils 皆經由 detection_engine）、
+   特殊回應與惡意行為檢查中每條規則的執行次數、命中次數與累計比對時間，用來找出從未命中的規則與執行成本高的規則
+2. 關聯頁面：後台管理頁面（規則統計、清理無效規則）
+3. 目前狀態：預設關閉（設定 RULE_PROFILING=1 或由後台開啟）；計數器每個執行緒各自一份，記錄時不加鎖，
+   查詢時才合併；各 worker 每隔 RULE_PROFILE_FLUSH_INTERVAL 秒將計數寫入只有本程序使用者可存取的資料目錄，
+   後台查詢時合併所有 worker（已結束或過久未更新的 worker 檔案會被移除）
+'''
+
+router = APIRouter(
+    prefix="/rule-profiler",
+    tags=["rule-profiler"],
+    responses={404: {"description": "Not found"}},
+)
+
+RULE_PROFILE_DIR = os.environ.get("RULE_PROFILE_DIR", os.path.join(DATA_DIR, "rule_profiles"))
+RULE_PROFILE_FLUSH_INTERVAL = 30  # 秒，各 worker 寫出計數與檢查開關的間隔
+# 超過此時間未更新的 worker 檔案視為過期（worker 的計數是累計值，仍在執行的 worker 下次寫出時會完整補回）
+RULE_PROFILE_STALE_AFTER = 4 * RULE_PROFILE_FLUSH_INTERVAL
+
+# 偵測器名稱
+DETECTOR_SCAM = "scam"
+DETECTOR_SPECIAL_RESPONSE = "special_response"
+DETECTOR_ABUSE = "abuse"
+
+_CONTROL_PATH = os.path.join(RULE_PROFILE_DIR, "control.json")
+_MERGED_PATH = os.path.join(RULE_PROFILE_DIR, "rule_profile.json")
+
+# 開關與重設代次（由控制檔同步到所有 worker）
+_ENABLED = os.environ.get("RULE_PROFILING", "").lower() in ("1", "true", "yes")
+_EPOCH = 0
+_LAST_SYNC = 0.0
+
+# 每個執行緒一份計數器：(偵測器, 規則ID) -> [執行次數, 命中次數, 累計奈秒]
+_LOCAL = threading.local()
+_ALL_COUNTERS: List[Dict[tuple, List[int]]] = []
+_COUNTERS_LOCK = threading.Lock()  # 只在新執行緒建立計數器時使用
+
+# 已登錄的規則：偵測器 -> 群組 -> {規則ID: 規則內容}，用來列出從未命中的規則
+_RULES: Dict[str, Dict[str, Dict[str, str]]] = {}
+
+def _thread_counters() -> Dict[tuple, List[int]]:
+    counters = getattr(_LOCAL, "counters", None)
+    if counters is None:
+        counters = _LOCAL.counters = {}
+        with _COUNTERS_LOCK:
+            _ALL_COUNTERS.append(counters)
+    return counters
+
+def profiling_enabled() -> bool:
+    """是否正在量測；每隔 RULE_PROFILE_FLUSH_INTERVAL 秒與控制檔同步並寫出本 worker 的計數"""
+    if time.monotonic() - _LAST_SYNC >= RULE_PROFILE_FLUSH_INTERVAL:
+        _sync()
+    return _ENABLED
+
+def record_rule(detector: str, rule_id: str, hit: bool, elapsed_ns: int) -> None:
+    """記錄一條規則的一次執行（呼叫端只在 profiling_enabled() 時計時並呼叫）"""
+    counters = _thread_counters()
+    entry = counters.get((detector, rule_id))
+    if entry is None:
+        entry = counters[(detector, rule_id)] = [0, 0, 0]
+    entry[0] += 1
+    entry[1] += hit
+    entry[2] += elapsed_ns
+
+def record_hits(detector: str, rule_ids) -> None:
+    """記錄由共用關鍵詞索引一次掃描命中的規則（沒有個別的執行時間，成本記在索引掃描上）"""
+    counters = _thread_counters()
+    for rule_id in rule_ids:
+        entry = counters.get((detector, rule_id))
+        if entry is None:
+            entry = counters[(detector, rule_id)] = [0, 0, 0]
+        entry[1] += 1
+
+def register_profiled_rules(detector: str, group: str, rules: Dict[str, str]) -> None:
+    """登錄（或替換）偵測器的一組規則，讓從未命中的規則也出現在統計中"""
+    detector_rules = dict(_RULES.get(detector, {}))
+    detector_rules[group] = dict(rules)
+    _RULES[detector] = detector_rules
+
+def snapshot() -> Dict[str, Any]:
+    """合併本 worker 所有執行緒的計數"""
+    merged: Dict[str, Dict[str, List[int]]] = {}
+    for counters in list(_ALL_COUNTERS):
+        for (detector, rule_id), entry in list(counters.items()):
+            total = merged.setdefault(detector, {}).setdefault(rule_id, [0, 0, 0])
+            for index in range(3):
+                total[index] += entry[index]
+    return {
+        "pid": os.getpid(),
+        "epoch": _EPOCH,
+        "updated_at": time.time(),
+        "counters": merged,
+        "rules": {
+            detector: {rule_id: pattern for rules in groups.values() for rule_id, pattern in rules.items()}
+            for detector, groups in _RULES.items()
+        }
+    }
+
+def _reset_local() -> None:
+    for counters in list(_ALL_COUNTERS):
+        counters.clear()
+
+def _write_json(path: str, data: Dict[str, Any]) -> None:
+    ensure_private_dir(RULE_PROFILE_DIR)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as dump_file:
+        json.dump(data, dump_file, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+def _read_json(path: str) -> Optional[Dict[str, Any]]:
+    """讀取本程序使用者寫入的檔案；目錄或檔案可被其他使用者寫入時忽略"""
+    if not is_trusted_path(RULE_PROFILE_DIR) or not is_trusted_path(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as dump_file:
+            return json.load(dump_file)
+    except (OSError, ValueError):
+        return None
+
+def _worker_path(pid: int) -> str:
+    return os.path.join(RULE_PROFILE_DIR, f"worker-{pid}.json")
+
+def _pid_alive(pid: Any) -> bool:
+    if not isinstance(pid, int) or pid <= 0:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def _read_worker_profiles() -> Dict[int, Dict[str, Any]]:
+    """讀取其他 worker 寫出的計數，並移除已結束（PID 不存在）或過久未更新的 worker 檔案"""
+    profiles: Dict[int, Dict[str, Any]] = {}
+    now = time.time()
+    for path in glob.glob(os.path.join(RULE_PROFILE_DIR, "worker-*.json")):
+        profile = _read_json(path)
+        if profile is None:
+            continue
+        pid = profile.get("pid")
+        if not _pid_alive(pid) or now - profile.get("updated_at", 0) > RULE_PROFILE_STALE_AFTER:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            continue
+        if profile.get("epoch") == _EPOCH:
+            profiles[pid] = profile
+    return profiles
+
+def _sync() -> None:
+    """套用控制檔的開關與重設，並寫出本 worker 的計數"""
+    global _ENABLED, _EPOCH, _LAST_SYNC
+    _LAST_SYNC = time.monotonic()
+    control = _read_json(_CONTROL_PATH)
+    if control is not None:
+        _ENABLED = bool(control.get("enabled", _ENABLED))
+        if control.get("epoch", 0) != _EPOCH:
+            _EPOCH = control.get("epoch", 0)
+            _reset_local()
+    if _ENABLED or any(_ALL_COUNTERS):
+        try:
+            _write_json(_worker_path(os.getpid()), snapshot())
+        except OSError as e:
+            print(f"Error writing rule profile: {str(e)}")
+
+def merge_profiles() -> Dict[str, Any]:
+    """
+    合併所有 worker 的計數（本 worker 使用即時計數，其他 worker 使用最近一次寫出的檔案）
+
+    Returns:
+        每個偵測器的規則統計（依累計時間排序）與從未命中的規則
+    """
+    _sync()
+    profiles = _read_worker_profiles()
+    profiles[os.getpid()] = snapshot()
+
+    detectors: Dict[str, Dict[str, Any]] = {}
+    for profile in profiles.values():
+        for detector, rules in profile.get("rules", {}).items():
+            detectors.setdefault(detector, {"rules": {}, "counters": {}})["rules"].update(rules)
+        for detector, counters in profile.get("counters", {}).items():
+            totals = detectors.setdefault(detector, {"rules": {}, "counters": {}})["counters"]
+            for rule_id, entry in counters.items():
+                total = totals.setdefault(rule_id, [0, 0, 0])
+                for index in range(3):
+                    total[index] += entry[index]
+
+    result = {}
+    for detector, data in sorted(detectors.items()):
+        rows = []
+        for rule_id in sorted(set(data["rules"]) | set(data["counters"])):
+            evaluations, hits, elapsed_ns = data["counters"].get(rule_id, [0, 0, 0])
+            rows.append({
+                "rule_id": rule_id,
+                "pattern": data["rules"].get(rule_id),
+                "evaluations": evaluations,
+                "hits": hits,
+                "total_ms": round(elapsed_ns / 1e6, 3),
+                "avg_us": round(elapsed_ns / evaluations / 1e3, 3) if evaluations else 0.0
+            })
+        rows.sort(key=lambda row: (-row["total_ms"], -row["hits"], row["rule_id"]))
+        result[detector] = {
+            "rules": rows,
+            "dead_rules": [row["rule_id"] for row in rows if row["hits"] == 0 and row["pattern"] is not None]
+        }
+    return {"enabled": _ENABLED, "epoch": _EPOCH, "workers": sorted(profiles), "generated_at": time.time(), "detectors": result}
+
+def dump_profiles() -> str:
+    """將合併後的統計寫入 RULE_PROFILE_DIR/rule_profile.json，回傳檔案路徑"""
+    _write_json(_MERGED_PATH, merge_profiles())
+    return _MERGED_PATH
+
+def set_profiling(enabled: bool, reset: bool = False) -> Dict[str, Any]:
+    """開啟或關閉量測（寫入控制檔，其他 worker 在同步間隔內跟進）；reset 時清除所有 worker 的計數"""
+    global _ENABLED, _EPOCH
+    _sync()
+    _ENABLED = enabled
+    if reset:
+        _EPOCH += 1
+        _reset_local()
+        for path in glob.glob(os.path.join(RULE_PROFILE_DIR, "worker-*.json")):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+    _write_json(_CONTROL_PATH, {"enabled": _ENABLED, "epoch": _EPOCH})
+    return {"enabled": _ENABLED, "epoch": _EPOCH}
+
+class RuleProfilingRequest(BaseModel):
+    enabled: bool = Field(..., description="是否開啟規則量測")
+    reset: bool = Field(False, description="是否清除目前的計數")
+
+@router.get("/stats", summary="取得規則統計", description="合併所有 worker 的規則執行次數、命中次數與累計時間，並列出從未命中的規則")
+def get_rule_profile():
+    """取得規則統計"""
+    try:
+        return merge_profiles()
+    except Exception as e:
+        print(f"Error getting rule profile: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to get rule profile: {str(e)}") from e
+
+@router.post("/dump", summary="匯出規則統計檔", description="將合併後的規則統計寫入資料目錄的 rule_profile.json")
+def dump_rule_profile():
+    """匯出規則統計檔"""
+    try:
+        return {"success": True, "path": dump_profiles()}
+    except Exception as e:
+        print(f"Error dumping rule profile: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to dump rule profile: {str(e)}") from e
+
+@router.post("/settings", summary="設定規則量測", description="開啟或關閉規則量測，可同時清除所有 worker 的計數")
+def update_rule_profiling(request: RuleProfilingRequest):
+    """設定規則量測"""
+    try:
+        return set_profiling(request.enabled, request.reset)
+    except Exception as e:
+        print(f"Error updating rule profiling: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to update rule profiling: {str(e)}") from e
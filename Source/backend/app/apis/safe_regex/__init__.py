@@ -0,0 +1,267 @@
+from typing import Dict, Any, List, Optional, Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+import re
+import threading
+import time
+# 標準函式庫沒有公開的規則剖析 API（舊的公開別名 sre_parse 自 3.11 起已棄用），因此使用 re 的內部模組；
+# 這些模組沒有相容性保證，改由載入時的 _self_check 驗證分析結果，而不是固定 Python 版本
+from re import _parser as sre_parse, _constants as sre_constants, _compiler as sre_compile
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel, Field
+
+'''
+1. API用途：規則的線性時間執行與每則訊息的偵測時間預算。詐騙規則、高風險語句與特殊回應規則（後台可編輯）
+   編譯前先做靜態分析，拒絕可能造成災難性回溯（ReDoS）的寫法：反向參照、前後查看、巢狀量詞、
+   量詞下的選擇、未限制長度且會被重複掃描的量詞、回溯組合數過大的規則；通過檢查的規則
+   在 re（回溯式引擎）上的執行時間也與訊息長度成線性，保護完全來自這個靜態分析。
+   靜態分析使用 re 的內部模組（re._parser、re._constants），模組載入時以已知的安全與不安全規則
+   自我檢查，內部結構改變時立即失敗，不會在新版 Python 上默默放行危險規則。
+   另外詐騙類別的規則有每則訊息的 CPU 時間預算，超過時停止執行剩餘類別，結果標示為未完成（incomplete）；
+   特殊回應（危機）規則與高風險語句不受預算限制
+2. 關聯頁面：後台管理頁面（「特殊回應設定」儲存規則前的檢查、預算統計）
+3. 目前狀態：啟用中（不安全的規則在儲存設定或發佈規則包時即被拒絕）
+'''
+
+router = APIRouter(
+    prefix="/safe-regex",
+    tags=["safe-regex"],
+    responses={404: {"description": "Not found"}},
+)
+
+# 規則每個起始位置最多的回溯組合數（有限量詞寬度的乘積）
+MAX_BACKTRACK_FACTOR = 10000
+# 每則訊息詐騙類別規則的 CPU 時間預算（毫秒，只計本執行緒），由最外層的詐騙偵測建立，同一則訊息的詐騙偵測共用
+DETECTION_BUDGET_MS = 50
+
+_MAXREPEAT = sre_constants.MAXREPEAT
+_REPEATS = (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT)
+_UNSUPPORTED = {
+    sre_constants.GROUPREF: "backreference",
+    sre_constants.GROUPREF_EXISTS: "conditional group",
+    sre_constants.ASSERT: "lookahead/lookbehind",
+    sre_constants.ASSERT_NOT: "lookahead/lookbehind",
+    sre_constants.ATOMIC_GROUP: "atomic group",
+    sre_constants.POSSESSIVE_REPEAT: "possessive quantifier",
+}
+# 接在量詞後面也不會讓量詞回溯的零寬度項目
+_TAIL_ASSERTIONS = (sre_constants.AT_BOUNDARY, sre_constants.AT_NON_BOUNDARY)
+
+class UnsafePatternError(ValueError):
+    """A rule that is invalid or can backtrack catastrophically"""
+
+    def __init__(self, pattern: str, problems: List[str]):
+        self.pattern = pattern
+        self.problems = problems
+        super().__init__(f"Unsafe pattern {pattern!r}: {'; '.join(problems)}")
+
+def _last_literals(item) -> Optional[List[int]]:
+    """項目最後一個字元的可能字元碼（只處理字面字元與其選擇），無法判斷時回傳 None"""
+    op, av = item
+    if op is sre_constants.LITERAL:
+        return [av]
+    if op is sre_constants.IN and all(item_op is sre_constants.LITERAL for item_op, _ in av):
+        # (?:你|我) 之類的單字元選擇會被解析為字元類別
+        return [code for _, code in av]
+    if op is sre_constants.SUBPATTERN:
+        return _last_literals(av[3][-1]) if len(av[3]) else None
+    if op is sre_constants.BRANCH:
+        codes = []
+        for branch in av[1]:
+            last = _last_literals(branch[-1]) if len(branch) else None
+            if last is None:
+                return None
+            codes.extend(last)
+        return codes
+    return None
+
+def _scans_disjoint_runs(state, previous, body, flags: int) -> bool:
+    """
+    未限制長度的單字元量詞前面若是不屬於其字元集合的字元，每次嘗試掃描的連續字元不會重疊，
+    整體仍是線性時間（例如 下載\\s*、借[0-9]+）
+    """
+    if previous is None or body.getwidth() != (1, 1):
+        return False
+    codes = _last_literals(previous)
+    if not codes:
+        return False
+    matcher = sre_compile.compile(sre_parse.SubPattern(state, list(body)), flags)
+    return not any(matcher.fullmatch(chr(code)) for code in codes)
+
+def _analyze(items, state, flags: int, tail: bool, problems: List[str]) -> int:
+    """檢查一段規則，回傳每個起始位置的回溯組合數上限"""
+    items = list(items)
+    consuming = [
+        index for index, (op, av) in enumerate(items)
+        if not (op is sre_constants.AT and av in _TAIL_ASSERTIONS)
+    ]
+    last = consuming[-1] if consuming else -1
+    factor = 1
+    previous = None
+    for index, (op, av) in enumerate(items):
+        item_tail = tail and index >= last
+        if op in _UNSUPPORTED:
+            problems.append(f"{_UNSUPPORTED[op]} is not supported by the linear-time engine")
+        elif op in _REPEATS:
+            low, high, body = av
+            body_min, body_max = body.getwidth()
+            if high > 1 and body_min != body_max:
+                problems.append("nested or variable-width quantified group (e.g. (a+)+); quantify a fixed-width item instead")
+            elif high > 1 and any(body_op is sre_constants.BRANCH for body_op, _ in body):
+                problems.append("alternation under a quantifier (e.g. (a|b)+); use a character class instead")
+            body_factor = _analyze(body, state, flags, False, problems)
+            if high == _MAXREPEAT:
+                if not item_tail and not _scans_disjoint_runs(state, previous, body, flags):
+                    problems.append("unbounded quantifier followed by more pattern; use a bounded {m,n} instead")
+            else:
+                factor *= (high - low + 1) * body_factor
+        elif op is sre_constants.SUBPATTERN:
+            factor *= _analyze(av[3], state, flags, item_tail, problems)
+        elif op is sre_constants.BRANCH:
+            factor *= sum(_analyze(branch, state, flags, item_tail, problems) for branch in av[1])
+        if not (op is sre_constants.AT):
+            previous = (op, av)
+    return factor
+
+def check_pattern(pattern: str, flags: int = re.IGNORECASE) -> List[str]:
+    """
+    靜態檢查規則是否能以線性時間執行
+
+    Args:
+        pattern: 規則字串
+        flags: 編譯旗標
+
+    Returns:
+        問題說明清單；空清單表示可以安全執行
+    """
+    try:
+        parsed = sre_parse.parse(pattern, flags)
+    except re.error as e:
+        return [f"invalid pattern: {str(e)}"]
+    except RecursionError:
+        return ["pattern is nested too deeply"]
+    problems: List[str] = []
+    factor = _analyze(parsed, parsed.state, flags, True, problems)
+    if factor > MAX_BACKTRACK_FACTOR:
+        problems.append(f"bounded quantifiers allow {factor} backtracking paths per position (max {MAX_BACKTRACK_FACTOR}); narrow the {{m,n}} ranges")
+    return list(dict.fromkeys(problems))
+
+# 載入時自我檢查：(規則, 是否應判定為安全)
+_SELF_CHECK_CASES = (
+    (r"(a+)+$", False),
+    (r"(a|ab)*c", False),
+    (r"(\w+)\1", False),
+    (r"(?=a)b", False),
+    (r".*a.*b", False),
+    (r"\b緊急\b", True),
+    (r"下載\s*app", True),
+    (r"匯款.{0,10}帳戶", True),
+)
+
+def _self_check() -> None:
+    """確認 re 內部模組的剖析結果仍符合分析器的假設；不符時拒絕載入，而不是放行危險規則"""
+    for pattern, safe in _SELF_CHECK_CASES:
+        if (not check_pattern(pattern)) != safe:
+            raise RuntimeError(
+                f"safe_regex self-check failed for {pattern!r}: the re parser internals changed in this Python version"
+            )
+
+_self_check()
+
+def compile_rule(pattern: str, flags: int = re.IGNORECASE):
+    """
+    檢查並編譯一條規則（只接受通過 check_pattern 的規則，執行時間與訊息長度成線性）
+
+    Raises:
+        UnsafePatternError: 規則無效或可能造成災難性回溯
+    """
+    problems = check_pattern(pattern, flags)
+    if problems:
+        raise UnsafePatternError(pattern, problems)
+    return re.compile(pattern, flags)
+
+class MessageBudget:
+    """
+    CPU-time budget for detecting one message, checked between rules
+
+    Measured with the thread's own CPU time, so time spent waiting for the GIL or
+    preempted by other threads does not count against the message.
+    exhausted is set once a check has found the budget used up, i.e. rules were skipped.
+    """
+
+    __slots__ = ("label", "deadline", "exhausted")
+
+    def __init__(self, label: str, budget_ms: float):
+        self.label = label
+        self.deadline = time.thread_time() + budget_ms / 1000
+        self.exhausted = False
+
+    def expired(self) -> bool:
+        if not self.exhausted and time.thread_time() > self.deadline:
+            self.exhausted = True
+            _record_exhausted(self.label)
+        return self.exhausted
+
+_CURRENT_BUDGET: ContextVar[Optional[MessageBudget]] = ContextVar("message_budget", default=None)
+_BUDGET_LOCK = threading.Lock()
+_BUDGET_STATS: Dict[str, Any] = {"started": 0, "exhausted": {}}
+
+def _record_exhausted(label: str) -> None:
+    with _BUDGET_LOCK:
+        _BUDGET_STATS["exhausted"][label] = _BUDGET_STATS["exhausted"].get(label, 0) + 1
+    print(f"Detection budget exhausted ({label}), remaining rules skipped for this message")
+
+@contextmanager
+def message_budget(label: str, budget_ms: float = DETECTION_BUDGET_MS) -> Iterator[MessageBudget]:
+    """
+    為一則訊息建立偵測時間預算；已在其他偵測的預算內時沿用同一個預算
+
+    使用方式：with message_budget("scam") as budget: ...，規則之間以 budget_expired() 檢查
+    """
+    current = _CURRENT_BUDGET.get()
+    if current is not None:
+        yield current
+        return
+    budget = MessageBudget(label, budget_ms)
+    _BUDGET_STATS["started"] += 1
+    token = _CURRENT_BUDGET.set(budget)
+    try:
+        yield budget
+    finally:
+        _CURRENT_BUDGET.reset(token)
+
+def budget_expired() -> bool:
+    """目前訊息的偵測預算是否已用完（不在預算內時永遠為 False）"""
+    budget = _CURRENT_BUDGET.get()
+    return budget is not None and budget.expired()
+
+def get_budget_stats() -> Dict[str, Any]:
+    with _BUDGET_LOCK:
+        return {
+            "engine": "re",
+            "budget_ms": DETECTION_BUDGET_MS,
+            "budgets_started": _BUDGET_STATS["started"],
+            "budgets_exhausted": dict(_BUDGET_STATS["exhausted"])
+        }
+
+class PatternCheckRequest(BaseModel):
+    pattern: str = Field(..., description="要檢查的規則（正規表示式）")
+
+@router.post("/check", summary="檢查規則", description="檢查規則是否能以線性時間執行，回傳不安全的原因")
+def check_rule_pattern(request: PatternCheckRequest):
+    """檢查規則是否安全"""
+    try:
+        problems = check_pattern(request.pattern)
+        return {"pattern": request.pattern, "safe": not problems, "problems": problems}
+    except Exception as e:
+        print(f"Error checking pattern: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to check pattern: {str(e)}") from e
+
+@router.get("/stats", summary="取得規則執行統計", description="取得使用中的規則引擎與偵測預算用完的次數")
+def get_safe_regex_stats():
+    """取得規則執行統計"""
+    try:
+        return get_budget_stats()
+    except Exception as e:
+        print(f"Error getting safe regex stats: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to get safe regex stats: {str(e)}") from e
@@ -1,12 +1,33 @@
 from typing import Dict, Any, Tuple, List, Optional
-import re
-from fastapi import APIRouter, HTTPException
+import os
+import json
+import hashlib
+import time
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from fastapi import APIRouter, HTTPException, Request, Header, Response
+from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel, Field
+# Detection itself lives in the shared detection engine; re-exported here for existing callers
+from app.apis.detection_engine import (
+    ScamDetectionResult, get_scam_patterns, get_scam_types, get_high_risk_phrases, get_scam_rules_version, calculate_confidence_score,
+    match_scam_indicators, score_scam_indicators, detect_scam, detect_scam_uncached, detect_scam_windowed,
+    detect_scam_image
+)
+from app.apis.scam_images import load_image_bytes, decode_image_base64
+from app.apis.scam_templates import get_template_version
+from app.apis.scam_identifiers import get_identifier_index_version
+from app.apis import detection_engine
+from app.apis.detection_cache import fingerprint_rules
+from app.apis.text_normalization import normalize_text_with_offsets, to_original_span
 
 '''
 1. API用途：詐騙偵測 API，程式化分析訊息中的詐騙特徵並產生回應建議
 2. 關聯頁面：前台「訊息偵測」頁面和後台的「詐騙偵測設定」頁面
-3. 目前狀態：部分啟用中（文字模式偵測啟用，圖片偵測功能暫時關閉；
+3. 目前狀態：啟用中（/analyze-text 與批次偵測使用相同的偵測引擎與回應格式；
+   圖片偵測以感知雜湊比對已知詐騙截圖，尚未做 OCR；
    注意：可以與純LLM模式並行使用，LLM模式關閉不影響此API的功能）
 '''
 
@@ -57,11 +78,20 @@ router = APIRouter(
 class ScamDetectionRequest(BaseModel):
     text: str = Field(..., description="Text to analyze for potential scams")
     language: Optional[str] = Field("auto", description="Language of the text (auto, en, zh)")
+    max_spans_per_category: Optional[int] = Field(None, ge=0, description="Maximum number of match spans returned per indicator (all by default)")
+
+class ScamMatchSpan(BaseModel):
+    rule_id: str = Field(..., description="Identifier of the rule that matched")
+    start: int = Field(..., description="Start offset of the match in the analyzed text")
+    end: int = Field(..., description="End offset (exclusive) of the match in the analyzed text")
+    text: str = Field(..., description="Matched text as seen by the rule (normalized)")
 
 class ScamIndicator(BaseModel):
+    category_id: Optional[str] = Field(None, description="Identifier of the indicator category")
     name: str = Field(..., description="Name of the indicator category")
     matches: List[str] = Field(..., description="Specific patterns matched")
     description: str = Field(..., description="Description of why this is concerning")
+    spans: List[ScamMatchSpan] = Field([], description="Position of every hit in the analyzed text, in text order")
 
 class ScamTypeInfo(BaseModel):
     id: str = Field(..., description="Identifier for the scam type")
@@ -76,9 +106,32 @@ class ScamDetectionResponse(BaseModel):
     scam_type: Optional[ScamTypeInfo] = Field(None, description="Information about the identified scam type")
     indicators: List[ScamIndicator] = Field([], description="List of detected scam indicators")
     analysis_summary: str = Field(..., description="Summary of the analysis in natural language")
+    incomplete: bool = Field(False, description="Detection time ran out before every rule was checked; a negative result is not conclusive")
+
+class BatchScamDetectionRequest(BaseModel):
+    texts: List[str] = Field(..., description="Texts to analyze, results are returned in the same order")
+    language: Optional[str] = Field("auto", description="Language of the texts (auto, en, zh)")
+
+class BatchScamDetectionItem(BaseModel):
+    index: int = Field(..., description="Position of the text in the request")
+    is_scam: bool = Field(..., description="Whether the message appears to be a scam")
+    overall_confidence: float = Field(..., description="Overall confidence score (0-1) that this is a scam")
+    scam_type: Optional[ScamTypeInfo] = Field(None, description="Information about the identified scam type")
+    indicators: List[ScamIndicator] = Field([], description="List of detected scam indicators")
+    analysis_summary: str = Field(..., description="Summary of the analysis in natural language")
+    incomplete: bool = Field(False, description="Detection time ran out before every rule was checked; a negative result is not conclusive")
+    processing_time_ms: float = Field(..., description="Time spent analyzing this text in milliseconds")
+
+class BatchScamDetectionResponse(BaseModel):
+    results: List[BatchScamDetectionItem] = Field([], description="Per-text results in input order")
+    total: int = Field(..., description="Number of texts analyzed")
+    scam_count: int = Field(..., description="Number of texts detected as potential scams")
+    processing_time_ms: float = Field(..., description="Wall-clock time for the whole batch in milliseconds")
+    workers: int = Field(..., description="Number of worker processes used (0 means analyzed in-process)")
 
 class ImageAnalysisRequest(BaseModel):
-    image_url: str = Field(..., description="URL of the image to analyze")
+    image_url: Optional[str] = Field(None, description="LINE message content URL or data: URL of the image to analyze")
+    image_base64: Optional[str] = Field(None, description="Base64 encoded image, for images from any other source")
 
 class AdviceRequest(BaseModel):
     scam_type_id: str = Field(..., description="Identifier for the scam type")
@@ -101,90 +154,6 @@ class AdviceResponse(BaseModel):
     support_resources: List[AdviceSuggestion] = Field([], description="Support resources and contacts")
     reassurance_message: str = Field(..., description="A reassuring message to help the user feel supported")
 
-# Enhanced: Define potential scam patterns with detailed information
-SCAM_PATTERNS = {
-    "urgent_action": {
-        "name": "緊急行動", 
-        "description": "訊息催促您立即行動，製造緊迫感以降低您的警覺性",
-        "patterns": [
-            r"\b緊急\b", r"\b立即\b", r"\b速度\b", r"\b盡快\b", r"\b馬上\b", r"\b現在就\b", r"\b不得延遲\b", r"\b刻不容緩\b",
-            r"\bimmediately\b", r"\burgent\b", r"\bASAP\b", r"\bquick\b", r"\bnow\b", r"\binstantly\b", r"\bno delay\b"
-        ]
-    },
-    "financial_incentives": {
-        "name": "金錢誘因", 
-        "description": "訊息提供非常誘人的金錢獎勵或利益，過於美好難以置信",
-        "patterns": [
-            r"\b贏取\b", r"\b中獎\b", r"\b獎金\b", r"\b報酬\b", r"\b紅利\b", r"\b利率\b", r"\b回報\b", r"\b免費\b", r"\b折扣\b", r"[0-9]+,[0-9]+元", r"[0-9]+元獎金", r"[0-9]+0%", r"每月15-20%", r"輕鬆賺取", r"先支付", r"成功率", r"高報酬", r"手續費", r"立即領取",
-            r"\bwin\b", r"\baward\b", r"\bprize\b", r"\breward\b", r"\bbonus\b", r"\brate\b", r"\breturn\b", r"\bfree\b", r"\bdiscount\b", r"\bclaim\b", r"\bhighly\sprofitable\b"
-        ]
-    },
-    "personal_information": {
-        "name": "個人資訊請求", 
-        "description": "訊息要求您提供敏感的個人資訊，這些資料可能被用於身份盜用",
-        "patterns": [
-            r"\b密碼\b", r"\b驗證碼\b", r"\b帳號\b", r"\b身分證\b", r"\b信用卡\b", r"\b銀行卡\b", r"\b cvv\b", r"\b卡號\b",
-            r"\bpassword\b", r"\bverify\b", r"\baccount\b", r"\bID\b", r"\bcredit card\b", r"\bcode\b", r"\bpin\b", r"\bsecurity\b"
-        ]
-    },
-    "suspicious_links": {
-        "name": "可疑連結", 
-        "description": "訊息包含可疑連結，點擊可能導致釣魚網站或惡意軟體下載",
-        "patterns": [
-            r"http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\(\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+",
-            r"bit\.ly", r"goo\.gl", r"tinyurl", r"t\.co"
-        ]
-    },
-    "impersonation": {
-        "name": "身份冒充", 
-        "description": "訊息冒充官方機構或知名企業，試圖獲取您的信任",
-        "patterns": [
-            r"\b銀行\b", r"\b客服\b", r"\b政府\b", r"\b公司\b", r"\b警察\b", r"\b稅務\b", r"\b海關\b", r"\b電信\b", r"\b官方\b",
-            r"\bbank\b", r"\bcustomer service\b", r"\bgovernment\b", r"\bcompany\b", r"\bpolice\b", r"\btax\b", r"\bofficial\b"
-        ]
-    },
-    "investment_schemes": {
-        "name": "投資騙局", 
-        "description": "訊息提供不切實際的投資機會，承諾高回報和低風險",
-        "patterns": [
-            r"\b投資\b", r"\b股票\b", r"\b基金\b", r"\b加密貨幣\b", r"\b比特幣\b", r"\b以太幣\b", r"\b保證[^\s]*利\b", r"\b翻倍\b", r"秘密投資", r"[0-9]+%回報", r"限量名額", r"致富", r"專家團隊", r"絕佳標的", r"風險低", r"獲利", r"穩賺", r"無風險",
-            r"\binvestment\b", r"\bstock\b", r"\bfund\b", r"\bcrypto\b", r"\bbitcoin\b", r"\bethereum\b", r"\bguaranteed\b", r"\bdouble\b", r"\bhigh return\b", r"\blow risk\b", r"\bsecret\b"
-        ]
-    },
-    "romance_scam": {
-        "name": "感情詐騙", 
-        "description": "訊息利用感情操控，快速建立親密關係後要求金錢協助",
-        "patterns": [
-            r"\b交友\b", r"\b戀愛\b", r"\b愛情\b", r"\b約會\b", r"\b喜歡你\b", r"\b愛你\b", r"\b想你\b", r"\b想見你\b", r"親愛", r"借[0-9]+元", r"銀行卡", r"凍結", r"給我", r"會還你", r"一直在想你", r"見你",
-            r"\bdating\b", r"\bromance\b", r"\blove\b", r"\brelationship\b", r"\blike you\b", r"\blove you\b", r"\bmiss you\b", r"dear", r"darling", r"sweetheart"
-        ]
-    },
-    "threat_or_blackmail": {
-        "name": "威脅或勒索", 
-        "description": "訊息使用威脅或恐嚇手段，聲稱掌握您的隱私或會造成傷害",
-        "patterns": [
-            r"\b威脅\b", r"\b勒索\b", r"\b恐嚇\b", r"\b曝光\b", r"\b攻擊\b", r"\b後果\b", r"\b危險\b", r"\b黑客\b",
-            r"\bthreat\b", r"\bblackmail\b", r"\bexpose\b", r"\bhack\b", r"\bdanger\b", r"\bconsequence\b", r"\bpunish\b"
-        ]
-    },
-    "fake_job_offers": {
-        "name": "虛假工作機會", 
-        "description": "訊息提供不切實際的工作機會，通常要求先付費或要求個人資訊",
-        "patterns": [
-            r"\b工作機會\b", r"\b賺錢\b", r"\b在家工作\b", r"\b兼職\b", r"\b高薪\b", r"\b招聘\b", r"\b錄取\b", r"\b面試\b",
-            r"\bjob opportunity\b", r"\bmake money\b", r"\bwork from home\b", r"\bpart-time\b", r"\bhigh salary\b", r"\bhiring\b"
-        ]
-    },
-    "lottery_or_inheritance": {
-        "name": "彩票或遺產詐騙", 
-        "description": "訊息聲稱您中了彩票或有遺產繼承，但要求先付費才能領取",
-        "patterns": [
-            r"\b彩票\b", r"\b樂透\b", r"\b中獎\b", r"\b遺產\b", r"\b繼承\b", r"\b領取\b", r"\b抽獎\b", r"\b幸運號碼\b",
-            r"\blottery\b", r"\bjackpot\b", r"\bprize\b", r"\binheritance\b", r"\bclaim\b", r"\blucky number\b", r"\bwinner\b"
-        ]
-    }
-}
-
 # Enhanced: Define detailed victim recovery advice for each scam type
 VICTIM_RECOVERY_ADVICE = {
     "fake_customer_service": {
@@ -568,115 +537,8 @@ PREVENTIVE_ADVICE = {
     }
 }
 
-# Enhanced: Define scam types with more detailed classifications and advice
-SCAM_TYPES = {
-    "fake_customer_service": {
-        "name": "假冒客服詐騙",
-        "description": "詐騙者冒充銀行、電商平台或公用事業等客服人員，聲稱您的賬戶有疑似不對勢交易或問題需要針對。",
-        "advice": [
-            "永遠不要提供您的賬號、密碼、OTP等資料，合法客服總和不會記齊要求這些資料",
-            "不要急於點擊訊息連結，請直接聯絡官方客服管道確認",
-            "無論對方如何急迫，總應多花3分鐘思考認真輕重"
-        ],
-        "indicators": ["personal_information", "urgent_action", "impersonation", "suspicious_links"]
-    },
-    "investment_scam": {
-        "name": "投資詐騙",
-        "description": "詐騙者以高報酬率或誘餌引誘受害者進行投資，包含加密貨幣及股息、股票、投款計劃等方式。",
-        "advice": [
-            "沒有穩賺的投資，請細心謹慎對待投資高收益率的產品",
-            "只向合法監管機構的投資平台投資",
-            "投資前仔細查核公司背景及合約細則"
-        ],
-        "indicators": ["financial_incentives", "investment_schemes", "urgent_action"]
-    },
-    "romance_scam": {
-        "name": "交友詐騙",
-        "description": "詐騙者在交友軟件或社交平台上創建虛假個人資料，並織造浪漫的戀愛情節。在建立信任關係後，開始要求金錢援助。",
-        "advice": [
-            "謹慎交友，尤其是顯示經濟富裕的陌生人",
-            "盡量使用視訊或實際見面驗證對方身份",
-            "不要輕易轉帳或提供個人財物資料"
-        ],
-        "indicators": ["romance_scam", "financial_incentives", "urgent_action"]
-    },
-    "prize_or_lottery_scam": {
-        "name": "中獎詐騙",
-        "description": "詐騙者通知您在未參加的抽獎活動中獲獎，但提取獎金前，您需要先支付手續費或稅金等費用。",
-        "advice": [
-            "未參加的抽獎活動不可能中獎",
-            "真正的獎項不會要求您預先支付任何費用",
-            "對任何要求轉帳的抽獎通知保持警惕"
-        ],
-        "indicators": ["financial_incentives", "suspicious_links", "urgent_action"]
-    },
-    "general_suspicious": {
-        "name": "可疑訊息",
-        "description": "這則訊息包含一些可疑元素，建議您提高警覺。",
-        "advice": [
-            "對要求個人資料或金錢的訊息保持警惕",
-            "不要點擊不明來源的連結",
-            "如有疑問，請透過官方管道確認"
-        ],
-        "indicators": []
-    }
-}
-
-def calculate_confidence_score(matched_categories: List[str], matched_indicators: List[Dict[str, Any]], message_length: int) -> float:
-    """
-    Calculate a confidence score based on the number and types of matched categories,
-    the specific matches found, and the message length
-    
-    Args:
-        matched_categories: List of matched category IDs
-        matched_indicators: Detailed information about matches
-        message_length: Length of the message in characters
-        
-    Returns:
-        Confidence score between 0 and 1
-    """
-    # Base factors
-    category_count = len(matched_categories)  # Number of different categories matched
-    total_categories = len(SCAM_PATTERNS)     # Total number of possible categories
-    
-    # No matches means no confidence
-    if category_count == 0:
-        return 0.0
-    
-    # Base score from category matches (0.1 to 0.7)
-    # More weight given to matches to make detection more sensitive
-    base_score = min(0.7, (category_count / total_categories) * 0.7 + 0.15)
-    
-    # Adjust based on high-risk and medium-risk categories
-    high_risk_categories = ["personal_information", "suspicious_links", "threat_or_blackmail"]
-    medium_risk_categories = ["urgent_action", "financial_incentives", "impersonation"]
-    
-    high_risk_bonus = sum(0.12 for cat in matched_categories if cat in high_risk_categories)
-    medium_risk_bonus = sum(0.07 for cat in matched_categories if cat in medium_risk_categories)
-    risk_score = min(0.25, high_risk_bonus + medium_risk_bonus)  # Cap at 0.25
-    
-    # Adjust based on number of matches in each category (density of hits)
-    match_density = 0
-    for ind in matched_indicators:
-        matches_count = len(ind.get("matches", []))
-        # More matches in a single category increases confidence
-        match_density += min(0.05, matches_count * 0.01)  # Diminishing returns
-    
-    # Adjust for message length (very short or very long messages are less likely to be scams)
-    length_factor = 1.0
-    if message_length < 20:  # Very short messages
-        length_factor = 0.5
-    elif message_length > 500:  # Very long messages
-        length_factor = 0.8
-    
-    # Combine factors
-    confidence = (base_score + risk_score + match_density) * length_factor
-    
-    # Ensure score is between 0 and 1
-    return min(1.0, max(0.0, confidence))
-
 def generate_analysis_summary(is_scam: bool, scam_type: Optional[Dict[str, Any]], 
-                              indicators: List[Dict[str, Any]], confidence: float) -> str:
+                              indicators: List[Dict[str, Any]], confidence: float, incomplete: bool = False) -> str:
     """
     Generate a natural language summary of the scam analysis
     
@@ -685,10 +547,13 @@ def generate_analysis_summary(is_scam: bool, scam_type: Optional[Dict[str, Any]]
         scam_type: Information about the identified scam type
         indicators: List of detected scam indicators
         confidence: Overall confidence score
+        incomplete: Whether some rules were skipped because detection time ran out
         
     Returns:
         String containing the analysis summary
     """
+    if incomplete and (not is_scam or confidence < 0.2):
+        return "此訊息過長，未能在時間內完成全部檢查，目前檢查過的部分未發現明顯的詐騙特徵。請仍謹慎對待訊息中的連結與匯款要求。"
     if not is_scam or confidence < 0.2:
         return "此訊息未顯示明顯的詐騙特徵。但請記住，詐騙手法日益精進，若您對任何訊息感到懷疑，請多加留意。"
     
@@ -722,97 +587,6 @@ def generate_analysis_summary(is_scam: bool, scam_type: Optional[Dict[str, Any]]
     
     return summary
 
-# Enhanced detection function with rich analysis and confidence scoring
-def detect_scam(message: str) -> Tuple[bool, Dict[str, Any], List[Dict[str, Any]], float]:
-    """
-    Analyze a message for potential scam indicators
-    
-    Args:
-        message: The message text to analyze
-        
-    Returns:
-        Tuple containing:
-        - Boolean indicating if the message appears to be a scam
-        - Dictionary with scam type information if detected, or None
-        - List of matched pattern categories
-    """
-    # Skip short messages or empty ones
-    if not message or len(message) < 5:
-        return False, None, [], 0.0
-        
-    # Check for patterns and collect detailed information
-    matched_indicators = []
-    for category_id, category_info in SCAM_PATTERNS.items():
-        matches = []
-        for pattern in category_info["patterns"]:
-            # Find all matches in the message
-            matches_found = re.findall(pattern, message, re.IGNORECASE)
-            if matches_found:
-                matches.extend(matches_found)
-        
-        # If we found matches for this category, add it to our results
-        if matches:
-            matched_indicators.append({
-                "category_id": category_id,
-                "name": category_info["name"],
-                "description": category_info["description"],
-                "matches": list(set(matches))  # Remove duplicates
-            })
-    
-    # Extract just the category IDs for easier processing
-    matched_categories = [ind["category_id"] for ind in matched_indicators]
-    
-    # Skip if no patterns matched
-    if not matched_categories:
-        return False, None, [], 0.0
-        
-    # Calculate overall confidence score
-    confidence_score = calculate_confidence_score(matched_categories, matched_indicators, len(message))
-    
-    # Determine most likely scam type with improved scoring
-    most_likely_scam = None
-    max_score = 0
-    
-    for scam_id, scam_info in SCAM_TYPES.items():
-        # Skip general suspicious category in initial matching
-        if scam_id == "general_suspicious":
-            continue
-            
-        indicators = scam_info.get("indicators", [])
-        
-        # Calculate a score based on how many of this scam type's indicators match our message
-        # Give more weight to matches with multiple patterns in the same category
-        score = 0
-        for cat in matched_categories:
-            if cat in indicators:
-                # Increase score more if we have a lot of matches in this category
-                cat_matches = sum(len(ind["matches"]) for ind in matched_indicators 
-                                  if ind["category_id"] == cat)
-                score += 1 + min(0.5, cat_matches * 0.1)  # Base + bonus for multiple matches
-        
-        # If we match more indicators than the current best match, update our result
-        if score > max_score:
-            max_score = score
-            
-            # Create a copy of the scam info with the ID and a confidence score
-            most_likely_scam = scam_info.copy()
-            most_likely_scam["id"] = scam_id
-            
-            # Calculate specific confidence for this scam type
-            matched_indicator_ratio = sum(1 for ind in indicators if ind in matched_categories) / len(indicators) if indicators else 0
-            type_confidence = matched_indicator_ratio * 0.7 + confidence_score * 0.3
-            most_likely_scam["confidence_score"] = min(1.0, type_confidence)
-    
-    # If no specific scam type matched well but we have suspicious elements, use generic
-    is_scam = confidence_score > 0.2  # Lower threshold to catch more potential scams
-    
-    if is_scam and (max_score < 1.5 or not most_likely_scam):
-        most_likely_scam = SCAM_TYPES["general_suspicious"].copy()
-        most_likely_scam["id"] = "general_suspicious"
-        most_likely_scam["confidence_score"] = confidence_score
-    
-    return is_scam, most_likely_scam, matched_indicators, confidence_score
-
 def generate_response(scam_info: Dict[str, Any], message_type: str = "text") -> str:
     """
     Generate a response based on the detected scam type
@@ -849,12 +623,12 @@ def generate_response(scam_info: Dict[str, Any], message_type: str = "text") ->
     
     return response
     
-def analyze_image(image_url: str) -> Tuple[bool, Dict[str, Any], List[Dict[str, Any]], float]:
+def analyze_image(image_url: str) -> ScamDetectionResult:
     """
-    Analyze an image for potential scam indicators - enhanced placeholder
+    Analyze an image for potential scam indicators by matching it against known scam screenshots
     
     Args:
-        image_url: URL of the image to analyze
+        image_url: LINE message content URL or data: URL of the image to analyze
         
     Returns:
         Tuple containing:
@@ -862,10 +636,12 @@ def analyze_image(image_url: str) -> Tuple[bool, Dict[str, Any], List[Dict[str,
         - Dictionary with scam type information if detected, or None
         - List of detailed indicator dictionaries
         - Overall confidence score
+
+    Raises:
+        ValueError: If the image cannot be downloaded or decoded, or the URL is not allowed
     """
-    # This is just a placeholder - we're not actually analyzing images yet
-    # In the future, we could implement OCR and image analysis
-    return False, None, [], 0.0
+    # Perceptual hash lookup only; OCR of unknown screenshots is not implemented yet
+    return detect_scam_image(load_image_bytes(image_url))
 
 # Generate personalized advice based on scam type and victim status
 def generate_personalized_advice(scam_type_id: str, is_victim: bool, user_profile: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
@@ -880,12 +656,15 @@ def generate_personalized_advice(scam_type_id: str, is_victim: bool, user_profil
     Returns:
         Dictionary containing personalized advice
     """
+    # Scam types currently installed in the detection engine (may be replaced by a rule pack)
+    scam_types = detection_engine.get_scam_types()
+
     # Default to general suspicious if scam type not found
-    if scam_type_id not in SCAM_TYPES and scam_type_id not in PREVENTIVE_ADVICE:
+    if scam_type_id not in scam_types and scam_type_id not in PREVENTIVE_ADVICE:
         scam_type_id = "general_suspicious"
         
     # Get basic scam type information
-    scam_type_info = SCAM_TYPES.get(scam_type_id, SCAM_TYPES["general_suspicious"]).copy()
+    scam_type_info = scam_types.get(scam_type_id, scam_types["general_suspicious"]).copy()
     scam_type_info["id"] = scam_type_id
     
     # Initialize response structure
@@ -932,85 +711,113 @@ def generate_personalized_advice(scam_type_id: str, is_victim: bool, user_profil
     if user_profile:
         # Example: Add age-specific advice
         age = user_profile.get("age")
-        if age and age > 65:
-            advice_response["preventive_measures"].append({
+        if age and age > SENIOR_AGE:
+            # 建立新的列表，避免修改共用的 PREVENTIVE_ADVICE
+            advice_response["preventive_measures"] = advice_response["preventive_measures"] + [{
                 "title": "尋求家人協助",
                 "description": "與信任的家人分享可疑訊息，在做出財務決定前徵詢他們的意見。",
                 "priority": 1
-            })
+            }]
     
     return advice_response
 
-# API Endpoints
+def build_advice_response(advice: Dict[str, Any]) -> AdviceResponse:
+    """Convert generate_personalized_advice output into the API response model"""
+    return AdviceResponse(
+        scam_type=ScamTypeInfo(
+            id=advice["scam_type"]["id"],
+            name=advice["scam_type"]["name"],
+            description=advice["scam_type"]["description"],
+            confidence_score=1.0,  # Not relevant for this endpoint but required
+            advice=advice["scam_type"]["advice"]
+        ),
+        is_victim=advice["is_victim"],
+        immediate_steps=[AdviceSuggestion(**step) for step in advice["immediate_steps"]],
+        preventive_measures=[AdviceSuggestion(**measure) for measure in advice["preventive_measures"]],
+        support_resources=[AdviceSuggestion(**resource) for resource in advice["support_resources"]],
+        reassurance_message=advice["reassurance_message"]
+    )
+
+# Advice bundles: the generate-advice response only depends on (scam type, victim, age bucket, language),
+# so every variant is serialized once and served as ready-made JSON bytes with an ETag
+SENIOR_AGE = 65
+ADVICE_AGE_BUCKETS = {"default": None, "senior": {"age": SENIOR_AGE + 1}}
+ADVICE_LANGUAGES = ("zh", "en")  # 建議內容目前只有中文，en 暫時使用相同內容
+DEFAULT_ADVICE_LANGUAGE = "zh"
+
+_ADVICE_BUNDLES: Dict[str, Any] = {"scam_types": None, "bundles": {}}
+
+def get_age_bucket(user_profile: Optional[Dict[str, Any]]) -> str:
+    """Map a user profile to the age bucket used for advice personalization"""
+    age = (user_profile or {}).get("age")
+    try:
+        return "senior" if age and float(age) > SENIOR_AGE else "default"
+    except (TypeError, ValueError):
+        return "default"
+
+def normalize_advice_language(language: Optional[str]) -> str:
+    code = (language or DEFAULT_ADVICE_LANGUAGE).lower()[:2]
+    return code if code in ADVICE_LANGUAGES else DEFAULT_ADVICE_LANGUAGE
+
+def build_advice_bundles() -> Dict[str, Any]:
+    """
+    Serialize every advice variant
+
+    Returns:
+        Dictionary with the scam types the bundles were built from and
+        (scam_type_id, is_victim, age bucket, language) -> (JSON bytes, ETag)
+    """
+    scam_types = detection_engine.get_scam_types()
+    version = fingerprint_rules(scam_types, VICTIM_RECOVERY_ADVICE, PREVENTIVE_ADVICE)
+    bundles = {}
+    for scam_type_id in dict.fromkeys([*scam_types, *PREVENTIVE_ADVICE]):
+        for is_victim in (False, True):
+            for age_bucket, user_profile in ADVICE_AGE_BUCKETS.items():
+                advice = generate_personalized_advice(scam_type_id, is_victim, user_profile)
+                # 與 FastAPI 預設 JSONResponse 相同的序列化方式
+                body = json.dumps(
+                    jsonable_encoder(build_advice_response(advice)),
+                    ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+                ).encode("utf-8")
+                etag = f'"{version}-{hashlib.blake2b(body, digest_size=8).hexdigest()}"'
+                for language in ADVICE_LANGUAGES:
+                    bundles[(scam_type_id, is_victim, age_bucket, language)] = (body, etag)
+    return {"scam_types": scam_types, "version": version, "bundles": bundles}
+
+def refresh_advice_bundles() -> Dict[str, Any]:
+    """Rebuild the advice bundles (call after changing the advice tables)"""
+    global _ADVICE_BUNDLES
+    _ADVICE_BUNDLES = build_advice_bundles()
+    return _ADVICE_BUNDLES
+
+def get_advice_bundle(scam_type_id: str, is_victim: bool, age_bucket: str, language: Optional[str]) -> Tuple[bytes, str]:
+    """
+    Look up the serialized advice for a request
+
+    Returns:
+        Tuple of (JSON body, ETag)
+    """
+    bundles = _ADVICE_BUNDLES
+    # 規則包替換了詐騙類型時重建
+    if bundles["scam_types"] is not detection_engine.get_scam_types():
+        bundles = refresh_advice_bundles()
+    language = normalize_advice_language(language)
+    bundle = bundles["bundles"].get((scam_type_id, is_victim, age_bucket, language))
+    if bundle is None:
+        bundle = bundles["bundles"][("general_suspicious", is_victim, age_bucket, language)]
+    return bundle
+
+refresh_advice_bundles()
+
 @router.post("/analyze-text", response_model=ScamDetectionResponse, summary="Analyze Text", description="Analyze text for potential scam indicators")
 def analyze_scam_text(request: ScamDetectionRequest):
     """
     Analyze text for potential scam indicators
     """
-    # 臨時關閉詐騙檢測
-    print("詐騙檢測已關閉，直接返回正常結果")
-    return ScamDetectionResponse(
-        is_scam=False,
-        overall_confidence=0.0,
-        scam_type=None,
-        indicators=[],
-        analysis_summary="訊息分析結果正常，未檢測到詐騙跡象。"
-    )
-    
     try:
-        # Run the scam detection using the imported function
-        is_scam, scam_type_info, matched_categories = scam_utils_detect_scam(request.text)
-        
-        # For compatibility with older API, set confidence to a reasonable value based on matches
-        confidence = min(1.0, len(matched_categories) * 0.2) if matched_categories else 0.0
-        
-        # Convert matched categories to the expected format for the response
-        matched_indicators = []
-        for category in matched_categories:
-            matched_indicators.append({
-                "name": category.replace("_", " ").title(),
-                "matches": [category],  # simplified
-                "description": f"Detected {category.replace('_', ' ')} patterns in the message"
-            })
-        
-        # Generate analysis summary
-        analysis_summary = "This message " + ("appears to contain elements commonly found in scam messages. Please be cautious." if is_scam else "does not appear to contain obvious scam indicators. However, always stay vigilant.")
-        
-        if is_scam and scam_type_info:
-            analysis_summary = f"This message appears to be a {scam_type_info['name']}. {scam_type_info['description']}\n\nAdvice:\n" + "\n".join([f"- {advice}" for advice in scam_type_info.get("advice", [])])
-        
-        # Convert the matched indicators to the response format
-        indicators = [
-            ScamIndicator(
-                name=ind["name"],
-                matches=ind["matches"],
-                description=ind["description"]
-            ) for ind in matched_indicators
-        ]
-        
-        # Convert the scam type info to the response format
-        scam_type = None
-        if scam_type_info:
-            # Add a confidence score if not present
-            if "confidence_score" not in scam_type_info:
-                scam_type_info["confidence_score"] = confidence
-                
-            scam_type = ScamTypeInfo(
-                id=scam_type_info.get("id", "unknown"),
-                name=scam_type_info.get("name", "Unknown Scam Type"),
-                description=scam_type_info.get("description", ""),
-                confidence_score=scam_type_info.get("confidence_score", 0.5),
-                advice=scam_type_info.get("advice", [])
-            )
-        
-        # Return the response
-        return ScamDetectionResponse(
-            is_scam=is_scam,
-            overall_confidence=confidence,
-            scam_type=scam_type,
-            indicators=indicators,
-            analysis_summary=analysis_summary
-        )
+        # Same detection and response as /analyze-batch: engine indicators, confidence and spans in the original text
+        result = detect_scam(request.text, request.language)
+        return build_detection_response(result, request.text, request.max_spans_per_category)
     except Exception as e:
         # Log the error
         print(f"Error analyzing text: {str(e)}")
@@ -1020,57 +827,276 @@ def analyze_scam_text(request: ScamDetectionRequest):
             detail=f"Error analyzing text: {str(e)}"
         ) from e
 
-@router.post("/analyze-image", response_model=ScamDetectionResponse, summary="Analyze Image", description="Analyze an image for potential scam indicators (placeholder)")
-def analyze_image_endpoint(request: ImageAnalysisRequest):
+def build_indicator_spans(indicator: Dict[str, Any], offsets: Optional[List[Tuple[int, int]]],
+                          max_spans: Optional[int] = None) -> List[ScamMatchSpan]:
     """
-    Placeholder for future image analysis capability
+    Convert an indicator's hits into response spans
+
+    The engine reports offsets in the normalized message; with the offset map of the
+    analyzed text they are converted to offsets in the text as the client sent it.
     """
-    # 臨時關閉圖片詐騙檢測
-    print("圖片詐騙檢測已關閉，直接返回正常結果")
+    if offsets is None:
+        return []
+    spans = indicator.get("spans", [])
+    if max_spans is not None:
+        spans = spans[:max_spans]
+    response_spans = []
+    for span in spans:
+        start, end = to_original_span(offsets, span["start"], span["end"])
+        response_spans.append(ScamMatchSpan(rule_id=span["rule_id"], start=start, end=end, text=span["text"]))
+    return response_spans
+
+def build_detection_response(result: ScamDetectionResult, text: Optional[str] = None,
+                             max_spans_per_category: Optional[int] = None) -> ScamDetectionResponse:
+    """
+    Convert a detection engine result into the API response model
+
+    Args:
+        result: Detection engine result
+        text: The analyzed text; match spans are only returned when it is given
+        max_spans_per_category: Maximum number of spans returned per indicator
+    """
+    is_scam, scam_info, matched_indicators, confidence, incomplete = result
+
+    # Offset map from the normalized message back to the text, only built when there is something to highlight
+    offsets = None
+    if text and any(ind.get("spans") for ind in matched_indicators):
+        normalized = normalize_text_with_offsets(text)
+        offsets = normalized[1] if normalized is not None else None
+
+    scam_type = None
+    if scam_info:
+        scam_type = ScamTypeInfo(
+            id=scam_info.get("id", "unknown"),
+            name=scam_info.get("name", "Unknown Scam Type"),
+            description=scam_info.get("description", ""),
+            confidence_score=scam_info.get("confidence_score", confidence),
+            advice=scam_info.get("advice", [])
+        )
+
     return ScamDetectionResponse(
-        is_scam=False,
-        overall_confidence=0.0,
-        scam_type=None,
-        indicators=[],
-        analysis_summary="圖片分析結果正常，未檢測到詐騙跡象。"
+        is_scam=is_scam,
+        overall_confidence=confidence,
+        scam_type=scam_type,
+        indicators=[
+            ScamIndicator(
+                category_id=ind.get("category_id"),
+                name=ind["name"],
+                matches=[str(match) for match in ind["matches"]],
+                description=ind["description"],
+                spans=build_indicator_spans(ind, offsets, max_spans_per_category)
+            ) for ind in matched_indicators
+        ],
+        analysis_summary=generate_analysis_summary(is_scam, scam_info, matched_indicators, confidence, incomplete),
+        incomplete=incomplete
     )
-    # This is just a placeholder - we're not actually analyzing images yet
-    return ScamDetectionResponse(
-        is_scam=False,
-        overall_confidence=0.0,
-        scam_type=None,
-        indicators=[],
-        analysis_summary="圖片分析功能正在開發中。目前無法分析圖片中的詐騙風險。"
+
+@router.post("/analyze-image", response_model=ScamDetectionResponse, summary="Analyze Image", description="Match an image against known scam screenshots by perceptual hash")
+def analyze_image_endpoint(request: ImageAnalysisRequest):
+    """
+    Analyze an image for potential scam indicators
+    """
+    try:
+        if request.image_base64:
+            return build_detection_response(detect_scam_image(decode_image_base64(request.image_base64)))
+        if not request.image_url:
+            raise ValueError("Either image_url or image_base64 is required")
+        return build_detection_response(analyze_image(request.image_url))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    except Exception as e:
+        print(f"Error analyzing image: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error analyzing image: {str(e)}"
+        ) from e
+
+# Batch analysis settings
+BATCH_MAX_SIZE = 5000           # 單次批次最多處理的訊息數
+BATCH_CHUNK_SIZE = 200          # 每個工作單位處理的訊息數
+BATCH_INLINE_THRESHOLD = 64     # 少量訊息直接在本程序處理，避免跨程序開銷
+BATCH_MAX_WORKERS = max(1, min(4, os.cpu_count() or 1))
+
+# 共用的程序池與建立時的偵測資料版本（一起替換）
+_BATCH_POOL: Optional[Dict[str, Any]] = None
+
+def get_batch_data_version() -> str:
+    """Version of everything detect_scam depends on: rules, reported identifiers and scam templates"""
+    return ":".join([get_scam_rules_version(), get_identifier_index_version(), get_template_version() or "-"])
+
+def install_batch_rules(rule_set: Dict[str, Any]) -> None:
+    """Process pool initializer: install the parent's active scam rules (including unpublished runtime changes)"""
+    detection_engine.install_scam_rule_set(detection_engine.compile_scam_rule_set(rule_set))
+
+def get_batch_executor() -> ProcessPoolExecutor:
+    """
+    Return the shared, bounded process pool used by the batch endpoint
+
+    The workers start with this process's rules; when the rules, the identifier list or the
+    templates change, the pool is replaced (running chunks finish on the old pool).
+    """
+    global _BATCH_POOL
+    version = get_batch_data_version()
+    pool = _BATCH_POOL
+    if pool is None or pool["version"] != version:
+        if pool is not None:
+            pool["executor"].shutdown(wait=False)
+        # spawn: 避免在多執行緒的伺服器程序中 fork
+        executor = ProcessPoolExecutor(
+            max_workers=BATCH_MAX_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=install_batch_rules,
+            initargs=(detection_engine.export_scam_rule_set(),)
+        )
+        pool = _BATCH_POOL = {"executor": executor, "version": version}
+    return pool["executor"]
+
+def reset_batch_executor() -> None:
+    """Drop the pool after it broke; the next batch starts a new one"""
+    global _BATCH_POOL
+    _BATCH_POOL = None
+
+def detect_scam_chunk(texts: List[str], language: Optional[str] = "auto") -> List[Tuple[ScamDetectionResult, float]]:
+    """
+    Run detect_scam over a chunk of texts (executed inside a worker process)
+
+    Returns:
+        List of (detect_scam result, elapsed milliseconds) in the same order as texts
+    """
+    results = []
+    for text in texts:
+        started = time.perf_counter()
+        result = detect_scam(text, language)
+        results.append((result, (time.perf_counter() - started) * 1000))
+    return results
+
+def detect_scam_worker_chunk(texts: List[str], language: Optional[str] = "auto") -> Tuple[int, List[Tuple[ScamDetectionResult, float]]]:
+    """detect_scam_chunk in a pool worker, returned with the worker's process id"""
+    return os.getpid(), detect_scam_chunk(texts, language)
+
+def parse_batch_body(body: bytes, content_type: str, language: Optional[str] = "auto") -> Tuple[List[str], Optional[str]]:
+    """
+    Parse a batch request body into a list of texts and the language of the texts
+
+    Accepts a JSON array of strings / {"text": ...} objects, a
+    {"texts": [...], "language": ...} object, or NDJSON with one string or object per line.
+    The language field of a {"texts": [...]} body overrides the given default.
+    """
+    def to_text(item: Any) -> str:
+        if isinstance(item, str):
+            return item
+        if isinstance(item, dict) and isinstance(item.get("text"), str):
+            return item["text"]
+        raise ValueError("each item must be a string or an object with a 'text' field")
+
+    raw = body.decode("utf-8")
+    if "ndjson" not in content_type and "jsonlines" not in content_type:
+        try:
+            payload = json.loads(raw)
+        except json.JSONDecodeError:
+            payload = None
+        if isinstance(payload, dict):
+            batch = BatchScamDetectionRequest(**{"language": language, **payload})
+            return batch.texts, batch.language
+        if isinstance(payload, list):
+            return [to_text(item) for item in payload], language
+
+    # NDJSON: 每行一則訊息
+    return [to_text(json.loads(line)) for line in raw.splitlines() if line.strip()], language
+
+def build_batch_item(index: int, result: ScamDetectionResult, elapsed_ms: float, text: Optional[str] = None,
+                     max_spans_per_category: Optional[int] = None) -> BatchScamDetectionItem:
+    """Convert a detect_scam result into a batch response item"""
+    response = build_detection_response(result, text, max_spans_per_category)
+    return BatchScamDetectionItem(
+        index=index,
+        is_scam=response.is_scam,
+        overall_confidence=response.overall_confidence,
+        scam_type=response.scam_type,
+        indicators=response.indicators,
+        analysis_summary=response.analysis_summary,
+        incomplete=response.incomplete,
+        processing_time_ms=round(elapsed_ms, 3)
     )
 
+@router.post("/analyze-batch", response_model=BatchScamDetectionResponse, summary="Analyze Batch", description="Analyze a list (JSON array or NDJSON body) of texts for potential scam indicators; ?language=auto, en or zh selects the rule packs, ?max_spans_per_category caps the returned match spans")
+async def analyze_scam_batch(request: Request):
+    """
+    Analyze many texts in one request, fanned out over a bounded process pool
+    """
+    try:
+        texts, language = parse_batch_body(
+            await request.body(), request.headers.get("content-type", ""), request.query_params.get("language", "auto")
+        )
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid batch body: {str(e)}") from e
+
+    if len(texts) > BATCH_MAX_SIZE:
+        raise HTTPException(status_code=413, detail=f"Batch too large: {len(texts)} texts (max {BATCH_MAX_SIZE})")
+
+    batch_start = time.perf_counter()
+    try:
+        loop = asyncio.get_running_loop()
+        chunks = [texts[i:i + BATCH_CHUNK_SIZE] for i in range(0, len(texts), BATCH_CHUNK_SIZE)]
+        workers = 0
+
+        if len(texts) <= BATCH_INLINE_THRESHOLD:
+            chunk_results = [await loop.run_in_executor(None, detect_scam_chunk, texts, language)] if texts else []
+        else:
+            try:
+                executor = get_batch_executor()
+                worker_results = await asyncio.gather(*[
+                    loop.run_in_executor(executor, detect_scam_worker_chunk, chunk, language) for chunk in chunks
+                ])
+                chunk_results = [chunk_result for _, chunk_result in worker_results]
+                # 實際處理了區塊的工作程序數
+                workers = len({pid for pid, _ in worker_results})
+            except (BrokenProcessPool, OSError, NotImplementedError) as e:
+                # 無法使用多程序時改用執行緒池逐塊處理
+                print(f"Process pool unavailable, falling back to in-process batch analysis: {str(e)}")
+                reset_batch_executor()
+                chunk_results = [await loop.run_in_executor(None, detect_scam_chunk, chunk, language) for chunk in chunks]
+
+        max_spans = request.query_params.get("max_spans_per_category")
+        max_spans = int(max_spans) if max_spans and max_spans.isdigit() else None
+        results = []
+        for chunk_result in chunk_results:
+            for result, elapsed_ms in chunk_result:
+                results.append(build_batch_item(len(results), result, elapsed_ms, texts[len(results)], max_spans))
+
+        return BatchScamDetectionResponse(
+            results=results,
+            total=len(results),
+            scam_count=sum(1 for item in results if item.is_scam),
+            processing_time_ms=round((time.perf_counter() - batch_start) * 1000, 3),
+            workers=workers
+        )
+    except Exception as e:
+        # Log the error
+        print(f"Error analyzing batch: {str(e)}")
+        # Re-raise as HTTP exception
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error analyzing batch: {str(e)}"
+        ) from e
+
 # Generate personalized advice endpoint
 @router.post("/generate-advice", response_model=AdviceResponse, summary="Generate Personalized Advice", description="Generate personalized advice based on scam type and victim status")
-def generate_advice(request: AdviceRequest):
+def generate_advice(request: AdviceRequest, if_none_match: Optional[str] = Header(None)):
     """
     Generate personalized advice based on scam type and victim status
     """
     try:
-        advice = generate_personalized_advice(
+        # Served from the precomputed bundles; no per-request model construction
+        body, etag = get_advice_bundle(
             scam_type_id=request.scam_type_id,
             is_victim=request.is_victim,
-            user_profile=request.user_profile
-        )
-        
-        # Convert to Pydantic model format
-        return AdviceResponse(
-            scam_type=ScamTypeInfo(
-                id=advice["scam_type"]["id"],
-                name=advice["scam_type"]["name"],
-                description=advice["scam_type"]["description"],
-                confidence_score=1.0,  # Not relevant for this endpoint but required
-                advice=advice["scam_type"]["advice"]
-            ),
-            is_victim=advice["is_victim"],
-            immediate_steps=[AdviceSuggestion(**step) for step in advice["immediate_steps"]],
-            preventive_measures=[AdviceSuggestion(**measure) for measure in advice["preventive_measures"]],
-            support_resources=[AdviceSuggestion(**resource) for resource in advice["support_resources"]],
-            reassurance_message=advice["reassurance_message"]
+            age_bucket=get_age_bucket(request.user_profile),
+            language=request.language
         )
+        if if_none_match == etag:
+            return Response(status_code=304, headers={"ETag": etag})
+        return Response(content=body, media_type="application/json", headers={"ETag": etag})
     except Exception as e:
         # Log the error
         print(f"Error generating advice: {str(e)}")
@@ -1109,3 +1135,11 @@ def get_examples():
         }
     ]
     return {"examples": examples}
+
+# 導出核心功能以便外部模組使用（偵測相關名稱轉自 detection_engine，保留給既有呼叫端）
+__all__ = [
+    'router', 'ScamDetectionResult', 'get_scam_patterns', 'get_scam_types', 'get_high_risk_phrases', 'get_scam_rules_version',
+    'calculate_confidence_score', 'match_scam_indicators', 'score_scam_indicators', 'detect_scam',
+    'detect_scam_uncached', 'detect_scam_windowed', 'detect_scam_image', 'generate_response',
+    'analyze_image', 'generate_personalized_advice', 'build_detection_response'
+]
@@ -0,0 +1,348 @@
+from typing import Dict, Any, List, Optional, Tuple
+import hashlib
+import os
+import re
+import threading
+import numpy as np
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel, Field
+from app.apis.text_normalization import get_normalized_text
+from app.apis.rule_packs import get_private_data_dir, is_trusted_path, register_reload_check
+
+'''
+1. API用途：擷取訊息中的台灣電話號碼、銀行帳號與 LINE ID，並查詢本地的已通報詐騙識別碼索引；
+   命中已通報的號碼是最強、也最便宜的詐騙訊號，scam_detector 會直接判定為詐騙而不需跑規則或呼叫LLM
+2. 關聯頁面：後台管理頁面（查詢識別碼、重新載入清單）
+3. 目前狀態：啟用中（清單檔於啟動時編譯為排序後的定長陣列並以 mmap 載入，多個 worker 共用同一份分頁；
+   查詢為二分搜尋，清單可容納數百萬筆；索引檔放在只有本程序使用者可存取的資料目錄；
+   清單檔變更後，各 worker 由背景檢查在規則包檢查間隔內重新載入）
+'''
+
+router = APIRouter(
+    prefix="/scam-identifiers",
+    tags=["scam-identifiers"],
+    responses={404: {"description": "Not found"}},
+)
+
+# 清單來源檔（可用環境變數指定其他路徑）
+DEFAULT_IDENTIFIER_SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "reported_identifiers.txt")
+IDENTIFIER_SOURCE = os.environ.get("SCAM_IDENTIFIERS_FILE", DEFAULT_IDENTIFIER_SOURCE)
+
+# 識別碼種類
+IDENTIFIER_PHONE = "phone"
+IDENTIFIER_BANK_ACCOUNT = "bank_account"
+IDENTIFIER_LINE_ID = "line_id"
+
+# 索引鍵前綴（同一串數字可能同時是電話與帳號，以前綴區分）
+_KEY_PREFIXES = {
+    IDENTIFIER_PHONE: "p:",
+    IDENTIFIER_BANK_ACCOUNT: "a:",
+    IDENTIFIER_LINE_ID: "l:",
+}
+
+# 定長欄位寬度（位元組）
+KEY_WIDTH = 32
+LABEL_WIDTH = 32
+
+# 電話號碼：手機 09xx-xxx-xxx、市話 (0x)xxxx-xxxx、+886 國際格式、0800 免付費電話
+_PHONE_RE = re.compile(
+    r"(?<![\d+])"
+    r"(?:"
+    r"(?P<mobile>(?:\+?886[-\s]?|0)9\d{2}[-\s]?\d{3}[-\s]?\d{3})"
+    r"|(?P<tollfree>0800[-\s]?\d{3}[-\s]?\d{3})"
+    r"|(?P<landline>(?:\+?886[-\s]?\(?|\(?0)[2-8]\d{0,2}\)?[-\s]?\d{3,4}[-\s]?\d{4})"
+    r")"
+    r"(?!\d)"
+)
+
+# 銀行帳號：10-16 碼數字（可含 - 或空白分隔），前面可帶 3 碼銀行代碼
+_ACCOUNT_RE = re.compile(r"(?<![\d-])(?:\(\d{3}\)\s?)?\d(?:[-\s]?\d){9,18}(?!\d)")
+_BANK_CODE_PREFIX_RE = re.compile(r"^\(?\d{3}\)?[-\s]")
+MIN_ACCOUNT_DIGITS = 10
+MAX_ACCOUNT_DIGITS = 16
+
+# LINE ID：「加line xxx」「line id: xxx」「賴：xxx」以及 line.me 加好友連結
+_LINE_ID_RE = re.compile(
+    r"(?:"
+    r"(?:加|add\s*)(?:line|賴)(?:\s*id)?\s*:?"
+    r"|(?<![a-z])(?:line|賴)\s*(?:id\s*:?|:)"
+    r")\s*(?!line\.me/)(?P<mention>@?[a-z0-9][a-z0-9._-]{2,19})"  # 「加賴 line.me/ti/p/...」交給連結的寫法
+    r"|line\.me/(?:r/)?ti/p/~?(?P<link>(?:@|%40)?[a-z0-9][a-z0-9._-]{2,19})"
+)
+
+# 擷取識別碼使用的規則（供訊息預篩推導觸發詞）
+IDENTIFIER_PATTERNS = (_PHONE_RE, _ACCOUNT_RE, _LINE_ID_RE)
+
+def normalize_phone(value: str) -> Optional[str]:
+    """電話號碼轉為 0 開頭的純數字；長度不符時回傳 None"""
+    digits = re.sub(r"\D", "", value)
+    if digits.startswith("886"):
+        digits = "0" + digits[3:]
+    if not digits.startswith("0") or not 9 <= len(digits) <= 10:
+        return None
+    return digits
+
+def normalize_bank_account(value: str) -> Optional[str]:
+    digits = re.sub(r"\D", "", value)
+    if not MIN_ACCOUNT_DIGITS <= len(digits) <= MAX_ACCOUNT_DIGITS:
+        return None
+    return digits
+
+def normalize_line_id(value: str) -> Optional[str]:
+    line_id = value.strip().lower().replace("%40", "@").rstrip("._-")
+    return line_id or None
+
+_NORMALIZERS = {
+    IDENTIFIER_PHONE: normalize_phone,
+    IDENTIFIER_BANK_ACCOUNT: normalize_bank_account,
+    IDENTIFIER_LINE_ID: normalize_line_id,
+}
+
+def extract_identifiers(text: str) -> List[Dict[str, str]]:
+    """
+    從訊息中擷取電話號碼、銀行帳號與 LINE ID（依出現順序，不重複）
+    回傳 [{type, value, raw}]，value 為正規化後的識別碼
+    """
+    text = get_normalized_text(text)
+    identifiers: Dict[Tuple[str, str], Dict[str, str]] = {}
+
+    def add(identifier_type: str, value: Optional[str], raw: str) -> None:
+        if value and (identifier_type, value) not in identifiers:
+            identifiers[(identifier_type, value)] = {"type": identifier_type, "value": value, "raw": raw}
+
+    if "line" in text or "賴" in text:
+        for match in _LINE_ID_RE.finditer(text):
+            raw = match.group("mention") or match.group("link")
+            add(IDENTIFIER_LINE_ID, normalize_line_id(raw), raw)
+
+    # 數字串少於 9 碼不可能是電話或帳號
+    if sum(ch.isdigit() for ch in text) < 9:
+        return list(identifiers.values())
+
+    phone_spans = []
+    for match in _PHONE_RE.finditer(text):
+        phone = normalize_phone(match.group(0))
+        if phone:
+            phone_spans.append(match.span())
+            add(IDENTIFIER_PHONE, phone, match.group(0))
+
+    for match in _ACCOUNT_RE.finditer(text):
+        start, end = match.span()
+        if any(start < phone_end and phone_start < end for phone_start, phone_end in phone_spans):
+            continue
+        raw = match.group(0)
+        add(IDENTIFIER_BANK_ACCOUNT, normalize_bank_account(raw), raw)
+        # 「822-123456789012」這類寫法同時查詢去掉銀行代碼後的帳號
+        if _BANK_CODE_PREFIX_RE.match(raw):
+            add(IDENTIFIER_BANK_ACCOUNT, normalize_bank_account(_BANK_CODE_PREFIX_RE.sub("", raw)), raw)
+    return list(identifiers.values())
+
+def make_key(identifier_type: str, value: str) -> bytes:
+    return (_KEY_PREFIXES[identifier_type] + value).encode("utf-8")
+
+def get_source_stat(path: str) -> Optional[Tuple[int, int]]:
+    """清單檔的 (修改時間, 大小)，用來判斷是否需要重新載入"""
+    try:
+        info = os.stat(path)
+    except OSError:
+        return None
+    return info.st_mtime_ns, info.st_size
+
+class ScamIdentifierIndex:
+    """
+    Sorted, memory-mapped index of reported scam identifiers
+
+    The source list is compiled once into two fixed-width arrays (sorted keys and their
+    scam type labels) saved as .npy files named after the content hash of the source, so
+    every worker maps the same files and shares their pages.
+    """
+
+    def __init__(self, source_path: str):
+        self.source_path = source_path
+        self.source_stat: Optional[Tuple[int, int]] = None
+        self.version = ""
+        self.entry_count = 0
+        self.index_paths: Optional[Tuple[str, str]] = None
+        self._keys: Optional[np.ndarray] = None
+        self._labels: Optional[np.ndarray] = None
+        self._load()
+
+    @staticmethod
+    def parse_source(lines) -> Dict[bytes, bytes]:
+        """解析清單來源檔，回傳 {索引鍵: 詐騙類型}；同一識別碼重複出現時以後者為準"""
+        entries: Dict[bytes, bytes] = {}
+        section = None
+        for raw_line in lines:
+            line = raw_line.split("#", 1)[0].strip()
+            if not line:
+                continue
+            if line.startswith("[") and line.endswith("]"):
+                section = line[1:-1].strip().lower()
+                if section not in _KEY_PREFIXES:
+                    raise ValueError(f"Unknown section in scam identifier list: {section}")
+                continue
+            if section is None:
+                raise ValueError(f"Identifier outside of a section: {line}")
+
+            # 號碼本身可能含空白（例如 0912 345 678），最後一欄不含數字才視為詐騙類型；LINE ID 不含空白
+            parts = line.rsplit(None, 1)
+            label = ""
+            if len(parts) == 2 and (section == IDENTIFIER_LINE_ID or not any(ch.isdigit() for ch in parts[1])):
+                line, label = parts
+            value = _NORMALIZERS[section](line)
+            if value is None:
+                raise ValueError(f"Invalid {section} in scam identifier list: {line}")
+            key = make_key(section, value)
+            if len(key) > KEY_WIDTH or len(label.encode("utf-8")) > LABEL_WIDTH:
+                raise ValueError(f"Identifier or label too long in scam identifier list: {line}")
+            entries[key] = label.encode("utf-8")
+        return entries
+
+    def _load(self) -> None:
+        self.source_stat = get_source_stat(self.source_path)
+        digest = hashlib.sha1()
+        with open(self.source_path, "rb") as source_file:
+            for chunk in iter(lambda: source_file.read(1 << 20), b""):
+                digest.update(chunk)
+        self.version = digest.hexdigest()[:12]
+
+        # 索引檔放在私有資料目錄；無法使用時改為只在本程序記憶體中建立索引
+        try:
+            base_path = os.path.join(get_private_data_dir("scam_identifiers"), f"scam_identifiers-{self.version}")
+        except OSError as e:
+            print(f"Scam identifier index directory unavailable, keeping the index in memory: {str(e)}")
+            base_path = None
+
+        if base_path is not None:
+            keys_path, labels_path = f"{base_path}.keys.npy", f"{base_path}.labels.npy"
+            if is_trusted_path(keys_path) and is_trusted_path(labels_path):
+                self._map(keys_path, labels_path)
+                return
+
+        with open(self.source_path, "r", encoding="utf-8") as source_file:
+            entries = self.parse_source(source_file)
+        if not entries:
+            return
+        keys = np.array(list(entries.keys()), dtype=f"S{KEY_WIDTH}")
+        labels = np.array(list(entries.values()), dtype=f"S{LABEL_WIDTH}")
+        order = np.argsort(keys, kind="stable")
+        keys, labels = keys[order], labels[order]
+        if base_path is None:
+            self._keys, self._labels = keys, labels
+            self.entry_count = len(keys)
+            return
+
+        # 寫入暫存檔後再原子性更名，同時啟動的 worker 不會讀到寫到一半的索引（標籤先寫，鍵檔存在即代表完整）
+        for path, array in ((labels_path, labels), (keys_path, keys)):
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as index_file:
+                np.save(index_file, array)
+            os.replace(tmp_path, path)
+        self._map(keys_path, labels_path)
+
+    def _map(self, keys_path: str, labels_path: str) -> None:
+        self.index_paths = (keys_path, labels_path)
+        self._keys = np.load(keys_path, mmap_mode="r")
+        self._labels = np.load(labels_path, mmap_mode="r")
+        self.entry_count = len(self._keys)
+
+    def lookup_keys(self, keys: List[bytes]) -> List[Optional[str]]:
+        """
+        一次二分搜尋多個索引鍵
+        回傳與 keys 對應的詐騙類型（未通報為 None，通報但未標類型為空字串）
+        """
+        if self._keys is None or not keys or not self.entry_count:
+            return [None] * len(keys)
+        positions = np.searchsorted(self._keys, np.array(keys, dtype=f"S{KEY_WIDTH}"))
+        results = []
+        for key, position in zip(keys, positions):
+            if position < self.entry_count and self._keys[position] == key:
+                results.append(self._labels[position].decode("utf-8"))
+            else:
+                results.append(None)
+        return results
+
+    def lookup(self, identifier_type: str, value: str) -> Optional[str]:
+        return self.lookup_keys([make_key(identifier_type, value)])[0]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "source_path": self.source_path,
+            "index_paths": list(self.index_paths) if self.index_paths else None,
+            "version": self.version,
+            "entries": self.entry_count,
+            "index_bytes": self.entry_count * (KEY_WIDTH + LABEL_WIDTH)
+        }
+
+_INDEX_LOCK = threading.Lock()
+_IDENTIFIER_INDEX = ScamIdentifierIndex(IDENTIFIER_SOURCE)
+
+def get_identifier_index() -> ScamIdentifierIndex:
+    return _IDENTIFIER_INDEX
+
+def get_identifier_index_version() -> str:
+    return _IDENTIFIER_INDEX.version
+
+def reload_identifier_index(source_path: Optional[str] = None) -> ScamIdentifierIndex:
+    """重新載入清單；新索引建立完成後才替換，查詢不需加鎖"""
+    global _IDENTIFIER_INDEX
+    with _INDEX_LOCK:
+        _IDENTIFIER_INDEX = ScamIdentifierIndex(source_path or _IDENTIFIER_INDEX.source_path)
+    return _IDENTIFIER_INDEX
+
+def refresh_identifier_index() -> None:
+    """由規則包背景執行緒定期呼叫：清單檔變更時重新載入（其他 worker 執行 /reload 或部署新清單後跟進）"""
+    index = _IDENTIFIER_INDEX
+    if get_source_stat(index.source_path) != index.source_stat:
+        reload_identifier_index(index.source_path)
+
+register_reload_check(refresh_identifier_index)
+
+def check_identifiers(text: str) -> List[Dict[str, Any]]:
+    """擷取訊息中的識別碼並查詢是否已被通報，回傳 [{type, value, raw, reported, scam_type}]"""
+    identifiers = extract_identifiers(text)
+    if not identifiers:
+        return []
+    index = _IDENTIFIER_INDEX
+    labels = index.lookup_keys([make_key(identifier["type"], identifier["value"]) for identifier in identifiers])
+    return [
+        {**identifier, "reported": label is not None, "scam_type": label or None}
+        for identifier, label in zip(identifiers, labels)
+    ]
+
+def find_reported_identifiers(text: str) -> List[Dict[str, Any]]:
+    """回傳訊息中已被通報的識別碼"""
+    if not _IDENTIFIER_INDEX.entry_count:
+        return []
+    return [identifier for identifier in check_identifiers(text) if identifier["reported"]]
+
+class IdentifierCheckRequest(BaseModel):
+    text: str = Field(..., description="要檢查的電話號碼、帳號、LINE ID 或包含這些資訊的訊息")
+
+@router.post("/check", summary="查詢詐騙識別碼", description="擷取文字中的電話號碼、銀行帳號與 LINE ID，回傳各自是否已被通報為詐騙")
+def check_scam_identifiers(request: IdentifierCheckRequest):
+    """查詢文字中的識別碼是否已被通報"""
+    try:
+        return {"identifiers": check_identifiers(request.text), "version": get_identifier_index_version()}
+    except Exception as e:
+        print(f"Error checking scam identifiers: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to check scam identifiers: {str(e)}") from e
+
+@router.get("/stats", summary="取得詐騙識別碼索引資訊", description="取得目前載入的識別碼清單版本與筆數")
+def get_identifier_stats():
+    """取得詐騙識別碼索引統計"""
+    try:
+        return _IDENTIFIER_INDEX.stats()
+    except Exception as e:
+        print(f"Error getting scam identifier stats: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to get scam identifier stats: {str(e)}") from e
+
+@router.post("/reload", summary="重新載入詐騙識別碼清單", description="重新讀取已通報詐騙識別碼清單檔並重建索引")
+def reload_scam_identifiers():
+    """重新載入詐騙識別碼清單"""
+    try:
+        index = reload_identifier_index()
+        return {"success": True, **index.stats()}
+    except Exception as e:
+        print(f"Error reloading scam identifier list: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to reload scam identifier list: {str(e)}") from e
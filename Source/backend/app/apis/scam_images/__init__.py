@@ -0,0 +1,443 @@
+from typing import Dict, Any, List, Optional, Tuple
+import base64
+import hashlib
+import io
+import ipaddress
+import socket
+import threading
+import time
+import numpy as np
+import requests
+import databutton as db
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel, Field
+from urllib.parse import urlparse
+from app.apis.detection_cache import fingerprint_rules
+from app.apis.rule_packs import register_reload_check
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+    print("Pillow is not installed, scam screenshot matching is disabled")
+
+'''
+1. API用途：已知詐騙截圖的感知雜湊索引（pHash + dHash，以 BK-tree 搜尋漢明距離），
+   同一張詐騙廣告截圖被大量轉傳時，不需 OCR 或視覺模型即可在微秒內判定詐騙類型
+2. 關聯頁面：後台管理頁面（新增已確認的詐騙截圖、查看索引數量）；LINE 圖片訊息與 /scam-detector/analyze-image 使用
+3. 目前狀態：啟用中（截圖雜湊儲存於 db.storage，啟動後第一次查詢時載入；新增截圖在本 worker 即時生效，
+   其他 worker 由背景檢查儲存的版本，在規則包檢查間隔內重新載入；需安裝 Pillow；
+   圖片網址只接受 LINE 訊息內容 API，其他圖片需直接上傳內容）
+'''
+
+router = APIRouter(
+    prefix="/scam-images",
+    tags=["scam-images"],
+    responses={404: {"description": "Not found"}},
+)
+
+SCAM_IMAGES_KEY = "scam_images"
+SCAM_IMAGES_VERSION_KEY = "scam_images_version"
+
+# 感知雜湊設定：64 位元 pHash 與 dHash，兩者的漢明距離都在門檻內才視為同一張截圖
+HASH_BITS = 64
+PHASH_SIZE = 32            # pHash 先縮為 32x32 灰階再做 DCT
+PHASH_LOW_FREQUENCY = 8    # 取左上 8x8 低頻係數
+PHASH_MAX_DISTANCE = 10    # 截圖重新壓縮、裁切狀態列、縮放後 pHash 距離通常在此範圍內
+DHASH_MAX_DISTANCE = 12
+
+# 下載圖片的限制
+IMAGE_DOWNLOAD_TIMEOUT = 10  # 秒
+MAX_IMAGE_BYTES = 10 * 1024 * 1024
+MAX_IMAGE_BASE64_LENGTH = (MAX_IMAGE_BYTES + 2) // 3 * 4  # 解碼前先以編碼長度檢查大小
+
+# 只從 LINE 訊息內容 API 下載圖片，其他來源請直接上傳圖片內容（image_base64 或 data: URL）
+ALLOWED_IMAGE_HOSTS = ("api-data.line.me",)
+LINE_CHANNEL_ACCESS_TOKEN_KEY = "LINE_CHANNEL_ACCESS_TOKEN"
+
+def _dct_matrix(size: int) -> np.ndarray:
+    """DCT-II 轉換矩陣（正交化）"""
+    k = np.arange(size)[:, None]
+    n = np.arange(size)[None, :]
+    matrix = np.cos(np.pi * (2 * n + 1) * k / (2 * size)) * np.sqrt(2 / size)
+    matrix[0] /= np.sqrt(2)
+    return matrix
+
+_DCT_MATRIX = _dct_matrix(PHASH_SIZE)
+_BIT_WEIGHTS = np.uint64(1) << np.arange(HASH_BITS - 1, -1, -1, dtype=np.uint64)
+
+def bits_to_int(bits: np.ndarray) -> int:
+    return int(np.bitwise_or.reduce(_BIT_WEIGHTS[bits.flatten()])) if bits.any() else 0
+
+def phash_from_pixels(pixels: np.ndarray) -> int:
+    """由 32x32 灰階像素計算 pHash：低頻 DCT 係數與中位數比較"""
+    coefficients = _DCT_MATRIX @ pixels.astype(np.float64) @ _DCT_MATRIX.T
+    low = coefficients[:PHASH_LOW_FREQUENCY, :PHASH_LOW_FREQUENCY]
+    return bits_to_int(low > np.median(low))
+
+def dhash_from_pixels(pixels: np.ndarray) -> int:
+    """由 8x9 灰階像素計算 dHash：相鄰像素亮度梯度"""
+    pixels = pixels.astype(np.int16)
+    return bits_to_int(pixels[:, 1:] > pixels[:, :-1])
+
+def compute_image_hashes(image_bytes: bytes) -> Dict[str, int]:
+    """
+    解碼圖片並計算感知雜湊
+    回傳 {phash, dhash}；圖片無法解碼或未安裝 Pillow 時拋出 ValueError
+    """
+    if Image is None:
+        raise ValueError("Image analysis requires Pillow")
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as image:
+            # JPEG 可在解碼時直接縮小，省下大部分解碼時間
+            image.draft("L", (PHASH_SIZE * 4, PHASH_SIZE * 4))
+            gray = image.convert("L")
+            phash_pixels = np.asarray(gray.resize((PHASH_SIZE, PHASH_SIZE), Image.LANCZOS))
+            dhash_pixels = np.asarray(gray.resize((9, 8), Image.LANCZOS))
+    except Exception as e:
+        raise ValueError(f"Unable to decode image: {str(e)}") from e
+    return {"phash": phash_from_pixels(phash_pixels), "dhash": dhash_from_pixels(dhash_pixels)}
+
+def hamming_distance(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+def format_hash(value: int) -> str:
+    return f"{value:016x}"
+
+class BKTree:
+    """BK-tree over 64-bit hashes with Hamming distance; each node keeps every id sharing its hash"""
+
+    def __init__(self):
+        self._root: Optional[Tuple[int, List[str], Dict[int, Any]]] = None
+        self.size = 0
+
+    def add(self, value: int, item_id: str) -> None:
+        self.size += 1
+        if self._root is None:
+            self._root = (value, [item_id], {})
+            return
+        node = self._root
+        while True:
+            node_value, node_ids, children = node
+            distance = hamming_distance(value, node_value)
+            if distance == 0:
+                node_ids.append(item_id)
+                return
+            child = children.get(distance)
+            if child is None:
+                children[distance] = (value, [item_id], {})
+                return
+            node = child
+
+    def search(self, value: int, max_distance: int) -> List[Tuple[int, str]]:
+        """回傳距離不超過 max_distance 的 (距離, id)，依距離排序"""
+        if self._root is None:
+            return []
+        found = []
+        stack = [self._root]
+        while stack:
+            node_value, node_ids, children = stack.pop()
+            distance = hamming_distance(value, node_value)
+            if distance <= max_distance:
+                found.extend((distance, item_id) for item_id in node_ids)
+            # 三角不等式：只需走訪距離在 [d - max, d + max] 範圍內的子樹
+            for child_distance in range(max(1, distance - max_distance), distance + max_distance + 1):
+                child = children.get(child_distance)
+                if child is not None:
+                    stack.append(child)
+        found.sort()
+        return found
+
+class ScamImageIndex:
+    """Perceptual hashes of confirmed scam screenshots in a BK-tree keyed on pHash"""
+
+    def __init__(self):
+        self._images: Dict[str, Dict[str, Any]] = {}
+        self._tree = BKTree()
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.hits = 0
+
+    def __len__(self) -> int:
+        return len(self._images)
+
+    def add(self, image: Dict[str, Any]) -> str:
+        """加入一張截圖（需含 phash、dhash），回傳截圖 ID"""
+        image_id = image.get("id") or f"img_{format_hash(image['phash'])}{format_hash(image['dhash'])}"
+        with self._lock:
+            replacing = image_id in self._images
+            self._images[image_id] = {**image, "id": image_id}
+            if replacing:
+                self._rebuild_locked()
+            else:
+                self._tree.add(image["phash"], image_id)
+        return image_id
+
+    def _rebuild_locked(self) -> None:
+        # BK-tree 不支援刪除節點，刪除或取代時重建（僅後台操作會觸發）
+        tree = BKTree()
+        for image_id, image in self._images.items():
+            tree.add(image["phash"], image_id)
+        self._tree = tree
+
+    def remove(self, image_id: str) -> bool:
+        with self._lock:
+            if self._images.pop(image_id, None) is None:
+                return False
+            self._rebuild_locked()
+            return True
+
+    def find(self, hashes: Dict[str, int]) -> Optional[Dict[str, Any]]:
+        """
+        尋找最相似的已知詐騙截圖
+        回傳 {image, distance, similarity}，沒有距離在門檻內的截圖時回傳 None
+        """
+        if not self._images:
+            return None
+        self.lookups += 1
+        # 新增截圖會改動 BK-tree 的節點，查詢時同樣持有鎖
+        with self._lock:
+            for distance, image_id in self._tree.search(hashes["phash"], PHASH_MAX_DISTANCE):
+                image = self._images.get(image_id)
+                if image is None or hamming_distance(hashes["dhash"], image["dhash"]) > DHASH_MAX_DISTANCE:
+                    continue
+                self.hits += 1
+                return {"image": image, "distance": distance, "similarity": round(1 - distance / HASH_BITS, 4)}
+        return None
+
+    def list_images(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self._images.values())
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "images": len(self._images),
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "hit_rate": round(self.hits / self.lookups, 4) if self.lookups else 0.0,
+            "phash_max_distance": PHASH_MAX_DISTANCE,
+            "dhash_max_distance": DHASH_MAX_DISTANCE,
+            "image_support": Image is not None
+        }
+
+# 目前的索引與其對應的儲存版本（一起替換）；新增、刪除與重新載入以 _LOAD_LOCK 依序進行
+_IMAGE_STATE: Optional[Dict[str, Any]] = None
+_LOAD_LOCK = threading.Lock()
+
+def get_stored_images() -> List[Dict[str, Any]]:
+    """獲取已儲存的詐騙截圖雜湊（雜湊以十六進位字串儲存）"""
+    try:
+        stored = db.storage.json.get(SCAM_IMAGES_KEY, default=[])
+        return [{**image, "phash": int(image["phash"], 16), "dhash": int(image["dhash"], 16)} for image in stored]
+    except Exception as e:
+        print(f"Error loading scam images: {str(e)}")
+        return []
+
+def get_stored_version() -> Optional[str]:
+    """獲取已儲存截圖的版本（任一 worker 新增或刪除截圖後改變）"""
+    try:
+        return (db.storage.json.get(SCAM_IMAGES_VERSION_KEY, default=None) or {}).get("version")
+    except Exception as e:
+        print(f"Error loading scam image version: {str(e)}")
+        return None
+
+def save_images(index: ScamImageIndex) -> str:
+    """儲存截圖雜湊，再更新版本（其他 worker 看到新版本時一定讀得到新資料），回傳新版本"""
+    stored = [
+        {**image, "phash": format_hash(image["phash"]), "dhash": format_hash(image["dhash"])}
+        for image in index.list_images()
+    ]
+    version = fingerprint_rules(stored)
+    db.storage.json.put(SCAM_IMAGES_KEY, stored)
+    db.storage.json.put(SCAM_IMAGES_VERSION_KEY, {"version": version, "updated_at": time.time()})
+    return version
+
+def _load_locked(version: Optional[str]) -> Dict[str, Any]:
+    global _IMAGE_STATE
+    index = ScamImageIndex()
+    for image in get_stored_images():
+        index.add(image)
+    _IMAGE_STATE = {"index": index, "version": version}
+    return _IMAGE_STATE
+
+def _refresh_locked() -> Dict[str, Any]:
+    """儲存的版本與已載入的不同（或尚未載入）時重新載入"""
+    version = get_stored_version()
+    if _IMAGE_STATE is None or _IMAGE_STATE["version"] != version:
+        return _load_locked(version)
+    return _IMAGE_STATE
+
+def get_image_index() -> ScamImageIndex:
+    """取得截圖索引，第一次使用時從儲存空間載入"""
+    state = _IMAGE_STATE
+    if state is None:
+        with _LOAD_LOCK:
+            state = _IMAGE_STATE or _refresh_locked()
+    return state["index"]
+
+def refresh_image_index() -> None:
+    """由規則包背景執行緒定期呼叫：其他 worker 變更了截圖時重新載入（尚未載入時不需處理）"""
+    if _IMAGE_STATE is not None:
+        with _LOAD_LOCK:
+            _refresh_locked()
+
+register_reload_check(refresh_image_index)
+
+def decode_image_base64(data: str) -> bytes:
+    """解碼 Base64 圖片內容；先以編碼長度檢查大小限制，超過時不解碼"""
+    if len(data) > MAX_IMAGE_BASE64_LENGTH:
+        raise ValueError(f"Image is larger than {MAX_IMAGE_BYTES} bytes")
+    try:
+        return base64.b64decode(data)
+    except Exception as e:
+        raise ValueError(f"Invalid base64 image: {str(e)}") from e
+
+def check_image_url(image_url: str) -> None:
+    """
+    檢查圖片網址可以下載：必須是 LINE 訊息內容 API 的 https 網址，
+    且主機解析出的每個位址都是公開位址（拒絕本機、私有與鏈路本地位址），否則拋出 ValueError
+    """
+    parsed = urlparse(image_url)
+    if parsed.scheme != "https" or parsed.hostname not in ALLOWED_IMAGE_HOSTS:
+        raise ValueError("Only LINE message content URLs can be downloaded; upload other images as image_base64")
+    try:
+        addresses = socket.getaddrinfo(parsed.hostname, parsed.port or 443, proto=socket.IPPROTO_TCP)
+    except socket.gaierror as e:
+        raise ValueError(f"Cannot resolve image host: {str(e)}") from e
+    for address in addresses:
+        ip = ipaddress.ip_address(address[4][0])
+        if not ip.is_global or ip.is_multicast:
+            raise ValueError(f"Image host resolves to a non-public address: {ip}")
+
+def load_image_bytes(image_url: str) -> bytes:
+    """取得圖片內容（data: URL 或 LINE 訊息內容 API），超過大小限制或來源不允許時拋出 ValueError"""
+    if image_url.startswith("data:"):
+        if "," not in image_url:
+            raise ValueError("Invalid data URL")
+        return decode_image_base64(image_url.split(",", 1)[1])
+    check_image_url(image_url)
+
+    headers = {}
+    token = db.secrets.get(LINE_CHANNEL_ACCESS_TOKEN_KEY)
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    # 不跟隨重新導向：導向的目標主機未經上面的檢查
+    response = requests.get(image_url, headers=headers, timeout=IMAGE_DOWNLOAD_TIMEOUT, stream=True, allow_redirects=False)
+    if response.is_redirect:
+        raise ValueError("Image URL redirects are not followed")
+    response.raise_for_status()
+    content = bytearray()
+    for chunk in response.iter_content(chunk_size=65536):
+        content.extend(chunk)
+        if len(content) > MAX_IMAGE_BYTES:
+            raise ValueError(f"Image is larger than {MAX_IMAGE_BYTES} bytes")
+    return bytes(content)
+
+def find_scam_image(image_bytes: bytes) -> Optional[Dict[str, Any]]:
+    """查詢圖片是否為已知詐騙截圖（或其重新壓縮、縮放後的版本）"""
+    index = get_image_index()
+    if not len(index):
+        return None
+    return index.find(compute_image_hashes(image_bytes))
+
+def add_scam_image(image_bytes: bytes, scam_type: str, source: str = "admin", description: str = "") -> str:
+    """新增已確認的詐騙截圖（本 worker 立即生效並寫入儲存空間）；詐騙類型未知時拋出 ValueError"""
+    # 偵測引擎匯入本模組，於使用時才匯入
+    from app.apis.detection_engine import get_scam_types
+    if scam_type not in get_scam_types():
+        raise ValueError(f"Unknown scam type: {scam_type}")
+    hashes = compute_image_hashes(image_bytes)
+    with _LOAD_LOCK:
+        # 先套用其他 worker 的變更，寫回時才不會覆蓋掉它們新增的截圖
+        state = _refresh_locked()
+        image_id = state["index"].add({
+            **hashes,
+            "scam_type": scam_type,
+            "source": source,
+            "description": description,
+            "sha1": hashlib.sha1(image_bytes).hexdigest(),
+            "created_at": time.time()
+        })
+        try:
+            state["version"] = save_images(state["index"])
+        except Exception as e:
+            print(f"Error saving scam images: {str(e)}")
+    return image_id
+
+def remove_scam_image(image_id: str) -> bool:
+    """刪除截圖並寫入儲存空間，截圖不存在時回傳 False"""
+    with _LOAD_LOCK:
+        state = _refresh_locked()
+        if not state["index"].remove(image_id):
+            return False
+        state["version"] = save_images(state["index"])
+    return True
+
+class ScamImageRequest(BaseModel):
+    image_url: Optional[str] = Field(None, description="LINE 訊息內容網址或 data: URL；其他來源請上傳 image_base64")
+    image_base64: Optional[str] = Field(None, description="Base64 編碼的圖片內容")
+
+    def load(self) -> bytes:
+        if self.image_base64:
+            return decode_image_base64(self.image_base64)
+        if self.image_url:
+            return load_image_bytes(self.image_url)
+        raise ValueError("Either image_url or image_base64 is required")
+
+class ScamImageAddRequest(ScamImageRequest):
+    scam_type: str = Field(..., description="詐騙類型ID，例如 investment_scam")
+    source: str = Field("admin", description="截圖來源")
+    description: str = Field("", description="截圖說明")
+
+@router.post("/add", summary="新增詐騙截圖", description="新增一張已確認的詐騙截圖，之後相同或近似的截圖會直接判定為相同詐騙類型")
+def add_image(request: ScamImageAddRequest):
+    """新增詐騙截圖"""
+    try:
+        image_id = add_scam_image(request.load(), request.scam_type, request.source, request.description)
+        return {"success": True, "id": image_id, "images": len(get_image_index())}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    except Exception as e:
+        print(f"Error adding scam image: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to add scam image: {str(e)}") from e
+
+@router.delete("/{image_id}", summary="刪除詐騙截圖", description="從索引與儲存空間中刪除指定截圖")
+def delete_image(image_id: str):
+    """刪除詐騙截圖"""
+    try:
+        if not remove_scam_image(image_id):
+            raise HTTPException(status_code=404, detail="Image not found")
+        return {"success": True, "images": len(get_image_index())}
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error deleting scam image: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to delete scam image: {str(e)}") from e
+
+@router.post("/match", summary="比對詐騙截圖", description="計算圖片的感知雜湊並查詢最接近的已知詐騙截圖")
+def match_image(request: ScamImageRequest):
+    """比對詐騙截圖"""
+    try:
+        image_bytes = request.load()
+        hashes = compute_image_hashes(image_bytes)
+        match = get_image_index().find(hashes)
+        return {
+            "phash": format_hash(hashes["phash"]),
+            "dhash": format_hash(hashes["dhash"]),
+            "match": {**match, "image": {**match["image"], "phash": format_hash(match["image"]["phash"]), "dhash": format_hash(match["image"]["dhash"])}} if match else None
+        }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    except Exception as e:
+        print(f"Error matching scam image: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to match scam image: {str(e)}") from e
+
+@router.get("/stats", summary="取得截圖索引統計", description="取得截圖數量與命中率")
+def get_image_stats():
+    """取得截圖索引統計"""
+    try:
+        index = get_image_index()
+        return {**index.stats(), "version": _IMAGE_STATE["version"]}
+    except Exception as e:
+        print(f"Error getting scam image stats: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to get scam image stats: {str(e)}") from e
@@ -0,0 +1,322 @@
+from typing import Dict, Any, List, Optional
+import hashlib
+import re
+import threading
+import time
+import zlib
+import numpy as np
+import databutton as db
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel, Field
+from app.apis.text_normalization import get_normalized_text
+from app.apis.detection_cache import fingerprint_rules
+from app.apis.rule_packs import register_reload_check
+
+'''
+1. API用途：已知詐騙範本的近似重複索引（MinHash + LSH），詐騙集團常只更換金額、人名、連結
+   來大量發送同一範本，與已知範本距離夠近的訊息可直接判定詐騙類型，不需跑完整規則或呼叫LLM
+2. 關聯頁面：後台管理頁面（新增已確認的詐騙範本、查看範本數量）
+3. 目前狀態：啟用中（範本儲存於 db.storage，啟動後第一次查詢時載入；新增範本在本 worker 即時生效，
+   其他 worker 由背景檢查儲存的版本，在規則包檢查間隔內重新載入）
+'''
+
+router = APIRouter(
+    prefix="/scam-templates",
+    tags=["scam-templates"],
+    responses={404: {"description": "Not found"}},
+)
+
+SCAM_TEMPLATES_KEY = "scam_templates"
+SCAM_TEMPLATES_VERSION_KEY = "scam_templates_version"
+
+# MinHash 設定：64個雜湊函數切成16段、每段4個，Jaccard 相似度約 0.5 以上的範本會成為候選
+NUM_PERMUTATIONS = 64
+LSH_BANDS = 16
+LSH_ROWS = NUM_PERMUTATIONS // LSH_BANDS
+MIN_SIMILARITY = 0.7  # 估計 Jaccard 相似度達此門檻才視為同一範本
+SHINGLE_SIZE = 3
+MIN_TEMPLATE_LENGTH = 20  # 遮罩後少於此字數的訊息不比對（短訊息容易誤判）
+
+# 遮罩會變動的部分：連結、數字金額、帳號等
+_MASK_RULES = [
+    (re.compile(r"(?:https?|hxxps?)://\S+|(?:www\.)?[a-z0-9-]+(?:\.[a-z0-9-]+)*\.[a-z]{2,24}(?:/\S*)?"), "U"),
+    (re.compile(r"\d+(?:[,.]\d+)*"), "0"),
+    (re.compile(r"[\s\W_]+"), ""),
+]
+
+def mask_template_text(text: str) -> str:
+    """正規化後遮罩連結與數字，並移除空白與標點"""
+    masked = get_normalized_text(text)
+    for pattern, replacement in _MASK_RULES:
+        masked = pattern.sub(replacement, masked)
+    return masked
+
+# 各雜湊函數的參數（固定種子，跨程序與重新啟動結果一致）
+_PERMUTATION_RNG = np.random.default_rng(20250419)
+_PERMUTATION_A = _PERMUTATION_RNG.integers(1, 2**63, NUM_PERMUTATIONS, dtype=np.uint64) | np.uint64(1)
+_PERMUTATION_B = _PERMUTATION_RNG.integers(0, 2**63, NUM_PERMUTATIONS, dtype=np.uint64)
+
+def compute_minhash(masked_text: str) -> Optional[np.ndarray]:
+    """以字元 3-gram 計算 MinHash 簽章（shingle 以 crc32 雜湊，跨程序結果一致）"""
+    shingles = {masked_text[i:i + SHINGLE_SIZE].encode("utf-8") for i in range(len(masked_text) - SHINGLE_SIZE + 1)}
+    if not shingles:
+        return None
+    hashes = np.fromiter(
+        (zlib.crc32(shingle) | (zlib.crc32(shingle, 0x5BD1E995) << 32) for shingle in shingles),
+        dtype=np.uint64, count=len(shingles)
+    )
+    # multiply-shift 雜湊（uint64 溢位即為 mod 2^64）
+    permuted = (hashes[:, None] * _PERMUTATION_A + _PERMUTATION_B) >> np.uint64(32)
+    return permuted.min(axis=0)
+
+def split_bands(signature: np.ndarray) -> List[bytes]:
+    return [signature[band * LSH_ROWS:(band + 1) * LSH_ROWS].tobytes() for band in range(LSH_BANDS)]
+
+def estimate_similarity(signature: np.ndarray, other: np.ndarray) -> float:
+    """以相同的 MinHash 值比例估計 Jaccard 相似度"""
+    return float(np.count_nonzero(signature == other)) / NUM_PERMUTATIONS
+
+class ScamTemplateIndex:
+    """MinHash signatures of confirmed scam messages in banded LSH tables"""
+
+    def __init__(self):
+        self._templates: Dict[str, Dict[str, Any]] = {}
+        self._signatures: Dict[str, np.ndarray] = {}
+        self._bands: List[Dict[bytes, List[str]]] = [{} for _ in range(LSH_BANDS)]
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.hits = 0
+
+    def __len__(self) -> int:
+        return len(self._templates)
+
+    def add(self, template: Dict[str, Any]) -> Optional[str]:
+        """加入一則範本；遮罩後太短的訊息不加入，回傳範本 ID"""
+        masked = mask_template_text(template["text"])
+        if len(masked) < MIN_TEMPLATE_LENGTH:
+            return None
+        signature = compute_minhash(masked)
+        template_id = template.get("id") or f"tpl_{hashlib.blake2b(masked.encode('utf-8'), digest_size=8).hexdigest()}"
+        with self._lock:
+            if template_id in self._templates:
+                self._remove_locked(template_id)
+            self._templates[template_id] = {**template, "id": template_id}
+            self._signatures[template_id] = signature
+            for band, value in enumerate(split_bands(signature)):
+                self._bands[band].setdefault(value, []).append(template_id)
+        return template_id
+
+    def _remove_locked(self, template_id: str) -> None:
+        signature = self._signatures.pop(template_id)
+        self._templates.pop(template_id, None)
+        for band, value in enumerate(split_bands(signature)):
+            bucket = self._bands[band].get(value, [])
+            if template_id in bucket:
+                bucket.remove(template_id)
+            if not bucket:
+                self._bands[band].pop(value, None)
+
+    def remove(self, template_id: str) -> bool:
+        with self._lock:
+            if template_id not in self._templates:
+                return False
+            self._remove_locked(template_id)
+            return True
+
+    def find(self, text: str, min_similarity: float = MIN_SIMILARITY) -> Optional[Dict[str, Any]]:
+        """
+        尋找最相似的已知範本
+        回傳 {template, similarity}，沒有相似度達門檻的範本時回傳 None
+        """
+        if not self._templates:
+            return None
+        masked = mask_template_text(text)
+        if len(masked) < MIN_TEMPLATE_LENGTH:
+            return None
+
+        self.lookups += 1
+        signature = compute_minhash(masked)
+        bands = split_bands(signature)
+        best_id, best_similarity = None, min_similarity
+        # 新增或刪除範本會改動 LSH 桶，查詢時同樣持有鎖
+        with self._lock:
+            candidates = set()
+            for band, value in enumerate(bands):
+                candidates.update(self._bands[band].get(value, ()))
+            for template_id in candidates:
+                similarity = estimate_similarity(signature, self._signatures[template_id])
+                if similarity >= best_similarity:
+                    best_id, best_similarity = template_id, similarity
+            template = self._templates.get(best_id) if best_id else None
+        if template is None:
+            return None
+
+        self.hits += 1
+        return {"template": template, "similarity": best_similarity}
+
+    def list_templates(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self._templates.values())
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "templates": len(self._templates),
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "hit_rate": round(self.hits / self.lookups, 4) if self.lookups else 0.0,
+            "min_similarity": MIN_SIMILARITY
+        }
+
+# 目前的索引與其對應的儲存版本（一起替換）；新增、刪除與重新載入以 _LOAD_LOCK 依序進行
+_TEMPLATE_STATE: Optional[Dict[str, Any]] = None
+_LOAD_LOCK = threading.Lock()
+
+def get_stored_templates() -> List[Dict[str, Any]]:
+    """獲取已儲存的詐騙範本"""
+    try:
+        return db.storage.json.get(SCAM_TEMPLATES_KEY, default=[])
+    except Exception as e:
+        print(f"Error loading scam templates: {str(e)}")
+        return []
+
+def get_stored_version() -> Optional[str]:
+    """獲取已儲存範本的版本（任一 worker 新增或刪除範本後改變）"""
+    try:
+        return (db.storage.json.get(SCAM_TEMPLATES_VERSION_KEY, default=None) or {}).get("version")
+    except Exception as e:
+        print(f"Error loading scam template version: {str(e)}")
+        return None
+
+def save_templates(index: ScamTemplateIndex) -> str:
+    """儲存範本，再更新版本（其他 worker 看到新版本時一定讀得到新範本），回傳新版本"""
+    templates = index.list_templates()
+    version = fingerprint_rules(templates)
+    db.storage.json.put(SCAM_TEMPLATES_KEY, templates)
+    db.storage.json.put(SCAM_TEMPLATES_VERSION_KEY, {"version": version, "updated_at": time.time()})
+    return version
+
+def _load_locked(version: Optional[str]) -> Dict[str, Any]:
+    global _TEMPLATE_STATE
+    index = ScamTemplateIndex()
+    for template in get_stored_templates():
+        index.add(template)
+    _TEMPLATE_STATE = {"index": index, "version": version}
+    return _TEMPLATE_STATE
+
+def _refresh_locked() -> Dict[str, Any]:
+    """儲存的版本與已載入的不同（或尚未載入）時重新載入"""
+    version = get_stored_version()
+    if _TEMPLATE_STATE is None or _TEMPLATE_STATE["version"] != version:
+        return _load_locked(version)
+    return _TEMPLATE_STATE
+
+def get_template_index() -> ScamTemplateIndex:
+    """取得範本索引，第一次使用時從儲存空間載入"""
+    state = _TEMPLATE_STATE
+    if state is None:
+        with _LOAD_LOCK:
+            state = _TEMPLATE_STATE or _refresh_locked()
+    return state["index"]
+
+def get_template_version() -> Optional[str]:
+    """已載入範本的儲存版本（尚未載入時為 None）"""
+    state = _TEMPLATE_STATE
+    return state["version"] if state is not None else None
+
+def refresh_template_index() -> None:
+    """由規則包背景執行緒定期呼叫：其他 worker 變更了範本時重新載入（尚未載入時不需處理）"""
+    if _TEMPLATE_STATE is not None:
+        with _LOAD_LOCK:
+            _refresh_locked()
+
+register_reload_check(refresh_template_index)
+
+def validate_scam_type(scam_type: str) -> None:
+    """範本的詐騙類型必須是偵測引擎中的類型，否則拋出 ValueError"""
+    # 偵測引擎匯入本模組，於使用時才匯入
+    from app.apis.detection_engine import get_scam_types
+    if scam_type not in get_scam_types():
+        raise ValueError(f"Unknown scam type: {scam_type}")
+
+def find_scam_template(text: str) -> Optional[Dict[str, Any]]:
+    """查詢訊息是否為已知詐騙範本的變體"""
+    return get_template_index().find(text)
+
+def add_scam_template(text: str, scam_type: str, source: str = "admin") -> Optional[str]:
+    """新增已確認的詐騙範本（本 worker 立即生效並寫入儲存空間）；詐騙類型未知時拋出 ValueError"""
+    validate_scam_type(scam_type)
+    with _LOAD_LOCK:
+        # 先套用其他 worker 的變更，寫回時才不會覆蓋掉它們新增的範本
+        state = _refresh_locked()
+        template_id = state["index"].add({"text": text, "scam_type": scam_type, "source": source, "created_at": time.time()})
+        if template_id:
+            try:
+                state["version"] = save_templates(state["index"])
+            except Exception as e:
+                print(f"Error saving scam templates: {str(e)}")
+    return template_id
+
+def remove_scam_template(template_id: str) -> bool:
+    """刪除範本並寫入儲存空間，範本不存在時回傳 False"""
+    with _LOAD_LOCK:
+        state = _refresh_locked()
+        if not state["index"].remove(template_id):
+            return False
+        state["version"] = save_templates(state["index"])
+    return True
+
+class ScamTemplateRequest(BaseModel):
+    text: str = Field(..., description="已確認的詐騙訊息內容")
+    scam_type: str = Field(..., description="詐騙類型ID，例如 investment_scam")
+    source: str = Field("admin", description="範本來源")
+
+class ScamTemplateMatchRequest(BaseModel):
+    text: str = Field(..., description="要比對的訊息")
+
+@router.post("/add", summary="新增詐騙範本", description="新增一則已確認的詐騙訊息，之後相似的訊息會直接判定為相同詐騙類型")
+def add_template(request: ScamTemplateRequest):
+    """新增詐騙範本"""
+    try:
+        template_id = add_scam_template(request.text, request.scam_type, request.source)
+        if not template_id:
+            raise HTTPException(status_code=400, detail=f"Template text is too short (at least {MIN_TEMPLATE_LENGTH} characters after masking)")
+        return {"success": True, "id": template_id, "templates": len(get_template_index())}
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    except Exception as e:
+        print(f"Error adding scam template: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to add scam template: {str(e)}") from e
+
+@router.delete("/{template_id}", summary="刪除詐騙範本", description="從索引與儲存空間中刪除指定範本")
+def delete_template(template_id: str):
+    """刪除詐騙範本"""
+    try:
+        if not remove_scam_template(template_id):
+            raise HTTPException(status_code=404, detail="Template not found")
+        return {"success": True, "templates": len(get_template_index())}
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error deleting scam template: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to delete scam template: {str(e)}") from e
+
+@router.post("/match", summary="比對詐騙範本", description="查詢訊息最接近的已知詐騙範本")
+def match_template(request: ScamTemplateMatchRequest):
+    """比對詐騙範本"""
+    try:
+        return {"match": find_scam_template(request.text)}
+    except Exception as e:
+        print(f"Error matching scam template: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to match scam template: {str(e)}") from e
+
+@router.get("/stats", summary="取得範本索引統計", description="取得範本數量與命中率")
+def get_template_stats():
+    """取得範本索引統計"""
+    try:
+        index = get_template_index()
+        return {**index.stats(), "version": _TEMPLATE_STATE["version"]}
+    except Exception as e:
+        print(f"Error getting scam template stats: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to get scam template stats: {str(e)}") from e
@@ -0,0 +1,85 @@
+from typing import Optional, FrozenSet, Union, Pattern
+import re
+from fastapi import APIRouter
+from app.apis.message_prefilter import extract_required_literals
+
+'''
+1. API用途：訊息文字系統（script）判斷，詐騙規則混合了中文與英文規則，以文字系統分布將每則訊息
+   只路由到可能命中的語言規則包：純中文訊息不執行英文規則、純英文訊息不執行中文規則，中英混合訊息兩者皆執行；
+   也用來套用 API 請求中指定的 language（auto、en、zh）
+2. 關聯頁面：無直接關聯頁面，由 detection_engine 編譯規則與偵測訊息時使用
+3. 目前狀態：啟用中（auto 模式以文字系統是否出現判斷，不以比例判斷，不會略過任何可能命中的規則）
+'''
+
+# 創建一個空的router物件以符合Databutton框架要求
+router = APIRouter()
+
+LANGUAGE_AUTO = "auto"
+LANGUAGE_ZH = "zh"
+LANGUAGE_EN = "en"
+SUPPORTED_LANGUAGES = (LANGUAGE_ZH, LANGUAGE_EN)
+ALL_LANGUAGES: FrozenSet[str] = frozenset(SUPPORTED_LANGUAGES)
+
+# 中日韓文字（與 detection_engine 判斷 CJK 關鍵詞規則的範圍一致，U+2E80 以上）
+_CJK_RE = re.compile("[\u2e80-\U0010ffff]")
+# 拉丁字母；另含 IGNORECASE 時會與 i、s、k 互相命中的 İ ı ſ K（Kelvin 符號）
+_LATIN_RE = re.compile("[a-zA-Z\u0130\u0131\u017f\u212a]")
+
+def is_cjk_text(text: str) -> bool:
+    return _CJK_RE.search(text) is not None
+
+def is_latin_text(text: str) -> bool:
+    return _LATIN_RE.search(text) is not None
+
+def detect_languages(text: str) -> FrozenSet[str]:
+    """
+    訊息中出現的文字系統對應的規則包：有中日韓文字為 zh、有拉丁字母為 en，混合文字兩者皆有
+
+    只檢查是否出現（找到第一個字元即停止），不計算比例，因此不會漏掉任何可能命中的規則
+    """
+    if not text:
+        return frozenset()
+    if text.isascii():
+        return frozenset([LANGUAGE_EN]) if is_latin_text(text) else frozenset()
+    languages = set()
+    if is_cjk_text(text):
+        languages.add(LANGUAGE_ZH)
+    if is_latin_text(text):
+        languages.add(LANGUAGE_EN)
+    return frozenset(languages)
+
+def normalize_language(language: Optional[str]) -> str:
+    """請求的 language 參數轉為 auto、zh 或 en（zh-TW、en-US 等取前兩碼，無法辨識時視為 auto）"""
+    code = (language or LANGUAGE_AUTO).strip().lower()[:2]
+    return code if code in SUPPORTED_LANGUAGES else LANGUAGE_AUTO
+
+def resolve_languages(text: str, language: Optional[str] = LANGUAGE_AUTO) -> FrozenSet[str]:
+    """
+    訊息要執行的規則包
+
+    Args:
+        text: 已正規化的訊息
+        language: 請求指定的語言（auto、zh、en）；指定時只執行該語言的規則包
+
+    Returns:
+        規則包語言集合（可能為空，此時只執行不分語言的規則）
+    """
+    detected = detect_languages(text)
+    language = normalize_language(language)
+    if language == LANGUAGE_AUTO:
+        return detected
+    return detected & {language}
+
+def classify_rule_language(pattern: Union[str, Pattern]) -> Optional[str]:
+    """
+    規則所屬的語言規則包：必須命中的觸發詞全部含中日韓文字為 zh、全部含拉丁字母為 en，
+    其他（例如只需要數字或符號）回傳 None，表示不分語言、所有訊息都執行
+    """
+    required = extract_required_literals(pattern)
+    if not required:
+        return None
+    if all(is_cjk_text(literal) for literal in required):
+        return LANGUAGE_ZH
+    if all(is_latin_text(literal) for literal in required):
+        return LANGUAGE_EN
+    return None
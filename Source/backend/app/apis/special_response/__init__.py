@@ -3,6 +3,7 @@ from pydantic import BaseModel, Field
 from fastapi import APIRouter, HTTPException
 import re
 import json
+import time
 import databutton as db
 
 '''
@@ -14,6 +15,9 @@ import databutton as db
 
 # Import existing modules
 from app.apis.emotional_support import get_emotional_support_message
+from app.apis.rule_packs import register_rule_set, publish_rule_pack
+from app.apis.safe_regex import compile_rule
+from app.apis.rule_profiler import profiling_enabled, record_rule, register_profiled_rules, DETECTOR_SPECIAL_RESPONSE
 
 # 內容安全檢查函數（已移除原模組導入）
 def check_content_safety(text):
@@ -55,6 +59,10 @@ class SpecialResponseConfig(BaseModel):
     system_enabled: bool = Field(True, description="Whether the special response system is enabled")
     last_updated: str = Field(..., description="When the configuration was last updated")
 
+class SpecialResponseConfigUpdate(SpecialResponseConfig):
+    rule_pack_published: bool = Field(True, description="Whether the new rules were published to every worker")
+    warning: Optional[str] = Field(None, description="Why publishing failed; the configuration itself was saved")
+
 # Default configuration
 # Default configuration
 DEFAULT_CONFIG = {
@@ -187,6 +195,70 @@ def save_config(config: SpecialResponseConfig) -> bool:
         print(f"Error saving special response config: {str(e)}")
         return False
 
+# Compiled rules currently in use (swapped as a whole by the rule pack, never mutated in place)
+_ACTIVE_SPECIAL_RULES: Optional[Dict[str, Any]] = None
+
+def special_rule_id(rule: SpecialResponseRule, pattern_index: int) -> str:
+    """Id of one pattern of a rule, used by the rule profiler (e.g. suicide_crisis.2)"""
+    return f"{rule.id}.{pattern_index}"
+
+def compile_special_rules(config_data: Dict[str, Any], strict: bool = True) -> Dict[str, Any]:
+    """
+    Validate a special response configuration and precompile its patterns
+    
+    Patterns are admin input, so each one must pass the safe_regex check (no backreferences,
+    lookarounds or quantifiers that can backtrack catastrophically) before it is compiled.
+    
+    Args:
+        config_data: Configuration in the shape of SpecialResponseConfig
+        strict: Raise on an invalid or unsafe pattern; otherwise skip it and list it under "flagged"
+            (used for configurations stored before the check existed)
+        
+    Returns:
+        Dictionary with the parsed configuration, (rule, [(pattern id, compiled pattern)]) pairs for enabled rules
+        and the flagged patterns
+    """
+    config = SpecialResponseConfig(**config_data)
+    rules = []
+    flagged = []
+    for rule in config.rules:
+        compiled_patterns = []
+        for index, pattern in enumerate(rule.patterns):
+            try:
+                compiled_patterns.append((special_rule_id(rule, index), compile_rule(pattern)))
+            except ValueError as e:
+                if strict:
+                    raise ValueError(f"Invalid pattern in rule {rule.id}: {pattern} ({str(e)})") from e
+                print(f"Skipping unsafe pattern in special response rule {rule.id}: {str(e)}")
+                flagged.append({"rule_id": rule.id, "pattern": pattern, "error": str(e)})
+        if rule.enabled:
+            rules.append((rule, compiled_patterns))
+    return {"config": config, "rules": rules, "flagged": flagged}
+
+def install_special_rules(compiled: Dict[str, Any]) -> None:
+    """Swap in a compiled special response configuration"""
+    global _ACTIVE_SPECIAL_RULES
+    _ACTIVE_SPECIAL_RULES = compiled
+    register_profiled_rules(DETECTOR_SPECIAL_RESPONSE, "rules", {
+        special_rule_id(rule, index): pattern
+        for rule, _ in compiled["rules"]
+        for index, pattern in enumerate(rule.patterns)
+    })
+
+def get_active_special_rules() -> Dict[str, Any]:
+    """Return the compiled rules, loading the stored configuration on first use"""
+    active = _ACTIVE_SPECIAL_RULES
+    if active is None:
+        active = compile_special_rules(get_config().dict(), strict=False)
+        install_special_rules(active)
+    return active
+
+def export_special_rules() -> Dict[str, Any]:
+    """Serializable definitions of the active special response configuration"""
+    return get_active_special_rules()["config"].dict()
+
+register_rule_set("special_response", export_special_rules, compile_special_rules, install_special_rules)
+
 def detect_special_situation(text: str, is_group: bool = False) -> Tuple[bool, Optional[SpecialResponseRule]]:
     """
     Detect if the text indicates a special situation
@@ -198,30 +270,32 @@ def detect_special_situation(text: str, is_group: bool = False) -> Tuple[bool, O
     Returns:
         Tuple containing whether a situation was detected and the matching rule if any
     """
-    # Get current configuration
-    config = get_config()
+    # Get current configuration (compiled once, swapped when a new rule pack is published)
+    active = get_active_special_rules()
     
     # If system is disabled, return immediately
-    if not config.system_enabled:
+    if not active["config"].system_enabled:
         return False, None
     
     # Skip detection for empty messages
     if not text or not text.strip():
         return False, None
     
-    # Check each enabled rule
-    for rule in config.rules:
-        # Skip disabled rules
-        if not rule.enabled:
-            continue
-            
+    # Check each enabled rule (crisis rules are never cut short by the detection budget;
+    # every pattern has passed the linear-time check, so the scan is bounded by the message length)
+    profiling = profiling_enabled()
+    for rule, compiled_patterns in active["rules"]:
         # Skip group tag detection in 1:1 chats
         if rule.id == "group_tag" and not is_group:
             continue
             
         # Check patterns
-        for pattern in rule.patterns:
-            if re.search(pattern, text, re.IGNORECASE):
+        for pattern_id, pattern in compiled_patterns:
+            started = time.perf_counter_ns() if profiling else 0
+            found = pattern.search(text)
+            if profiling:
+                record_rule(DETECTOR_SPECIAL_RESPONSE, pattern_id, found is not None, time.perf_counter_ns() - started)
+            if found:
                 return True, rule
     
     return False, None
@@ -359,16 +433,34 @@ def get_special_response_config() -> SpecialResponseConfig:
             detail=f"Error getting special response config: {str(e)}"
         ) from e
 
-@router.post("/config", response_model=SpecialResponseConfig, summary="Update Special Response Configuration", description="Update the configuration for special response rules")
-def update_special_response_config(config: SpecialResponseConfig) -> SpecialResponseConfig:
+def publish_special_rules(config: SpecialResponseConfig) -> Optional[str]:
+    """
+    Hot-swap the compiled rules in every worker after the configuration has been saved
+
+    Returns:
+        None on success, otherwise a warning (the saved configuration takes effect after the next reload)
+    """
+    try:
+        publish_rule_pack({"special_response": config.dict()})
+        return None
+    except Exception as e:
+        print(f"Error publishing special response rules: {str(e)}")
+        return f"Configuration saved, but publishing the rules failed: {str(e)}"
+
+@router.post("/config", response_model=SpecialResponseConfigUpdate, summary="Update Special Response Configuration", description="Update the configuration for special response rules")
+def update_special_response_config(config: SpecialResponseConfig) -> SpecialResponseConfigUpdate:
     """
     Update the configuration for special response rules
     """
+    try:
+        compile_special_rules(config.dict())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid special response config: {str(e)}") from e
+
     try:
         success = save_config(config)
         if not success:
             raise ValueError("Failed to save configuration")
-        return config
     except Exception as e:
         print(f"Error updating special response config: {str(e)}")
         raise HTTPException(
@@ -376,6 +468,10 @@ def update_special_response_config(config: SpecialResponseConfig) -> SpecialResp
             detail=f"Error updating special response config: {str(e)}"
         ) from e
 
+    # The configuration is saved at this point; a publish failure is reported as a partial success
+    warning = publish_special_rules(config)
+    return SpecialResponseConfigUpdate(**config.dict(), rule_pack_published=warning is None, warning=warning)
+
 @router.post("/toggle", summary="Toggle Special Response System", description="Enable or disable the entire special response system")
 def toggle_system2(enabled: bool) -> Dict[str, Any]:
     """
@@ -388,11 +484,12 @@ def toggle_system2(enabled: bool) -> Dict[str, Any]:
         
         if not success:
             raise ValueError("Failed to save configuration")
-            
-        return {"success": True, "system_enabled": enabled}
     except Exception as e:
         print(f"Error toggling special response system: {str(e)}")
         raise HTTPException(
             status_code=500,
             detail=f"Error toggling special response system: {str(e)}"
         ) from e
+
+    warning = publish_special_rules(config)
+    return {"success": True, "system_enabled": enabled, "rule_pack_published": warning is None, "warning": warning}
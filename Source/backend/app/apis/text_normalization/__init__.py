@@ -0,0 +1,149 @@
+from typing import Optional, Tuple, List
+from contextvars import ContextVar
+from functools import lru_cache
+import re
+import unicodedata
+from fastapi import APIRouter
+
+'''
+1. API用途：訊息正規化，每則進入系統的訊息只正規化一次，產生供詐騙、惡意行為、關鍵詞、
+   危機與緊急關鍵詞等偵測共用的標準化文字（全形半形統一、移除零寬字元、合併空白、大小寫統一）
+2. 關聯頁面：無直接關聯頁面，由 ai_conversation 與 LINE 相關處理流程在收到訊息時呼叫
+3. 目前狀態：啟用中
+'''
+
+# 創建一個空的router物件以符合Databutton框架要求
+router = APIRouter()
+
+# 零寬字元與不可見格式字元（常被用來拆開關鍵詞躲避偵測）
+_INVISIBLE_CHARACTERS = dict.fromkeys(map(ord, "\u200b\u200c\u200d\u200e\u200f\u2060\u2061\u2062\u2063\u2064\ufeff\u00ad\u180e\u034f"), None)
+
+# 連續空白合併為單一空白
+_WHITESPACE_RE = re.compile(r"\s+")
+
+# 中日韓文字之間的空白（中文不以空白分詞，「中 獎」應視為「中獎」）
+_CJK = r"\u2e80-\u2fff\u3040-\u30ff\u3100-\u31ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff"
+_CJK_SPACE_RE = re.compile(f"(?<=[{_CJK}]) (?=[{_CJK}])")
+_CJK_CHAR_RE = re.compile(f"[{_CJK}]")
+
+# 韓文字母（組合用 jamo）在 NFKC 時會與前一個字元合併
+_HANGUL_JAMO = range(0x1160, 0x1200)
+
+# 目前請求的正規化結果 (原始訊息, 正規化訊息)
+_CURRENT_MESSAGE: ContextVar[Optional[Tuple[str, str]]] = ContextVar("normalized_message", default=None)
+
+# 只快取短訊息：長訊息（最長可達數萬字）當作快取鍵會佔用大量記憶體，
+# 同一請求內的重複正規化已由 prepare_message 的 context 處理
+NORMALIZE_CACHE_MAX_LENGTH = 512
+
+def normalize_text(text: str) -> str:
+    """
+    將訊息轉為標準化文字
+
+    1. NFKC：全形英數與標點轉半形、相容字元統一
+    2. 移除零寬與不可見字元
+    3. 合併連續空白並去除頭尾空白，移除中文字之間的空白
+    4. 轉為小寫
+    """
+    if not text:
+        return ""
+    if len(text) <= NORMALIZE_CACHE_MAX_LENGTH:
+        return _normalize_text_cached(text)
+    return _normalize_text(text)
+
+@lru_cache(maxsize=1024)
+def _normalize_text_cached(text: str) -> str:
+    return _normalize_text(text)
+
+def clear_normalize_cache() -> None:
+    """清除短訊息的正規化快取"""
+    _normalize_text_cached.cache_clear()
+
+def _normalize_text(text: str) -> str:
+    normalized = unicodedata.normalize("NFKC", text)
+    normalized = normalized.translate(_INVISIBLE_CHARACTERS)
+    normalized = _WHITESPACE_RE.sub(" ", normalized).strip()
+    normalized = _CJK_SPACE_RE.sub("", normalized)
+    return normalized.lower()
+
+def prepare_message(text: str) -> str:
+    """
+    在請求開始時正規化訊息一次，並存放在目前請求的 context 中
+    之後各偵測模組透過 get_normalized_text 取得同一份結果
+    """
+    normalized = normalize_text(text or "")
+    _CURRENT_MESSAGE.set((text or "", normalized))
+    return normalized
+
+def get_normalized_text(text: str) -> str:
+    """取得訊息的正規化結果；若為目前請求已準備好的訊息則直接使用快取"""
+    if not text:
+        return ""
+    current = _CURRENT_MESSAGE.get()
+    if current is not None and (current[0] is text or current[0] == text or current[1] == text):
+        return current[1]
+    return normalize_text(text)
+
+def _starts_segment(ch: str) -> bool:
+    # NFKC 只會合併起始字元與其後的組合字元（以及韓文字母），可以逐段正規化；
+    # 半形濁音符號（ﾞ、ﾟ）等相容字元分解後才是組合字元，同樣併入前一段
+    return unicodedata.combining(unicodedata.normalize("NFKD", ch)[:1] or ch) == 0 and ord(ch) not in _HANGUL_JAMO
+
+def normalize_text_with_offsets(text: str) -> Optional[Tuple[str, List[Tuple[int, int]]]]:
+    """
+    與 normalize_text 相同的正規化，另回傳每個正規化字元在原始訊息中的範圍 (start, end)，
+    讓偵測結果的位置（以正規化文字計算）可以換算回原始訊息，供前端標示可疑片段
+
+    只在需要回傳位置時呼叫（逐字處理，比 normalize_text 慢）；無法逐字對應時回傳 None
+    """
+    if not text:
+        return "", []
+
+    # 1. NFKC（逐段處理，每個輸出字元對應到其來源段落）
+    chars: List[str] = []
+    offsets: List[Tuple[int, int]] = []
+    segment_start = 0
+    for index in range(1, len(text) + 1):
+        if index < len(text) and not _starts_segment(text[index]):
+            continue
+        for ch in unicodedata.normalize("NFKC", text[segment_start:index]):
+            # 2. 移除零寬與不可見字元
+            if ord(ch) in _INVISIBLE_CHARACTERS:
+                continue
+            # 3. 合併連續空白
+            if ch.isspace():
+                if chars and chars[-1] == " ":
+                    offsets[-1] = (offsets[-1][0], index)
+                    continue
+                ch = " "
+            chars.append(ch)
+            offsets.append((segment_start, index))
+        segment_start = index
+
+    # 去除頭尾空白，移除中文字之間的空白
+    kept = [
+        position for position, ch in enumerate(chars)
+        if ch != " " or (
+            0 < position < len(chars) - 1
+            and not (_CJK_CHAR_RE.match(chars[position - 1]) and _CJK_CHAR_RE.match(chars[position + 1]))
+        )
+    ]
+    chars = [chars[position] for position in kept]
+    offsets = [offsets[position] for position in kept]
+
+    # 4. 轉為小寫（整段轉換以保留與上下文有關的規則，例如字尾的 σ；İ 等字元會變成兩個字元）
+    lowered = "".join(chars).lower()
+    if len(lowered) != len(chars):
+        offsets = [offset for ch, offset in zip(chars, offsets) for _ in ch.lower()]
+
+    if lowered != normalize_text(text):
+        return None
+    return lowered, offsets
+
+def to_original_span(offsets: List[Tuple[int, int]], start: int, end: int) -> Tuple[int, int]:
+    """正規化文字中的範圍 [start, end) 換算為原始訊息中的範圍"""
+    if not offsets:
+        return 0, 0
+    start = min(max(start, 0), len(offsets) - 1)
+    end = min(max(end, start + 1), len(offsets))
+    return offsets[start][0], offsets[end - 1][1]
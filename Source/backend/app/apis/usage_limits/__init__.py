@@ -4,6 +4,7 @@ import databutton as db
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel, Field
 from typing import Dict, List, Optional, Any, Union
+from app.apis.keyword_index import register_keywords, has_keyword
 
 '''
 1. API用途：系統使用限制 API，管理和控制用戶對 AI 服務的使用限制，包括會話次數限制、token 使用計算和全局限制
@@ -152,8 +153,15 @@ def get_global_stats() -> Dict[str, Any]:
             "all_time": {"count": 0, "tokens": 0}
         }
 
-def update_global_stats(token_count: int = 0) -> Dict[str, Any]:
-    """更新全局使用統計"""
+def update_global_stats(token_count: int = 0, cache_read_tokens: int = 0, cache_write_tokens: int = 0) -> Dict[str, Any]:
+    """
+    更新全局使用統計
+
+    Args:
+        token_count: 本次呼叫的總 token 數
+        cache_read_tokens: 從提示快取讀取的輸入 token 數（大於0即為快取命中）
+        cache_write_tokens: 寫入提示快取的輸入 token 數
+    """
     try:
         stats = get_global_stats()
         
@@ -167,6 +175,14 @@ def update_global_stats(token_count: int = 0) -> Dict[str, Any]:
         stats["all_time"]["count"] += 1
         stats["all_time"]["tokens"] += token_count
         
+        # 提示快取統計（較早建立的統計沒有這些欄位）
+        for period in ("hourly", "daily", "all_time"):
+            bucket = stats[period]
+            bucket["cache_requests"] = bucket.get("cache_requests", 0) + (1 if cache_read_tokens or cache_write_tokens else 0)
+            bucket["cache_hits"] = bucket.get("cache_hits", 0) + (1 if cache_read_tokens else 0)
+            bucket["cache_read_tokens"] = bucket.get("cache_read_tokens", 0) + cache_read_tokens
+            bucket["cache_write_tokens"] = bucket.get("cache_write_tokens", 0) + cache_write_tokens
+        
         db.storage.json.put(GLOBAL_STATS_KEY, stats)
         return stats
     except Exception as e:
@@ -348,6 +364,19 @@ def update_user_usage(user_id: str, token_count: int) -> None:
     
     update_usage_records(records)
 
+# 緊急情況關鍵詞列表
+EMERGENCY_KEYWORDS = [
+    "被騙了", "詐騙", "騙走", "騙錢", "被騙", "騙我", 
+    "被盜", "被盜用", "身分證", "個資外洩",
+    "急", "緊急", "救命", "幫助", "害怕", "恐懼",
+    "自殺", "輕生", "不想活", "想死", "了結",  
+    "被勒索", "威脅", "警察", "報警", "165"
+]
+
+# 註冊到共用關鍵詞索引
+EMERGENCY_KEYWORD_NAMESPACE = "emergency_keywords"
+register_keywords(EMERGENCY_KEYWORD_NAMESPACE, EMERGENCY_KEYWORDS)
+
 @router.post("/check", summary="檢查使用限制", description="檢查使用者是否達到使用限制")
 # 檢測緊急關鍵詞的函數
 def has_emergency_keywords(message: str) -> bool:
@@ -355,17 +384,8 @@ def has_emergency_keywords(message: str) -> bool:
     if not message:
         return False
         
-    # 緊急情況關鍵詞列表
-    emergency_keywords = [
-        "被騙了", "詐騙", "騙走", "騙錢", "被騙", "騙我", 
-        "被盜", "被盜用", "身分證", "個資外洩",
-        "急", "緊急", "救命", "幫助", "害怕", "恐懼",
-        "自殺", "輕生", "不想活", "想死", "了結",  
-        "被勒索", "威脅", "警察", "報警", "165"
-    ]
-    
-    # 檢查是否包含任意緊急關鍵詞
-    return any(keyword in message for keyword in emergency_keywords)
+    # 透過共用關鍵詞索引檢查是否包含任意緊急關鍵詞
+    return has_keyword(message, EMERGENCY_KEYWORD_NAMESPACE)
 
 
 class EmergencyCheckRequest(BaseModel):
@@ -499,11 +519,21 @@ def get_usage_stats():
             "timestamp": current_time
         }
     
+    # 提示快取命中率（使用快取的呼叫中，讀取到快取的比例）
+    all_time = global_stats.get("all_time", {})
+    cache_requests = all_time.get("cache_requests", 0)
+    cache_hit_rate = all_time.get("cache_hits", 0) / cache_requests if cache_requests else 0.0
+    
     return {
         "global": global_stats,
         "users": {
             "total": user_count,
             "active": active_users
+        },
+        "prompt_cache": {
+            "hit_rate": round(cache_hit_rate, 3),
+            "cache_read_tokens": all_time.get("cache_read_tokens", 0),
+            "cache_write_tokens": all_time.get("cache_write_tokens", 0)
         }
     }
 
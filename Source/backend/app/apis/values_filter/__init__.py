@@ -117,6 +117,14 @@ def check_interaction_pattern(response: str) -> bool:
     # 檢查末尾是否有問號或邀請性詞語
     return '？' in last_text or any(phrase in last_text for phrase in ['如何', '什麼', '要不要', '想不想', '可以嗎'])
 
+# 依據回應內容選擇適合的互動問句
+INTERACTION_QUESTIONS = [
+    '你覺得這樣可以嗎？',
+    '你有什麼想法呢？',
+    '這對你有幫助嗎？',
+    '你遇到類似的情況嗎？'
+]
+
 # 添加互動性問句
 def add_interaction(response: str) -> str:
     # 如果結尾沒有問句，添加一個互動性問題
@@ -125,17 +133,9 @@ def add_interaction(response: str) -> str:
         emoji_pattern = re.compile(r'[\U0001F600-\U0001F64F\U0001F300-\U0001F5FF\U0001F680-\U0001F6FF\U0001F700-\U0001F77F\U0001F780-\U0001F7FF\U0001F800-\U0001F8FF\U0001F900-\U0001F9FF\U0001FA00-\U0001FA6F\U0001FA70-\U0001FAFF\U00002702-\U000027B0\U000024C2-\U0001F251\U0001f926-\U0001f937]+')
         clean_response = emoji_pattern.sub('', response.rstrip())
         
-        # 依據回應內容選擇適合的互動問句
-        interaction_questions = [
-            '你覺得這樣可以嗎？',
-            '你有什麼想法呢？',
-            '這對你有幫助嗎？',
-            '你遇到類似的情況嗎？'
-        ]
-        
         # 選擇一個問句
         import random
-        question = random.choice(interaction_questions)
+        question = random.choice(INTERACTION_QUESTIONS)
         
         # 添加到回應末尾
         return f"{clean_response}\n\n{question}😊"
@@ -188,10 +188,22 @@ def check_equality_perspective(response: str) -> bool:
     equality_phrases = ["一起", "我們可以", "你覺得", "你想", "謝謝你"]
     return any(phrase in response for phrase in equality_phrases)
 
+# 已有平等表達的詞語
+EQUALITY_MARKERS = ["一起", "我們", "你覺得", "如果你想", "也許我們", "與你分享"]
+
+# 在第二句前添加的平等視角詞語
+EQUALITY_PREFIXES = [
+    "我們可以一起想想", 
+    "跟你分享我的想法，", 
+    "也許我們可以這樣看，", 
+    "不知道你覺得如何，", 
+    "希望能跟你一起想想，"
+]
+
 # 改善平等平視的視角
 def improve_equality_perspective(response: str) -> str:
     # 分析是否需要添加平等表達詞語
-    if not any(phrase in response for phrase in ["一起", "我們", "你覺得", "如果你想", "也許我們", "與你分享"]):
+    if not any(phrase in response for phrase in EQUALITY_MARKERS):
         # 找到適合插入平等視角詞語的位置
         sentences = re.split(r'[。！？]', response)
         if len(sentences) > 1:
@@ -201,15 +213,8 @@ def improve_equality_perspective(response: str) -> str:
             for i, sentence in enumerate(sentences):
                 if i == 1 and not inserted and sentence.strip():
                     # 在第二句前添加平等視角詞語
-                    equality_phrases = [
-                        "我們可以一起想想", 
-                        "跟你分享我的想法，", 
-                        "也許我們可以這樣看，", 
-                        "不知道你覺得如何，", 
-                        "希望能跟你一起想想，"
-                    ]
                     import random
-                    prefix = random.choice(equality_phrases)
+                    prefix = random.choice(EQUALITY_PREFIXES)
                     modified_sentences.append(f"{prefix}{sentence}")
                     inserted = True
                 else:
@@ -353,3 +358,167 @@ def apply_values_filter(response: str, user_message: str) -> Tuple[str, List[str
         applied_principles.append("safety_check")
     
     return final_response, applied_principles
+
+# 串流回應的斷句：全形句末標點與換行
+SENTENCE_END_PATTERN = re.compile(r'[。！？\n]')
+ENDING_EMOJIS = ['😊', '🤗', '👍', '💪', '😉']
+
+class StreamingValuesFilter:
+    """
+    串流回應的價值觀過濾：以完整句子為單位套用價值觀原則，句子完成後才放行
+
+    溫柔說服、謙卑語氣、高中生身份只替換句子內的詞語，逐句套用與整段套用結果相同；
+    需要整段回應才能判斷的原則以目前為止的內容近似：
+    - 簡潔性：段落或字數超過上限時在句子邊界截斷，可能被截掉的句子先暫存，確定不會截斷才放行
+    - 平等平視：在第二句完成時，依前兩句決定是否加入平等視角詞語
+    - 互動性、有意義的回應：串流結束時檢查，必要時在結尾補上
+
+    使用方式：每個文字片段呼叫 feed() 取得可放行的文字，結束時呼叫 finish() 取得結尾，
+    truncated 為 True 時後續片段不會再放行，可提早呼叫 finish() 結束回應
+    """
+
+    def __init__(self, user_message: str):
+        self.user_message = user_message
+        self.is_simple_question = len(user_message) < 50  # 與 check_response_length 的標準相同
+        self.raw = ""                  # 原始回應（簡潔性依原始長度判斷）
+        self.text = ""                 # 已放行的回應
+        self.applied_principles: List[str] = []
+        self.truncated = False         # 已截斷，後續內容不再放行
+        self._pending = ""             # 尚未成句的文字
+        self._held: List[str] = []     # 可能被簡潔性原則截掉的句子
+        self._holding = False
+        self._paragraphs = 0
+        self._line_has_content = False
+        self._sentence_ends = 0        # 已放行的句末標點數
+        self._equality_decided = False
+
+    def feed(self, delta: str) -> str:
+        """加入一段新產生的文字，回傳過濾後可以放行的完整句子（可能為空字串）"""
+        if self.truncated:
+            return ""
+        self.raw += delta
+        self._pending += delta
+        segments = []
+        match = SENTENCE_END_PATTERN.search(self._pending)
+        while match and not self.truncated:
+            segment = self._pending[:match.end()]
+            self._pending = self._pending[match.end():]
+            segments.extend(self._gate(segment))
+            match = SENTENCE_END_PATTERN.search(self._pending)
+        if not self.truncated:
+            segments.extend(self._check_length())
+        return self._release(segments)
+
+    def finish(self) -> str:
+        """串流結束：放行剩餘的文字並補上需要的結尾，回傳最後要放行的文字"""
+        segments = []
+        if not self.truncated:
+            if self._pending:
+                segments.extend(self._gate(self._pending))
+                self._pending = ""
+            if not self.truncated:
+                segments.extend(self._check_length())
+            if not self.truncated:
+                segments.extend(self._held)
+                self._held = []
+        released = self._release(segments)
+
+        # 互動性原則：結尾沒有問句時補上互動問句
+        if not check_interaction_pattern(self.text) and not self.text.rstrip().endswith('？'):
+            import random
+            released += self._append(f"\n\n{random.choice(INTERACTION_QUESTIONS)}😊", "interactivity")
+
+        # 最終確保回應有意義
+        if re.match(r'^[\s\.,，。、？！""…]{0,20}$', self.text):
+            released += self._append("哎呀，這個問題讓我想了一下。可以再告訴我多一些細節嗎？這樣我能更好地幫助你。😊", "safety_check")
+        return released
+
+    def _append(self, text: str, principle_id: str) -> str:
+        self.text += text
+        self._mark(principle_id)
+        return text
+
+    def _mark(self, principle_id: str) -> None:
+        if principle_id not in self.applied_principles:
+            self.applied_principles.append(principle_id)
+
+    def _gate(self, segment: str) -> List[str]:
+        """簡潔性原則：回傳現在可以放行的句子，可能被截掉的句子暫存"""
+        if segment.strip() and not self._line_has_content:
+            self._line_has_content = True
+            self._paragraphs += 1
+            if self._paragraphs == 3:
+                if self.is_simple_question:
+                    # 簡單問題只保留前兩段
+                    return self._truncate(keep_held=True)
+                # 一般問題超過三段時只保留前兩段，第三段先暫存
+                self._holding = True
+            elif self._paragraphs > 3:
+                return self._truncate(keep_held=False)
+        if segment.endswith("\n"):
+            self._line_has_content = False
+
+        if self._holding:
+            self._held.append(segment)
+            return []
+        # 簡單問題超過 150 字時在 80 字後的第一個句末截斷，之後的句子等確定長度後才放行
+        if self.is_simple_question and segment[-1] in "。？！" and len(self.raw) - len(self._pending) - 1 > 80:
+            self._holding = True
+        return [segment]
+
+    def _check_length(self) -> List[str]:
+        if self.is_simple_question and self._holding and len(self.raw) > 150:
+            return self._truncate(keep_held=False)
+        return []
+
+    def _truncate(self, keep_held: bool) -> List[str]:
+        released = self._held if keep_held else []
+        self._held = []
+        self._holding = False
+        self._pending = ""
+        self.truncated = True
+        self._mark("brevity")
+        return released
+
+    def _release(self, segments: List[str]) -> str:
+        released = ""
+        for segment in segments:
+            fixed = self._fix(segment)
+            self.text += fixed
+            released += fixed
+            if segment.rstrip()[-1:] in ("。", "！", "？"):
+                self._sentence_ends += 1
+        # 截斷後確保結尾有表情符號
+        if self.truncated and not any(emoji in self.text[-5:] for emoji in ENDING_EMOJIS):
+            released += self._append('😊', "brevity")
+        return released
+
+    def _fix(self, sentence: str) -> str:
+        """對一個完整句子套用溫柔說服、謙卑語氣、平等平視、高中生身份原則"""
+        fixed = make_tone_gentler(sentence)
+        # 整段回應避免重複使用「擔心」
+        if "擔心" in fixed and "擔心" in self.text:
+            fixed = fixed.replace("擔心", "在意", 1)
+        if fixed != sentence:
+            self._mark("gentle_persuasion")
+
+        if not check_humble_tone(fixed):
+            before = fixed
+            fixed = remove_condescending_phrases(fixed)
+            if fixed != before:
+                self._mark("humility")
+
+        # 平等平視：在第二句前添加平等視角詞語
+        if not self._equality_decided and self._sentence_ends >= 1 and fixed.strip():
+            self._equality_decided = True
+            seen = self.text + fixed
+            if not check_equality_perspective(seen) and not any(phrase in seen for phrase in EQUALITY_MARKERS):
+                import random
+                content = fixed.lstrip()
+                fixed = fixed[:len(fixed) - len(content)] + random.choice(EQUALITY_PREFIXES) + content
+                self._mark("equality")
+
+        if not check_high_school_knowledge(fixed):
+            fixed = adjust_to_high_school_level(fixed)
+            self._mark("high_school_identity")
+        return fixed
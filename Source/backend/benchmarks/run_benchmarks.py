@@ -0,0 +1,363 @@
+"""
+偵測器效能與準確度基準測試
+
+以 benchmarks/corpus.jsonl 的標註語料測量各偵測器的吞吐量（訊息/秒）、
+依訊息長度分組的 p50/p99 延遲，以及各分類的 precision/recall，結果可輸出為 JSON 以便比較不同版本。
+
+用法（於 Source/backend 目錄下執行）：
+    python benchmarks/run_benchmarks.py
+    python benchmarks/run_benchmarks.py --iterations 5 --output benchmarks/results/after.json
+    python benchmarks/run_benchmarks.py --compare benchmarks/results/before.json
+
+語料格式（每行一筆 JSON）：
+    id        語料編號
+    group     scam / benign / abuse / crisis / obfuscated / long
+    text      訊息內容；長訊息可改用 segments: [[文字, 重複次數], ...] 組成
+    labels    {"scam": 詐騙類型ID或null, "abuse": bool, "crisis": 危機類型或null, "keyword": 關鍵詞類別或null}
+"""
+from typing import Dict, Any, List, Optional, Callable, Set, Tuple
+import argparse
+import contextlib
+import hashlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_CORPUS = os.path.join(BACKEND_DIR, "benchmarks", "corpus.jsonl")
+RESULT_FORMAT = 1
+
+# 訊息長度分組（字數上限）；超過 3000 字的貼文會走分段偵測
+LENGTH_BUCKETS = [
+    ("short", 20),
+    ("medium", 200),
+    ("long", 3000),
+    ("paste", None),
+]
+
+def length_bucket(text: str) -> str:
+    for name, limit in LENGTH_BUCKETS:
+        if limit is None or len(text) <= limit:
+            return name
+    return LENGTH_BUCKETS[-1][0]
+
+def load_corpus(path: str) -> List[Dict[str, Any]]:
+    """讀取標註語料，將 segments 展開為完整訊息"""
+    corpus = []
+    with open(path, "r", encoding="utf-8") as corpus_file:
+        for line_number, line in enumerate(corpus_file, 1):
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if "segments" in entry:
+                entry["text"] = "".join(segment * repeat for segment, repeat in entry["segments"])
+            if not isinstance(entry.get("text"), str) or "labels" not in entry:
+                raise ValueError(f"Invalid corpus entry on line {line_number}")
+            corpus.append(entry)
+    return corpus
+
+def load_detectors() -> Dict[str, Tuple[str, Callable[[str], Set[str]]]]:
+    """
+    Import the detectors under test
+
+    Returns:
+        Dictionary of detector name -> (label key in the corpus, function returning the predicted categories)
+    """
+    sys.path.insert(0, BACKEND_DIR)
+    from app.apis import scam_detector, scam_utils
+    from app.apis.abuse_protection import AbuseConfig, DEFAULT_ABUSE_CONFIG, check_message_for_abuse
+    from app.apis.keyword_responses import get_keyword_config, get_response_for_keyword
+    from app.apis.emotional_response_orchestrator import detect_crisis_situation
+
+    def detect_scam_detector(text: str) -> Set[str]:
+        is_scam, scam_info = scam_detector.detect_scam(text)[:2]
+        return {scam_info["id"]} if is_scam and scam_info else set()
+
+    def detect_scam_utils(text: str) -> Set[str]:
+        is_scam, scam_info, _ = scam_utils.detect_scam(text)
+        return {scam_info["id"]} if is_scam and scam_info else set()
+
+    # 使用預設設定，不讀取後台修改過的敏感詞
+    abuse_config = AbuseConfig(**DEFAULT_ABUSE_CONFIG)
+
+    def detect_abuse(text: str) -> Set[str]:
+        return {"abuse"} if check_message_for_abuse(text, abuse_config) else set()
+
+    # 關鍵詞回覆只回傳隨機選出的回覆內容，以回覆反查所屬類別
+    response_categories = {}
+    for category_id, category in get_keyword_config().categories.items():
+        for response in category.responses:
+            response_categories.setdefault(response, category_id)
+
+    def detect_keyword(text: str) -> Set[str]:
+        response = get_response_for_keyword(text)
+        return {response_categories.get(response, "unknown")} if response else set()
+
+    def detect_crisis(text: str) -> Set[str]:
+        crisis = detect_crisis_situation(text)
+        return {crisis.crisis_type} if crisis.is_crisis else set()
+
+    return {
+        "scam_detector.detect_scam": ("scam", detect_scam_detector),
+        "scam_utils.detect_scam": ("scam", detect_scam_utils),
+        "abuse": ("abuse", detect_abuse),
+        "keyword": ("keyword", detect_keyword),
+        "crisis": ("crisis", detect_crisis),
+    }
+
+def expected_categories(labels: Dict[str, Any], label_key: str) -> Set[str]:
+    value = labels.get(label_key)
+    if value is True:
+        return {label_key}
+    return {value} if value else set()
+
+def clear_detection_caches() -> None:
+    """清除偵測結果、關鍵詞掃描與正規化快取，讓每一輪都測到實際的偵測成本"""
+    from app.apis.detection_cache import clear_caches
+    from app.apis.keyword_index import get_keyword_index
+    from app.apis.text_normalization import clear_normalize_cache
+    clear_caches()
+    get_keyword_index().clear_cache()
+    clear_normalize_cache()
+
+def ratio(numerator: int, denominator: int) -> Optional[float]:
+    return round(numerator / denominator, 4) if denominator else None
+
+def summarize_latencies(latencies_ns: List[int]) -> Dict[str, Any]:
+    latencies = np.array(latencies_ns, dtype=np.float64) / 1e6
+    total_seconds = float(latencies.sum()) / 1000
+    return {
+        "calls": int(latencies.size),
+        "msgs_per_sec": round(latencies.size / total_seconds, 1) if total_seconds else None,
+        "p50_ms": round(float(np.percentile(latencies, 50)), 4),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 4),
+        "max_ms": round(float(latencies.max()), 4),
+    }
+
+def score_predictions(corpus: List[Dict[str, Any]], label_key: str, predictions: List[Set[str]]) -> Dict[str, Any]:
+    """
+    Compute precision/recall per category and for detection overall
+
+    A message counts towards a category when it is labelled with it (gold) or the
+    detector returned it (predicted). "overall" only asks whether anything was detected.
+    """
+    counts: Dict[str, Dict[str, int]] = {}
+    overall = {"tp": 0, "fp": 0, "fn": 0, "tn": 0}
+    errors = []
+    for entry, predicted in zip(corpus, predictions):
+        gold = expected_categories(entry["labels"], label_key)
+        for category in gold | predicted:
+            category_counts = counts.setdefault(category, {"tp": 0, "fp": 0, "fn": 0})
+            if category in gold and category in predicted:
+                category_counts["tp"] += 1
+            elif category in predicted:
+                category_counts["fp"] += 1
+            else:
+                category_counts["fn"] += 1
+        if gold and predicted:
+            overall["tp"] += 1
+        elif predicted:
+            overall["fp"] += 1
+        elif gold:
+            overall["fn"] += 1
+        else:
+            overall["tn"] += 1
+        if gold != predicted:
+            errors.append({"id": entry["id"], "expected": sorted(gold), "predicted": sorted(predicted)})
+
+    def metrics(category_counts: Dict[str, int]) -> Dict[str, Any]:
+        tp, fp, fn = category_counts["tp"], category_counts["fp"], category_counts["fn"]
+        return {
+            **category_counts,
+            "precision": ratio(tp, tp + fp),
+            "recall": ratio(tp, tp + fn),
+        }
+
+    return {
+        "overall": metrics(overall),
+        "categories": {category: metrics(counts[category]) for category in sorted(counts)},
+        "errors": errors,
+    }
+
+def run_detector(detect: Callable[[str], Set[str]], corpus: List[Dict[str, Any]],
+                 iterations: int, warmup: int, warm_cache: bool) -> Tuple[List[Set[str]], Dict[str, List[int]]]:
+    """
+    Time a detector over the corpus
+
+    Returns:
+        Predictions of the first timed pass and per-bucket latencies (ns) of all timed passes
+    """
+    texts = [entry["text"] for entry in corpus]
+    buckets = [length_bucket(text) for text in texts]
+    latencies: Dict[str, List[int]] = {name: [] for name, _ in LENGTH_BUCKETS}
+    predictions: List[Set[str]] = []
+
+    for iteration in range(warmup + iterations):
+        if not warm_cache:
+            clear_detection_caches()
+        timed = iteration >= warmup
+        for text, bucket in zip(texts, buckets):
+            start = time.perf_counter_ns()
+            predicted = detect(text)
+            elapsed = time.perf_counter_ns() - start
+            if timed:
+                latencies[bucket].append(elapsed)
+                if iteration == warmup:
+                    predictions.append(predicted)
+    return predictions, latencies
+
+def get_git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+def run_benchmarks(corpus_path: str, iterations: int, warmup: int, warm_cache: bool,
+                   detector_names: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Run every selected detector over the corpus and collect a machine-readable report"""
+    with open(corpus_path, "rb") as corpus_file:
+        corpus_hash = hashlib.sha1(corpus_file.read()).hexdigest()[:12]
+    corpus = load_corpus(corpus_path)
+
+    # 偵測器會印出除錯訊息，測量期間將其導向 /dev/null（仍計入延遲，與正式環境相同）
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        detectors = load_detectors()
+        unknown = set(detector_names or []) - set(detectors)
+        if unknown:
+            raise ValueError(f"Unknown detectors: {', '.join(sorted(unknown))}")
+
+        from app.apis.scam_detector import get_scam_rules_version
+        from app.apis.message_prefilter import get_prefilter_stats, reset_prefilter_stats
+        report = {
+            "format": RESULT_FORMAT,
+            "meta": {
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "git_commit": get_git_commit(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "scam_rules_version": get_scam_rules_version(),
+                "corpus": {
+                    "path": os.path.relpath(corpus_path, BACKEND_DIR),
+                    "sha1": corpus_hash,
+                    "messages": len(corpus),
+                    "buckets": {name: sum(1 for entry in corpus if length_bucket(entry["text"]) == name) for name, _ in LENGTH_BUCKETS},
+                },
+                "iterations": iterations,
+                "warmup": warmup,
+                "warm_cache": warm_cache,
+            },
+            "detectors": {},
+        }
+
+        for name, (label_key, detect) in detectors.items():
+            if detector_names and name not in detector_names:
+                continue
+            reset_prefilter_stats()
+            predictions, latencies = run_detector(detect, corpus, iterations, warmup, warm_cache)
+            prefilter = {
+                group: {"checked": stats["checked"], "skipped": stats["skipped"], "skip_rate": stats["skip_rate"]}
+                for group, stats in get_prefilter_stats()["groups"].items() if stats["checked"]
+            }
+            all_latencies = [latency for bucket_latencies in latencies.values() for latency in bucket_latencies]
+            report["detectors"][name] = {
+                "label": label_key,
+                "latency": {
+                    "all": summarize_latencies(all_latencies),
+                    **{bucket: summarize_latencies(values) for bucket, values in latencies.items() if values},
+                },
+                "accuracy": score_predictions(corpus, label_key, predictions),
+                "prefilter": prefilter,
+            }
+    return report
+
+def format_number(value: Optional[float], digits: int = 3) -> str:
+    return "-" if value is None else f"{value:.{digits}f}"
+
+def format_change(current: Optional[float], baseline: Optional[float]) -> str:
+    if current is None or baseline is None:
+        return ""
+    if baseline == 0:
+        return f" ({current - baseline:+.3f})"
+    return f" ({(current - baseline) / baseline * 100:+.1f}%)"
+
+def print_report(report: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None) -> None:
+    """以表格列出結果；提供 baseline 時同時列出與基準的差異"""
+    meta = report["meta"]
+    print(f"corpus {meta['corpus']['path']} ({meta['corpus']['messages']} messages, sha1 {meta['corpus']['sha1']}), "
+          f"iterations {meta['iterations']}, warm cache {meta['warm_cache']}, rules {meta['scam_rules_version']}")
+    if baseline:
+        print(f"baseline: {baseline['meta'].get('git_commit')} at {baseline['meta'].get('timestamp')}")
+
+    for name, result in report["detectors"].items():
+        base_result = (baseline or {}).get("detectors", {}).get(name, {})
+        print(f"\n== {name}")
+        print(f"  {'bucket':<8}{'calls':>7}{'msgs/s':>24}{'p50 ms':>22}{'p99 ms':>22}")
+        for bucket, latency in result["latency"].items():
+            base_latency = base_result.get("latency", {}).get(bucket, {})
+            msgs_per_sec = format_number(latency["msgs_per_sec"], 1) + format_change(latency["msgs_per_sec"], base_latency.get("msgs_per_sec"))
+            p50 = format_number(latency["p50_ms"]) + format_change(latency["p50_ms"], base_latency.get("p50_ms"))
+            p99 = format_number(latency["p99_ms"]) + format_change(latency["p99_ms"], base_latency.get("p99_ms"))
+            print(f"  {bucket:<8}{latency['calls']:>7}{msgs_per_sec:>24}{p50:>22}{p99:>22}")
+
+        accuracy = result["accuracy"]
+        base_accuracy = base_result.get("accuracy", {})
+        print(f"  {'category':<28}{'tp':>5}{'fp':>5}{'fn':>5}{'precision':>20}{'recall':>20}")
+        rows = [("overall", accuracy["overall"], base_accuracy.get("overall", {}))]
+        rows += [(category, metrics, base_accuracy.get("categories", {}).get(category, {}))
+                 for category, metrics in accuracy["categories"].items()]
+        for category, metrics, base_metrics in rows:
+            precision = format_number(metrics["precision"]) + format_change(metrics["precision"], base_metrics.get("precision"))
+            recall = format_number(metrics["recall"]) + format_change(metrics["recall"], base_metrics.get("recall"))
+            print(f"  {category:<28}{metrics['tp']:>5}{metrics['fp']:>5}{metrics['fn']:>5}{precision:>20}{recall:>20}")
+        if accuracy["errors"]:
+            print(f"  misclassified: {', '.join(error['id'] for error in accuracy['errors'])}")
+        for group, stats in result.get("prefilter", {}).items():
+            base_rate = base_result.get("prefilter", {}).get(group, {}).get("skip_rate")
+            print(f"  prefilter {group}: skipped {stats['skipped']}/{stats['checked']} "
+                  f"(skip rate {format_number(stats['skip_rate'])}{format_change(stats['skip_rate'], base_rate)})")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark detector throughput, latency and accuracy over the labelled corpus")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS, help="Path to the labelled JSONL corpus")
+    parser.add_argument("--iterations", type=int, default=3, help="Timed passes over the corpus per detector")
+    parser.add_argument("--warmup", type=int, default=1, help="Untimed passes before measuring")
+    parser.add_argument("--warm-cache", action="store_true", help="Keep detection result caches between passes (measures the cache hit path)")
+    parser.add_argument("--detectors", help="Comma separated detector names to run (default: all)")
+    parser.add_argument("--output", help="Write the JSON report to this path ('-' for stdout)")
+    parser.add_argument("--compare", help="Baseline JSON report to compare against")
+    args = parser.parse_args()
+
+    if args.iterations < 1:
+        parser.error("--iterations must be at least 1")
+    detector_names = [name.strip() for name in args.detectors.split(",")] if args.detectors else None
+    try:
+        report = run_benchmarks(args.corpus, args.iterations, max(0, args.warmup), args.warm_cache, detector_names)
+    except ValueError as e:
+        parser.error(str(e))
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as baseline_file:
+            baseline = json.load(baseline_file)
+
+    if args.output == "-":
+        json.dump(report, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+        return
+    print_report(report, baseline)
+    if args.output:
+        output_dir = os.path.dirname(os.path.abspath(args.output))
+        os.makedirs(output_dir, exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            json.dump(report, output_file, ensure_ascii=False, indent=2)
+        print(f"\nreport written to {args.output}")
+
+if __name__ == "__main__":
+    main()
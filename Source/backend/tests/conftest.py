@@ -0,0 +1,20 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# 規則包與索引檔寫入獨立的暫存資料目錄，需在載入 app 模組之前設定
+os.environ.setdefault("ANTI_SCAM_DATA_DIR", tempfile.mkdtemp(prefix="anti_scam_tests_"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture
+def builtin_scam_rules():
+    """測試結束後重新編譯並安裝內建的詐騙規則，避免測試中新增的規則影響其他測試"""
+    from app.apis import detection_engine
+    yield detection_engine
+    detection_engine.install_scam_rule_set(detection_engine.compile_scam_rule_set({
+        "patterns": detection_engine.SCAM_PATTERNS,
+        "high_risk_phrases": detection_engine.HIGH_RISK_PHRASES,
+        "scam_types": detection_engine.SCAM_TYPES
+    }))
@@ -0,0 +1,45 @@
+from app.apis.detection_cache import DetectionResultCache, get_detection_cache
+
+def test_rules_version_change_invalidates_entries():
+    cache = DetectionResultCache("test", max_size=8)
+    cache.put("訊息", "v1", {"is_scam": True})
+    assert cache.get("訊息", "v1") == {"is_scam": True}
+    assert cache.get("訊息", "v2") is None
+    assert cache.invalidations == 1
+    # 換回舊版本也不會取得換版前的結果
+    assert cache.get("訊息", "v1") is None
+
+def test_cached_results_are_copies():
+    cache = DetectionResultCache("test", max_size=8)
+    result = {"matches": ["a"]}
+    cache.put("訊息", "v1", result)
+    result["matches"].append("b")
+    cached = cache.get("訊息", "v1")
+    cached["matches"].append("c")
+    assert cache.get("訊息", "v1") == {"matches": ["a"]}
+
+def test_lru_eviction():
+    cache = DetectionResultCache("test", max_size=2)
+    cache.put("a", "v1", 1)
+    cache.put("b", "v1", 2)
+    assert cache.get("a", "v1") == 1
+    cache.put("c", "v1", 3)
+    assert cache.get("b", "v1") is None
+    assert cache.get("a", "v1") == 1
+    assert cache.evictions == 1
+
+def test_detect_scam_reruns_after_rule_change(builtin_scam_rules):
+    detection_engine = builtin_scam_rules
+    message = "您好，請提供您的密碼，另外請記得 zzqq暗號 的事情"
+    cache = get_detection_cache("detection_engine")
+    first = detection_engine.detect_scam(message)
+    hits = cache.hits
+    assert detection_engine.detect_scam(message) == first
+    assert cache.hits == hits + 1
+    assert all(ind["category_id"] != "cache_test" for ind in first.matched_indicators)
+
+    version = detection_engine.get_scam_rules_version()
+    detection_engine.register_scam_rules("cache_test", ["zzqq暗號"])
+    assert detection_engine.get_scam_rules_version() != version
+    second = detection_engine.detect_scam(message)
+    assert any(ind["category_id"] == "cache_test" for ind in second.matched_indicators)
@@ -0,0 +1,63 @@
+import pytest
+
+from app.apis.domain_reputation import (
+    VERDICT_BAD, VERDICT_GOOD, VERDICT_SHORTENER, VERDICT_UNKNOWN,
+    DomainReputationIndex, extract_urls, find_lookalike_brand
+)
+
+SOURCE = """
+[bad]
+bank-secure.example.com
+evil.test   # 整個網域
+[good]
+esunbank.com.tw
+gov.tw
+[shortener]
+bit.ly
+"""
+
+@pytest.fixture
+def reputation_index(tmp_path):
+    source = tmp_path / "domains.txt"
+    source.write_text(SOURCE, encoding="utf-8")
+    index = DomainReputationIndex(str(source))
+    yield index
+    index.close()
+
+def test_lookup_uses_the_closest_listed_parent(reputation_index):
+    assert reputation_index.lookup("evil.test") == (VERDICT_BAD, "evil.test")
+    assert reputation_index.lookup("login.evil.test") == (VERDICT_BAD, "evil.test")
+    assert reputation_index.lookup("BANK-SECURE.example.com.") == (VERDICT_BAD, "bank-secure.example.com")
+    assert reputation_index.lookup("example.com") == (VERDICT_UNKNOWN, None)
+    assert reputation_index.lookup("www.esunbank.com.tw") == (VERDICT_GOOD, "esunbank.com.tw")
+    assert reputation_index.lookup("165.npa.gov.tw") == (VERDICT_GOOD, "gov.tw")
+    assert reputation_index.lookup("bit.ly") == (VERDICT_SHORTENER, "bit.ly")
+
+def test_index_file_is_shared_by_content_version(tmp_path, reputation_index):
+    assert reputation_index.stats()["entries"] == 5
+    source = tmp_path / "copy.txt"
+    source.write_text(SOURCE, encoding="utf-8")
+    same = DomainReputationIndex(str(source))
+    try:
+        assert same.version == reputation_index.version
+        assert same.index_path == reputation_index.index_path
+        assert same.lookup("evil.test") == (VERDICT_BAD, "evil.test")
+    finally:
+        same.close()
+
+def test_invalid_source_is_rejected():
+    with pytest.raises(ValueError):
+        DomainReputationIndex.parse_source("[unknown]\nexample.com")
+    with pytest.raises(ValueError):
+        DomainReputationIndex.parse_source("example.com")
+
+def test_extract_urls():
+    links = extract_urls("請點 HTTPS://Bank-Secure.Example.com/login?id=1。或 www.test.io 和 bit.ly/abc領取，file.txt 不算")
+    assert [link["domain"] for link in links] == ["bank-secure.example.com", "www.test.io", "bit.ly"]
+    assert [link["url"] for link in links] == ["https://bank-secure.example.com/login?id=1", "www.test.io", "bit.ly/abc"]
+
+def test_lookalike_brands():
+    assert find_lookalike_brand("esunbank-verify.com") == "esunbank"
+    assert find_lookalike_brand("g00gle.com") == "google"
+    assert find_lookalike_brand("gooogle.net") == "google"
+    assert find_lookalike_brand("online-shop.com") is None
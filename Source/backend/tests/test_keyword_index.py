@@ -0,0 +1,73 @@
+import random
+
+from app.apis.detection_engine import find_nested_hits
+from app.apis.keyword_index import KeywordIndex
+from app.apis.text_normalization import normalize_text
+
+def brute_force_hits(text, vocabulary):
+    hits = []
+    for term in vocabulary:
+        start = text.find(term)
+        while start != -1:
+            hits.append((term, start, start + len(term)))
+            start = text.find(term, start + 1)
+    return sorted(hits, key=lambda hit: (hit[2], hit[1]))
+
+def test_scan_finds_every_occurrence_including_overlaps():
+    index = KeywordIndex()
+    vocabulary = ["he", "she", "his", "hers", "ab", "abab", "b", "匯款", "款項", "匯"]
+    index.register("test", vocabulary)
+    random.seed(7)
+    for _ in range(300):
+        # 位置以正規化後的訊息為準
+        text = normalize_text("".join(random.choice("hesirabx匯款項 ") for _ in range(random.randint(1, 40))))
+        found = sorted(index.scan(text).get("test", ()), key=lambda hit: (hit[2], hit[1]))
+        assert found == brute_force_hits(text, vocabulary), text
+
+def test_scan_keeps_namespaces_apart():
+    index = KeywordIndex()
+    index.register("scam", ["保證獲利", "匯款"])
+    index.register("crisis", ["想死"])
+    hits = index.scan("保證獲利，先匯款")
+    assert set(hits) == {"scam"}
+    assert [term for term, _, _ in hits["scam"]] == ["保證獲利", "匯款"]
+
+def test_register_invalidates_cached_scans():
+    index = KeywordIndex()
+    index.register("test", ["投資"])
+    version = index.version
+    assert index.scan("穩賺投資") == {"test": (("投資", 2, 4),)}
+    index.register("test", ["投資"])
+    assert index.version == version  # 詞表未變動時不重建
+    index.register("test", ["穩賺"])
+    assert index.version == version + 1
+    assert index.scan("穩賺投資") == {"test": (("穩賺", 0, 2),)}
+
+def test_preloaded_automaton_is_only_used_for_the_same_vocabulary():
+    source = KeywordIndex()
+    source.register("test", ["中獎", "領取"])
+    snapshot = source.export_automaton()
+
+    same = KeywordIndex()
+    same.preload_automaton(snapshot)
+    same.register("test", ["中獎", "領取"])
+    assert same.scan("恭喜中獎請領取") == source.scan("恭喜中獎請領取")
+
+    changed = KeywordIndex()
+    changed.preload_automaton(snapshot)
+    changed.register("test", ["包裹"])
+    assert changed.scan("恭喜中獎請領取包裹") == {"test": (("包裹", 7, 9),)}
+
+def test_find_nested_hits_matches_pairwise_containment():
+    random.seed(11)
+    for _ in range(2000):
+        hits = []
+        for _ in range(random.randint(0, 8)):
+            start = random.randint(0, 10)
+            hits.append(("t", start, start + random.randint(1, 5)))
+        expected = [
+            any(j != i and other[1] <= hit[1] and hit[2] <= other[2] and (other[1], other[2]) != (hit[1], hit[2])
+                for j, other in enumerate(hits))
+            for i, hit in enumerate(hits)
+        ]
+        assert find_nested_hits(hits) == expected, hits
@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+
+from app.apis.llm_client import LLMConcurrencyLimiter, LLMOverloadedError
+
+def test_active_calls_never_exceed_the_limit():
+    limiter = LLMConcurrencyLimiter(max_concurrency=3, max_queued=100, queue_timeout=5)
+    peak = 0
+
+    async def call():
+        nonlocal peak
+        async with limiter.slot():
+            peak = max(peak, limiter.active)
+            await asyncio.sleep(0.01)
+
+    async def run():
+        await asyncio.gather(*(call() for _ in range(20)))
+
+    asyncio.run(run())
+    assert peak == 3
+    assert limiter.snapshot() == {"active": 0, "waiting": 0, "completed": 20, "rejected": 0}
+
+def test_full_queue_is_rejected_immediately():
+    limiter = LLMConcurrencyLimiter(max_concurrency=1, max_queued=1, queue_timeout=5)
+
+    async def run():
+        release = asyncio.Event()
+
+        async def hold():
+            async with limiter.slot():
+                await release.wait()
+
+        holder = asyncio.create_task(hold())
+        waiter = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        assert (limiter.active, limiter.waiting) == (1, 1)
+        with pytest.raises(LLMOverloadedError):
+            async with limiter.slot():
+                pass
+        release.set()
+        await asyncio.gather(holder, waiter)
+
+    asyncio.run(run())
+    assert limiter.snapshot() == {"active": 0, "waiting": 0, "completed": 2, "rejected": 1}
+
+def test_queue_timeout():
+    limiter = LLMConcurrencyLimiter(max_concurrency=1, max_queued=10, queue_timeout=0.05)
+
+    async def run():
+        async with limiter.slot():
+            with pytest.raises(LLMOverloadedError):
+                async with limiter.slot():
+                    pass
+        # 逾時的呼叫不佔用名額
+        async with limiter.slot():
+            pass
+
+    asyncio.run(run())
+    assert limiter.snapshot() == {"active": 0, "waiting": 0, "completed": 2, "rejected": 1}
+
+def test_slot_is_released_when_the_call_fails():
+    limiter = LLMConcurrencyLimiter(max_concurrency=1, max_queued=0, queue_timeout=0.05)
+
+    async def run():
+        with pytest.raises(RuntimeError):
+            async with limiter.slot():
+                raise RuntimeError("api error")
+        async with limiter.slot():
+            pass
+
+    asyncio.run(run())
+    assert limiter.snapshot()["completed"] == 2
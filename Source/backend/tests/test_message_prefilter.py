@@ -0,0 +1,81 @@
+import json
+import os
+import random
+import re
+
+from app.apis.message_prefilter import MessagePrefilter, extract_required_literals
+from app.apis.text_normalization import normalize_text
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks", "corpus.jsonl")
+
+def load_corpus():
+    with open(CORPUS_PATH, encoding="utf-8") as corpus_file:
+        return [normalize_text(json.loads(line).get("text", "")) for line in corpus_file if line.strip()]
+
+def random_messages(fragments, count, seed):
+    rng = random.Random(seed)
+    filler = list("你好我們的是今天明天謝謝 ,.!?123") + ["hello", "dear", "ok"]
+    return [
+        normalize_text("".join(rng.choice(fragments if rng.random() < 0.15 else filler) for _ in range(rng.randint(1, 30))))
+        for _ in range(count)
+    ]
+
+def test_required_literals():
+    assert extract_required_literals("投資|理財") == frozenset(["投資", "理財"])
+    assert extract_required_literals("(?:立即|馬上)匯款") == frozenset(["匯款"])
+    assert extract_required_literals(r"bank\s*account") == frozenset(["account"])
+    assert extract_required_literals("a?b") == frozenset(["b"])
+    assert extract_required_literals(".*") is None
+
+def test_skipped_messages_never_match_the_registered_rules():
+    patterns = [r"保證(?:獲利|賺錢)", r"\b(?:verify|confirm)\s+your\s+account\b", r"[0-9]{4}-[0-9]{4}", r"line\s*id", "中獎"]
+    prefilter = MessagePrefilter()
+    prefilter.register_patterns("test", "rules", patterns)
+    compiled = [re.compile(pattern) for pattern in patterns]
+    fragments = ["保證", "獲利", "賺錢", "verify your account", "confirm", "1234-5678", "line id", "line", "中", "獎"]
+    skipped = 0
+    for message in random_messages(fragments, 3000, seed=1):
+        if prefilter.could_match(message, "test"):
+            continue
+        skipped += 1
+        assert not any(pattern.search(message) for pattern in compiled), message
+    assert skipped > 0
+
+def test_skipped_messages_have_no_scam_result(builtin_scam_rules):
+    detection_engine = builtin_scam_rules
+    from app.apis.message_prefilter import could_match
+
+    fragments = [
+        pattern.replace("\\b", "").replace("\\s", " ")
+        for category in detection_engine.SCAM_PATTERNS.values() for pattern in category["patterns"]
+    ] + ["http://a.co", "0912345678", "加line abc123"]
+    messages = load_corpus() + random_messages(fragments, 3000, seed=2)
+    skipped = 0
+    for message in messages:
+        if len(message) < 5 or could_match(message, detection_engine.SCAM_PREFILTER_GROUP):
+            continue
+        skipped += 1
+        result = detection_engine.detect_scam_uncached(message)
+        assert result.matched_indicators == [] and not result.is_scam, message
+        assert detection_engine.detect_reported_identifier(message) is None
+    assert skipped > 0
+
+def test_skipped_messages_have_no_keyword_hits():
+    from app.apis import abuse_protection, emotional_response_orchestrator as orchestrator
+    from app.apis.keyword_index import scan_keywords
+    from app.apis.message_prefilter import could_match
+
+    groups = {
+        abuse_protection.ABUSE_PREFILTER_GROUP: [
+            abuse_protection.ABUSE_SENSITIVE_NAMESPACE, abuse_protection.ABUSE_MILD_NAMESPACE, abuse_protection.ABUSE_TEST_NAMESPACE
+        ],
+        orchestrator.CRISIS_PREFILTER_GROUP: [
+            orchestrator.CRISIS_SUICIDE_NAMESPACE, orchestrator.CRISIS_DANGER_NAMESPACE, orchestrator.CRISIS_SEVERE_LOSS_NAMESPACE
+        ],
+    }
+    fragments = list(orchestrator.SUICIDE_PATTERNS) + list(orchestrator.DANGER_PATTERNS) + list(abuse_protection.MILD_NEGATIVE_WORDS)
+    for message in load_corpus() + random_messages(fragments, 2000, seed=3):
+        hits = scan_keywords(message)
+        for group, namespaces in groups.items():
+            if not could_match(message, group):
+                assert not any(hits.get(namespace) for namespace in namespaces), (group, message)
@@ -0,0 +1,70 @@
+import pytest
+
+from app.apis import rule_packs
+
+MESSAGE = "你好，這是 zzqq暗號 請回覆"
+
+def with_category(rule_set, category_id, patterns):
+    return {**rule_set, "patterns": {**rule_set["patterns"], category_id: {"name": category_id, "description": "", "patterns": patterns}}}
+
+def test_activated_pack_swaps_the_whole_rule_set(builtin_scam_rules):
+    detection_engine = builtin_scam_rules
+    before = detection_engine.get_active_scam_rules()
+    assert "hot_swap" not in detection_engine.detect_scam(MESSAGE).categories
+
+    pack, compiled = rule_packs.build_rule_pack({"scam": with_category(detection_engine.export_scam_rule_set(), "hot_swap", ["zzqq暗號"])})
+    active = rule_packs.activate_rule_pack(pack, compiled, "test")
+    assert active["version"] == pack["version"]
+    assert rule_packs.read_current_version() == pack["version"]
+
+    after = detection_engine.get_active_scam_rules()
+    assert after is not before
+    assert "hot_swap" not in before.patterns  # 持有舊規則集的讀取端不受影響
+    assert after.pattern_engine["source"] is after.patterns
+    assert "hot_swap" in detection_engine.detect_scam(MESSAGE).categories
+
+def test_other_workers_follow_the_pointer_file(builtin_scam_rules):
+    detection_engine = builtin_scam_rules
+    before = detection_engine.get_active_scam_rules()
+    # 另一個 worker 發布的規則包：只寫入規則包檔案與指標檔，本程序尚未套用
+    pack, _ = rule_packs.build_rule_pack({"scam": with_category(detection_engine.export_scam_rule_set(), "from_artifact", ["zzqq暗號"])})
+    rule_packs.write_artifact(pack)
+    assert detection_engine.get_active_scam_rules() is before
+
+    rule_packs.refresh_rule_pack()
+    assert rule_packs.get_active_rule_pack()["version"] == pack["version"]
+    assert "from_artifact" in detection_engine.detect_scam(MESSAGE).categories
+
+def test_invalid_pack_leaves_the_active_rules_in_place(builtin_scam_rules):
+    detection_engine = builtin_scam_rules
+    before = detection_engine.get_active_scam_rules()
+    invalid = {**detection_engine.export_scam_rule_set(), "high_risk_phrases": {"no_such_type": ["x"]}}
+    with pytest.raises(ValueError):
+        rule_packs.build_rule_pack({"scam": invalid})
+    with pytest.raises(ValueError):
+        rule_packs.build_rule_pack({"no_such_rule_set": {}})
+    assert detection_engine.get_active_scam_rules() is before
+
+def test_registered_rules_install_a_new_set(builtin_scam_rules):
+    detection_engine = builtin_scam_rules
+    before = detection_engine.get_active_scam_rules()
+    detection_engine.register_scam_rules("registered", ["yyww密語"])
+    after = detection_engine.get_active_scam_rules()
+    assert after is not before
+    assert "registered" in after.patterns and "registered" not in before.patterns
+    assert "registered" in detection_engine.detect_scam("請記得 yyww密語 今天要用").categories
+
+def test_compiling_a_candidate_pack_does_not_change_matching(builtin_scam_rules):
+    detection_engine = builtin_scam_rules
+    message = "老師說這檔保證獲利，穩賺不賠，名額有限"
+    expected = detection_engine.match_scam_indicators(message)
+    assert any("穩賺" in ind["matches"] for ind in expected)
+
+    # 移除「穩賺」的候選規則包只編譯、未套用，目前規則的比對結果不變
+    rule_set = detection_engine.export_scam_rule_set()
+    patterns = {
+        category_id: {**category, "patterns": [pattern for pattern in category["patterns"] if "穩賺" not in pattern]}
+        for category_id, category in rule_set["patterns"].items()
+    }
+    rule_packs.build_rule_pack({"scam": {**rule_set, "patterns": patterns}})
+    assert detection_engine.match_scam_indicators(message) == expected
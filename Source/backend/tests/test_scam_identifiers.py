@@ -0,0 +1,80 @@
+import os
+
+import pytest
+
+from app.apis import scam_identifiers
+from app.apis.scam_identifiers import (
+    IDENTIFIER_BANK_ACCOUNT, IDENTIFIER_LINE_ID, IDENTIFIER_PHONE,
+    ScamIdentifierIndex, extract_identifiers
+)
+
+SOURCE = """
+[phone]
+0912-345-678 investment_scam
++886 2 2345 6789
+[bank_account]
+822-123456789012 fake_shopping
+[line_id]
+@scam_helper impersonation
+"""
+
+@pytest.fixture
+def source_file(tmp_path):
+    source = tmp_path / "identifiers.txt"
+    source.write_text(SOURCE, encoding="utf-8")
+    return source
+
+@pytest.fixture
+def active_source(source_file):
+    """以測試清單取代共用索引，結束後換回原本的清單"""
+    original = scam_identifiers.get_identifier_index().source_path
+    scam_identifiers.reload_identifier_index(str(source_file))
+    yield source_file
+    scam_identifiers.reload_identifier_index(original)
+
+def test_lookup_normalizes_identifiers(source_file):
+    index = ScamIdentifierIndex(str(source_file))
+    assert index.entry_count == 4
+    assert index.lookup(IDENTIFIER_PHONE, "0912345678") == "investment_scam"
+    assert index.lookup(IDENTIFIER_PHONE, "0223456789") == ""
+    assert index.lookup(IDENTIFIER_BANK_ACCOUNT, "822123456789012") == "fake_shopping"
+    assert index.lookup(IDENTIFIER_LINE_ID, "@scam_helper") == "impersonation"
+    assert index.lookup(IDENTIFIER_PHONE, "0912000000") is None
+
+def test_index_files_are_reused_for_the_same_content(tmp_path, source_file):
+    first = ScamIdentifierIndex(str(source_file))
+    copy = tmp_path / "copy.txt"
+    copy.write_text(SOURCE, encoding="utf-8")
+    second = ScamIdentifierIndex(str(copy))
+    assert first.index_paths is not None
+    assert second.index_paths == first.index_paths
+    assert second.lookup(IDENTIFIER_PHONE, "0912345678") == "investment_scam"
+
+def test_invalid_source_is_rejected():
+    with pytest.raises(ValueError):
+        ScamIdentifierIndex.parse_source(["[phone]", "12345"])
+    with pytest.raises(ValueError):
+        ScamIdentifierIndex.parse_source(["[email]", "a@b.c"])
+
+def test_extract_identifiers():
+    identifiers = extract_identifiers("請匯款到 822-123456789012，有問題打 +886 912 345 678 或加賴 line.me/ti/p/@Scam_Helper")
+    found = {(identifier["type"], identifier["value"]) for identifier in identifiers}
+    assert (IDENTIFIER_PHONE, "0912345678") in found
+    assert (IDENTIFIER_BANK_ACCOUNT, "822123456789012") in found
+    assert (IDENTIFIER_BANK_ACCOUNT, "123456789012") in found
+    assert (IDENTIFIER_LINE_ID, "@scam_helper") in found
+
+def test_reported_identifier_detection_follows_the_source_file(active_source):
+    from app.apis.detection_engine import detect_reported_identifier
+
+    result = detect_reported_identifier("有問題請打 0912 345 678 找王專員")
+    assert result is not None and result.is_scam
+    assert result.scam_info["id"] == "investment_scam"
+    assert detect_reported_identifier("有問題請打 0933 111 222 找王專員") is None
+
+    # 其他程序更新清單檔後，背景檢查依檔案狀態重新載入
+    active_source.write_text(SOURCE + "[phone]\n0933111222\n", encoding="utf-8")
+    stat = os.stat(active_source)
+    os.utime(active_source, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    scam_identifiers.refresh_identifier_index()
+    assert detect_reported_identifier("有問題請打 0933 111 222 找王專員") is not None
@@ -0,0 +1,64 @@
+import io
+import random
+
+import numpy as np
+import pytest
+
+from app.apis.scam_images import BKTree, ScamImageIndex, compute_image_hashes, hamming_distance
+
+Image = pytest.importorskip("PIL.Image")
+
+def make_screenshot(seed: int, size=(360, 640)) -> "Image.Image":
+    """以隨機色塊組成的假截圖"""
+    rng = np.random.default_rng(seed)
+    blocks = rng.integers(0, 256, size=(16, 9, 3), dtype=np.uint8)
+    return Image.fromarray(blocks).resize(size, Image.NEAREST)
+
+def encode(image, image_format="PNG", **options) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format, **options)
+    return buffer.getvalue()
+
+def test_bk_tree_search_matches_linear_scan():
+    rng = random.Random(9)
+    values = [rng.getrandbits(64) for _ in range(500)]
+    values += [value ^ (1 << rng.randrange(64)) for value in values[:100]]  # 近似的雜湊
+    tree = BKTree()
+    for i, value in enumerate(values):
+        tree.add(value, f"id{i}")
+    for _ in range(50):
+        query = rng.choice(values) ^ rng.getrandbits(64) & rng.getrandbits(64) & rng.getrandbits(64)
+        expected = sorted(
+            (hamming_distance(query, value), f"id{i}") for i, value in enumerate(values)
+            if hamming_distance(query, value) <= 12
+        )
+        assert tree.search(query, 12) == expected
+
+def test_recompressed_screenshot_is_found():
+    index = ScamImageIndex()
+    original = make_screenshot(1)
+    image_id = index.add({**compute_image_hashes(encode(original)), "scam_type": "phishing"})
+    index.add({**compute_image_hashes(encode(make_screenshot(2))), "scam_type": "investment_scam"})
+
+    # 重新壓縮並縮小的同一張截圖
+    variant = encode(original.resize((270, 480)).convert("RGB"), "JPEG", quality=60)
+    match = index.find(compute_image_hashes(variant))
+    assert match is not None
+    assert match["image"]["id"] == image_id
+    assert match["image"]["scam_type"] == "phishing"
+
+    assert index.find(compute_image_hashes(encode(make_screenshot(3)))) is None
+
+def test_remove_rebuilds_the_tree():
+    index = ScamImageIndex()
+    hashes = compute_image_hashes(encode(make_screenshot(4)))
+    image_id = index.add({**hashes, "scam_type": "phishing"})
+    assert index.add({**hashes, "scam_type": "phishing"}) == image_id  # 相同截圖取代原本的項目
+    assert len(index) == 1
+    assert index.remove(image_id)
+    assert not index.remove(image_id)
+    assert index.find(hashes) is None
+
+def test_undecodable_image_is_rejected():
+    with pytest.raises(ValueError):
+        compute_image_hashes(b"not an image")
@@ -0,0 +1,72 @@
+import random
+
+import pytest
+
+from app.apis.detection_engine import (
+    SCAM_PATTERNS, SCAM_TYPES, build_match_count_vector, build_scam_scoring_model, score_match_counts
+)
+
+def reference_score(matched_indicators, message_length):
+    """改用權重矩陣之前逐類別、逐類型計分的寫法，回傳 (是否詐騙, 類型ID, 類型信心分數, 整體信心分數, 各類型分數)"""
+    matched_categories = [ind["category_id"] for ind in matched_indicators]
+    base_score = min(0.7, (len(matched_categories) / len(SCAM_PATTERNS)) * 0.7 + 0.15)
+    high_risk_bonus = sum(0.12 for cat in matched_categories if cat in ["personal_information", "suspicious_links", "threat_or_blackmail"])
+    medium_risk_bonus = sum(0.07 for cat in matched_categories if cat in ["urgent_action", "financial_incentives", "impersonation"])
+    risk_score = min(0.25, high_risk_bonus + medium_risk_bonus)
+    match_density = sum(min(0.05, len(ind["matches"]) * 0.01) for ind in matched_indicators)
+    length_factor = 0.5 if message_length < 20 else 0.8 if message_length > 500 else 1.0
+    confidence_score = min(1.0, max(0.0, (base_score + risk_score + match_density) * length_factor))
+
+    scores = {}
+    best_id, best_confidence, max_score = None, None, 0
+    for scam_id, scam_info in SCAM_TYPES.items():
+        if scam_id == "general_suspicious":
+            continue
+        indicators = scam_info.get("indicators", [])
+        score = 0
+        for cat in matched_categories:
+            if cat in indicators:
+                cat_matches = sum(len(ind["matches"]) for ind in matched_indicators if ind["category_id"] == cat)
+                score += 1 + min(0.5, cat_matches * 0.1)
+        scores[scam_id] = score
+        if score > max_score:
+            max_score = score
+            best_id = scam_id
+            ratio = sum(1 for ind in indicators if ind in matched_categories) / len(indicators) if indicators else 0
+            best_confidence = min(1.0, ratio * 0.7 + confidence_score * 0.3)
+
+    is_scam = confidence_score > 0.2
+    if is_scam and (max_score < 1.5 or best_id is None):
+        best_id, best_confidence = "general_suspicious", confidence_score
+    return is_scam, best_id, best_confidence, confidence_score, scores
+
+def random_indicators(rng):
+    categories = rng.sample(list(SCAM_PATTERNS), rng.randint(1, len(SCAM_PATTERNS)))
+    return [
+        {"category_id": category_id, "matches": [f"m{i}" for i in range(rng.randint(1, 8))]}
+        for category_id in categories
+    ]
+
+def test_weight_matrix_scores_like_the_per_type_loop():
+    model = build_scam_scoring_model(SCAM_PATTERNS, SCAM_TYPES)
+    rng = random.Random(5)
+    for _ in range(3000):
+        indicators = random_indicators(rng)
+        length = rng.choice([5, 19, 20, 120, 500, 501, 2000])
+        is_scam, scam_type, confidence = score_match_counts(build_match_count_vector(indicators, model), length, model)
+        expected_is_scam, expected_id, expected_type_confidence, expected_confidence, scores = reference_score(indicators, length)
+
+        assert is_scam == expected_is_scam
+        assert confidence == pytest.approx(expected_confidence)
+        if expected_id is None:
+            assert scam_type is None
+            continue
+        if scam_type["id"] != expected_id:
+            # 只有數學上相等的分數（浮點誤差內）才可能選到不同的類型
+            assert scores[scam_type["id"]] == pytest.approx(scores[expected_id])
+            continue
+        assert scam_type["confidence_score"] == pytest.approx(expected_type_confidence)
+
+def test_no_indicators_score_zero():
+    model = build_scam_scoring_model(SCAM_PATTERNS, SCAM_TYPES)
+    assert score_match_counts(build_match_count_vector([], model), 100, model) == (False, None, 0.0)
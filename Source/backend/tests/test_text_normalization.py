@@ -0,0 +1,43 @@
+import random
+import unicodedata
+
+from app.apis.text_normalization import normalize_text, normalize_text_with_offsets, to_original_span
+
+ALPHABET = ["a", "Ｂ", "ｃ", "中", "文", " ", "　", "\n", "​", "­", "é", "Σ", "İ", "①", "ﾊﾟ", "ｶ", "ﾞ", "1", "，", "!"]
+
+def test_offsets_follow_normalize_text():
+    rng = random.Random(3)
+    for _ in range(2000):
+        text = "".join(rng.choice(ALPHABET) for _ in range(rng.randint(0, 20)))
+        normalized, offsets = normalize_text_with_offsets(text)
+        assert normalized == normalize_text(text)
+        assert len(offsets) == len(normalized)
+        assert offsets == sorted(offsets)
+        for ch, (start, end) in zip(normalized, offsets):
+            assert 0 <= start < end <= len(text)
+            # 整段轉小寫時字尾的 σ 會變成 ς，以 casefold 比較
+            source = unicodedata.normalize("NFKC", text[start:end]).casefold()
+            assert ch.casefold() in source or (ch == " " and any(c.isspace() for c in source)), (text, ch, text[start:end])
+
+def test_span_maps_back_to_original_text():
+    text = "請​點擊　ＨＴＴＰ://Example.com  領取"
+    normalized, offsets = normalize_text_with_offsets(text)
+    start = normalized.index("http")
+    original_start, original_end = to_original_span(offsets, start, start + len("http"))
+    assert text[original_start:original_end] == "ＨＴＴＰ"
+
+def test_span_is_clamped_to_the_text():
+    normalized, offsets = normalize_text_with_offsets("ab")
+    assert to_original_span(offsets, -3, 10) == (0, 2)
+    assert to_original_span([], 0, 1) == (0, 0)
+
+def test_detection_spans_point_at_the_matched_text():
+    from app.apis.detection_engine import detect_scam
+    from app.apis.scam_detector import build_detection_response
+
+    text = "ＵＲＧＥＮＴ！！您的帳戶 已被凍結，請立即   提供密碼​並點擊連結"
+    response = build_detection_response(detect_scam(text), text)
+    spans = [span for indicator in response.indicators for span in indicator.spans]
+    assert spans
+    for span in spans:
+        assert normalize_text(text[span.start:span.end]) == span.text
@@ -0,0 +1,86 @@
+import asyncio
+import json
+import random
+from types import SimpleNamespace
+
+import pytest
+
+from app.apis.values_filter import StreamingValuesFilter
+
+LONG_REPLY = (
+    "這種中獎簡訊通常是詐騙的手法之一，它們會利用人們想要獲得意外之財的心理來吸引點擊。"
+    "點擊連結後可能會被要求輸入個人資料或信用卡號碼，導致個資外洩或金錢損失。"
+    "建議你不要點擊任何連結，也不要回覆這則簡訊。如果真的不放心，可以直接打電話給官方客服確認。"
+    "另外也可以撥打165反詐騙專線詢問。保護好自己最重要喔！你有收過類似的訊息嗎？"
+)
+CASES = [
+    ("這是真的嗎", "其實這是詐騙。你應該馬上封鎖對方，不能匯款！根據研究，這類訊息很常見。要小心喔😊"),
+    ("朋友叫我投資虛擬貨幣保證獲利", "聽起來很吸引人。但保證獲利的投資通常有問題。\n\n我們可以一起查查看這家公司是否合法，你覺得呢？"),
+    ("這個簡訊說我中獎了要我點連結領獎金請問是真的嗎？", LONG_REPLY),
+    ("嗨", "第一段。\n第二段。\n第三段。\n第四段？"),
+]
+
+def stream(user_message, reply, chunk_size):
+    random.seed(1)
+    values_filter = StreamingValuesFilter(user_message)
+    released = [values_filter.feed(reply[i:i + chunk_size]) for i in range(0, len(reply), chunk_size)]
+    released.append(values_filter.finish())
+    return values_filter, "".join(released)
+
+@pytest.mark.parametrize("user_message,reply", CASES)
+def test_output_does_not_depend_on_chunking(user_message, reply):
+    values_filter, expected = stream(user_message, reply, len(reply))
+    for chunk_size in (1, 2, 3, 7):
+        chunked_filter, text = stream(user_message, reply, chunk_size)
+        assert text == expected
+        assert text == chunked_filter.text
+        assert set(chunked_filter.applied_principles) == set(values_filter.applied_principles)
+
+def test_only_complete_sentences_are_released():
+    values_filter = StreamingValuesFilter("這是真的嗎")
+    assert values_filter.feed("其實這是") == ""
+    released = values_filter.feed("詐騙。你應")
+    assert released.endswith("。") and "你應" not in released
+
+def test_truncated_reply_releases_nothing_more():
+    values_filter = StreamingValuesFilter("嗨")
+    released = values_filter.feed("第一段。\n第二段。\n第三段。\n")
+    assert values_filter.truncated
+    assert "第三段" not in released
+    assert values_filter.feed("第四段。") == ""
+    assert "brevity" in values_filter.applied_principles
+
+def text_event(text):
+    return SimpleNamespace(type="content_block_delta", delta=SimpleNamespace(type="text_delta", text=text))
+
+async def fake_events(reply, output_tokens):
+    usage = SimpleNamespace(input_tokens=10, output_tokens=1, cache_read_input_tokens=0, cache_creation_input_tokens=0)
+    yield SimpleNamespace(type="message_start", message=SimpleNamespace(usage=usage))
+    for i in range(0, len(reply), 4):
+        yield text_event(reply[i:i + 4])
+    yield SimpleNamespace(type="message_delta", usage=SimpleNamespace(output_tokens=output_tokens))
+
+def parse_sse(raw_events):
+    parsed = []
+    for raw in raw_events:
+        lines = dict(line.split(": ", 1) for line in raw.strip().split("\n"))
+        parsed.append((lines["event"], json.loads(lines["data"])))
+    return parsed
+
+def test_truncated_stream_is_drained_for_the_real_usage(monkeypatch):
+    from app.apis import ai_conversation
+
+    recorded = []
+    monkeypatch.setattr(ai_conversation, "record_token_usage", lambda *args: recorded.append(args))
+    plan = ai_conversation.ReplyPlan(system="", messages=[], max_tokens=300, temperature=0.7, analysis={}, filter_values=True)
+    reply = "第一段。\n第二段。\n第三段。\n" + "後面還有很多內容。" * 50
+
+    async def collect():
+        return [event async for event in ai_conversation.stream_reply_plan(plan, fake_events(reply, 321), "user", "嗨")]
+
+    events = parse_sse(asyncio.run(collect()))
+    names = [name for name, _ in events]
+    assert names.count("done") == 1 and names[-1] == "done"
+    assert "後面還有" not in events[-1][1]["response"]
+    # 截斷後仍讀完串流，以最後 message_delta 的實際輸出用量記錄
+    assert recorded == [("user", 10 + 321, 0, 0)]